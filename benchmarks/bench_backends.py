@@ -0,0 +1,123 @@
+"""
+小さなファイルの一括変換でバックエンドごとの所要時間を比べるベンチマーク
+
+    python benchmarks/bench_backends.py --count 200 --to docx
+
+N 個の小さな Markdown を生成し、次の経路で同じ変換を行って秒数と files/s を表示する。
+
+  - subprocess   : ファイルごとに subprocess.run で pandoc を起動 (比較の基準)
+  - process      : conversion.run_jobs (cli.run_pandoc と同じ asyncio のプロセス経路)
+  - inprocess    : pypandoc_backend.PypandocBackend (pypandoc が無ければ省略)
+  - server       : pandoc_server.PandocServer (pandoc server が起動できなければ省略)
+
+-j で同時実行数を指定できる (subprocess は常に逐次)。
+"""
+from __future__ import annotations
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from conversion import ConversionBackend, ConversionJob, run_jobs  # noqa: E402
+from pandoc_server import PandocServer  # noqa: E402
+from pypandoc_backend import PypandocBackend  # noqa: E402
+
+SAMPLE = """# 文書 {n}
+
+本文の段落です。*強調* と **太字**、`code` を含みます。
+
+- 項目 1
+- 項目 2
+
+| 列 A | 列 B |
+|------|------|
+| {n}  | 2    |
+"""
+
+
+def make_inputs(root: Path, count: int) -> List[str]:
+    paths = []
+    for n in range(count):
+        path = root / f"doc{n:04d}.md"
+        path.write_text(SAMPLE.format(n=n), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def make_jobs(inputs: List[str], out_dir: Path, to: str) -> List[ConversionJob]:
+    return [ConversionJob(inputs=[p], output_file=str(out_dir / (Path(p).stem + "." + to)))
+            for p in inputs]
+
+
+def bench_subprocess(pandoc: str, inputs: List[str], out_dir: Path, to: str, jobs: int) -> int:
+    for job in make_jobs(inputs, out_dir, to):
+        subprocess.run([pandoc, *job.inputs, "-o", job.output_file], check=True,
+                       capture_output=True)
+    return len(inputs)
+
+
+def _bench_runner(backend: Optional[ConversionBackend], pandoc: str, inputs: List[str],
+                  out_dir: Path, to: str, jobs: int) -> int:
+    results = run_jobs(make_jobs(inputs, out_dir, to), pandoc=pandoc, max_jobs=jobs,
+                       backends=[backend] if backend is not None else None)
+    failed = [r.job.name for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f"変換失敗: {', '.join(failed[:5])}")
+    if backend is not None:
+        # 高速経路で変換されたジョブ数 (残りはプロセスにフォールバックした)
+        return sum(1 for r in results if r.backend == backend.name)
+    return len(results)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="pandoc バックエンドのベンチマーク")
+    parser.add_argument("--count", type=int, default=100, help="生成する Markdown の数 (既定: 100)")
+    parser.add_argument("--to", default="docx", help="出力の拡張子 (既定: docx)")
+    parser.add_argument("--pandoc", default="pandoc", help="pandoc のパス (既定: PATH から)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="同時実行数 (既定: 1)")
+    args = parser.parse_args(argv)
+
+    pandoc = shutil.which(args.pandoc)
+    if pandoc is None:
+        print(f"pandoc が見つかりません: {args.pandoc}", file=sys.stderr)
+        return 1
+
+    cases: List[tuple[str, Callable[..., int]]] = [
+        ("subprocess", bench_subprocess),
+        ("process", lambda *a: _bench_runner(None, *a)),
+    ]
+    inprocess = PypandocBackend(log=print)
+    if inprocess.start():
+        cases.append(("inprocess", lambda *a: _bench_runner(inprocess, *a)))
+    server = PandocServer(pandoc=pandoc, pool_size=args.jobs, log=print)
+    if server.start():
+        cases.append(("server", lambda *a: _bench_runner(server, *a)))
+
+    print(f"{args.count} 個の Markdown → {args.to} (-j {args.jobs}, {pandoc})")
+    try:
+        with tempfile.TemporaryDirectory(prefix="pandoctools-bench-") as tmp:
+            root = Path(tmp)
+            inputs = make_inputs(root, args.count)
+            for name, func in cases:
+                out_dir = root / name
+                out_dir.mkdir()
+                start = time.perf_counter()
+                handled = func(pandoc, inputs, out_dir, args.to, args.jobs)
+                elapsed = time.perf_counter() - start
+                print(f"{name:<11} {elapsed:8.2f}s  {args.count / elapsed:8.1f} files/s"
+                      f"  ({handled}/{args.count} をこの経路で変換)")
+    finally:
+        inprocess.stop()
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
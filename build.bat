@@ -23,6 +23,8 @@ if exist "dist\Pandoc GUI Converter.exe" (
     xcopy /E /I /Y "profiles" "dist\profiles\" >nul 2>&1 || echo Warning: Could not copy profiles
     xcopy /E /I /Y "src\filters" "dist\filters\" >nul 2>&1 || echo Warning: Could not copy filters
     xcopy /E /I /Y "src\templates" "dist\templates\" >nul 2>&1 || echo Warning: Could not copy templates
+    if exist "src\typst-packages" xcopy /E /I /Y "src\typst-packages" "dist\typst-packages\" >nul 2>&1 || echo Warning: Could not copy typst-packages
+    if exist "src\preview" xcopy /E /I /Y "src\preview" "dist\preview\" >nul 2>&1 || echo Warning: Could not copy preview
     
     echo.
     echo Executable and resources ready in dist folder:
@@ -30,6 +32,8 @@ if exist "dist\Pandoc GUI Converter.exe" (
     echo - dist\profiles\
     echo - dist\filters\
     echo - dist\templates\ (if exists)
+    echo - dist\typst-packages\ (if exists, see: pandoctools typst-packages sync)
+    echo - dist\preview\ (if exists, local KaTeX / MathJax for the preview)
     echo.
     echo You can now run the executable from the dist folder.
     
@@ -0,0 +1,207 @@
+"""
+読み取り段 (Markdown のパース + 内蔵フィルタ) の AST キャッシュ
+
+GUI で文字サイズ・用紙・余白・エンジンだけを変えて変換し直すと、そのたびに
+`markdown+hard_line_breaks` のパースと default_filter.lua / typst_tag.lua の適用が繰り返される。
+AstCache は変換を 2 段に分け、
+
+  1. 読み取り段: pandoc <入力> --from ... --lua-filter <内蔵> -t json  (結果をキャッシュ)
+  2. 書き出し段: pandoc <キャッシュ.json> --from json <残りの引数>     (毎回実行)
+
+読み取り段の出力を「入力の内容 + 読み取りオプション + 内蔵フィルタの内容 + pandoc 本体」の
+ハッシュをキーにキャッシュディレクトリの ast/ に保存する。書き出し側の設定だけを変えた
+再変換ではパースとフィルタが省かれ、writer とエンジンだけが動く。
+
+読み取り段に移すもの:
+  - --from と読み取り専用のオプション (READER_OPTIONS / READER_FLAGS)
+  - 内蔵フィルタ (RESOURCE_DIR/filters)。ただしユーザーのフィルタ (--lua-filter / --filter) より
+    前にあるものだけ (順序を変えない)。内蔵フィルタは数式しか触らず出力形式 (FORMAT) も
+    見ないので、--citeproc より先に適用しても結果は同じ
+ユーザーのフィルタ・--citeproc・pandoc-crossref は出力形式に依存しうるので書き出し段に残す。
+
+engine: auto でフォールバックを持つジョブ (Typst と LaTeX で内蔵フィルタが異なる) は対象外。
+読み取り段が失敗した場合は元のコマンドのまま変換する (エラーは pandoc 本体に報告させる)。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from bibcache import file_digest
+from common import CACHE_DIR, RESOURCE_DIR
+from conversion import ConversionJob
+
+AST_CACHE_DIR = CACHE_DIR / "ast"
+# 保持するエントリ数の上限 (古いものから消す)
+MAX_ENTRIES = 200
+
+# 値を取る読み取り専用オプション
+READER_OPTIONS = {
+    "--from", "-f", "--read", "-r", "--tab-stop", "--abbreviations",
+    "--default-image-extension", "--indented-code-classes", "--shift-heading-level-by",
+    "--track-changes",
+}
+READER_FLAGS = {"--preserve-tabs", "--file-scope", "--strip-comments"}
+# フィルタ (出現順に適用される) を指定するオプション
+_FILTER_OPTIONS = {"--lua-filter", "-L", "--filter", "-F"}
+
+LogCallback = Callable[[str], None]
+
+
+def _option(args: List[str], i: int) -> Tuple[str, Optional[str], int]:
+    """args[i] を (オプション名, 値, 次の位置) に分ける (--opt=value / --opt value)."""
+    arg = args[i]
+    if arg.startswith("--") and "=" in arg:
+        name, value = arg.split("=", 1)
+        return name, value, i + 1
+    if i + 1 < len(args):
+        return arg, args[i + 1], i + 2
+    return arg, None, i + 1
+
+
+def split_args(args: List[str], builtin_dir: Optional[Path] = None) -> Tuple[List[str], List[str], List[str]]:
+    """pandoc 引数を (読み取りオプション, 内蔵フィルタのパス, 書き出し段の引数) に分ける."""
+    builtin_dir = (builtin_dir or RESOURCE_DIR / "filters").resolve()
+    reader: List[str] = []
+    filters: List[str] = []
+    writer: List[str] = []
+    user_filter_seen = False
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        name = arg.split("=", 1)[0] if arg.startswith("--") else arg
+        if name in READER_FLAGS:
+            reader.append(arg)
+            i += 1
+        elif name in READER_OPTIONS:
+            j = _option(args, i)[2]
+            reader.extend(args[i:j])
+            i = j
+        elif arg[:2] in ("-f", "-r") and len(arg) > 2:
+            # -fmarkdown 形式
+            reader.append(arg)
+            i += 1
+        elif name in _FILTER_OPTIONS:
+            name, value, j = _option(args, i)
+            builtin = (name in ("--lua-filter", "-L") and value is not None
+                       and Path(value).resolve().parent == builtin_dir)
+            if builtin and not user_filter_seen:
+                filters.append(value)
+            else:
+                user_filter_seen = True
+                writer.extend(args[i:j])
+            i = j
+        else:
+            writer.append(arg)
+            i += 1
+    return reader, filters, writer
+
+
+class AstCache:
+    """読み取り段の出力 (pandoc JSON AST) のキャッシュ."""
+
+    def __init__(self, cache_dir: Optional[Path] = None, pandoc: str = "pandoc",
+                 builtin_dir: Optional[Path] = None, log: Optional[LogCallback] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else AST_CACHE_DIR
+        self.pandoc = pandoc
+        self.builtin_dir = builtin_dir
+        self.log = log or (lambda text: None)
+        self._pandoc_id: Optional[str] = None
+
+    def _pandoc_identity(self) -> Optional[str]:
+        """pandoc 本体の識別子 (パス + mtime + サイズ)。AST の形式は版によって変わるのでキーに含める."""
+        if self._pandoc_id is None:
+            path = shutil.which(self.pandoc)
+            if path is None:
+                return None
+            st = os.stat(path)
+            self._pandoc_id = f"{os.path.realpath(path)}:{st.st_mtime_ns}:{st.st_size}"
+        return self._pandoc_id
+
+    def key(self, job: ConversionJob, reader: List[str], filters: List[str]) -> Optional[str]:
+        pandoc_id = self._pandoc_identity()
+        if pandoc_id is None:
+            return None
+        try:
+            digests = [file_digest(p) for p in [*job.pandoc_inputs, *filters]]
+        except OSError:
+            return None
+        payload = json.dumps([pandoc_id, reader, len(job.inputs), digests])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def prepare(self, job: ConversionJob, convert: bool = True) -> bool:
+        """job を読み取り段のキャッシュ (ast_input / ast_args) を使う形にする。使えなければ False.
+
+        convert=False のときはキャッシュ済みの場合だけ使う。
+        """
+        if job.fallback_args is not None or job.ast_input is not None:
+            return False
+        reader, filters, writer = split_args(job.extra_args, self.builtin_dir)
+        key = self.key(job, reader, filters)
+        if key is None:
+            return False
+        cached = self.cache_dir / f"{key}.json"
+        if cached.exists():
+            # 最近使ったものを残すよう mtime を更新する
+            os.utime(cached)
+            self.log(f"AST キャッシュを使います: {job.name}\n")
+        elif not convert or not self._read(job, reader, filters, cached):
+            return False
+        job.ast_input, job.ast_args = str(cached), writer
+        return True
+
+    def _read(self, job: ConversionJob, reader: List[str], filters: List[str], cached: Path) -> bool:
+        """読み取り段を実行して cached に書く."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f"{cached.name}.{os.getpid()}.{id(job)}.tmp")
+        cmd = [self.pandoc, *job.pandoc_inputs, "-o", str(tmp), "--to", "json", *reader]
+        for f in filters:
+            cmd.extend(["--lua-filter", f])
+        self.log(f"読み取り段を実行中 (AST をキャッシュ): {job.name}\n")
+        try:
+            r = subprocess.run(cmd, cwd=job.cwd(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError:
+            return False
+        if r.returncode != 0 or not tmp.exists():
+            # エラーはキャッシュを使わない元のコマンドで pandoc 本体に出させる
+            tmp.unlink(missing_ok=True)
+            return False
+        # パース時の警告はここでしか出ない (キャッシュを使う次回以降は表示されない)
+        if r.stderr:
+            self.log(r.stderr.decode("utf-8", errors="replace"))
+        os.replace(tmp, cached)
+        return True
+
+    def prune(self, keep: int = MAX_ENTRIES) -> None:
+        """古いエントリを消して keep 件に収める."""
+        try:
+            entries = sorted(self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime,
+                             reverse=True)
+        except OSError:
+            return
+        for path in entries[keep:]:
+            path.unlink(missing_ok=True)
+
+
+def prepare_jobs(jobs: List[ConversionJob], pandoc: str = "pandoc", max_workers: int = 1,
+                 convert: bool = True, log: Optional[LogCallback] = None) -> int:
+    """ジョブ群に読み取り段のキャッシュを使わせる (CLI / GUI 共通)。使えたジョブ数を返す.
+
+    キャッシュに無いジョブの読み取り段は max_workers 並列で実行する。
+    """
+    cache = AstCache(pandoc=pandoc, log=log)
+    if max_workers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            used = sum(pool.map(lambda job: cache.prepare(job, convert=convert), jobs))
+    else:
+        used = sum(cache.prepare(job, convert=convert) for job in jobs)
+    if convert:
+        cache.prune()
+    return used
@@ -0,0 +1,201 @@
+"""
+参考文献の前処理キャッシュ (BibTeX/BibLaTeX → CSL JSON)
+
+--citeproc は変換のたびに .bib 全体をパースし直す。数万件規模のデータベースでは
+これが変換時間の大半を占めるため、
+
+  1. .bib を内容ハッシュをキーに一度だけ CSL JSON へ変換してキャッシュする
+     (pandoc <bib> -f biblatex -t csljson)
+  2. 必要なら文書が引用しているキーだけに絞り込んだ CSL JSON を作る (prune)
+
+を行い、ジョブの --bibliography をキャッシュ側の JSON に差し替える。
+キャッシュはキャッシュディレクトリの bib/ に置く。変換に失敗した場合は元の .bib のまま実行する。
+
+バッチでは 1 つの BibCache を全ジョブで共有し、.bib のハッシュ計算と CSL JSON の
+パースは 1 回だけ行う (id → エントリの索引をメモリに持つ)。各ジョブには引用キーで
+絞った小さな JSON を渡すので、citeproc のコストはデータベースの大きさではなく
+引用数に比例する。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from common import CACHE_DIR
+from conversion import ConversionJob
+from deps import scan_references
+
+BIB_CACHE_DIR = CACHE_DIR / "bib"
+
+# 拡張子 → pandoc の reader (pandoc 自身の --bibliography と同じ対応)
+_BIB_READERS = {".bib": "biblatex", ".bibtex": "bibtex"}
+
+# pandoc の引用構文 [@key] / @key / -@key / @{key}。メールアドレス等 (直前が英数字) は除く
+_CITE_RE = re.compile(r"(?<![\w@])-?@(?:\{([^}]+)\}|([\w][\w:.#$%&\-+?<>~/]*[\w]|[\w]))")
+# nocite: '@*' (全件を載せる) が指定されていると絞り込めない
+_NOCITE_ALL_RE = re.compile(r"@\*")
+# include 先も引用を含みうるので走査する
+_CITING_SUFFIXES = {".md", ".markdown", ".txt", ".qmd", ".rmd"}
+
+LogCallback = Callable[[str], None]
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cited_keys(paths: Iterable[str]) -> Optional[Set[str]]:
+    """文書群 (include 先を含む) が引用しているキー。nocite: '@*' があれば None (全件必要)."""
+    keys: Set[str] = set()
+    files: List[str] = []
+    for path in paths:
+        files.append(path)
+        files.extend(sorted(p for p in scan_references(path)
+                            if Path(p).suffix.lower() in _CITING_SUFFIXES))
+    for path in dict.fromkeys(files):
+        try:
+            text = Path(path).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        if "@" not in text:
+            continue
+        if _NOCITE_ALL_RE.search(text):
+            return None
+        for braced, plain in _CITE_RE.findall(text):
+            keys.add(braced or plain)
+    return keys
+
+
+def _write_json(path: Path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class BibCache:
+    """.bib → CSL JSON 変換結果のキャッシュ."""
+
+    def __init__(self, cache_dir: Optional[Path] = None, pandoc: str = "pandoc",
+                 log: Optional[LogCallback] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else BIB_CACHE_DIR
+        self.pandoc = pandoc
+        self.log = log or (lambda text: None)
+        # バッチ内で共有する: (bib パス, mtime, size) → CSL JSON パス / CSL JSON パス → {id: エントリ}
+        self._csl_paths: Dict[tuple, Optional[Path]] = {}
+        self._index: Dict[Path, Dict[str, dict]] = {}
+
+    def csl_json(self, bib: str, convert: bool = True) -> Optional[Path]:
+        """bib の CSL JSON (キャッシュ)。変換できなければ None。
+
+        convert=False のときはキャッシュ済みの場合だけ返す (--dry-run 用)。
+        """
+        reader = _BIB_READERS.get(Path(bib).suffix.lower())
+        if reader is None:
+            return None
+        try:
+            st = os.stat(bib)
+        except OSError:
+            return None
+        # 同じバッチ内では stat が変わらない限りハッシュを計算し直さない
+        memo_key = (os.path.abspath(bib), st.st_mtime_ns, st.st_size)
+        if memo_key in self._csl_paths:
+            return self._csl_paths[memo_key]
+        csl = self._convert(bib, reader, convert)
+        if csl is not None or convert:
+            self._csl_paths[memo_key] = csl
+        return csl
+
+    def _convert(self, bib: str, reader: str, convert: bool) -> Optional[Path]:
+        try:
+            digest = file_digest(bib)
+        except OSError:
+            return None
+        cached = self.cache_dir / f"{digest}.json"
+        if cached.exists():
+            return cached
+        if not convert:
+            return None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+        self.log(f"参考文献を CSL JSON に変換中: {Path(bib).name}\n")
+        try:
+            r = subprocess.run([self.pandoc, bib, "-f", reader, "-t", "csljson", "-o", str(tmp)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            self.log(f"参考文献の変換に失敗しました ({e})。元の {Path(bib).name} を使います\n")
+            return None
+        if r.returncode != 0 or not tmp.exists():
+            err = r.stderr.decode("utf-8", errors="replace").strip()
+            self.log(f"参考文献の変換に失敗しました: {err}\n元の {Path(bib).name} を使います\n")
+            tmp.unlink(missing_ok=True)
+            return None
+        os.replace(tmp, cached)
+        return cached
+
+    def pruned(self, csl: Path, keys: Set[str]) -> Path:
+        """CSL JSON を引用キーだけに絞ったファイル (キー集合ごとにキャッシュ)."""
+        key_digest = hashlib.sha256("\n".join(sorted(keys)).encode("utf-8")).hexdigest()[:16]
+        path = csl.with_name(f"{csl.stem}-{key_digest}.json")
+        if not path.exists():
+            index = self.entries(csl)
+            _write_json(path, [index[k] for k in sorted(keys) if k in index])
+        return path
+
+    def entries(self, csl: Path) -> Dict[str, dict]:
+        """CSL JSON の id → エントリ (パースはインスタンスごとに 1 回)."""
+        index = self._index.get(csl)
+        if index is None:
+            with open(csl, "r", encoding="utf-8") as f:
+                index = {e["id"]: e for e in json.load(f) if "id" in e}
+            self._index[csl] = index
+        return index
+
+    def prepare(self, job: ConversionJob, prune: bool = False, convert: bool = True) -> Dict[str, str]:
+        """job の --bibliography をキャッシュ済み CSL JSON に差し替える。
+
+        --citeproc を使うジョブだけが対象。差し替えた対応 (元 → 新) を返す。
+        """
+        if "--citeproc" not in job.extra_args:
+            return {}
+        keys = cited_keys(job.inputs) if prune else None
+        replaced: Dict[str, str] = {}
+        args = list(job.extra_args)
+        for i, arg in enumerate(args[:-1]):
+            if arg != "--bibliography":
+                continue
+            bib = args[i + 1]
+            csl = self.csl_json(bib, convert=convert)
+            if csl is None:
+                continue
+            if keys is not None:
+                csl = self.pruned(csl, keys)
+            args[i + 1] = str(csl)
+            replaced[bib] = str(csl)
+        job.extra_args = args
+        if job.fallback_args and replaced:
+            # engine: auto のフォールバック (LaTeX) 側も同じものを使う
+            job.fallback_args = [replaced.get(arg, arg) if i and job.fallback_args[i - 1] == "--bibliography"
+                                 else arg for i, arg in enumerate(job.fallback_args)]
+        return replaced
+
+
+def prepare_jobs(jobs: List[ConversionJob], prune: bool = False, pandoc: str = "pandoc",
+                 convert: bool = True, log: Optional[LogCallback] = None) -> None:
+    """ジョブ群の参考文献をキャッシュ済み CSL JSON に差し替える (CLI / GUI 共通).
+
+    キャッシュ (ハッシュ・パース結果) はジョブ群全体で共有する。
+    """
+    cache = BibCache(pandoc=pandoc, log=log)
+    for job in jobs:
+        cache.prepare(job, prune=prune, convert=convert)
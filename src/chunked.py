@@ -0,0 +1,253 @@
+"""
+巨大な 1 文書の分割並列変換 (`convert --chunks N`)
+
+pandoc と xelatex はシングルスレッドなので、数百ページの結合文書は 1 コアで
+何十分もかかる。本モジュールは変換を 2 段に分ける:
+
+  1. 入力をトップレベル見出しで N 個のチャンクに分け、各チャンクを並列に
+     LaTeX / Typst の本文 (standalone でない断片) へ変換する
+     (Markdown の読み込み・Lua フィルタ・画像の取り出しが並列化される)
+  2. 断片を raw ブロック (```{=latex} / ```{=typst}) として 1 つの Markdown に並べ、
+     元の引数 (テンプレート・ヘッダ・--pdf-engine) で 1 回だけ組版する
+
+節番号・式番号 (\\tag)・目次・脚注番号は最終パスのエンジンが文書全体で数えるため連続する。
+
+LaTeX の最終パスは raw ブロックしか見ないので、pandoc のテンプレートが本文の要素に応じて
+読み込むパッケージ (graphicx・longtable/booktabs・コードの Shaded / \\KeywordTok 等) が
+そのままでは入らない。チャンク変換は専用テンプレート (_CHUNK_LATEX_TEMPLATE) で、立った
+テンプレート変数と highlighting-macros を本文の前に書き出させ、最終パスには
+-V <変数>=true と、マクロを書いたファイルの --include-in-header で引き継ぐ。
+Typst も同じく 1 回のコンパイルにまとめる (PDF を結合するより単純で、
+ページ番号も自然に通しになる)。
+
+--citeproc と pandoc-crossref はチャンクをまたぐ参照を解決できないため対象外。
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from conversion import ConversionJob
+
+# チャンク変換 (本文だけを作る段) に引き継ぐ引数。値を取るものは次の要素ごと残す
+_BODY_OPTIONS_WITH_VALUE = {"--from", "-f", "-r", "--read", "--lua-filter", "-L",
+                            "--shift-heading-level-by", "--top-level-division",
+                            "--columns", "--tab-stop", "--metadata", "-M",
+                            "--default-image-extension"}
+_BODY_FLAG_PREFIXES = ("--wrap=", "--from=", "--shift-heading-level-by=",
+                       "--top-level-division=", "--columns=", "--lua-filter=",
+                       "--default-image-extension=", "--metadata=")
+
+# 分割変換できる出力形式 (raw LaTeX / Typst ブロックが最終出力に残るもの)
+CHUNKABLE_FORMATS = {"pdf", "latex", "tex", "typst"}
+
+# LaTeX writer が本文の内容に応じて立てるテンプレート変数 (パッケージの読み込みに使われる)
+LATEX_CONTENT_VARIABLES = ("graphics", "tables", "multirow", "svg", "strikeout", "subfigure",
+                           "verbatim-in-note")
+_VARS_MARK = "%% pandoctools-chunk-vars:"
+_MACROS_BEGIN = "%% pandoctools-chunk-highlighting-begin"
+_MACROS_END = "%% pandoctools-chunk-highlighting-end"
+# チャンク変換 (LaTeX) 用のテンプレート: 立った変数とハイライト用マクロ、本文の順に書く
+_CHUNK_LATEX_TEMPLATE = (
+    _VARS_MARK + "".join(f"$if({v})$ {v}$endif$" for v in LATEX_CONTENT_VARIABLES) + "\n"
+    "$if(highlighting-macros)$\n"
+    + _MACROS_BEGIN + "\n"
+    "$highlighting-macros$\n"
+    + _MACROS_END + "\n"
+    "$endif$\n"
+    "$body$\n"
+)
+
+_FENCE_RE = re.compile(r"^(`{3,}|~{3,})")
+_ATX_RE = re.compile(r"^(#{1,6})[ \t]+\S")
+_YAML_START = "---"
+_YAML_END = ("---", "...")
+
+
+def unsupported_reason(extra_args: List[str]) -> Optional[str]:
+    """分割変換できない設定なら理由を返す."""
+    if "--citeproc" in extra_args:
+        return "--citeproc (参考文献リストがチャンクごとに分かれる)"
+    for i, arg in enumerate(extra_args):
+        if arg == "--filter" and i + 1 < len(extra_args) and "crossref" in extra_args[i + 1]:
+            return "pandoc-crossref (チャンクをまたぐ相互参照を解決できない)"
+    return None
+
+
+def split_front_matter(text: str) -> Tuple[str, str]:
+    """先頭の YAML メタデータブロックと本文に分ける."""
+    lines = text.splitlines(keepends=True)
+    if not lines or lines[0].rstrip() != _YAML_START:
+        return "", text
+    for i in range(1, len(lines)):
+        if lines[i].rstrip() in _YAML_END:
+            return "".join(lines[:i + 1]), "".join(lines[i + 1:])
+    return "", text
+
+
+def split_sections(text: str) -> List[str]:
+    """本文をトップレベル見出しの直前で分割する (コードブロック内の # は無視).
+
+    トップレベルは文書中で最も浅い ATX 見出しのレベル。先頭の見出し前の部分は
+    最初の要素になる。
+    """
+    lines = text.splitlines(keepends=True)
+    fence = None
+    headings: List[Tuple[int, int]] = []  # (行番号, レベル)
+    for i, line in enumerate(lines):
+        m = _FENCE_RE.match(line)
+        if m:
+            if fence is None:
+                fence = m.group(1)[0] * len(m.group(1))
+            elif line.startswith(fence):
+                fence = None
+            continue
+        if fence is None:
+            h = _ATX_RE.match(line)
+            if h:
+                headings.append((i, len(h.group(1))))
+    if not headings:
+        return [text]
+    top = min(level for _, level in headings)
+    cuts = [i for i, level in headings if level == top]
+    if cuts[0] != 0:
+        cuts.insert(0, 0)
+    cuts.append(len(lines))
+    return ["".join(lines[a:b]) for a, b in zip(cuts, cuts[1:]) if a < b]
+
+
+def group_sections(sections: List[str], chunks: int) -> List[str]:
+    """連続する節を大きさがなるべく揃うよう chunks 個以下にまとめる."""
+    chunks = max(1, min(chunks, len(sections)))
+    total = sum(len(s) for s in sections)
+    groups: List[str] = []
+    current: List[str] = []
+    size = 0
+    for i, section in enumerate(sections):
+        current.append(section)
+        size += len(section)
+        remaining_groups = chunks - len(groups) - 1
+        remaining_sections = len(sections) - i - 1
+        if remaining_groups > 0 and (size >= total * (len(groups) + 1) / chunks
+                                     or remaining_sections == remaining_groups):
+            groups.append("".join(current))
+            current = []
+    if current:
+        groups.append("".join(current))
+    return groups
+
+
+def body_args(extra_args: List[str]) -> List[str]:
+    """チャンク変換に引き継ぐ引数 (読み込み・フィルタ関連だけ)."""
+    kept: List[str] = []
+    it = iter(extra_args)
+    for arg in it:
+        if arg in _BODY_OPTIONS_WITH_VALUE:
+            value = next(it, None)
+            if value is not None:
+                kept.extend([arg, value])
+        elif arg.startswith(_BODY_FLAG_PREFIXES):
+            kept.append(arg)
+    return kept
+
+
+def raw_block(body: str, fmt: str) -> str:
+    """本文を raw ブロックにする (本文中のどのフェンスより長いフェンスを使う)."""
+    longest = max((len(m) for m in re.findall(r"`{3,}", body)), default=2)
+    fence = "`" * (longest + 1)
+    return f"{fence}{{={fmt}}}\n{body.rstrip()}\n{fence}\n"
+
+
+def split_chunk_output(text: str) -> Tuple[List[str], str, str]:
+    """LaTeX のチャンク出力を (立った変数, highlighting-macros, 本文) に分ける.
+
+    _CHUNK_LATEX_TEMPLATE の印が無ければ全体を本文とみなす。
+    """
+    if not text.startswith(_VARS_MARK):
+        return [], "", text
+    first, _, rest = text.partition("\n")
+    variables = first[len(_VARS_MARK):].split()
+    macros = ""
+    if rest.startswith(_MACROS_BEGIN + "\n"):
+        macros, sep, after = rest[len(_MACROS_BEGIN) + 1:].partition(_MACROS_END + "\n")
+        if sep:
+            rest = after
+        else:
+            macros = ""
+    return variables, macros.strip(), rest
+
+
+def read_inputs(inputs: List[str]) -> Tuple[str, str]:
+    """入力群を pandoc と同じく空行区切りで連結し、(YAML メタデータ群, 本文) を返す."""
+    fronts: List[str] = []
+    bodies: List[str] = []
+    for path in inputs:
+        text = Path(path).read_text(encoding="utf-8")
+        front, body = split_front_matter(text)
+        if front:
+            fronts.append(front)
+        bodies.append(body)
+    return "\n".join(fronts), "\n\n".join(bodies)
+
+
+class ChunkPlan:
+    """1 ジョブを「チャンク変換ジョブ群 + 最終組版ジョブ」に分ける計画."""
+
+    def __init__(self, job: ConversionJob, chunks: int, work_dir: str, typst: bool):
+        self.job = job
+        self.work_dir = Path(work_dir)
+        self.fmt = "typst" if typst else "latex"
+        self.front, body = read_inputs(job.pandoc_inputs)
+        self.pieces = group_sections(split_sections(body), chunks)
+        self.assembled = self.work_dir / "assembled.md"
+        self.macros = self.work_dir / "highlighting.tex"
+
+    def chunk_jobs(self) -> List[ConversionJob]:
+        """各チャンクを本文断片へ変換するジョブ (Markdown は work_dir に書き出す)."""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        ext = "typ" if self.fmt == "typst" else "tex"
+        args = body_args(self.job.extra_args) + ["-t", self.fmt]
+        if self.fmt == "latex":
+            # raw LaTeX 内の画像は最終パスで pandoc が取り出さないので、ここで絶対パスに取り出す
+            args += ["--extract-media", str((self.work_dir / "media").resolve())]
+            # 最終パスに引き継ぐテンプレート変数とマクロも書き出させる
+            template = self.work_dir / "chunk-template.latex"
+            template.write_text(_CHUNK_LATEX_TEMPLATE, encoding="utf-8")
+            args += ["--standalone", f"--template={template.resolve()}"]
+        jobs = []
+        for i, piece in enumerate(self.pieces):
+            src = self.work_dir / f"chunk-{i:03d}.md"
+            src.write_text(self.front + ("\n" if self.front else "") + piece, encoding="utf-8")
+            jobs.append(replace(
+                self.job, inputs=[str(src)], input_copies=None,
+                output_file=str(self.work_dir / f"chunk-{i:03d}.{ext}"),
+                extra_args=list(args), working_dir=self.job.cwd(),
+                label=f"{self.job.name} [chunk {i + 1}/{len(self.pieces)}]"))
+        return jobs
+
+    def final_job(self, chunk_jobs: List[ConversionJob]) -> ConversionJob:
+        """断片を raw ブロックとして並べた文書を、元の引数で 1 回だけ組版するジョブ.
+
+        LaTeX ではチャンク変換で立ったテンプレート変数とハイライト用マクロを引数に足す。
+        """
+        blocks: List[str] = []
+        variables: List[str] = []
+        macros = ""
+        for j in chunk_jobs:
+            output = Path(j.output_file).read_text(encoding="utf-8")
+            found, chunk_macros, body = split_chunk_output(output)
+            variables += [v for v in found if v not in variables]
+            macros = macros or chunk_macros
+            blocks.append(raw_block(body, self.fmt))
+        text = (self.front + "\n" if self.front else "") + "\n".join(blocks)
+        self.assembled.write_text(text, encoding="utf-8")
+        extra_args = list(self.job.extra_args)
+        for variable in variables:
+            extra_args += ["-V", f"{variable}=true"]
+        if macros:
+            self.macros.write_text(macros + "\n", encoding="utf-8")
+            extra_args += ["--include-in-header", str(self.macros.resolve())]
+        return replace(self.job, inputs=[str(self.assembled)], input_copies=None,
+                       extra_args=extra_args, working_dir=self.job.cwd())
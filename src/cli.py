@@ -14,20 +14,52 @@ GUI と同じプリセット (プロファイル) / 標準書き出し設定を
   python src/cli.py convert input.md
   python src/cli.py convert input.md --profile compact -o out.pdf
   python src/cli.py convert input.md --engine typst --dry-run
+  python src/cli.py convert input.md --engine auto
   python src/cli.py convert a.md b.md --batch --output-dir out/
+  python src/cli.py convert *.md --batch -j 4 --output-dir out/
+  python src/cli.py submit --queue /mnt/share/q *.md --batch --output-dir out/
+  python src/cli.py worker --queue /mnt/share/q -j 2
   python src/cli.py profiles
 """
 from __future__ import annotations
 
 import argparse
+import asyncio
+import contextlib
+import hashlib
 import os
-import subprocess
+import shutil
 import sys
+from dataclasses import replace
 from pathlib import Path
-from typing import List, Optional
+from typing import IO, Iterator, List, Optional
 
 # src/ をスクリプトディレクトリとして実行する前提 (python src/cli.py ...)
-from common import RESOURCE_DIR
+from common import CACHE_DIR, RESOURCE_DIR
+from conversion import STATUS_OK, STATUS_TIMEOUT, ConversionJob, JobResult, pandoc_version, run_jobs
+from scheduler import ORDER_GIVEN, ORDERS, AdaptiveLimiter, RunHistory, order_jobs
+from astcache import prepare_jobs as prepare_ast
+from bibcache import prepare_jobs
+from chunked import CHUNKABLE_FORMATS, ChunkPlan, unsupported_reason
+from deps import DependencyDB
+from engine_select import apply_auto_engine, localize_jobs
+from fonts import (
+    ENGINE_LATEX,
+    FontCheck,
+    check_fonts,
+    ensure_warm,
+    fontconfig_index,
+    typst_families,
+    typst_font_path,
+    warm,
+)
+from pandoc_server import BACKEND_PROCESS, BACKEND_SERVER, PandocServer
+from pypandoc_backend import BACKEND_AUTO, BACKEND_INPROCESS, PypandocBackend
+from report import REPORT_FORMATS, RunReport
+from resources import prepare_jobs as prepare_resources, resource_path
+from scratch import SCRATCH_AUTO, SCRATCH_NONE, resolve_scratch
+from typst_packages import PROBLEM_TEXT, PackageError, PackageStore, typst_tool_paths
+from work_queue import DEFAULT_LEASE, DEFAULT_POLL, QueueWorker, WorkQueue, iter_wait
 from engines import LogicalConfig, get_adapter, is_typst_mode
 from config import (
     get_available_profiles,
@@ -35,10 +67,13 @@ from config import (
     is_v2_profile,
     profile_to_logical_config,
     profile_extras,
+    profile_path,
 )
 
 # bibliography とみなす拡張子 (GUI と同じ挙動)
 _BIB_SUFFIXES = {".bib"}
+# --backend の選択肢
+BACKENDS = (BACKEND_AUTO, BACKEND_PROCESS, BACKEND_INPROCESS, BACKEND_SERVER)
 
 
 # --- 表示ユーティリティ -------------------------------------------------------
@@ -61,63 +96,281 @@ def _eprint(*args, **kwargs) -> None:
 # --- pandoc 実行 --------------------------------------------------------------
 
 def _check_pandoc() -> bool:
-    try:
-        r = subprocess.run(
-            ["pandoc", "--version"],
-            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-        )
-        return r.returncode == 0
-    except FileNotFoundError:
-        return False
-
-
-def _resource_path(input_files: List[str]) -> str:
-    """入力ファイル群のディレクトリを os.pathsep 区切りで結合 (重複除去・ソート)."""
-    dirs = {str(Path(f).parent.resolve()) for f in input_files}
-    return os.pathsep.join(sorted(dirs))
-
+    return pandoc_version() is not None
 
-def run_pandoc(input_files: List[str], output_file: str, extra_args: List[str],
-               dry_run: bool = False) -> int:
-    """pandoc を 1 回実行する。実行コマンドを常に表示する。
 
-    戻り値は pandoc の終了コード (dry-run 時は 0)。
-    """
+def _make_job(input_files: List[str], output_file: str, extra_args: List[str],
+              label: str = "", timeout: float = 0, idle_timeout: float = 0,
+              profile: str = "", scratch_dir: Optional[str] = None) -> ConversionJob:
     input_files = [str(Path(f).resolve()) for f in input_files]
-    output_file = str(Path(output_file).resolve())
-    resource_path = _resource_path(input_files)
-    # SVG/Inkscape がローカル画像へ直接アクセスできるよう作業ディレクトリを入力側に置く
-    working_dir = str(Path(input_files[0]).parent.resolve())
-
-    cmd = (
-        ["pandoc", *input_files, "-o", output_file,
-         "--resource-path", resource_path]
-        + extra_args
+    return ConversionJob(
+        inputs=input_files,
+        output_file=str(Path(output_file).resolve()),
+        extra_args=list(extra_args),
+        resource_path=resource_path(input_files),
+        timeout=timeout or None,
+        idle_timeout=idle_timeout or None,
+        label=label,
+        profile=profile,
+        scratch_dir=scratch_dir,
     )
 
+
+def _print_job(job: ConversionJob) -> None:
     print("COMMAND:")
-    print("  " + _format_command(cmd))
-    print(f"CWD: {working_dir}")
+    print("  " + _format_command(job.command()))
+    print(f"CWD: {job.cwd()}")
+
+
+def _mib(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+def _print_result(result: JobResult) -> None:
+    output_file = result.job.output_file
+    print(f"exit code: {result.exit_code}")
+    if result.backend:
+        print(f"backend: {result.backend}")
+    if result.attempts:
+        print("engine: " + " -> ".join(f"{a['engine']} {a['status']} ({a['duration']:.1f}s)"
+                                       for a in result.attempts))
+    if result.job.scratch_dir and result.metrics:
+        print(f"scratch: {result.job.scratch_dir} (peak {_mib(result.metrics.get('scratch_bytes', 0))}, "
+              f"dest {_mib(result.metrics.get('dest_bytes', 0))})")
+    if Path(output_file).exists():
+        print(f"output: {output_file}")
+    else:
+        print(f"output: {output_file} (生成されませんでした)")
+
+
+def run_conversions(jobs: List[ConversionJob], dry_run: bool = False, max_jobs: int = 1,
+                    order: str = ORDER_GIVEN, report: Optional[RunReport] = None,
+                    deps: Optional[DependencyDB] = None, backend: str = BACKEND_PROCESS,
+                    ast_cache: bool = False, resource_index: bool = False,
+                    summarize: bool = True) -> int:
+    """ジョブ群を変換コア (conversion.ConversionRunner) で実行する。
+
+    実行コマンドを常に表示する。戻り値は最初に失敗したジョブの終了コード (全成功 / dry-run 時は 0)。
+    max_jobs=0 は適応スケジューラ (-j auto: 負荷と空きメモリに応じて並列度を決める)。
+    order は投入順 (given / lpt / sjf)。所要時間の見込みは実行履歴 (無ければ入力サイズ) から求める。
+    report を渡すとジョブの完了ごとに JSON Lines のレコードを書き出す。summarize=False なら
+    summary レコードは書かない (1 回の実行で何度も呼ぶ run_chunked 用。呼び出し側が最後に書く)。
+    deps を渡すと (--incremental) 出力が全依存ファイルより新しいジョブを実行せずに済ませる。
+    backend=server はローカルの pandoc server に送れるジョブをそちらで変換する (残りはプロセス)。
+    backend=inprocess / auto は小さな docx / html / markdown 出力を pypandoc の高速経路で変換する
+    (auto は pypandoc が無ければ黙ってプロセスだけを使う)。
+    ast_cache=True は Markdown のパースと内蔵フィルタ (読み取り段) の結果をキャッシュして使う (astcache.py)。
+    resource_index=True は複数フォルダにまたがるジョブの画像参照を 1 つの索引で絶対パスに解決する (resources.py)。
+    """
+    history = RunHistory()
+    skipped: List[JobResult] = []
+    if deps is not None:
+        pending = []
+        for job in jobs:
+            if deps.is_up_to_date(job):
+                skipped.append(JobResult(job, STATUS_OK, 0, cache="hit"))
+            else:
+                pending.append(job)
+        jobs = pending
+        for r in skipped:
+            print(f"up-to-date: {r.job.name} (skip)")
+            if report and not dry_run:
+                report.job(r)
+        if not jobs:
+            if report and summarize:
+                report.summary(skipped, 0)
+            return 0
+    jobs = order_jobs(jobs, order, history)
+    adaptive = max_jobs == 0
+    parallel = (adaptive or max_jobs > 1) and len(jobs) > 1
+    index = {id(job): i for i, job in enumerate(jobs, 1)}
+
+    def print_header(job: ConversionJob) -> None:
+        if len(jobs) > 1:
+            print(f"\n--- ({index[id(job)]}/{len(jobs)}) {job.name} ---")
+        _print_job(job)
 
     if dry_run:
+        for job in jobs:
+            print_header(job)
+            if report:
+                report.planned(job)
         print("(--dry-run: pandoc は実行していません)")
+        if report and summarize:
+            report.summary([], 0)
         return 0
 
     if not _check_pandoc():
+        for job in jobs:
+            print_header(job)
         _eprint("エラー: pandoc が見つかりません。インストールと PATH 設定を確認してください。")
+        if report and summarize:
+            report.summary([], 127)
         return 127
 
-    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    def on_start(job: ConversionJob) -> None:
+        print_header(job)
+        print("--- pandoc output ---")
+
+    def on_output(job: ConversionJob, stream: str, text: str) -> None:
+        if report and stream == "stderr":
+            report.warnings.feed(job, text)
+        out = sys.stderr if stream == "stderr" else sys.stdout
+        if parallel:
+            # 並列実行時は行ごとにジョブ名を付けて混在を見分けられるようにする
+            text = "".join(f"[{job.name}] {line}" for line in text.splitlines(keepends=True))
+        out.write(text)
+        out.flush()
+
+    def on_finish(result: JobResult) -> None:
+        if deps is not None:
+            result.cache = "miss"
+        if len(jobs) > 1:
+            print(f"--- result: {result.job.name} ({result.status}, {result.duration:.1f}s) ---")
+        else:
+            print("--- result ---")
+        _print_result(result)
+        if report:
+            report.job(result)
+
+    limiter = AdaptiveLimiter(history=history, log=print) if adaptive else None
+    extra = None
+    if backend == BACKEND_SERVER:
+        # 接続数は同時実行数に合わせる (auto では CPU 数)
+        extra = PandocServer(pool_size=(os.cpu_count() or 4) if adaptive else max_jobs, log=print)
+    elif backend in (BACKEND_AUTO, BACKEND_INPROCESS):
+        extra = PypandocBackend(log=print if backend == BACKEND_INPROCESS else None)
+    if extra is not None:
+        extra.start()
+    rewriter = None
+    try:
+        if resource_index:
+            rewriter = prepare_resources(jobs, log=lambda text: print(text, end=""))
+        if ast_cache:
+            # server / pypandoc で変換するジョブは元の入力を読むので対象外
+            prepare_ast([job for job in jobs
+                         if extra is None or not extra.available or extra.prepare(job) is None],
+                        max_workers=(os.cpu_count() or 4) if adaptive else max_jobs,
+                        log=lambda text: print(text, end=""))
+        results = run_jobs(jobs, max_jobs=max(1, max_jobs), limiter=limiter, on_output=on_output,
+                           on_start=on_start, on_finish=on_finish,
+                           backends=[extra] if extra is not None and extra.available else None)
+    finally:
+        if extra is not None:
+            extra.stop()
+        if rewriter is not None:
+            rewriter.cleanup()
+    for r in results:
+        if r.ok:
+            history.record_duration(r.job, r.duration)
+        if r.attempts:
+            history.record_attempts(r.job, r.attempts)
+        if deps is not None and r.ok:
+            deps.record(r.job)
+    history.save()
+    if deps is not None:
+        deps.save()
+    results = skipped + results
+    if len(results) > 1:
+        _print_summary(results)
+    rc = next((r.exit_code for r in results if not r.ok), 0)
+    if report and summarize:
+        report.summary(results, rc)
+    return rc
 
-    print("--- pandoc output ---")
-    proc = subprocess.run(cmd, cwd=working_dir)
-    print("--- result ---")
-    print(f"exit code: {proc.returncode}")
-    if Path(output_file).exists():
-        print(f"output: {output_file}")
+
+def _print_summary(results: List[JobResult]) -> None:
+    """バッチ全体の結果一覧 (タイムアウトしたジョブも理由付きで残す)."""
+    counts: dict = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    print("\n=== summary ===")
+    print("  " + "  ".join(f"{status}: {n}" for status, n in counts.items()))
+    for r in results:
+        if r.status == STATUS_OK:
+            continue
+        detail = f" ({r.reason})" if r.status == STATUS_TIMEOUT and r.reason else ""
+        print(f"  {r.status:<9} exit={r.exit_code:<4} {r.duration:6.1f}s  {r.job.name}{detail}")
+
+
+def run_chunked(job: ConversionJob, cfg: LogicalConfig, chunks: int, max_jobs: int = 1,
+                dry_run: bool = False, report: Optional[RunReport] = None,
+                resource_index: bool = False) -> int:
+    """1 つの大きな文書をトップレベル見出しで分割し、本文を並列に変換してから 1 回で組版する.
+
+    分割できない設定 (--citeproc / pandoc-crossref / raw ブロックが残らない出力形式) では
+    通常どおり 1 ジョブで変換する。
+    engine: auto で Typst を選んだジョブは、Typst で失敗したら LaTeX の引数で分割変換をやり直す。
+    report には各変換 (チャンクを含む) の job レコードだけを書く。summary は呼び出し側が report.results から
+    1 回だけ書く (やり直しや最終組版のたびに summary が増えないように)。
+    """
+    if job.fallback_args is not None:
+        fallback = replace(job, extra_args=list(job.fallback_args), engine=job.fallback_engine,
+                           fallback_args=None, fallback_engine="")
+        job = replace(job, fallback_args=None, fallback_engine="")
+        rc = run_chunked(job, cfg, chunks, max_jobs=max_jobs, dry_run=dry_run, report=report,
+                         resource_index=resource_index)
+        if rc == 0 or dry_run:
+            return rc
+        print(f"\n{job.engine} での変換に失敗したため {fallback.engine} でやり直します")
+        return run_chunked(fallback, cfg, chunks, max_jobs=max_jobs, report=report,
+                           resource_index=resource_index)
+    reason = unsupported_reason(job.extra_args)
+    if reason is None and cfg.output_format not in CHUNKABLE_FORMATS:
+        reason = f"出力形式 {cfg.output_format}"
+    if reason:
+        print(f"--chunks: {reason} は分割変換に対応しないため、通常どおり変換します")
+        return run_conversions([job], dry_run=dry_run, report=report, resource_index=resource_index,
+                               summarize=False)
+    if dry_run:
+        print(f"--chunks: 最大 {chunks} チャンクに分割して並列変換し、最後に 1 回だけ組版します")
+        return run_conversions([job], dry_run=True, report=report, summarize=False)
+
+    # 作業ディレクトリは出力ごとに固定 (失敗時は次回実行まで中間ファイルを残す)
+    key = hashlib.sha256(job.output_file.encode("utf-8")).hexdigest()[:16]
+    if job.scratch_dir:
+        work_dir = Path(job.scratch_dir) / "pandoctools" / f"chunks-{key}"
     else:
-        print(f"output: {output_file} (生成されませんでした)")
-    return proc.returncode
+        work_dir = CACHE_DIR / "chunks" / key
+    shutil.rmtree(work_dir, ignore_errors=True)
+    typst = job.engine == "typst" if job.engine else is_typst_mode(cfg)
+    # チャンクは作業ディレクトリに書き出すので、画像参照は分割前に解決しておく
+    rewriter = prepare_resources([job], log=lambda text: print(text, end="")) if resource_index else None
+    try:
+        plan = ChunkPlan(job, chunks, str(work_dir), typst=typst)
+    finally:
+        if rewriter is not None:
+            rewriter.cleanup()
+            job.input_copies = None
+    if len(plan.pieces) < 2:
+        print("--chunks: トップレベル見出しが 1 つ以下のため、通常どおり変換します")
+        return run_conversions([job], report=report, resource_index=resource_index, summarize=False)
+
+    chunk_jobs = plan.chunk_jobs()
+    print(f"=== 分割変換: {len(chunk_jobs)} チャンクを並列に本文へ変換 ===")
+    # -j 未指定 (1) ならチャンク数だけ並列にする
+    # チャンクの結果も job レコードに残す (失敗したチャンクをレポートから辿れるように)
+    rc = run_conversions(chunk_jobs, max_jobs=len(chunk_jobs) if max_jobs == 1 else max_jobs,
+                         report=report, summarize=False)
+    if rc != 0:
+        _eprint(f"チャンクの変換に失敗しました。中間ファイル: {work_dir}")
+        return rc
+    print("\n=== 最終組版 (1 パス) ===")
+    rc = run_conversions([plan.final_job(chunk_jobs)], report=report, summarize=False)
+    if rc == 0:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        _eprint(f"結合文書: {plan.assembled}")
+    return rc
+
+
+def run_pandoc(input_files: List[str], output_file: str, extra_args: List[str],
+               dry_run: bool = False) -> int:
+    """pandoc を 1 回実行する。実行コマンドを常に表示する。
+
+    戻り値は pandoc の終了コード (dry-run 時は 0)。
+    """
+    return run_conversions([_make_job(input_files, output_file, extra_args)], dry_run=dry_run)
 
 
 # --- 入力ファイルの仕分け / 出力パス決定 --------------------------------------
@@ -202,7 +455,7 @@ def _apply_overrides(cfg: LogicalConfig, args: argparse.Namespace) -> LogicalCon
 
 
 def _print_config(cfg: LogicalConfig) -> None:
-    adapter = get_adapter(cfg)
+    adapter = get_adapter(cfg, *typst_tool_paths(RESOURCE_DIR))
     print("RESOLVED CONFIG:")
     print(f"  adapter        : {adapter.name}  (typst_mode={is_typst_mode(cfg)})")
     fields = [
@@ -224,22 +477,23 @@ def _print_config(cfg: LogicalConfig) -> None:
 
 # --- サブコマンド: convert ----------------------------------------------------
 
-def cmd_convert(args: argparse.Namespace) -> int:
+def _plan_convert(args: argparse.Namespace) -> Optional[tuple[LogicalConfig, List[ConversionJob]]]:
+    """convert / submit 共通: 引数から LogicalConfig とジョブ群を組み立てる (エラー時は None)."""
     inputs, bibs = _split_inputs(args.inputs)
     if not inputs:
         _eprint("エラー: 変換対象の入力ファイル (Markdown 等) がありません。")
-        return 2
+        return None
     for f in inputs + bibs:
         if not Path(f).exists():
             _eprint(f"エラー: ファイルが存在しません: {f}")
-            return 2
+            return None
 
     # プロファイル → LogicalConfig
     try:
         profile_data = resolve_profile(args.profile)
     except ValueError as e:
         _eprint(str(e))
-        return 2
+        return None
     cfg = profile_to_logical_config(profile_data)
     cfg.bibliography_files.extend(bibs)
     cfg = _apply_overrides(cfg, args)
@@ -247,7 +501,9 @@ def cmd_convert(args: argparse.Namespace) -> int:
     extras = profile_extras(profile_data)
     schema = "v2" if is_v2_profile(profile_data) else "v1"
 
-    adapter = get_adapter(cfg)
+    # submit では typst のパッケージ / フォントの置き場所も worker 側で決める (work_queue.QueueWorker)
+    typst_paths = typst_tool_paths(RESOURCE_DIR) if hasattr(args, "scratch") else (None, None)
+    adapter = get_adapter(cfg, *typst_paths)
     extra_args = adapter.build_args(cfg, RESOURCE_DIR)
     ext = adapter.output_extension(cfg)
 
@@ -266,27 +522,91 @@ def cmd_convert(args: argparse.Namespace) -> int:
         merge = False
 
     default_dir = str(Path(inputs[0]).parent.resolve())
+    # タイムアウト (CLI フラグ > プロファイル)
+    job_opts = {
+        "timeout": extras["timeout"] if args.timeout is None else args.timeout,
+        "idle_timeout": extras["idle_timeout"] if args.idle_timeout is None else args.idle_timeout,
+        "profile": args.profile,
+        # submit では worker 側で決める
+        "scratch_dir": resolve_scratch(args.scratch) if hasattr(args, "scratch") else None,
+    }
 
     # 出力ファイル名のベース (プロファイルの output_filename / --output より弱い)
     profile_name = extras["output_filename"]
 
-    rc = 0
+    jobs: List[ConversionJob] = []
     if len(inputs) == 1:
         stem = profile_name or Path(inputs[0]).stem
         out = _output_path(stem, ext, args.output, args.output_dir, default_dir)
-        rc = run_pandoc(inputs, out, extra_args, dry_run=args.dry_run)
+        jobs.append(_make_job(inputs, out, extra_args, **job_opts))
     elif merge:
         stem = profile_name or (Path(inputs[0]).stem + "_merged")
         out = _output_path(stem, ext, args.output, args.output_dir, default_dir)
-        rc = run_pandoc(inputs, out, extra_args, dry_run=args.dry_run)
+        jobs.append(_make_job(inputs, out, extra_args, **job_opts))
     else:
-        # batch: 各ファイルを個別変換
-        for i, f in enumerate(inputs, 1):
+        # batch: 各ファイルを個別変換 (-j で並列)
+        for f in inputs:
             stem = Path(f).stem
             out = _output_path(stem, ext, None, args.output_dir, default_dir)
-            print(f"\n--- ({i}/{len(inputs)}) {Path(f).name} ---")
-            r = run_pandoc([f], out, extra_args, dry_run=args.dry_run)
-            rc = rc or r
+            jobs.append(_make_job([f], out, extra_args, label=Path(f).name, **job_opts))
+
+    # engine: auto: ジョブごとに Typst / LaTeX を選んで引数を差し替える
+    apply_auto_engine(jobs, cfg, RESOURCE_DIR, log=print, typst_paths=typst_paths)
+
+    # --citeproc: .bib をキャッシュ済み CSL JSON に差し替える (dry-run では変換しない)
+    if cfg.citeproc and cfg.bibliography_files and getattr(args, "bib_cache", False):
+        # 既定ではバッチ (複数ジョブ) のときに文書ごとの引用キーで絞り込む
+        prune = args.prune_bib if args.prune_bib is not None else len(jobs) > 1
+        prepare_jobs(jobs, prune=prune, convert=not args.dry_run,
+                     log=lambda text: print(text, end=""))
+    return cfg, jobs
+
+
+@contextlib.contextmanager
+def _report_stream(path: Optional[str]) -> Iterator[IO[str]]:
+    """レポートの書き込み先。標準出力に書くときは人間向けの表示を stderr へ逃がす."""
+    if path in (None, "-"):
+        stream = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            yield stream
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            yield f
+
+
+def cmd_convert(args: argparse.Namespace) -> int:
+    if args.report is None:
+        return _convert(args, None)
+    with _report_stream(args.report_file) as stream:
+        return _convert(args, stream)
+
+
+def _convert(args: argparse.Namespace, report_stream: Optional[IO[str]]) -> int:
+    planned = _plan_convert(args)
+    if planned is None:
+        return 2
+    cfg, jobs = planned
+    report = None
+    if report_stream is not None:
+        report = RunReport(report_stream, argv=getattr(args, "argv", sys.argv[1:]),
+                           profile=args.profile, config=cfg)
+    if cfg.output_format == "pdf" and not args.dry_run:
+        # 初回だけフォント索引を作っておく (以降の変換がフォント探索で待たない)
+        if ensure_warm(log=print) is not None:
+            # 集めたフォントのディレクトリは今できたので、Typst の --font-path を付け直す
+            localize_jobs(jobs, typst_tool_paths(RESOURCE_DIR))
+    deps = None
+    if args.incremental:
+        deps = DependencyDB(extra_files=[str(profile_path(args.profile) or "")])
+    if args.chunks > 1 and len(jobs) == 1:
+        rc = run_chunked(jobs[0], cfg, args.chunks, max_jobs=args.jobs, dry_run=args.dry_run,
+                         report=report, resource_index=args.resource_index)
+        if report:
+            report.summary(report.results, rc)
+    else:
+        rc = run_conversions(jobs, dry_run=args.dry_run, max_jobs=args.jobs, order=args.order,
+                             report=report, deps=deps, backend=args.backend,
+                             ast_cache=args.ast_cache, resource_index=args.resource_index)
 
     if rc != 0 and not args.dry_run:
         _print_failure_hint(cfg)
@@ -312,6 +632,63 @@ def _print_failure_hint(cfg: LogicalConfig) -> None:
         )
 
 
+# --- サブコマンド: submit / worker (共有ディレクトリキュー) ---------------------
+
+def cmd_submit(args: argparse.Namespace) -> int:
+    planned = _plan_convert(args)
+    if planned is None:
+        return 2
+    cfg, jobs = planned
+    jobs = order_jobs(jobs, args.order)
+    if args.dry_run:
+        for job in jobs:
+            _print_job(job)
+        print("(--dry-run: キューには投入していません)")
+        return 0
+
+    queue = WorkQueue(args.queue)
+    ids = queue.submit(jobs)
+    print(f"submitted: {len(ids)} job(s) -> {Path(args.queue).resolve()}")
+    for job_id, job in zip(ids, jobs):
+        print(f"  {job_id}  {job.name}")
+    if not args.wait:
+        return 0
+
+    # 全ジョブの終了を待ち、convert と同じ形式で結果をまとめる
+    names = {job_id: job.name for job_id, job in zip(ids, jobs)}
+    rc = 0
+    counts: dict = {}
+    for job_id, res in iter_wait(queue, ids, poll=args.poll):
+        counts[res["status"]] = counts.get(res["status"], 0) + 1
+        print(f"--- result: {names[job_id]} ({res['status']}, {res['duration']:.1f}s, "
+              f"{res['worker']}) ---")
+        if res["status"] != STATUS_OK:
+            print(f"  log: {Path(args.queue).resolve() / 'done' / (job_id + '.log')}")
+            rc = rc or res["exit_code"]
+    print("\n=== summary ===")
+    print("  " + "  ".join(f"{status}: {n}" for status, n in counts.items()))
+    return rc
+
+
+def cmd_worker(args: argparse.Namespace) -> int:
+    if not _check_pandoc():
+        _eprint("エラー: pandoc が見つかりません。インストールと PATH 設定を確認してください。")
+        return 127
+    ensure_warm(log=print)
+    queue = WorkQueue(args.queue, lease=args.lease)
+    worker = QueueWorker(queue, max_jobs=args.jobs, poll=args.poll, log=print)
+    print(f"worker {worker.name}: queue={Path(args.queue).resolve()} jobs={worker.max_jobs} "
+          f"lease={args.lease:g}s")
+    try:
+        asyncio.run(worker.run(exit_when_empty=args.exit_when_empty))
+    except KeyboardInterrupt:
+        # 実行中のジョブはリース切れで他の worker が拾い直す
+        print("interrupted")
+        return 130
+    print(f"worker {worker.name}: processed {worker.processed} job(s)")
+    return 0
+
+
 # --- サブコマンド: profiles ---------------------------------------------------
 
 def cmd_profiles(args: argparse.Namespace) -> int:
@@ -328,11 +705,71 @@ def cmd_profiles(args: argparse.Namespace) -> int:
     return 0
 
 
+# --- サブコマンド: fonts ------------------------------------------------------
+
+def cmd_fonts(args: argparse.Namespace) -> int:
+    if args.action == "warm":
+        record = warm(log=print)
+        for step in record["steps"]:
+            status = "ok" if step["ok"] else "failed"
+            print(f"  {' '.join(step['command'])}: {status} ({step['seconds']:.1f}s)")
+        checks = [FontCheck(**c) for c in record["fonts"]]
+    else:
+        checks = check_fonts(index=fontconfig_index(), typst=typst_families(typst_font_path()))
+    rc = 0
+    for c in checks:
+        engine = "LaTeX" if c.engine == ENGINE_LATEX else "Typst"
+        if c.found is None:
+            status = "?"
+        elif c.found:
+            status = "ok"
+        else:
+            status = "NG"
+            rc = 1
+        print(f"  {status:<3} {engine:<6} {c.name}")
+    font_path = typst_font_path()
+    if font_path is not None:
+        print(f"typst --font-path: {font_path}")
+    if any(c.found is None for c in checks):
+        _eprint("? は確認できなかったもの (fc-list / typst が見つからない)")
+    return rc
+
+
+# --- サブコマンド: typst-packages --------------------------------------------
+
+def cmd_typst_packages(args: argparse.Namespace) -> int:
+    store = PackageStore(Path(args.dir) if args.dir else None)
+    if args.action == "sync":
+        source = Path(args.source).resolve() if args.source else None
+        try:
+            fetched = store.sync(source=source, repin=args.repin, log=print)
+        except PackageError as e:
+            _eprint(f"エラー: {e}")
+            return 1
+        print(f"{len(fetched)} package(s) fetched -> {store.root}")
+    # sync 後も verify と同じ基準で確認して結果を表示する
+    problems = store.verify()
+    if not problems:
+        print("(内蔵テンプレートは Typst パッケージを使っていません)")
+        return 0
+    rc = 0
+    for spec, problem in problems.items():
+        if problem is None:
+            print(f"  ok      {spec}")
+        else:
+            print(f"  NG      {spec}: {PROBLEM_TEXT[problem]}")
+            rc = 1
+    if rc:
+        _eprint(f"`pandoctools typst-packages sync` で {store.root} を揃えてください。")
+    return rc
+
+
 # --- argparse -----------------------------------------------------------------
 
 def _add_override_flags(p: argparse.ArgumentParser) -> None:
     g = p.add_argument_group("プロファイル上書き (指定したものだけ上書き)")
-    g.add_argument("--engine", help="pdf-engine / 組版エンジン (xelatex, lualatex, tectonic, typst ...)")
+    g.add_argument("--engine", help="pdf-engine / 組版エンジン (xelatex, lualatex, tectonic, typst, "
+                                    "auto = Typst で組めれば Typst、だめなら xelatex)")
     g.add_argument("-t", "--to", "--output-format", dest="to",
                    help="出力フォーマット (pdf, typst, docx, html, tex ...)")
     g.add_argument("--fontsize")
@@ -362,6 +799,19 @@ def _add_override_flags(p: argparse.ArgumentParser) -> None:
                    help="任意の pandoc 引数を末尾に追加 (繰り返し可)")
 
 
+def _jobs_arg(value: str) -> int:
+    """-j の値: 正の整数、または auto (= 0: 適応スケジューラ)."""
+    if value.lower() == "auto":
+        return 0
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"整数または auto を指定してください: {value}")
+    if n < 1:
+        raise argparse.ArgumentTypeError("1 以上を指定してください")
+    return n
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="pandoctools",
@@ -377,11 +827,102 @@ def build_parser() -> argparse.ArgumentParser:
     pc.add_argument("--merge", action=argparse.BooleanOptionalAction, default=None,
                     help="複数入力を結合する/しない (既定はプロファイル設定)")
     pc.add_argument("--batch", action="store_true", help="複数入力を個別に変換する")
+    pc.add_argument("-j", "--jobs", type=_jobs_arg, default=1, metavar="N|auto",
+                    help="--batch 時の同時実行数 (既定: 1)。auto は負荷と空きメモリを見て自動調整")
+    pc.add_argument("--order", choices=ORDERS, default=ORDER_GIVEN,
+                    help="--batch の実行順: given=指定順 / lpt=長いジョブから (並列時の総時間短縮) / "
+                         "sjf=短いジョブから (早く結果を確認)。所要時間は過去の実行履歴から推定")
+    pc.add_argument("--chunks", type=int, default=0, metavar="N",
+                    help="1 つの大きな文書をトップレベル見出しで最大 N 個に分割して並列に本文変換し、"
+                         "最後に 1 回だけ組版する (PDF / LaTeX / Typst 出力。--citeproc・crossref は非対応)")
+    pc.add_argument("--scratch", metavar="auto|none|DIR",
+                    help="中間ファイル (pandoc/xelatex の一時ファイル・出力の書きかけ) を置く場所。"
+                         f"既定は環境変数 PANDOCTOOLS_SCRATCH、無ければ {SCRATCH_AUTO} "
+                         f"(Linux で /dev/shm に十分な空きがあれば使う)。{SCRATCH_NONE} で無効")
+    pc.add_argument("--timeout", type=float, metavar="SEC",
+                    help="ジョブごとの壁時計タイムアウト秒 (0 = 無制限, 既定はプロファイル設定)")
+    pc.add_argument("--idle-timeout", type=float, metavar="SEC",
+                    help="出力が途絶えてからハングとみなすまでの秒数 (0 = 無制限, 既定はプロファイル設定)")
+    pc.add_argument("--bib-cache", action=argparse.BooleanOptionalAction, default=True,
+                    help="--citeproc 時、.bib を CSL JSON に変換してキャッシュしたものを使う (既定: 有効)")
+    pc.add_argument("--prune-bib", action=argparse.BooleanOptionalAction, default=None,
+                    help="参考文献を文書が引用しているキーだけに絞ってから citeproc に渡す "
+                         "(既定: --batch で複数ジョブのときだけ絞る)")
+    pc.add_argument("--backend", choices=BACKENDS, default=BACKEND_PROCESS,
+                    help="process = 常にジョブごとに pandoc を起動 (既定) / "
+                         "auto = 小さな docx/html/markdown 出力は pypandoc があればその高速経路、"
+                         "ほかは pandoc プロセス (この経路の pandoc の警告はレポートに残らない) / "
+                         "inprocess = auto と同じだが pypandoc が無いことを表示する / "
+                         "server = pandoc server を 1 つ起動し、PDF 以外でフィルタを使わないジョブを"
+                         "そちらで変換する (大量の小さなファイル向け)")
+    pc.add_argument("--ast-cache", action=argparse.BooleanOptionalAction, default=False,
+                    help="Markdown のパースと内蔵フィルタの結果 (JSON AST) をキャッシュし、書き出し側の設定"
+                         "(文字サイズ・用紙・余白・エンジン) だけを変えた再変換では writer とエンジンだけを実行する")
+    pc.add_argument("--resource-index", action=argparse.BooleanOptionalAction, default=True,
+                    help="入力が複数のフォルダにあるとき、画像参照を実行ごとに 1 つの索引で解決し、"
+                         "絶対パスに書き換えたコピーを pandoc に渡す (各入力のフォルダを優先。"
+                         "候補が複数あれば警告。既定: 有効)")
+    pc.add_argument("--incremental", action="store_true",
+                    help="出力が全依存ファイル (入力・画像・include・.bib・フィルタ/テンプレート・"
+                         "プロファイル) より新しいジョブを省略する (make 相当)")
+    pc.add_argument("--report", choices=REPORT_FORMATS,
+                    help="機械可読なレポートを出力する (json = JSON Lines。ジョブの完了ごとに 1 行)")
+    pc.add_argument("--report-file", metavar="PATH", default="-",
+                    help="レポートの出力先 (既定: - = 標準出力。このとき通常の表示は stderr へ)")
     pc.add_argument("--dry-run", action="store_true", help="実行せずコマンドと設定だけ表示")
     pc.add_argument("--print-config", action="store_true", help="解決後の LogicalConfig を表示")
     _add_override_flags(pc)
     pc.set_defaults(func=cmd_convert)
 
+    ps = sub.add_parser("submit", help="共有ディレクトリのキューに変換ジョブを投入する")
+    ps.add_argument("--queue", required=True, metavar="DIR", help="キューディレクトリ (全 worker から同じパスで見えること)")
+    ps.add_argument("inputs", nargs="+", help="入力ファイル (.md 等。.bib は参考文献として扱う)")
+    ps.add_argument("--profile", default="default", help="プロファイル名 or yml パス (既定: default)")
+    ps.add_argument("-o", "--output", help="出力ファイルパス (拡張子省略時はフォーマットから補完)")
+    ps.add_argument("--output-dir", help="出力ディレクトリ")
+    ps.add_argument("--merge", action=argparse.BooleanOptionalAction, default=None,
+                    help="複数入力を結合する/しない (既定はプロファイル設定)")
+    ps.add_argument("--batch", action="store_true", help="複数入力を個別ジョブとして投入する")
+    ps.add_argument("--order", choices=ORDERS, default=ORDER_GIVEN, help="投入順 (convert と同じ)")
+    ps.add_argument("--timeout", type=float, metavar="SEC", help="ジョブごとの壁時計タイムアウト秒")
+    ps.add_argument("--idle-timeout", type=float, metavar="SEC", help="無出力タイムアウト秒")
+    ps.add_argument("--wait", action="store_true", help="全ジョブの終了を待って結果をまとめる")
+    ps.add_argument("--poll", type=float, default=DEFAULT_POLL, metavar="SEC", help="--wait 時の確認間隔")
+    ps.add_argument("--dry-run", action="store_true", help="投入せずコマンドだけ表示")
+    ps.add_argument("--print-config", action="store_true", help="解決後の LogicalConfig を表示")
+    _add_override_flags(ps)
+    ps.set_defaults(func=cmd_submit)
+
+    pw = sub.add_parser("worker", help="共有ディレクトリのキューからジョブを取り出して変換する")
+    pw.add_argument("--queue", required=True, metavar="DIR", help="キューディレクトリ")
+    pw.add_argument("-j", "--jobs", type=int, default=1, metavar="N", help="この worker の同時実行数 (既定: 1)")
+    pw.add_argument("--lease", type=float, default=DEFAULT_LEASE, metavar="SEC",
+                    help="ハートビートが途絶えたジョブを再投入するまでの秒数 (全 worker で揃えること)")
+    pw.add_argument("--poll", type=float, default=DEFAULT_POLL, metavar="SEC", help="キューの確認間隔")
+    pw.add_argument("--exit-when-empty", action="store_true", help="キューが空になったら終了する")
+    pw.set_defaults(func=cmd_worker)
+
+    pt = sub.add_parser("typst-packages",
+                        help="Typst テンプレートが使うパッケージをローカルに揃える / 確認する (オフライン用)")
+    pt.add_argument("action", choices=("sync", "verify"),
+                    help="sync = 足りない・壊れたパッケージを取得してハッシュを記録 / "
+                         "verify = 揃っていてハッシュが一致するか確認")
+    pt.add_argument("--dir", metavar="DIR",
+                    help="パッケージの置き場所 (既定: 環境変数 PANDOCTOOLS_TYPST_PACKAGES、"
+                         "無ければリソースディレクトリの typst-packages)")
+    pt.add_argument("--from", dest="source", metavar="DIR",
+                    help="sync の取得元 (<namespace>/<name>/<version> 構成のディレクトリ。"
+                         "typst のパッケージキャッシュ等)。省略時は packages.typst.org からダウンロード")
+    pt.add_argument("--repin", action="store_true",
+                    help="manifest.json と異なる内容でも受け入れてハッシュを記録し直す")
+    pt.set_defaults(func=cmd_typst_packages)
+
+    pf = sub.add_parser("fonts", help="テンプレートが使うフォントの確認とフォントキャッシュの事前作成")
+    pf.add_argument("action", choices=("warm", "check"),
+                    help="warm = フォント索引 (fontconfig / luaotfload) を作り、参照フォントを確認して "
+                         "typst 用に集める / check = 参照フォントが見つかるかだけ確認")
+    pf.set_defaults(func=cmd_fonts)
+
     pp = sub.add_parser("profiles", help="利用可能なプロファイル一覧")
     pp.set_defaults(func=cmd_profiles)
 
@@ -405,6 +946,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     _setup_utf8()
     parser = build_parser()
     args = parser.parse_args(argv)
+    args.argv = list(sys.argv[1:] if argv is None else argv)
     if not getattr(args, "command", None):
         parser.print_help()
         return 1
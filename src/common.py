@@ -1,6 +1,7 @@
 """
 共通定数とユーティリティ関数
 """
+import os
 import sys
 from pathlib import Path
 
@@ -13,4 +14,20 @@ if getattr(sys, 'frozen', False):
 else:
     # 開発環境の場合
     BASE_DIR = Path(__file__).resolve().parent.parent
-    RESOURCE_DIR = Path(__file__).resolve().parent
\ No newline at end of file
+    RESOURCE_DIR = Path(__file__).resolve().parent
+
+
+def _default_cache_dir() -> Path:
+    """実行履歴・各種キャッシュの保存先 (PANDOCTOOLS_CACHE_DIR で上書き可)."""
+    override = os.environ.get("PANDOCTOOLS_CACHE_DIR")
+    if override:
+        return Path(override)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "pandoctools"
+
+
+# ディレクトリは書き込む側が必要になった時点で作成する
+CACHE_DIR = _default_cache_dir()
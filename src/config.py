@@ -21,7 +21,7 @@ v1 形式 (旧、互換読込):
 """
 import yaml
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 
 from common import BASE_DIR
 from engines import LogicalConfig
@@ -60,6 +60,9 @@ PROFILE_BASELINE: Dict[str, Any] = {
     # UI 専用 (LogicalConfig には含めない)
     "merge_files": True,
     "output_filename": "",
+    # 実行制御 (秒, 0 = 無制限)。壁時計 / 無出力 (ハング検出) タイムアウト
+    "timeout": 0,
+    "idle_timeout": 0,
 }
 
 
@@ -156,14 +159,33 @@ def resolve_profile(name_or_path: str) -> Dict[str, Any]:
     return load_profile(name_or_path)
 
 
+def profile_path(name_or_path: str) -> Optional[Path]:
+    """resolve_profile が読む YAML ファイルのパス (組み込み既定値のみの場合は None)."""
+    p = Path(name_or_path)
+    if p.suffix.lower() in ('.yml', '.yaml') and p.exists():
+        return p.resolve()
+    candidate = PROFILE_DIR / f'{name_or_path}.yml'
+    return candidate if candidate.exists() else None
+
+
 def profile_extras(data: Dict[str, Any]) -> Dict[str, Any]:
-    """LogicalConfig に含まれない UI 専用項目 (merge_files / output_filename) を取り出す."""
+    """LogicalConfig に含まれない UI 専用項目 (merge_files / output_filename / タイムアウト) を取り出す."""
     return {
         "merge_files": bool(data.get("merge_files", True)),
         "output_filename": str(data.get("output_filename", "") or ""),
+        "timeout": _seconds(data.get("timeout")),
+        "idle_timeout": _seconds(data.get("idle_timeout")),
     }
 
 
+def _seconds(value: Any) -> float:
+    """タイムアウト秒を float に正規化 (未指定・不正値・負値は 0 = 無制限)."""
+    try:
+        return max(0.0, float(value or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
 def profile_to_logical_config(data: Dict[str, Any]) -> LogicalConfig:
     """プロファイル辞書 (v1/v2) を LogicalConfig に変換する."""
     if is_v2_profile(data):
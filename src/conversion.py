@@ -0,0 +1,528 @@
+"""
+Qt 非依存の非同期変換コア (asyncio)
+
+CLI (cli.py) と GUI (pandoc_process.PandocWorker) はどちらもこのモジュールで
+pandoc を起動する。スケジューリング / 同時実行数の制限 / タイムアウト / キャンセル /
+出力のストリーミングをここに一本化し、呼び出し側は表示だけを担当する。
+
+- ConversionJob    : 1 回の pandoc 実行 (入力群 → 出力 1 ファイル) の記述
+- JobResult        : 実行結果 (状態・終了コード・所要時間)
+- ConversionRunner : asyncio.create_subprocess_exec でジョブ群を実行する
+
+ConversionRunner に backends (ConversionBackend: pandoc server など、プロセスを起動しない経路) を
+渡すと、引き受けられるジョブはそちらで変換する。引き受けられない・失敗したジョブは通常どおり
+pandoc プロセスで実行する。
+
+ジョブが fallback_args を持つ場合 (engine: auto で Typst を選んだとき)、pandoc が失敗したら
+その引数 (LaTeX 系) で 1 度だけやり直し、各エンジンでの結果を JobResult.attempts に残す。
+
+出力は常に一時ファイル (出力先ディレクトリ内、またはスクラッチ) に書かせ、成功したときだけ
+出力パスへ atomic に置き換える。失敗・キャンセルで書きかけのファイルが残ることはない。
+
+CLI は asyncio.run(...) (run_jobs) で直接駆動し、GUI はバックグラウンドスレッド上の
+イベントループで駆動して結果を Qt シグナルに変換する。
+"""
+from __future__ import annotations
+
+import asyncio
+import codecs
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from scratch import (
+    dir_size,
+    discard,
+    make_job_dir,
+    publish,
+    replace_output,
+    scratch_env,
+    temp_output_path,
+)
+
+# ジョブの終了状態
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_CANCELLED = "cancelled"
+STATUS_ERROR = "error"  # pandoc を起動できなかった等
+
+# pandoc 自身の終了コードと区別するための疑似終了コード (coreutils timeout / シェルの慣習に合わせる)
+EXIT_TIMEOUT = 124
+EXIT_NOT_FOUND = 127
+EXIT_CANCELLED = 130
+
+# タイムアウト理由 (JobResult.reason)
+REASON_WALL_CLOCK = "wall-clock"
+REASON_NO_OUTPUT = "no-output"
+
+_READ_CHUNK = 4096
+# タイムアウト監視の最大間隔 (秒)
+_WATCH_INTERVAL = 1.0
+# プロセスツリーを kill した後、パイプの EOF を待つ上限 (秒)
+_DRAIN_GRACE = 5.0
+# スクラッチ使用量のサンプリング間隔 (秒)
+_SCRATCH_SAMPLE = 0.5
+
+
+@dataclass
+class ConversionJob:
+    """pandoc 1 回分の実行内容."""
+
+    inputs: List[str]
+    output_file: str
+    extra_args: List[str] = field(default_factory=list)
+    # --resource-path に渡す文字列 (None なら付けない)。区切り方は呼び出し側が決める
+    resource_path: Optional[str] = None
+    # 作業ディレクトリ (None なら先頭入力のディレクトリ)
+    working_dir: Optional[str] = None
+    # 壁時計タイムアウト秒 (None / 0 は無制限)
+    timeout: Optional[float] = None
+    # 無出力タイムアウト秒: stdout/stderr がこの時間途絶えたらハングとみなす (None / 0 は無制限)
+    idle_timeout: Optional[float] = None
+    # ログ表示用の名前
+    label: str = ""
+    # 実行履歴 (メモリ使用量など) の集計キーにするプロファイル名
+    profile: str = ""
+    # スクラッチ領域の親ディレクトリ (None なら使わない)。scratch.resolve_scratch で決める
+    scratch_dir: Optional[str] = None
+    # 使うエンジン名 (engine: auto で決めたもの。記録用、空なら記録しない)
+    engine: str = ""
+    # 失敗 (STATUS_FAILED) したときにやり直す引数とそのエンジン名 (None ならやり直さない)
+    fallback_args: Optional[List[str]] = None
+    fallback_engine: str = ""
+    # 読み取り段 (Markdown のパースと内蔵フィルタ) のキャッシュ済み AST と、それを読む書き出し段の引数。
+    # 設定されていれば inputs / extra_args の代わりに `<ast_input> --from json <ast_args>` で実行する (astcache.py)
+    ast_input: Optional[str] = None
+    ast_args: Optional[List[str]] = None
+    # 画像参照を絶対パスに書き換えた入力のコピー (resources.py)。設定されていれば inputs の代わりに読む
+    input_copies: Optional[List[str]] = None
+
+    @property
+    def pandoc_inputs(self) -> List[str]:
+        """pandoc に渡す入力 (書き換えたコピーがあればそちら)."""
+        return self.input_copies if self.input_copies is not None else self.inputs
+
+    def command(self, pandoc: str = "pandoc", output: Optional[str] = None,
+                prepared: bool = True) -> List[str]:
+        """実行する pandoc フルコマンド (output で書き込み先を差し替えられる).
+
+        prepared=False は AST キャッシュや入力のコピーを使わない元のコマンド (依存判定など設定の比較用)。
+        """
+        if prepared and self.ast_input is not None:
+            cmd = [pandoc, self.ast_input, "-o", output or self.output_file, "--from", "json"]
+            args = self.ast_args or []
+        else:
+            inputs = self.pandoc_inputs if prepared else self.inputs
+            cmd = [pandoc, *inputs, "-o", output or self.output_file]
+            args = self.extra_args
+        if self.resource_path:
+            cmd.extend(["--resource-path", self.resource_path])
+        return cmd + list(args)
+
+    def cwd(self) -> str:
+        # SVG/Inkscape がローカル画像へ直接アクセスできるよう作業ディレクトリを入力側に置く
+        if self.working_dir:
+            return self.working_dir
+        return str(Path(self.inputs[0]).parent.resolve())
+
+    @property
+    def name(self) -> str:
+        return self.label or Path(self.output_file).name
+
+
+@dataclass
+class JobResult:
+    """ConversionJob の実行結果."""
+
+    job: ConversionJob
+    status: str
+    exit_code: int
+    duration: float = 0.0
+    # 補足 (タイムアウト時は REASON_WALL_CLOCK / REASON_NO_OUTPUT)
+    reason: str = ""
+    # キャッシュ利用状況 ("hit" / "miss"。キャッシュ対象外なら "")
+    cache: str = ""
+    # I/O 計測 (scratch_bytes: スクラッチ使用量のピーク / dest_bytes: 出力先へ書いたバイト数)
+    metrics: Dict[str, int] = field(default_factory=dict)
+    # エンジンごとの試行 ({engine, status, exit_code, duration})。job.engine が空なら記録しない
+    attempts: List[Dict[str, Any]] = field(default_factory=list)
+    # pandoc プロセス以外で変換した場合のバックエンド名 (ConversionBackend.name)
+    backend: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status == STATUS_OK
+
+
+# コールバック型: (job, "stdout" | "stderr", テキスト)
+OutputCallback = Callable[[ConversionJob, str, str], None]
+StartCallback = Callable[[ConversionJob], None]
+FinishCallback = Callable[[JobResult], None]
+
+
+class JobLimiter:
+    """ジョブの開始可否を決める同時実行制御 (固定上限)。
+
+    ConversionRunner は各ジョブの前後で acquire / started / release を呼ぶ。
+    負荷に応じて上限を変える実装は scheduler.AdaptiveLimiter を参照。
+    """
+
+    def __init__(self, max_jobs: int = 1):
+        self.max_jobs = max(1, int(max_jobs))
+        # Semaphore は実行中のイベントループ上で生成する (Python 3.9 互換)
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self, job: ConversionJob) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_jobs)
+        await self._sem.acquire()
+
+    def started(self, job: ConversionJob, pid: int) -> None:
+        """プロセス起動直後に呼ばれる (計測用フック)."""
+
+    def release(self, job: ConversionJob, result: JobResult) -> None:
+        if self._sem is not None:
+            self._sem.release()
+
+
+class BackendError(Exception):
+    """バックエンドで変換できなかった (ConversionRunner は pandoc プロセスでやり直す)."""
+
+
+class ConversionBackend:
+    """pandoc プロセスを起動せずに変換する経路の基底 (実装は pandoc_server.PandocServer 等)。
+
+    ConversionRunner はワーカースレッドで prepare() を呼び、引き受けられる (None 以外を返す)
+    ジョブだけ convert() で変換して出力を書く。convert() が BackendError を送出したときは
+    通常どおり pandoc プロセスで実行する。
+    """
+
+    name: str = ""
+
+    def prepare(self, job: ConversionJob) -> Optional[Any]:
+        """job をこのバックエンド用のリクエストにする (引き受けられなければ None)."""
+        return None
+
+    def convert(self, request: Any, timeout: Optional[float] = None) -> Tuple[bytes, List[str]]:
+        """変換して (出力の内容, 警告などのメッセージ行) を返す."""
+        raise NotImplementedError
+
+
+class ConversionRunner:
+    """ConversionJob 群を asyncio で実行する.
+
+    max_jobs で同時実行数を制限する (limiter を渡した場合はそちらに従う)。
+    コールバックはイベントループのスレッドから呼ばれる
+    (GUI 側はシグナル経由でメインスレッドへ渡すこと)。
+    """
+
+    def __init__(self, max_jobs: int = 1, pandoc: str = "pandoc",
+                 on_output: Optional[OutputCallback] = None,
+                 on_start: Optional[StartCallback] = None,
+                 on_finish: Optional[FinishCallback] = None,
+                 limiter: Optional[JobLimiter] = None,
+                 backends: Optional[List[ConversionBackend]] = None):
+        self.limiter = limiter or JobLimiter(max_jobs)
+        self.backends = list(backends or [])
+        self.pandoc = pandoc
+        self.on_output = on_output
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self._procs: Set[asyncio.subprocess.Process] = set()
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """実行中のジョブを停止し、未開始のジョブを取り消す (ループのスレッドから呼ぶ)."""
+        self._cancelled = True
+        for proc in list(self._procs):
+            self._kill(proc)
+
+    async def run_all(self, jobs: List[ConversionJob]) -> List[JobResult]:
+        """全ジョブを実行し、入力順に結果を返す."""
+        return list(await asyncio.gather(*(self.run_job(job) for job in jobs)))
+
+    async def run_job(self, job: ConversionJob) -> JobResult:
+        await self.limiter.acquire(job)
+        result = JobResult(job, STATUS_CANCELLED, EXIT_CANCELLED)
+        try:
+            if not self._cancelled:
+                result = await self._execute_with_fallback(job)
+        finally:
+            self.limiter.release(job, result)
+        if self.on_finish:
+            self.on_finish(result)
+        return result
+
+    # --- 内部 -------------------------------------------------------------------
+
+    async def _execute_with_fallback(self, job: ConversionJob) -> JobResult:
+        """job を実行し、失敗したら fallback_args でやり直す.
+
+        やり直すときは job 自体をフォールバック側の内容 (引数・エンジン名) に書き換えるので、
+        結果の job.command() は最後に実行したコマンドになる。所要時間は全試行の合計。
+        """
+        attempts: List[Dict[str, Any]] = []
+        total = 0.0
+        while True:
+            result = await self._execute(job)
+            total += result.duration
+            if job.engine:
+                attempts.append({"engine": job.engine, "status": result.status,
+                                 "exit_code": result.exit_code,
+                                 "duration": round(result.duration, 3)})
+            # タイムアウトはやり直さない (同じ時間をもう一度待つことになるため)
+            if result.status != STATUS_FAILED or job.fallback_args is None or self._cancelled:
+                break
+            self._emit(job, "stderr", f"{job.engine or 'pandoc'} での変換に失敗したため "
+                                      f"{job.fallback_engine or '代替設定'} でやり直します\n")
+            job.extra_args, job.fallback_args = list(job.fallback_args), None
+            job.engine, job.fallback_engine = job.fallback_engine, ""
+        result.duration = total
+        result.attempts = attempts
+        return result
+
+    async def _execute(self, job: ConversionJob) -> JobResult:
+        started = time.monotonic()
+        Path(job.output_file).parent.mkdir(parents=True, exist_ok=True)
+        for backend in self.backends:
+            result = await self._run_backend(job, backend, started)
+            if result is not None:
+                return result
+        if not job.scratch_dir:
+            # 出力先ディレクトリの一時ファイルに書かせ、成功したときだけ置き換える
+            staged = temp_output_path(job.output_file)
+            try:
+                result = await self._run_process(job, started, output=staged)
+                if result.ok:
+                    try:
+                        result.metrics = {"scratch_bytes": 0, "dest_bytes": os.path.getsize(staged)}
+                        replace_output(staged, job.output_file)
+                    except OSError as e:
+                        self._emit(job, "stderr", f"エラー: 出力ファイルを配置できません ({e})\n")
+                        result.status, result.exit_code = STATUS_ERROR, 1
+                return result
+            finally:
+                discard(staged)
+
+        # スクラッチ: 一時ファイルと出力をスクラッチに置き、成功したら出力先へ atomic に移す
+        job_dir = make_job_dir(job.scratch_dir)
+        staged = os.path.join(job_dir, Path(job.output_file).name)
+        peak = [0]
+        sampler = asyncio.ensure_future(self._sample_scratch(job_dir, peak))
+        try:
+            result = await self._run_process(job, started, output=staged, env=scratch_env(job_dir))
+            sampler.cancel()
+            peak[0] = max(peak[0], dir_size(job_dir))
+            result.metrics = {"scratch_bytes": peak[0], "dest_bytes": 0}
+            if result.ok and os.path.exists(staged):
+                try:
+                    result.metrics["dest_bytes"] = publish(staged, job.output_file)
+                except OSError as e:
+                    self._emit(job, "stderr", f"エラー: 出力ファイルを配置できません ({e})\n")
+                    result.status, result.exit_code = STATUS_ERROR, 1
+            return result
+        finally:
+            sampler.cancel()
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    async def _run_backend(self, job: ConversionJob, backend: ConversionBackend,
+                           started: float) -> Optional[JobResult]:
+        """backend で変換する。引き受けられない / 失敗したら None (呼び出し側がプロセスで実行)."""
+        loop = asyncio.get_running_loop()
+        request = await loop.run_in_executor(None, backend.prepare, job)
+        if request is None or self._cancelled:
+            return None
+        if self.on_start:
+            self.on_start(job)
+        try:
+            data, messages = await loop.run_in_executor(None, backend.convert, request, job.timeout)
+        except BackendError as e:
+            self._emit(job, "stderr", f"{backend.name}: {e} (pandoc を起動して変換し直します)\n")
+            return None
+        duration = time.monotonic() - started
+        if self._cancelled:
+            return JobResult(job, STATUS_CANCELLED, EXIT_CANCELLED, duration)
+        for line in messages:
+            self._emit(job, "stderr", line + "\n")
+        staged = temp_output_path(job.output_file)
+        try:
+            with open(staged, "wb") as f:
+                f.write(data)
+            replace_output(staged, job.output_file)
+        except OSError as e:
+            self._emit(job, "stderr", f"エラー: 出力ファイルを配置できません ({e})\n")
+            return JobResult(job, STATUS_ERROR, 1, duration, backend=backend.name)
+        finally:
+            discard(staged)
+        return JobResult(job, STATUS_OK, 0, duration, backend=backend.name,
+                         metrics={"scratch_bytes": 0, "dest_bytes": len(data)})
+
+    async def _sample_scratch(self, job_dir: str, peak: List[int]) -> None:
+        while True:
+            peak[0] = max(peak[0], await asyncio.get_running_loop().run_in_executor(
+                None, dir_size, job_dir))
+            await asyncio.sleep(_SCRATCH_SAMPLE)
+
+    async def _run_process(self, job: ConversionJob, started: float, output: Optional[str] = None,
+                           env: Optional[Dict[str, str]] = None) -> JobResult:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *job.command(self.pandoc, output=output), cwd=job.cwd(), env=env,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                **_new_group_kwargs(),
+            )
+        except OSError as e:
+            self._emit(job, "stderr", f"エラー: pandoc を起動できません ({e})\n")
+            return JobResult(job, STATUS_ERROR, EXIT_NOT_FOUND, time.monotonic() - started)
+
+        self._procs.add(proc)
+        self.limiter.started(job, proc.pid)
+        if self.on_start:
+            self.on_start(job)
+        activity = [time.monotonic()]  # 最終出力時刻 (pump が更新)
+        pumps = [
+            asyncio.ensure_future(self._pump(job, proc.stdout, "stdout", activity)),
+            asyncio.ensure_future(self._pump(job, proc.stderr, "stderr", activity)),
+        ]
+        try:
+            reason = await self._watch(job, proc, started, activity)
+            # pandoc の子 (xelatex / typst) がパイプを握ったまま残っても固まらないよう上限付きで待つ
+            _, pending = await asyncio.wait(pumps, timeout=_DRAIN_GRACE)
+            for p in pending:
+                p.cancel()
+        except asyncio.CancelledError:
+            # 外側のタスクごと取り消された (GUI 終了時など): 子プロセスを残さない
+            self._kill(proc)
+            for p in pumps:
+                p.cancel()
+            raise
+        finally:
+            self._procs.discard(proc)
+
+        duration = time.monotonic() - started
+        if self._cancelled:
+            return JobResult(job, STATUS_CANCELLED, EXIT_CANCELLED, duration)
+        if reason == REASON_WALL_CLOCK:
+            self._emit(job, "stderr", f"タイムアウト: {job.timeout:g} 秒を超えたため停止しました\n")
+            return JobResult(job, STATUS_TIMEOUT, EXIT_TIMEOUT, duration, reason)
+        if reason == REASON_NO_OUTPUT:
+            self._emit(job, "stderr",
+                       f"タイムアウト: {job.idle_timeout:g} 秒間出力が無いためハングとみなし停止しました\n")
+            return JobResult(job, STATUS_TIMEOUT, EXIT_TIMEOUT, duration, reason)
+        code = proc.returncode if proc.returncode is not None else 1
+        return JobResult(job, STATUS_OK if code == 0 else STATUS_FAILED, code, duration)
+
+    async def _watch(self, job: ConversionJob, proc: asyncio.subprocess.Process,
+                     started: float, activity: List[float]) -> str:
+        """プロセス終了を待ちつつ壁時計 / 無出力タイムアウトを監視する.
+
+        タイムアウトした場合はプロセスツリーを kill して理由を返す (正常終了時は "")。
+        """
+        limits = [t for t in (job.timeout, job.idle_timeout) if t]
+        if not limits:
+            await proc.wait()
+            return ""
+        interval = min([_WATCH_INTERVAL] + [t / 4 for t in limits])
+        waiter = asyncio.ensure_future(proc.wait())
+        try:
+            while True:
+                done, _ = await asyncio.wait({waiter}, timeout=interval)
+                if done:
+                    return ""
+                now = time.monotonic()
+                reason = ""
+                if job.timeout and now - started >= job.timeout:
+                    reason = REASON_WALL_CLOCK
+                elif job.idle_timeout and now - activity[0] >= job.idle_timeout:
+                    reason = REASON_NO_OUTPUT
+                if reason:
+                    self._kill(proc)
+                    await waiter
+                    return reason
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+
+    async def _pump(self, job: ConversionJob, stream: asyncio.StreamReader, name: str,
+                    activity: List[float]) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = await stream.read(_READ_CHUNK)
+            if not chunk:
+                break
+            activity[0] = time.monotonic()
+            text = decoder.decode(chunk)
+            if text:
+                self._emit(job, name, text)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            self._emit(job, name, tail)
+
+    def _emit(self, job: ConversionJob, stream: str, text: str) -> None:
+        if self.on_output:
+            self.on_output(job, stream, text)
+
+    @staticmethod
+    def _kill(proc: asyncio.subprocess.Process) -> None:
+        if proc.returncode is None:
+            kill_process_tree(proc.pid)
+
+
+def _new_group_kwargs() -> dict:
+    """子プロセスを独立したプロセスグループで起動する引数 (ツリーごと kill するため)."""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_process_tree(pid: int) -> None:
+    """pandoc とその子 (xelatex / typst など) をまとめて強制終了する."""
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        # start_new_session=True で起動しているので pgid == pid
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def pandoc_version(pandoc: str = "pandoc", timeout: float = 30) -> Optional[str]:
+    """`pandoc --version` の 1 行目 (例: "pandoc 3.1.11")。起動できない・失敗したら None.
+
+    初回起動はウイルス対策ソフトのスキャン等で数秒かかることがあるので、GUI スレッドからは呼ばないこと。
+    """
+    kwargs = {}
+    if sys.platform == "win32":
+        # ウィンドウアプリ (EXE) からの起動でコンソールを開かない
+        kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+    try:
+        r = subprocess.run([pandoc, "--version"], stdout=subprocess.PIPE,
+                           stderr=subprocess.DEVNULL, timeout=timeout, **kwargs)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if r.returncode != 0:
+        return None
+    lines = r.stdout.decode("utf-8", errors="replace").splitlines()
+    return lines[0].strip() if lines else ""
+
+
+def run_jobs(jobs: List[ConversionJob], **runner_kwargs) -> List[JobResult]:
+    """同期呼び出し用ラッパ (CLI 向け)。runner_kwargs は ConversionRunner にそのまま渡す."""
+    runner = ConversionRunner(**runner_kwargs)
+    return asyncio.run(runner.run_all(jobs))
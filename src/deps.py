@@ -0,0 +1,205 @@
+"""
+変換ジョブの依存ファイル集合と up-to-date 判定 (`convert --incremental`)
+
+make と同じく「出力が全依存ファイルより新しければ変換を省略する」。
+依存集合は変換成功時に 1 度だけ計算して DependencyDB (キャッシュディレクトリの
+deps.json) に保存し、次回以降の判定は保存済みの集合に対する stat だけで行う。
+
+依存ファイル:
+  - 入力ファイル
+  - Markdown から参照される画像 / include されたファイル (再帰的に走査)
+  - EngineAdapter が組み立てた引数に現れるファイル
+    (--bibliography / --lua-filter / --template / --include-in-header / --csl など)
+  - プロファイル YAML
+
+参照されているのに存在しないファイル (書きかけの文書の画像など) は、置かれるはずのパスを
+"missing" に記録し、後からそのどれかが作られたら作り直す。
+pandoc のコマンドライン自体もハッシュで記録し、設定が変わった場合は作り直す。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from common import CACHE_DIR
+from conversion import ConversionJob
+from jsonstore import JsonStore, LogCallback
+
+DEPS_FILE = "deps.json"
+
+# 値としてファイルを取る pandoc オプション
+_FILE_OPTIONS = {
+    "--bibliography", "--lua-filter", "--filter", "--template", "--include-in-header",
+    "-H", "--include-before-body", "-B", "--include-after-body", "-A", "--csl",
+    "--reference-doc", "--metadata-file", "--defaults", "-d", "--css", "-c",
+    "--syntax-definition", "--abbreviations",
+}
+
+# Markdown / 埋め込み LaTeX / HTML 中のファイル参照
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\(\s*<?([^)\s>]+)")
+_HTML_IMG_RE = re.compile(r"<img\b[^>]*\bsrc\s*=\s*[\"']([^\"']+)[\"']", re.IGNORECASE)
+_GRAPHICS_RE = re.compile(r"\\includegraphics\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}")
+_TEX_INCLUDE_RE = re.compile(r"\\(?:input|include)\s*\{([^}]+)\}")
+_BANG_INCLUDE_RE = re.compile(r"^!include\s+(\S+)", re.MULTILINE)
+# ```{.include} ... ``` (include-files.lua 形式): ブロック内の各行がファイル
+_INCLUDE_BLOCK_RE = re.compile(r"^(`{3,}|~{3,})\s*\{[^}]*\.include\b[^}]*\}\s*\n(.*?)^\1",
+                               re.MULTILINE | re.DOTALL)
+
+# include 先として中身まで走査するテキスト形式
+_TEXT_SUFFIXES = {".md", ".markdown", ".txt", ".tex", ".qmd", ".rmd"}
+
+
+def _is_local(ref: str) -> bool:
+    return "://" not in ref and not ref.startswith(("data:", "#", "mailto:"))
+
+
+def _candidates(ref: str, base_dirs: List[Path]) -> List[Path]:
+    """参照 ref が指し得るパス (探す順)。ローカルでない参照は空."""
+    ref = ref.split("#", 1)[0].split("?", 1)[0]
+    if not ref or not _is_local(ref):
+        return []
+    path = Path(ref)
+    candidates: List[Path] = []
+    for candidate in [path] if path.is_absolute() else [d / path for d in base_dirs]:
+        candidates.append(candidate)
+        # \input{chapter} / \includegraphics{fig} は拡張子を省略できる
+        if not candidate.suffix:
+            candidates.extend(candidate.with_suffix(ext)
+                              for ext in (".tex", ".pdf", ".png", ".jpg", ".svg"))
+    return candidates
+
+
+def _resolve(ref: str, base_dirs: List[Path], missing: Optional[Set[str]] = None) -> Optional[Path]:
+    """ref の実際のパス。見つからなければ None で、missing があれば候補をすべて加える."""
+    candidates = _candidates(ref, base_dirs)
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate.resolve()
+    if missing is not None:
+        missing.update(str(c.absolute()) for c in candidates)
+    return None
+
+
+def scan_references(path: str, resource_dirs: Iterable[str] = (),
+                    missing: Optional[Set[str]] = None) -> Set[str]:
+    """Markdown から参照される画像 / include ファイルを再帰的に集める (存在するものだけ).
+
+    missing を渡すと、見つからなかった参照の候補パスをそこに加える。
+    """
+    extra_dirs = [Path(d) for d in resource_dirs if d]
+    found: Set[str] = set()
+    pending = [Path(path).resolve()]
+    visited: Set[Path] = set()
+    while pending:
+        current = pending.pop()
+        if current in visited:
+            continue
+        visited.add(current)
+        try:
+            text = current.read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        base_dirs = [current.parent] + extra_dirs
+        refs: List[str] = []
+        for regex in (_IMAGE_RE, _HTML_IMG_RE, _GRAPHICS_RE):
+            refs.extend(regex.findall(text))
+        includes: List[str] = list(_TEX_INCLUDE_RE.findall(text)) + _BANG_INCLUDE_RE.findall(text)
+        for _, body in _INCLUDE_BLOCK_RE.findall(text):
+            includes.extend(line.strip() for line in body.splitlines()
+                            if line.strip() and not line.lstrip().startswith("//"))
+        for ref in refs + includes:
+            resolved = _resolve(ref.strip(), base_dirs, missing)
+            if resolved is None:
+                continue
+            found.add(str(resolved))
+            if ref in includes and resolved.suffix.lower() in _TEXT_SUFFIXES:
+                pending.append(resolved)
+    return found
+
+
+def argument_files(args: List[str], cwd: str, missing: Optional[Set[str]] = None) -> Set[str]:
+    """pandoc 引数列からファイルを取るオプションの値を集める (存在するものだけ).
+
+    missing を渡すと、存在しないファイルのパスをそこに加える。
+    """
+    found: Set[str] = set()
+    values: List[str] = []
+    it = iter(args)
+    for arg in it:
+        if "=" in arg and arg.split("=", 1)[0] in _FILE_OPTIONS:
+            values.append(arg.split("=", 1)[1])
+        elif arg in _FILE_OPTIONS:
+            values.append(next(it, ""))
+    for value in values:
+        path = Path(value)
+        if not path.is_absolute():
+            path = Path(cwd) / path
+        if path.is_file():
+            found.add(str(path.resolve()))
+        elif value and missing is not None:
+            missing.add(str(path.absolute()))
+    return found
+
+
+def collect_dependencies(job: ConversionJob, extra_files: Iterable[str] = (),
+                         missing: Optional[Set[str]] = None) -> List[str]:
+    """ジョブの依存ファイル一覧 (重複なし・ソート済み).
+
+    missing を渡すと、参照されているのに存在しないファイルの候補パスをそこに加える。
+    """
+    resource_dirs = job.resource_path.split(os.pathsep) if job.resource_path else []
+    deps: Set[str] = {str(Path(f).resolve()) for f in job.inputs}
+    for f in job.inputs:
+        deps |= scan_references(f, resource_dirs, missing)
+    deps |= argument_files(job.extra_args, job.cwd(), missing)
+    deps |= {str(Path(f).resolve()) for f in extra_files if f and Path(f).is_file()}
+    return sorted(deps)
+
+
+def command_digest(job: ConversionJob) -> str:
+    return hashlib.sha256(json.dumps(job.command(prepared=False)).encode("utf-8")).hexdigest()
+
+
+class DependencyDB(JsonStore):
+    """出力ファイルごとの依存集合 + コマンドハッシュを JSON に永続化する.
+
+    保存時は他のプロセスが間に記録した出力の分とマージする (jsonstore.JsonStore)。
+    """
+
+    save_error = "依存関係の保存に失敗しました"
+
+    def __init__(self, path: Optional[Path] = None, extra_files: Iterable[str] = (),
+                 log: Optional[LogCallback] = None):
+        super().__init__(Path(path) if path else CACHE_DIR / DEPS_FILE, log=log)
+        self.extra_files = [str(f) for f in extra_files if f]
+
+    @staticmethod
+    def _key(job: ConversionJob) -> str:
+        return os.path.normcase(os.path.abspath(job.output_file))
+
+    def is_up_to_date(self, job: ConversionJob) -> bool:
+        """保存済みの依存集合に対する stat だけで、変換を省略できるか判定する."""
+        entry = self.data.get(self._key(job))
+        if not entry or entry.get("command") != command_digest(job):
+            return False
+        try:
+            output_mtime = os.stat(job.output_file).st_mtime_ns
+            for dep in entry.get("deps", []):
+                if os.stat(dep).st_mtime_ns > output_mtime:
+                    return False
+        except OSError:
+            return False  # 出力または依存ファイルが消えた
+        # 前回は無かった参照先が作られた
+        return not any(os.path.exists(path) for path in entry.get("missing", []))
+
+    def record(self, job: ConversionJob) -> None:
+        missing: Set[str] = set()
+        self.data[self._key(job)] = {
+            "command": command_digest(job),
+            "deps": collect_dependencies(job, self.extra_files, missing),
+            "missing": sorted(missing),
+        }
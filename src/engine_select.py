@@ -0,0 +1,183 @@
+"""
+組版エンジンの自動選択 (`engine: auto`)
+
+Typst は LaTeX 系より桁違いに速いが、LaTeX でしか通らない記法 (raw LaTeX、
+default_filter.lua が raw LaTeX として渡す align 等の数式環境、pandoc-crossref の参照) を
+含む文書は Typst では崩れる・失敗する。engine: auto はジョブごとに入力を調べ、
+
+  - Typst で組める文書    → Typst で変換し、失敗したら LaTeX (AUTO_FALLBACK_ENGINE) でやり直す
+  - LaTeX が必要な文書    → 最初から LaTeX で変換する (理由を表示)
+
+とする。やり直しは conversion.ConversionRunner が ConversionJob.fallback_args を使って行い、
+各エンジンでの結果と所要時間は JobResult.attempts に残る。
+
+Typst で失敗して LaTeX に切り替わった入力は実行履歴 (scheduler.RunHistory) に記録し、
+入力が変わるまでは次回から Typst を試さない (失敗する Typst の実行時間を毎回払わない)。
+"""
+from __future__ import annotations
+
+import dataclasses
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from conversion import ConversionJob
+from engines import (
+    AUTO_FALLBACK_ENGINE,
+    ENGINE_AUTO,
+    LogicalConfig,
+    get_adapter,
+    localize_typst_args,
+)
+from scheduler import RunHistory
+
+ENGINE_TYPST = "typst"
+
+# 中身を調べる入力 (Markdown 以外は調べずに Typst を試す)
+_TEXT_SUFFIXES = {".md", ".markdown", ".txt", ".rmd", ".qmd"}
+
+# ```{=latex} ... ``` / `...`{=latex} / ```{=tex}
+_RAW_LATEX_RE = re.compile(r"\{=(?:latex|tex)\}")
+# default_filter.lua が RawInline("latex") にする数式環境 (+ eqnarray)
+_MATH_ENV_RE = re.compile(r"\\begin\{(align|gather|multline|equation|flalign|alignat|eqnarray)\*?\}")
+# 本文中の LaTeX コマンド (raw_tex 拡張で raw LaTeX として渡り、Typst では消える)
+_TEX_COMMAND_RE = re.compile(r"\\([A-Za-z]+)")
+# pandoc-crossref のラベルと参照
+_CROSSREF_RE = re.compile(r"(?:\{#|@)(?:fig|eq|tbl|sec|lst):")
+
+_FENCE_RE = re.compile(r"^(```+|~~~+).*?^\1[ \t]*$", re.MULTILINE | re.DOTALL)
+_CODE_SPAN_RE = re.compile(r"(`+)[^`].*?\1", re.DOTALL)
+_DISPLAY_MATH_RE = re.compile(r"\$\$.+?\$\$", re.DOTALL)
+_INLINE_MATH_RE = re.compile(r"\$[^$\n]+\$")
+
+LogCallback = Callable[[str], None]
+
+
+@dataclass
+class EngineChoice:
+    """ジョブ 1 件について選んだエンジン."""
+
+    engine: str
+    # engine で失敗したときにやり直すエンジン (None ならやり直さない)
+    fallback: Optional[str] = None
+    # LaTeX を選んだ理由 (Typst を選んだときは空)
+    reasons: List[str] = field(default_factory=list)
+
+
+def typst_blockers(text: str, crossref: bool = False) -> List[str]:
+    """Markdown 本文のうち Typst では組めない記法 (理由の文言) を返す."""
+    reasons: List[str] = []
+    if _RAW_LATEX_RE.search(text):
+        reasons.append("raw LaTeX ブロック")
+    # コードは記法の判定対象外 (raw ブロックは上で判定済み)
+    body = _CODE_SPAN_RE.sub("", _FENCE_RE.sub("", text))
+    env = _MATH_ENV_RE.search(body)
+    if env:
+        reasons.append(f"数式環境 {env.group(1)}")
+    if crossref and _CROSSREF_RE.search(body):
+        reasons.append("pandoc-crossref の参照")
+    prose = _INLINE_MATH_RE.sub("", _DISPLAY_MATH_RE.sub("", body))
+    command = _TEX_COMMAND_RE.search(prose)
+    if command:
+        reasons.append(f"LaTeX コマンド \\{command.group(1)}")
+    return reasons
+
+
+def config_blockers(cfg: LogicalConfig) -> List[str]:
+    """設定のうち LaTeX を前提とするもの.
+
+    documentclass / classoption 等の LaTeX 専用の値は TypstAdapter が無視するだけなので対象外。
+    """
+    reasons: List[str] = []
+    if cfg.template_file and Path(cfg.template_file).suffix.lower() in (".tex", ".latex"):
+        reasons.append("LaTeX テンプレート")
+    if any(arg.lower().endswith((".tex", ".sty")) for arg in cfg.custom_args):
+        reasons.append("カスタム引数の .tex / .sty")
+    return reasons
+
+
+def choose_engine(cfg: LogicalConfig, inputs: List[str], typst_failed: bool = False) -> EngineChoice:
+    """cfg (engine=auto) と入力から、このジョブで使うエンジンを選ぶ."""
+    if cfg.output_format == ENGINE_TYPST:
+        return EngineChoice(ENGINE_TYPST)
+    if cfg.output_format != "pdf":
+        # PDF 以外ではエンジンは使われない (LaTeX 系の引数で中間形式を出す)
+        return EngineChoice(AUTO_FALLBACK_ENGINE)
+    if cfg.template_file and Path(cfg.template_file).suffix.lower() == ".typ":
+        return EngineChoice(ENGINE_TYPST)
+
+    reasons = config_blockers(cfg)
+    for path in inputs:
+        if Path(path).suffix.lower() not in _TEXT_SUFFIXES:
+            continue
+        try:
+            text = Path(path).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        for reason in typst_blockers(text, crossref=cfg.pandoc_crossref):
+            if reason not in reasons:
+                reasons.append(reason)
+    if typst_failed:
+        reasons.append("前回 Typst で失敗")
+    if reasons:
+        return EngineChoice(AUTO_FALLBACK_ENGINE, reasons=reasons)
+    return EngineChoice(ENGINE_TYPST, fallback=AUTO_FALLBACK_ENGINE)
+
+
+def engine_config(cfg: LogicalConfig, engine: str) -> LogicalConfig:
+    """cfg の engine だけを差し替えたコピー."""
+    return dataclasses.replace(cfg, engine=engine, custom_args=list(cfg.custom_args),
+                               bibliography_files=list(cfg.bibliography_files))
+
+
+def _build_args(cfg: LogicalConfig, engine: str, resource_dir: Path,
+                typst_paths: Tuple[Optional[Path], Optional[Path]]) -> List[str]:
+    resolved = engine_config(cfg, engine)
+    return get_adapter(resolved, *typst_paths).build_args(resolved, resource_dir)
+
+
+def apply_auto_engine(jobs: List[ConversionJob], cfg: LogicalConfig, resource_dir: Path,
+                      history: Optional[RunHistory] = None,
+                      log: Optional[LogCallback] = None,
+                      typst_paths: Tuple[Optional[Path], Optional[Path]] = (None, None)) -> None:
+    """engine=auto のとき、各ジョブの引数を選んだエンジンのものに差し替える.
+
+    Typst を選んだジョブにはフォールバック (LaTeX) の引数も持たせる。
+    typst_paths は Typst に渡す (パッケージ, フォント) の置き場所 (get_adapter と同じ)。
+    cfg.engine が auto でなければ何もしない。
+    """
+    if cfg.engine != ENGINE_AUTO:
+        return
+    log = log or (lambda text: None)
+    history = history if history is not None else RunHistory()
+    args = {}
+    for job in jobs:
+        choice = choose_engine(cfg, job.inputs, typst_failed=history.typst_failed(job))
+        if choice.engine not in args:
+            args[choice.engine] = _build_args(cfg, choice.engine, resource_dir, typst_paths)
+        job.extra_args = list(args[choice.engine])
+        job.engine = choice.engine
+        if choice.fallback:
+            if choice.fallback not in args:
+                args[choice.fallback] = _build_args(cfg, choice.fallback, resource_dir, typst_paths)
+            job.fallback_args = list(args[choice.fallback])
+            job.fallback_engine = choice.fallback
+        else:
+            job.fallback_args, job.fallback_engine = None, ""
+        if choice.reasons:
+            log(f"engine auto: {job.name} -> {choice.engine} ({', '.join(choice.reasons)})")
+        else:
+            log(f"engine auto: {job.name} -> {choice.engine}")
+
+
+def localize_jobs(jobs: List[ConversionJob],
+                  typst_paths: Tuple[Optional[Path], Optional[Path]]) -> None:
+    """組み立て済みのジョブの typst のパッケージ / フォント指定を typst_paths に替える.
+
+    引数を組み立てた後で置き場所が変わったとき (初回の fonts warm、別マシンの worker) に使う。
+    """
+    for job in jobs:
+        job.extra_args = localize_typst_args(job.extra_args, *typst_paths)
+        if job.fallback_args is not None:
+            job.fallback_args = localize_typst_args(job.fallback_args, *typst_paths)
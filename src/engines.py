@@ -9,6 +9,9 @@ EngineAdapter: 論理的な組版設定 (LogicalConfig) を engine 別の Pandoc
   1. LaTeX / Typst で命名の異なる Pandoc 変数 (-V foo=bar) のマッピング
   2. 各 engine で対応外の項目を黙って無視 (C-2-c)
   3. 出力ファイルの拡張子決定 (output_extension)
+
+engine: auto (ENGINE_AUTO) はジョブごとに Typst / LaTeX を選ぶ (engine_select.py)。
+選ぶ前の cfg をそのまま渡された場合は LaTeX 系 (AUTO_FALLBACK_ENGINE) として扱う。
 """
 from __future__ import annotations
 
@@ -25,6 +28,10 @@ _TYPST_PAPER_MAP = {
     "letterpaper": "us-letter",
 }
 
+# engine: auto と、その LaTeX 側 (Typst で組めない / 失敗したとき) のエンジン
+ENGINE_AUTO = "auto"
+AUTO_FALLBACK_ENGINE = "xelatex"
+
 # output_format 名 → 出力ファイル拡張子 (Pandoc 互換)
 _OUTPUT_EXT_MAP = {"typst": "typ"}
 
@@ -72,13 +79,48 @@ def is_typst_mode(cfg: LogicalConfig) -> bool:
     return cfg.engine == "typst" or cfg.output_format == "typst"
 
 
-def get_adapter(cfg: LogicalConfig) -> "EngineAdapter":
-    """LogicalConfig から適切な EngineAdapter インスタンスを返す."""
+def get_adapter(cfg: LogicalConfig, package_path: Optional[Path] = None,
+                font_path: Optional[Path] = None) -> "EngineAdapter":
+    """LogicalConfig から適切な EngineAdapter インスタンスを返す.
+
+    package_path / font_path は Typst に渡すローカルのパッケージ / フォントの置き場所
+    (typst_packages.typst_tool_paths で呼び出し側が決める)。
+    """
     if is_typst_mode(cfg):
-        return TypstAdapter()
+        return TypstAdapter(package_path=package_path, font_path=font_path)
     return LatexAdapter()
 
 
+_TYPST_ENGINE_ARG = "--pdf-engine=typst"
+_TYPST_TOOL_PREFIXES = ("--pdf-engine-opt=--package-path=", "--pdf-engine-opt=--font-path=")
+
+
+def typst_tool_args(package_path: Optional[Path] = None,
+                    font_path: Optional[Path] = None) -> List[str]:
+    """typst (PDF エンジン) にローカルのパッケージ / フォントの置き場所を渡す引数."""
+    args: List[str] = []
+    # @preview パッケージをダウンロードせずローカルの配置から解決させる
+    if package_path is not None:
+        args.append(f"{_TYPST_TOOL_PREFIXES[0]}{package_path}")
+    if font_path is not None:
+        args.append(f"{_TYPST_TOOL_PREFIXES[1]}{font_path}")
+    return args
+
+
+def localize_typst_args(args: List[str], package_path: Optional[Path] = None,
+                        font_path: Optional[Path] = None) -> List[str]:
+    """組み立て済みの引数の typst のパッケージ / フォント指定を、このマシンの置き場所に替える.
+
+    キューの worker が、投入したマシンで解決されたパスの代わりに自分のパスを使うためのもの。
+    --pdf-engine=typst を含まない引数はそのまま返す。
+    """
+    if _TYPST_ENGINE_ARG not in args:
+        return list(args)
+    kept = [arg for arg in args if not arg.startswith(_TYPST_TOOL_PREFIXES)]
+    at = kept.index(_TYPST_ENGINE_ARG) + 1
+    return kept[:at] + typst_tool_args(package_path, font_path) + kept[at:]
+
+
 class EngineAdapter:
     """論理設定 → Pandoc 引数列 を組み立てる抽象基底."""
 
@@ -148,7 +190,8 @@ class LatexAdapter(EngineAdapter):
         args: List[str] = []
         # --pdf-engine は PDF 出力時のみ意味を持つ (A-2-d)
         if cfg.output_format == "pdf" and cfg.engine:
-            args.append(f"--pdf-engine={cfg.engine}")
+            engine = AUTO_FALLBACK_ENGINE if cfg.engine == ENGINE_AUTO else cfg.engine
+            args.append(f"--pdf-engine={engine}")
             args.append("--pdf-engine-opt=-shell-escape")
         if cfg.documentclass:
             args.extend(["-V", f"documentclass={cfg.documentclass}"])
@@ -214,15 +257,23 @@ class TypstAdapter(EngineAdapter):
     - default_filter.lua と pandoc-crossref は LaTeX 専用なのでスキップ (A-2-e, A-2-f)
     - CSL パスは Windows でも `\\` を `/` に正規化 (A-2-g)
     - ユーザー指定テンプレが無いときのみ default_typst.typ を適用
+    - package_path (ローカルのパッケージディレクトリ) を渡されれば --package-path で typst に渡す
+    - font_path (fonts warm で集めたフォント) を渡されれば --font-path で typst に渡す
+      (どちらもディスクの状態に依存するので、build_args の中では調べない)
     """
 
     name = "typst"
 
+    def __init__(self, package_path: Optional[Path] = None, font_path: Optional[Path] = None):
+        self.package_path = package_path
+        self.font_path = font_path
+
     def _engine_specific(self, cfg: LogicalConfig, resource_dir: Path) -> List[str]:
         args: List[str] = []
         # --pdf-engine は PDF 出力時のみ
         if cfg.output_format == "pdf":
-            args.append("--pdf-engine=typst")
+            args.append(_TYPST_ENGINE_ARG)
+            args.extend(typst_tool_args(self.package_path, self.font_path))
 
         if cfg.paper:
             mapped = _TYPST_PAPER_MAP.get(cfg.paper, cfg.paper)
@@ -0,0 +1,129 @@
+"""
+GUI のファイルリスト用モデル
+
+pathlist.PathList をそのまま QAbstractListModel として見せる。行ごとのアイテム
+オブジェクトは作らず、表示名・パスは data() が呼ばれたときに配列から引くだけなので、
+数万行でも追加・並べ替え・移動が軽い。QListView の InternalMove (ドラッグでの並べ替え) は
+moveRows で処理される。
+"""
+from typing import Iterable, List
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from pathlist import SORT_NAME, PathList, display_name
+
+# 旧 QListWidget 版と同じく UserRole (=256) でフルパスを返す
+PATH_ROLE = Qt.ItemDataRole.UserRole
+
+
+class FileListModel(QAbstractListModel):
+    """入力ファイル一覧のモデル."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._list = PathList()
+
+    # --- QAbstractListModel ------------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._list)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._list):
+            return None
+        path = self._list[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return display_name(path)
+        if role in (PATH_ROLE, Qt.ItemDataRole.ToolTipRole):
+            return path
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid():
+            # 行の間へのドロップを受け付ける
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return (Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+                | Qt.ItemFlag.ItemIsDragEnabled)
+
+    def supportedDropActions(self) -> Qt.DropAction:
+        return Qt.DropAction.MoveAction
+
+    def moveRows(self, source_parent: QModelIndex, source_row: int, count: int,
+                 destination_parent: QModelIndex, destination_child: int) -> bool:
+        if source_parent.isValid() or destination_parent.isValid() or count <= 0:
+            return False
+        if not self.beginMoveRows(QModelIndex(), source_row, source_row + count - 1,
+                                  QModelIndex(), destination_child):
+            return False
+        self._list.move_rows(range(source_row, source_row + count), destination_child)
+        self.endMoveRows()
+        return True
+
+    def removeRows(self, row: int, count: int, parent=QModelIndex()) -> bool:
+        if parent.isValid() or count <= 0 or row < 0 or row + count > len(self._list):
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        self._list.remove_rows(range(row, row + count))
+        self.endRemoveRows()
+        return True
+
+    # --- 一覧操作 ------------------------------------------------------------------
+
+    def paths(self) -> List[str]:
+        return self._list.paths()
+
+    def path(self, row: int) -> str:
+        return self._list[row]
+
+    def contains(self, path: str) -> bool:
+        return path in self._list
+
+    def matches(self, row: int, text: str) -> bool:
+        return self._list.matches(row, text)
+
+    def add_paths(self, paths: Iterable[str]) -> int:
+        """末尾に追加し (既にあるパスは無視)、追加した件数を返す."""
+        fresh = self._list.new_paths(paths)
+        if fresh:
+            first = len(self._list)
+            self.beginInsertRows(QModelIndex(), first, first + len(fresh) - 1)
+            self._list.extend(fresh)
+            self.endInsertRows()
+        return len(fresh)
+
+    def set_paths(self, paths: Iterable[str]) -> None:
+        self.beginResetModel()
+        self._list = PathList(paths)
+        self.endResetModel()
+
+    def clear(self) -> None:
+        self.set_paths([])
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        """任意の行をまとめて削除する (連続する範囲ごとに通知)."""
+        ranges: List[List[int]] = []  # [先頭行, 件数] (後ろから)
+        for row in sorted(set(rows), reverse=True):
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+                ranges[-1][1] += 1
+            else:
+                ranges.append([row, 1])
+        for start, count in ranges:
+            self.removeRows(start, count)
+
+    def move_row(self, row: int, to: int) -> bool:
+        """row を to の位置へ動かす (to は移動後の行番号)."""
+        if row == to or not (0 <= row < len(self._list) and 0 <= to < len(self._list)):
+            return False
+        return self.moveRows(QModelIndex(), row, 1, QModelIndex(), to + 1 if to > row else to)
+
+    def sort_paths(self, key: str = SORT_NAME, reverse: bool = False) -> None:
+        """一覧そのものを並べ替える (変換・結合の順序も変わる)."""
+        self.layoutAboutToBeChanged.emit()
+        old = self._list.paths()
+        self._list.sort(key, reverse)
+        new_rows = {path: row for row, path in enumerate(self._list)}
+        for index in self.persistentIndexList():
+            if index.isValid():
+                self.changePersistentIndex(index, self.index(new_rows[old[index.row()]], 0))
+        self.layoutChanged.emit()
@@ -0,0 +1,85 @@
+"""
+GUI 向けフォルダ取り込み
+
+folder_scan.FolderScanner をバックグラウンドスレッドで回し、見つかったファイルを
+バッチごとに Qt シグナルで GUI スレッドへ渡す (PandocWorker と同じく threading.Thread +
+シグナルのキューイング)。GUI 側は batch_found を受けるたびにリストへ追加するので、
+数万ファイルのフォルダでもウィンドウが固まらない。
+
+cancel() は走査の中止を指示するだけでスレッドの終了を待たない (ネットワーク上の
+ディレクトリで scandir が止まっていても GUI は固まらない)。中止後のバッチは捨て、
+スレッドが抜けた時点で finished(..., True) を通知する。
+"""
+import threading
+from typing import Iterable, List, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from folder_scan import DEFAULT_IGNORE, MARKDOWN_EXTENSIONS, FolderScanner
+
+
+class FolderImporter(QObject):
+    """フォルダを走査してファイルパスをバッチで通知するワーカー."""
+
+    # (見つかったパスのリスト, ここまでの件数, 走査したエントリ数)
+    batch_found = pyqtSignal(list, int, int)
+    # (見つかった件数, キャンセルされたか)
+    finished = pyqtSignal(int, bool)
+
+    # スレッド → GUI スレッドの中継用。先頭は取り込みの世代番号で、
+    # 新しい取り込みを始めた後に届いた古い取り込みの通知をここで捨てる
+    _batch = pyqtSignal(int, list, int, int)
+    _done = pyqtSignal(int, int, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._scanners: List[FolderScanner] = []
+        self._thread: Optional[threading.Thread] = None
+        self._generation = 0
+        self._cancelled = False
+        self._batch.connect(self._relay_batch)
+        self._done.connect(self._relay_done)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, folders: List[str], extensions: Iterable[str] = MARKDOWN_EXTENSIONS,
+              ignore: Iterable[str] = DEFAULT_IGNORE, recursive: bool = True):
+        """folders を順に走査する (実行中の取り込みは先に中止する)."""
+        self.cancel()
+        self._generation += 1
+        self._cancelled = False
+        self._scanners = [FolderScanner(f, extensions, ignore, recursive) for f in folders]
+        self._thread = threading.Thread(target=self._thread_main,
+                                        args=(self._generation, list(self._scanners)),
+                                        name="folder-import", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """走査の中止を指示する (待たない)。以降のバッチは届かず、終了時に finished が届く."""
+        for scanner in self._scanners:
+            scanner.cancel()
+        self._cancelled = True
+
+    def _thread_main(self, generation: int, scanners: List[FolderScanner]):
+        found = 0
+        scanned = 0
+        cancelled = False
+        for scanner in scanners:
+            for batch in scanner.batches():
+                found += len(batch)
+                self._batch.emit(generation, batch, found, scanned + scanner.scanned)
+            scanned += scanner.scanned
+            if scanner.cancelled:
+                cancelled = True
+                break
+        self._done.emit(generation, found, cancelled)
+
+    def _relay_batch(self, generation: int, batch: list, found: int, scanned: int):
+        if generation == self._generation and not self._cancelled:
+            self.batch_found.emit(batch, found, scanned)
+
+    def _relay_done(self, generation: int, found: int, cancelled: bool):
+        if generation == self._generation:
+            self._thread = None
+            self.finished.emit(found, cancelled or self._cancelled)
@@ -0,0 +1,113 @@
+"""
+フォルダ内の入力ファイル探索 (GUI のフォルダ取り込み用, Qt 非依存)
+
+リポジトリ全体のような数万ファイルのフォルダでも GUI を止めないよう、
+os.scandir で 1 回ずつディレクトリを読み (stat を追加で呼ばない)、
+見つかったファイルを一定件数 / 一定時間ごとのまとまり (バッチ) で返す。
+呼び出し側 (folder_import.FolderImporter) はこれをバックグラウンドスレッドで回し、
+バッチ単位でファイルリストに追加する。cancel() で途中終了できる。
+"""
+from __future__ import annotations
+
+import fnmatch
+import os
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+# フォルダ選択で取り込む拡張子 (小文字で比較)
+MARKDOWN_EXTENSIONS = (".md", ".markdown", ".mdown", ".mkd")
+
+# 既定で降りないディレクトリ / 拾わないファイル (名前または相対パスに fnmatch)
+DEFAULT_IGNORE = (".*", "node_modules", "__pycache__", "venv", "_build", "build", "dist")
+
+# 1 バッチの最大件数と、件数に満たなくても返す間隔 (秒)
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BATCH_INTERVAL = 0.1
+
+
+def is_ignored(name: str, rel_path: str, patterns: Iterable[str]) -> bool:
+    """名前か (/ 区切りの) 相対パスがいずれかのパターンに一致するか."""
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+
+class FolderScanner:
+    """1 つのフォルダを走査して、拡張子が一致するファイルのパスをバッチで返す.
+
+    順序は決定的で、各ディレクトリ内のファイル (名前順) → サブディレクトリ (名前順) の深さ優先。
+    """
+
+    def __init__(self, root: str, extensions: Iterable[str] = MARKDOWN_EXTENSIONS,
+                 ignore: Iterable[str] = DEFAULT_IGNORE, recursive: bool = True):
+        self.root = os.path.abspath(root)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.ignore = tuple(ignore)
+        self.recursive = recursive
+        # 見たエントリ数 (進捗表示用) と見つけたファイル数
+        self.scanned = 0
+        self.found = 0
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _list_dir(self, path: str) -> Tuple[List[str], List[str]]:
+        """(ファイル, サブディレクトリ) をそれぞれ名前順で返す (読めないディレクトリは空)."""
+        files: List[str] = []
+        dirs: List[str] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    self.scanned += 1
+                    if is_ignored(entry.name, self._rel(entry.path), self.ignore):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            if self.recursive and not entry.is_symlink():
+                                dirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return sorted(files), sorted(dirs)
+
+    def iter_files(self) -> Iterator[str]:
+        stack = [self.root]
+        while stack and not self.cancelled:
+            files, dirs = self._list_dir(stack.pop())
+            for path in files:
+                if self.cancelled:
+                    return
+                self.found += 1
+                yield path
+            stack.extend(reversed(dirs))
+
+    def batches(self, size: int = DEFAULT_BATCH_SIZE,
+                interval: float = DEFAULT_BATCH_INTERVAL) -> Iterator[List[str]]:
+        """size 件ごと、または前回から interval 秒経ったところで溜まった分を返す."""
+        batch: List[str] = []
+        last = time.monotonic()
+        for path in self.iter_files():
+            batch.append(path)
+            now = time.monotonic()
+            if len(batch) >= size or now - last >= interval:
+                yield batch
+                batch = []
+                last = now
+        if batch and not self.cancelled:
+            yield batch
+
+
+def scan_folder(root: str, extensions: Iterable[str] = MARKDOWN_EXTENSIONS,
+                ignore: Iterable[str] = DEFAULT_IGNORE, recursive: bool = True) -> List[str]:
+    """走査結果をまとめて返す (同期版)."""
+    return list(FolderScanner(root, extensions, ignore, recursive).iter_files())
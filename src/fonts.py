@@ -0,0 +1,227 @@
+"""
+フォントの確認とフォントキャッシュの事前構築 (`pandoctools fonts warm`)
+
+内蔵テンプレートはフォントを名前で指定している (latex_header_base.tex の \\setmainfont{XITS} 等、
+default_typst.typ の "New Computer Modern" 等)。まっさらなコンテナでは最初の変換で
+fontconfig (xelatex) / luaotfload (lualatex) の索引作りが走り、その分だけ初回が遅くなる。
+
+warm() はこれを変換の前にまとめて行う:
+
+  1. fc-cache / luaotfload-tool --update で各エンジンの索引を作る (ツールがある場合のみ)
+  2. テンプレートが参照するフォントを fontconfig と typst で探し、見つからないものを報告する
+  3. 見つかったフォントファイルを FONT_DIR/files に集め、Typst には --font-path で渡す
+     (TeX ツリーにしか無いフォントも typst から使える)
+  4. 結果を FONT_DIR/warm.json に記録する
+
+FONT_DIR はキャッシュディレクトリ (PANDOCTOOLS_CACHE_DIR) の fonts/ なので、
+コンテナではキャッシュディレクトリを永続ボリュームに置けば warm は 1 回で済む。
+warm.json が無い (または参照フォントが変わった) ときは、変換前に ensure_warm() が自動で実行する
+(環境変数 PANDOCTOOLS_NO_FONT_WARM=1 で無効)。
+fontconfig / luaotfload の索引自体は各ツールの既定の場所 (~/.cache/fontconfig, TEXMFVAR) に作られる。
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from common import CACHE_DIR, RESOURCE_DIR
+
+FONT_DIR = CACHE_DIR / "fonts"
+MARKER_NAME = "warm.json"
+NO_WARM_ENV = "PANDOCTOOLS_NO_FONT_WARM"
+# 索引作りは初回に数分かかることがある
+TOOL_TIMEOUT = 900
+
+ENGINE_LATEX = "latex"
+ENGINE_TYPST = "typst"
+
+# \setmainfont{XITS} など (行頭の % コメントは除外して探す)
+_LATEX_FONT_RE = re.compile(r"\\set(?:main|sans|mono|math|CJKmain|CJKsans|CJKmono)font(?:\[[^\]]*\])?\{([^}]+)\}")
+# default_typst.typ の既定フォント: `seriffont: ... default: "..." } else { "..." }`
+_TYPST_FONT_KEY_RE = re.compile(r"\s*[\w-]*font\s*:")
+_TYPST_FONT_RE = re.compile(r'(?:default:\s*|else\s*\{\s*)"([^"]+)"')
+
+LogCallback = Callable[[str], None]
+
+
+@dataclass
+class FontCheck:
+    name: str
+    engine: str
+    found: Optional[bool] = None  # None = 確認する手段が無い
+    files: List[str] = field(default_factory=list)
+
+
+def normalize(name: str) -> str:
+    """フォント名の比較用 (空白・ハイフン・大文字小文字を無視)."""
+    return re.sub(r"[\s_-]", "", name).lower()
+
+
+def referenced_fonts(resource_dir: Path = RESOURCE_DIR) -> Dict[str, List[str]]:
+    """内蔵テンプレートが名前で参照しているフォント (engine → 名前のリスト)."""
+    refs: Dict[str, List[str]] = {ENGINE_LATEX: [], ENGINE_TYPST: []}
+    header = resource_dir / "templates" / "latex_header_base.tex"
+    if header.exists():
+        for line in header.read_text(encoding="utf-8").splitlines():
+            code = line.split("%", 1)[0]
+            for name in _LATEX_FONT_RE.findall(code):
+                if name not in refs[ENGINE_LATEX]:
+                    refs[ENGINE_LATEX].append(name)
+    typst = resource_dir / "templates" / "default_typst.typ"
+    if typst.exists():
+        for line in typst.read_text(encoding="utf-8").splitlines():
+            code = line.split("//", 1)[0]
+            if not _TYPST_FONT_KEY_RE.match(code):
+                continue
+            for name in _TYPST_FONT_RE.findall(code):
+                if name not in refs[ENGINE_TYPST]:
+                    refs[ENGINE_TYPST].append(name)
+    return refs
+
+
+def _run(cmd: List[str], timeout: float = TOOL_TIMEOUT) -> Optional[subprocess.CompletedProcess]:
+    try:
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def fontconfig_index() -> Optional[Dict[str, List[str]]]:
+    """fontconfig が知っているファミリ (正規化名 → フォントファイル)。fc-list が無ければ None."""
+    if not shutil.which("fc-list"):
+        return None
+    r = _run(["fc-list", "--format", "%{file}\\t%{family}\\n"], timeout=120)
+    if r is None or r.returncode != 0:
+        return None
+    index: Dict[str, List[str]] = {}
+    for line in r.stdout.decode("utf-8", errors="replace").splitlines():
+        path, _, families = line.partition("\t")
+        for family in families.split(","):
+            files = index.setdefault(normalize(family), [])
+            if path and path not in files:
+                files.append(path)
+    return index
+
+
+def typst_families(font_path: Optional[Path] = None) -> Optional[set]:
+    """typst が使えるファミリ (正規化名, 内蔵フォントを含む)。typst が無ければ None."""
+    if not shutil.which("typst"):
+        return None
+    cmd = ["typst", "fonts"]
+    if font_path is not None and font_path.is_dir():
+        cmd += ["--font-path", str(font_path)]
+    r = _run(cmd, timeout=300)
+    if r is None or r.returncode != 0:
+        return None
+    return {normalize(line) for line in r.stdout.decode("utf-8", errors="replace").splitlines()
+            if line.strip()}
+
+
+def typst_font_path() -> Optional[Path]:
+    """warm で集めたフォントファイルの置き場所 (あれば Typst に --font-path で渡す)."""
+    files = FONT_DIR / "files"
+    if files.is_dir() and any(files.iterdir()):
+        return files
+    return None
+
+
+def _collect(paths: List[str], dest: Path) -> None:
+    """フォントファイルを dest に集める (同じファイルシステムならハードリンク)."""
+    dest.mkdir(parents=True, exist_ok=True)
+    for path in paths:
+        target = dest / Path(path).name
+        if target.exists():
+            continue
+        try:
+            os.link(path, target)
+        except OSError:
+            try:
+                shutil.copy2(path, target)
+            except OSError:
+                continue
+
+
+def check_fonts(resource_dir: Path = RESOURCE_DIR,
+                index: Optional[Dict[str, List[str]]] = None,
+                typst: Optional[set] = None) -> List[FontCheck]:
+    """参照フォントがそれぞれのエンジンから見つかるか."""
+    refs = referenced_fonts(resource_dir)
+    checks: List[FontCheck] = []
+    for name in refs[ENGINE_LATEX]:
+        files = (index or {}).get(normalize(name), [])
+        checks.append(FontCheck(name, ENGINE_LATEX, None if index is None else bool(files), files))
+    for name in refs[ENGINE_TYPST]:
+        files = (index or {}).get(normalize(name), [])
+        if typst is not None:
+            found: Optional[bool] = normalize(name) in typst
+        else:
+            found = None if index is None else bool(files)
+        checks.append(FontCheck(name, ENGINE_TYPST, found, files))
+    return checks
+
+
+def warm(resource_dir: Path = RESOURCE_DIR, log: Optional[LogCallback] = None) -> dict:
+    """フォント索引を作り、参照フォントを確認・収集して warm.json に記録した内容を返す."""
+    log = log or (lambda text: None)
+    steps = []
+    for cmd in (["fc-cache"], ["luaotfload-tool", "--update"]):
+        if not shutil.which(cmd[0]):
+            continue
+        log(f"font cache: {' '.join(cmd)}")
+        started = time.monotonic()
+        r = _run(cmd)
+        steps.append({"command": cmd, "ok": r is not None and r.returncode == 0,
+                      "seconds": round(time.monotonic() - started, 3)})
+
+    index = fontconfig_index()
+    checks = check_fonts(resource_dir, index=index)
+    files_dir = FONT_DIR / "files"
+    _collect([f for c in checks for f in c.files], files_dir)
+    # 集めたファイルを含めて typst から見えるかを確かめる (typst 自身の内蔵フォントも数える)
+    typst = typst_families(files_dir)
+    if typst is not None:
+        checks = check_fonts(resource_dir, index=index, typst=typst)
+
+    record = {
+        "created": time.time(),
+        "referenced": referenced_fonts(resource_dir),
+        "steps": steps,
+        "fonts": [asdict(c) for c in checks],
+    }
+    FONT_DIR.mkdir(parents=True, exist_ok=True)
+    marker = FONT_DIR / MARKER_NAME
+    tmp = marker.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, marker)
+    for c in checks:
+        if c.found is False:
+            log(f"warning: {c.engine} のフォント '{c.name}' が見つかりません")
+    return record
+
+
+def is_warm(resource_dir: Path = RESOURCE_DIR) -> bool:
+    """warm 済みで、参照フォントがその時から変わっていないか."""
+    try:
+        with open(FONT_DIR / MARKER_NAME, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return record.get("referenced") == referenced_fonts(resource_dir)
+
+
+def ensure_warm(resource_dir: Path = RESOURCE_DIR, log: Optional[LogCallback] = None) -> Optional[dict]:
+    """初回だけ warm する (済んでいる / 無効化されていれば None)."""
+    if os.environ.get(NO_WARM_ENV) or is_warm(resource_dir):
+        return None
+    log = log or (lambda text: None)
+    log("初回実行: フォントキャッシュを作成しています (次回以降は不要です)")
+    return warm(resource_dir, log=log)
@@ -0,0 +1,133 @@
+"""
+キャッシュディレクトリ上の共有 JSON (history.json / deps.json) の保存
+
+CLI のバッチ・GUI・キュー worker が同じファイルを同時に読み書きするため、
+読み込んだ時点の内容を覚えておき、保存時には
+
+  1. ロックファイル (<name>.lock) を排他作成してから
+  2. ディスク上の最新の内容を読み直し
+  3. 読み込み以降に自分が変更・削除したキーだけをそこへ反映し
+  4. 同じディレクトリの一時ファイルに書いて os.replace する
+
+ことで、他のプロセスが間に保存した更新を落とさない。同じキーを両方が変更した場合は
+後から保存した側の値になる。保存の失敗は例外にせず log に報告する。
+"""
+from __future__ import annotations
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# ロック取得を諦めるまでの秒数 / これより古いロックファイルは死んだプロセスの残骸とみなす
+LOCK_TIMEOUT = 10.0
+STALE_LOCK = 30.0
+_LOCK_POLL = 0.05
+
+LogCallback = Callable[[str], None]
+
+
+def _eprint(text: str) -> None:
+    print(text, file=sys.stderr)
+
+
+def read_json(path: Path) -> Dict[str, Any]:
+    """JSON オブジェクトを読む (無い・壊れている・オブジェクトでない場合は空)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def merge_changes(base: Dict[str, Any], ours: Dict[str, Any], theirs: Dict[str, Any]) -> Dict[str, Any]:
+    """base から ours への変更 (追加・変更・削除) を theirs に適用した辞書を返す.
+
+    入れ子の辞書はキーごとに再帰的にマージする。
+    """
+    merged = dict(theirs)
+    for key in base.keys() - ours.keys():
+        merged.pop(key, None)
+    for key, value in ours.items():
+        old = base.get(key)
+        if key in base and value == old:
+            continue  # 変更していないキーは他のプロセスの値を残す
+        current = merged.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            merged[key] = merge_changes(old if isinstance(old, dict) else {}, value, current)
+        else:
+            merged[key] = value
+    return merged
+
+
+@contextmanager
+def file_lock(path: Path, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """path + ".lock" を排他作成して保持する (取れなければ OSError)."""
+    lock = path.with_name(path.name + ".lock")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > STALE_LOCK:
+                    os.unlink(lock)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                raise OSError(f"ロックを取得できません: {lock}")
+            time.sleep(_LOCK_POLL)
+    try:
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.unlink(lock)
+        except FileNotFoundError:
+            pass
+
+
+class JsonStore:
+    """読み込み後の変更だけを保存時にディスク上の内容へマージする JSON 永続化の基底."""
+
+    # 保存失敗時のメッセージ (サブクラスで上書きする)
+    save_error = "JSON の保存に失敗しました"
+
+    def __init__(self, path: Path, log: Optional[LogCallback] = None):
+        self.path = Path(path)
+        self.log = log or _eprint
+        self.data: Dict[str, Any] = read_json(self.path)
+        self._base = copy.deepcopy(self.data)
+
+    def save(self) -> bool:
+        """ディスク上の最新の内容に変更をマージして置き換える。失敗したら log に報告して False."""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.path):
+                merged = merge_changes(self._base, self.data, read_json(self.path))
+                fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp",
+                                           dir=str(self.path.parent))
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(merged, f, ensure_ascii=False, indent=1)
+                    os.replace(tmp, self.path)
+                except BaseException:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+                    raise
+        except OSError as e:
+            self.log(f"{self.save_error}: {e}")
+            return False
+        self.data = merged
+        self._base = copy.deepcopy(merged)
+        return True
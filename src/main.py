@@ -5,11 +5,11 @@ import sys
 import os
 import subprocess
 import tempfile
+from dataclasses import replace
 from pathlib import Path
 from typing import List, Dict, Any
 from PyQt6.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QMessageBox,
-    QListWidgetItem
+    QApplication, QMainWindow, QFileDialog, QMessageBox
 )
 from PyQt6.QtCore import QTimer, pyqtSignal
 from PyQt6.QtGui import QDragEnterEvent, QDropEvent, QCloseEvent
@@ -19,9 +19,14 @@ from common import BASE_DIR, RESOURCE_DIR
 
 from ui_main import Ui_MainWindow
 from pandoc_process import PandocWorker
-from config import load_profile, save_profile, get_available_profiles, delete_profile, get_default_profile, is_v2_profile, SCHEMA_VERSION
+from folder_import import FolderImporter
+from file_list_model import FileListModel
+from preview_pane import PreviewPane, TypstPagePane
+from config import load_profile, save_profile, get_available_profiles, delete_profile, get_default_profile, is_v2_profile, profile_extras, SCHEMA_VERSION
 from defaults import load_defaults_file, save_defaults_file, defaults_to_app_config, app_config_to_defaults
-from engines import LogicalConfig, get_adapter, is_typst_mode
+from engines import ENGINE_AUTO, LogicalConfig, TypstAdapter, get_adapter, is_typst_mode
+from typst_packages import typst_tool_paths
+from typst_preview import typst_compile_args
 
 
 class MainWindow(QMainWindow):
@@ -31,6 +36,18 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+
+        # 入力ファイル一覧 (パスの配列を持つモデルを QListView で表示)
+        self.file_model = FileListModel(self)
+        self.ui.file_list.setModel(self.file_model)
+
+        # HTML ライブプレビュー (選択中のファイル。保存のたびに変わったブロックだけ描画し直す)
+        self.preview = PreviewPane()
+        self.ui.preview_layout.addWidget(self.preview, 1)
+        # Typst のページ単位プレビュー (変わったページの画像だけ描き直す)
+        self.page_preview = TypstPagePane()
+        self.ui.preview_layout.addWidget(self.page_preview, 1)
+        self.page_preview.hide()
         
         # Pandoc ワーカー
         self.worker = PandocWorker()
@@ -38,6 +55,18 @@ class MainWindow(QMainWindow):
         self.worker.stderr_received.connect(self.append_log)
         self.worker.finished.connect(self.on_conversion_finished)
         self.worker.started.connect(self.on_conversion_started)
+        self.worker.pandoc_checked.connect(self.on_pandoc_checked)
+
+        # フォルダ取り込み (バックグラウンドで走査してバッチごとにリストへ追加)
+        self.folder_importer = FolderImporter()
+        self.folder_importer.batch_found.connect(self.on_folder_batch)
+        self.folder_importer.finished.connect(self.on_folder_import_finished)
+        self._import_notify_empty = False
+        # True の間は、最初のバッチが届いた時点で一覧を置き換える (見つからなければ一覧を残す)
+        self._import_replace = False
+        # 絞り込みで表示中の件数と、名前順ボタンの次回の向き
+        self._shown_count = 0
+        self._sort_reverse = False
 
         # プロジェクトファイル関連
         self.current_project_path = None
@@ -88,6 +117,19 @@ class MainWindow(QMainWindow):
         self.ui.btn_select_files.clicked.connect(self.select_files)
         self.ui.btn_select_folder.clicked.connect(self.select_folder)
         self.ui.btn_clear_files.clicked.connect(self.clear_file_list)
+        self.ui.btn_cancel_import.clicked.connect(self.cancel_folder_import)
+        self.ui.btn_sort_files.clicked.connect(self.sort_files)
+        self.ui.file_filter.textChanged.connect(self.apply_file_filter)
+        self.file_model.rowsInserted.connect(self._on_files_inserted)
+        self.file_model.rowsRemoved.connect(self._on_files_removed)
+        self.file_model.modelReset.connect(self._on_files_reset)
+        self.ui.file_list.selectionModel().currentChanged.connect(self._update_preview_source)
+        self.file_model.rowsInserted.connect(self._update_preview_source)
+        self.file_model.rowsRemoved.connect(self._update_preview_source)
+        self.file_model.modelReset.connect(self._update_preview_source)
+        self.ui.markdown_extensions.textChanged.connect(self.preview.set_reader)
+        self.ui.preview_mode.currentIndexChanged.connect(self._on_preview_mode_changed)
+        self.ui.btn_preview_apply.clicked.connect(self._apply_page_preview_options)
         self.ui.btn_move_up.clicked.connect(self.move_file_up)
         self.ui.btn_move_down.clicked.connect(self.move_file_down)
         self.ui.btn_remove_file.clicked.connect(self.remove_file)
@@ -130,7 +172,19 @@ class MainWindow(QMainWindow):
             default_profile = get_default_profile()
             self.apply_profile_to_ui(default_profile)
         
-        self.ui.statusbar.showMessage("準備完了 - Pandocが利用可能かご確認ください")
+        self.preview.set_reader(self.ui.markdown_extensions.text())
+        self.ui.statusbar.showMessage("準備完了")
+        # pandoc の確認は起動を待たせないようバックグラウンドで一度だけ行う
+        self.worker.check_pandoc_async()
+
+    def on_pandoc_checked(self, available: bool, version: str):
+        """pandoc の確認結果をステータスバーに表示"""
+        if available:
+            self.ui.pandoc_status.setText(version or "Pandoc: 利用可能")
+            self.ui.pandoc_status.setToolTip("")
+        else:
+            self.ui.pandoc_status.setText("Pandoc: 見つかりません")
+            self.ui.pandoc_status.setToolTip("Pandocがインストールされ、PATHに設定されていることを確認してください。")
         
     def select_files(self):
         """ファイルを選択（リストに追加）"""
@@ -139,65 +193,159 @@ class MainWindow(QMainWindow):
             "Markdown files (*.md *.markdown *.mdown *.mkd);;Bibliography files (*.bib *.json *.yaml);;All files (*)"
         )
         if file_paths:
-            for file_path in file_paths:
-                # 重複チェック
-                is_duplicate = False
-                for i in range(self.ui.file_list.count()):
-                    if self.ui.file_list.item(i).data(256) == file_path:
-                        is_duplicate = True
-                        break
-
-                if not is_duplicate:
-                    display_name = self._get_file_display_name(file_path)
-                    item = QListWidgetItem(display_name)
-                    item.setData(256, file_path)  # フルパスをデータとして保存
-                    self.ui.file_list.addItem(item)
-                
+            # 重複はモデルが無視する
+            self.file_model.add_paths(file_paths)
+
     def select_folder(self):
-        """フォルダを選択してMarkdownファイルを追加"""
+        """フォルダを選択して、その下の Markdown ファイルで一覧を置き換える (バックグラウンドで走査)"""
         folder_path = QFileDialog.getExistingDirectory(self, "フォルダを選択")
         if folder_path:
-            md_files = list(Path(folder_path).glob("*.md"))
-            md_files.extend(Path(folder_path).glob("*.markdown"))
-            md_files.extend(Path(folder_path).glob("*.mdown"))
-            md_files.extend(Path(folder_path).glob("*.mkd"))
-            
-            if md_files:
-                self.ui.file_list.clear()
-                for md_file in md_files:
-                    display_name = self._get_file_display_name(str(md_file))
-                    item = QListWidgetItem(display_name)
-                    item.setData(256, str(md_file))
-                    self.ui.file_list.addItem(item)
-            else:
-                QMessageBox.information(self, "情報", "選択したフォルダにMarkdownファイルが見つかりませんでした。")
-                
+            self.start_folder_import([folder_path], notify_empty=True, replace=True)
+
+    def start_folder_import(self, folders: List[str], notify_empty: bool = False,
+                            replace: bool = False):
+        """folders 以下の Markdown ファイルを一覧に追加していく (重複は追加しない)
+
+        replace なら最初に見つかったバッチで一覧を置き換える。1 件も見つからない・
+        その前に中止された場合は今の一覧を残す。
+        """
+        self._import_notify_empty = notify_empty
+        self._import_replace = replace
+        self.ui.btn_cancel_import.setVisible(True)
+        self.ui.btn_cancel_import.setEnabled(True)
+        self.ui.btn_select_folder.setEnabled(False)
+        self.ui.statusbar.showMessage("フォルダを読み込み中...")
+        self.folder_importer.start(folders)
+
+    def cancel_folder_import(self):
+        """フォルダ取り込みを中止する (追加済みのファイルは残す)
+
+        走査スレッドの終了は待たない。ボタン等の後始末は finished (on_folder_import_finished) で行う。
+        """
+        self._import_replace = False
+        if self.folder_importer.is_running():
+            self.folder_importer.cancel()
+            self.ui.btn_cancel_import.setEnabled(False)
+            self.ui.statusbar.showMessage("フォルダの読み込みを中止しています...")
+
+    def on_folder_batch(self, paths: list, found: int, scanned: int):
+        """走査結果のバッチを一覧に追加"""
+        if self._import_replace:
+            self._import_replace = False
+            self.file_model.clear()
+        self.file_model.add_paths(paths)
+        self.ui.statusbar.showMessage(f"フォルダを読み込み中... {found} 件 (走査 {scanned} 項目)")
+
+    def on_folder_import_finished(self, found: int, cancelled: bool):
+        self._finish_folder_import()
+        self._import_replace = False
+        if cancelled:
+            self.ui.statusbar.showMessage(f"フォルダの読み込みを中止しました ({self.file_model.rowCount()} 件)")
+            return
+        self.ui.statusbar.showMessage(f"フォルダの読み込みが完了しました ({found} 件)")
+        if found == 0 and self._import_notify_empty:
+            QMessageBox.information(self, "情報", "選択したフォルダにMarkdownファイルが見つかりませんでした。")
+
+    def _finish_folder_import(self):
+        self.ui.btn_cancel_import.setVisible(False)
+        self.ui.btn_select_folder.setEnabled(True)
+
+    def _update_file_count(self, *args):
+        total = self.file_model.rowCount()
+        if self.ui.file_filter.text():
+            self.ui.file_count_label.setText(f"{self._shown_count} / {total} 件")
+        else:
+            self.ui.file_count_label.setText(f"{total} 件")
+
+    def _on_files_inserted(self, parent, first: int, last: int):
+        # 絞り込み中なら追加された行にだけ適用する
+        text = self.ui.file_filter.text()
+        if text:
+            for row in range(first, last + 1):
+                hidden = not self.file_model.matches(row, text)
+                self.ui.file_list.setRowHidden(row, hidden)
+                self._shown_count += not hidden
+        self._update_file_count()
+
+    def _on_files_removed(self, *args):
+        if self.ui.file_filter.text():
+            self._shown_count = sum(1 for row in range(self.file_model.rowCount())
+                                    if not self.ui.file_list.isRowHidden(row))
+        self._update_file_count()
+
+    def apply_file_filter(self, text: str):
+        """一覧をパスの部分一致で絞り込む (表示だけで、変換対象は全件のまま)"""
+        view = self.ui.file_list
+        shown = 0
+        view.setUpdatesEnabled(False)
+        try:
+            for row in range(self.file_model.rowCount()):
+                hidden = not self.file_model.matches(row, text)
+                view.setRowHidden(row, hidden)
+                shown += not hidden
+        finally:
+            view.setUpdatesEnabled(True)
+        self._shown_count = shown
+        self._update_file_count()
+
+    def _on_files_reset(self):
+        self.apply_file_filter(self.ui.file_filter.text())
+
+    def sort_files(self):
+        """一覧をファイル名順に並べ替える (もう一度押すと逆順)"""
+        self.file_model.sort_paths(reverse=self._sort_reverse)
+        self._sort_reverse = not self._sort_reverse
+        self.apply_file_filter(self.ui.file_filter.text())
+
+    def _update_preview_source(self, *args):
+        """プレビュー対象を選択中のファイル (未選択なら先頭) にする"""
+        row = self.ui.file_list.currentIndex().row()
+        if row < 0 and self.file_model.rowCount() > 0:
+            row = 0
+        path = self.file_model.path(row) if row >= 0 else None
+        self.preview.set_source(path)
+        self.page_preview.set_source(path)
+
+    def _on_preview_mode_changed(self, index: int):
+        """プレビューの表示を HTML / Typst のページ画像で切り替える"""
+        typst_pages = index == 1
+        if typst_pages:
+            self._apply_page_preview_options()
+        self.preview.setVisible(not typst_pages)
+        self.page_preview.setVisible(typst_pages)
+
+    def _apply_page_preview_options(self):
+        """Typst のページ表示に現在の変換設定を使う (出力形式・エンジンは Typst に固定)"""
+        cfg = replace(self.build_logical_config(), output_format="typst", engine="typst")
+        self.page_preview.set_options(TypstAdapter().build_args(cfg, RESOURCE_DIR), typst_compile_args())
+
+    def _selected_rows(self) -> List[int]:
+        return sorted(index.row() for index in self.ui.file_list.selectionModel().selectedRows())
+
     def clear_file_list(self):
         """ファイルリストをクリア"""
-        self.ui.file_list.clear()
+        self.cancel_folder_import()
+        self.file_model.clear()
         
     def move_file_up(self):
         """選択されたファイルを上に移動"""
-        current_row = self.ui.file_list.currentRow()
-        if current_row > 0:
-            item = self.ui.file_list.takeItem(current_row)
-            self.ui.file_list.insertItem(current_row - 1, item)
-            self.ui.file_list.setCurrentRow(current_row - 1)
-            
+        current_row = self.ui.file_list.currentIndex().row()
+        if current_row > 0 and self.file_model.move_row(current_row, current_row - 1):
+            self.ui.file_list.setCurrentIndex(self.file_model.index(current_row - 1, 0))
+
     def move_file_down(self):
         """選択されたファイルを下に移動"""
-        current_row = self.ui.file_list.currentRow()
-        if current_row < self.ui.file_list.count() - 1 and current_row >= 0:
-            item = self.ui.file_list.takeItem(current_row)
-            self.ui.file_list.insertItem(current_row + 1, item)
-            self.ui.file_list.setCurrentRow(current_row + 1)
-            
+        current_row = self.ui.file_list.currentIndex().row()
+        if 0 <= current_row < self.file_model.rowCount() - 1 \
+                and self.file_model.move_row(current_row, current_row + 1):
+            self.ui.file_list.setCurrentIndex(self.file_model.index(current_row + 1, 0))
+
     def remove_file(self):
-        """選択されたファイルを削除"""
-        current_row = self.ui.file_list.currentRow()
-        if current_row >= 0:
-            self.ui.file_list.takeItem(current_row)
-        
+        """選択されたファイル (複数可) を削除"""
+        rows = self._selected_rows()
+        if rows:
+            self.file_model.remove_rows(rows)
+
     def select_output_directory(self):
         """出力ディレクトリを選択"""
         dir_path = QFileDialog.getExistingDirectory(self, "出力ディレクトリを選択")
@@ -221,11 +369,6 @@ class MainWindow(QMainWindow):
             self.ui.template_file.setText(file_path)
             
 
-    def _get_file_display_name(self, file_path: str) -> str:
-        """ファイルの表示名を生成"""
-        path = Path(file_path)
-        return path.name
-            
     def build_logical_config(self, bibliography_files: List[str] = None) -> LogicalConfig:
         """UI 状態を engine 非依存の LogicalConfig に詰める."""
         custom_args: List[str] = []
@@ -273,7 +416,7 @@ class MainWindow(QMainWindow):
     def collect_extra_args(self, bibliography_files: List[str] = None) -> List[str]:
         """UI から Pandoc コマンドライン引数を生成 (engine 別 Adapter 経由)."""
         cfg = self.build_logical_config(bibliography_files=bibliography_files)
-        adapter = get_adapter(cfg)
+        adapter = get_adapter(cfg, *typst_tool_paths(RESOURCE_DIR))
         return adapter.build_args(cfg, RESOURCE_DIR)
 
 
@@ -285,9 +428,7 @@ class MainWindow(QMainWindow):
         bibliography_files = []
 
         # ファイルリストから取得
-        for i in range(self.ui.file_list.count()):
-            item = self.ui.file_list.item(i)
-            file_path = item.data(256)
+        for file_path in self.file_model.paths():
             all_files.append(file_path)
 
             # ファイル種別で分離
@@ -313,12 +454,18 @@ class MainWindow(QMainWindow):
         extra_args = self.collect_extra_args(bibliography_files=bibliography_files)
 
         # 出力ファイルの拡張子は Adapter から取得 (typst -> typ 変換)
-        cfg = self.build_logical_config()
+        cfg = self.build_logical_config(bibliography_files=bibliography_files)
         output_ext = get_adapter(cfg).output_extension(cfg)
+        # engine: auto はジョブごとに Typst / LaTeX を選ぶ (入力を読むので worker のスレッドで行う)
+        self.worker.auto_engine = cfg if cfg.engine == ENGINE_AUTO else None
 
         # ローディングUIを即座に表示
         self.show_loading_ui()
 
+        # タイムアウト (0 = 無制限)
+        self.worker.timeout = self.ui.timeout.value()
+        self.worker.idle_timeout = self.ui.idle_timeout.value()
+
         # 変換開始
         if len(input_files) == 1:
             # 単一ファイル変換
@@ -506,6 +653,8 @@ class MainWindow(QMainWindow):
         self.ui.template_file.setText("")
         self.ui.custom_args.setPlainText("")
         self.ui.merge_files.setChecked(True)
+        self.ui.timeout.setValue(0)
+        self.ui.idle_timeout.setValue(0)
 
     def apply_profile_to_ui(self, profile_data: Dict[str, Any]):
         """プロファイルデータを UI に適用.
@@ -572,6 +721,11 @@ class MainWindow(QMainWindow):
         set_text("template_file", "template")
         set_check("merge_files", "merge_files")
 
+        # 実行制御 (秒)
+        extras = profile_extras(profile_data)
+        self.ui.timeout.setValue(int(extras["timeout"]))
+        self.ui.idle_timeout.setValue(int(extras["idle_timeout"]))
+
         # custom_args (リスト → 1 行 1 要素)
         custom = profile_data.get("custom_args", [])
         if custom:
@@ -755,6 +909,10 @@ class MainWindow(QMainWindow):
         output_filename = self.ui.output_filename.text().strip()
         if output_filename:
             profile_data["output_filename"] = output_filename
+        if self.ui.timeout.value():
+            profile_data["timeout"] = self.ui.timeout.value()
+        if self.ui.idle_timeout.value():
+            profile_data["idle_timeout"] = self.ui.idle_timeout.value()
         
         if save_profile(profile_name, profile_data):
             QMessageBox.information(self, "完了", f"プロファイル '{profile_name}' を保存しました。")
@@ -820,15 +978,14 @@ class MainWindow(QMainWindow):
         # 入力ファイルをファイルリストに設定
         input_files = app_config.get('input_files', [])
         if input_files:
-            self.ui.file_list.clear()
+            self.cancel_folder_import()
+            existing = []
             for file_path in input_files:
                 if Path(file_path).exists():
-                    display_name = self._get_file_display_name(file_path)
-                    item = QListWidgetItem(display_name)
-                    item.setData(256, file_path)
-                    self.ui.file_list.addItem(item)
+                    existing.append(file_path)
                 else:
                     self.append_log(f"警告: ファイルが見つかりません: {file_path}\n")
+            self.file_model.set_paths(existing)
 
 
         # 出力ファイル名のみを設定
@@ -964,10 +1121,7 @@ class MainWindow(QMainWindow):
         """プロジェクトファイルを指定パスに保存"""
         try:
             # 現在のUI設定を収集
-            input_files = []
-            for i in range(self.ui.file_list.count()):
-                item = self.ui.file_list.item(i)
-                input_files.append(item.data(256))
+            input_files = self.file_model.paths()
 
             if not input_files:
                 QMessageBox.warning(self, "エラー", "入力ファイルが選択されていません。")
@@ -1018,9 +1172,12 @@ class MainWindow(QMainWindow):
     def dropEvent(self, event: QDropEvent):
         """ドロップ時の処理"""
         files = []
+        folders = []
         for url in event.mimeData().urls():
             file_path = url.toLocalFile()
-            if file_path.lower().endswith(('.md', '.markdown', '.mdown', '.mkd', '.bib', '.json', '.yaml', '.yml')):
+            if os.path.isdir(file_path):
+                folders.append(file_path)
+            elif file_path.lower().endswith(('.md', '.markdown', '.mdown', '.mkd', '.bib', '.json', '.yaml', '.yml')):
                 files.append(file_path)
 
         if files:
@@ -1034,18 +1191,12 @@ class MainWindow(QMainWindow):
 
                 # その他のファイルは通常の入力ファイルとして処理
                 if file_path.lower().endswith(('.md', '.markdown', '.mdown', '.mkd', '.bib', '.json', '.yaml', '.yml')):
-                    # 重複チェック
-                    is_duplicate = False
-                    for i in range(self.ui.file_list.count()):
-                        if self.ui.file_list.item(i).data(256) == file_path:
-                            is_duplicate = True
-                            break
-
-                    if not is_duplicate:
-                        display_name = self._get_file_display_name(file_path)
-                        item = QListWidgetItem(display_name)
-                        item.setData(256, file_path)
-                        self.ui.file_list.addItem(item)
+                    # 重複はモデルが無視する
+                    self.file_model.add_paths([file_path])
+
+        if folders:
+            # フォルダは中の Markdown ファイルをバックグラウンドで追加する
+            self.start_folder_import(folders)
     
     def is_pandoc_defaults_file(self, file_path: str) -> bool:
         """
@@ -1107,9 +1258,13 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event: QCloseEvent):
         """アプリケーション終了時の処理"""
-        # 実行中のプロセスを停止
-        if self.worker.proc.state() != self.worker.proc.ProcessState.NotRunning:
+        # フォルダ取り込みと実行中のプロセスを停止
+        self.folder_importer.cancel()
+        if self.worker.is_running():
             self.worker.terminate_process()
+        self.worker.close()
+        self.preview.shutdown()
+        self.page_preview.shutdown()
 
         super().closeEvent(event)
 
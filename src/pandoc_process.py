@@ -1,221 +1,306 @@
 """
-QProcess を使った非同期 Pandoc 実行モジュール
+GUI 向け Pandoc 実行アダプタ
+
+変換そのものは Qt 非依存の conversion.ConversionRunner (asyncio) が行う。
+本モジュールはバックグラウンドスレッド上でイベントループを回し、その経過を
+Qt シグナル (stdout_received / stderr_received / started / finished) に変換するだけの薄い層。
+
+pandoc が使えるかの確認 (`pandoc --version`) も GUI スレッドでは行わない。起動時に
+check_pandoc_async() で一度だけバックグラウンドで確認して結果を保持し (pandoc_checked で通知)、
+再確認するのは変換で pandoc を起動できなかったときだけ。
+
+小さな docx / html / markdown 出力は pypandoc の高速経路 (pypandoc_backend) で変換する。
+それ以外は読み取り段の AST キャッシュ (astcache) を使い、書き出し側の設定だけを変えた再変換を速くする。
+この経路は最初の変換時に 1 度だけ準備し、アプリ終了 (close()) まで使い回す。
 """
+import asyncio
+import threading
 from pathlib import Path
-from typing import List
-from PyQt6.QtCore import QObject, QProcess, pyqtSignal
+from typing import List, Optional
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from astcache import prepare_jobs as prepare_ast
+from bibcache import prepare_jobs
+from common import RESOURCE_DIR
+from conversion import (
+    EXIT_NOT_FOUND,
+    STATUS_TIMEOUT,
+    ConversionJob,
+    ConversionRunner,
+    JobResult,
+    pandoc_version,
+)
+from engine_select import apply_auto_engine, localize_jobs
+from engines import LogicalConfig
+from fonts import ensure_warm
+from pypandoc_backend import PypandocBackend
+from resources import prepare_jobs as prepare_resources, resource_path
+from scheduler import RunHistory
+from scratch import resolve_scratch
+from typst_packages import typst_tool_paths
 
 
 class PandocWorker(QObject):
     """
     Pandoc を非同期で実行するワーカークラス
     """
-    # シグナル定義
+    # シグナル定義 (バックグラウンドスレッドから emit → Qt がメインスレッドへキューイング)
     stdout_received = pyqtSignal(str)
     stderr_received = pyqtSignal(str)
     finished = pyqtSignal(int)  # 終了コード
     started = pyqtSignal()
-    
+    pandoc_checked = pyqtSignal(bool, str)  # (利用可能か, バージョン文字列)
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.proc = QProcess(self)
-        self.proc.readyReadStandardOutput.connect(self._on_stdout)
-        self.proc.readyReadStandardError.connect(self._on_stderr)
-        self.proc.finished.connect(self._on_finished)
-        self.proc.started.connect(self._on_started)
-        
+        self._runner: Optional[ConversionRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # pypandoc の高速経路 (fast_path が有効なときだけ最初の変換時に準備。pypandoc が無ければ使わない)。
+        # pandoc の警告がログに出ず、停止ボタンでも止められないので既定では使わない
+        self.fast_path: bool = False
+        self._fast_path: Optional[PypandocBackend] = None
+        # ジョブごとのタイムアウト秒 (0 = 無制限)。MainWindow が実行前に設定する
+        self.timeout: float = 0
+        self.idle_timeout: float = 0
+        # --citeproc 時に .bib をキャッシュ済み CSL JSON に差し替える
+        self.bib_cache: bool = True
+        # Markdown のパースと内蔵フィルタの結果 (AST) をキャッシュし、書き出し側の設定だけを
+        # 変えた再変換では writer とエンジンだけを動かす。初回の変換は pandoc が 2 回になり、
+        # 内蔵フィルタが --citeproc より先に動くので、CLI (--ast-cache) と同じく既定では使わない
+        self.ast_cache: bool = False
+        # 複数フォルダにまたがる結合変換の画像参照を 1 つの索引で絶対パスに解決する
+        self.resource_index: bool = True
+        # engine: auto のときの設定 (ジョブごとに Typst / LaTeX を選ぶ)。MainWindow が実行前に設定する
+        self.auto_engine: Optional[LogicalConfig] = None
+        # pandoc の利用可否 (None = 未確認 / 確認中) とバージョン
+        self.pandoc_available: Optional[bool] = None
+        self.pandoc_version: str = ""
+        self._check_thread: Optional[threading.Thread] = None
+
     def run(self, input_file: str, output_file: str, extra_args: List[str] = None):
         """
         Pandoc を実行する
-        
+
         Args:
             input_file: 入力ファイルパス
             output_file: 出力ファイルパス
             extra_args: 追加引数のリスト
         """
-        if extra_args is None:
-            extra_args = []
-            
-        # Pandoc が PATH にあるかチェック
-        if not self._check_pandoc_available():
-            self.stderr_received.emit("エラー: Pandoc が見つかりません。Pandocがインストールされ、PATHに設定されていることを確認してください。\n")
-            self.finished.emit(1)
+        if not self._ensure_pandoc():
             return
-            
-        # 出力ディレクトリが存在しない場合は作成
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # リソースパスを抽出して追加
-        resource_paths = self._extract_resource_paths([input_file])
-
-        # 作業ディレクトリを入力ファイルのディレクトリに設定
-        # SVG変換時にInkscapeがローカルファイルに直接アクセスできるようにする
-        working_dir = str(Path(input_file).parent.resolve())
-        self.proc.setWorkingDirectory(working_dir)
 
-        # コマンドライン引数を構築
-        cmd = ['pandoc', input_file, '-o', output_file, '--resource-path', resource_paths] + extra_args
+        job = self._make_job([input_file], output_file, extra_args)
+        self.stdout_received.emit(f"実行コマンド: {' '.join(job.command())}\n")
+        self._start([job], batch=False)
 
-        # プロセス実行
-        self.stdout_received.emit(f"実行コマンド: {' '.join(cmd)}\n")
-        self.proc.start('pandoc', cmd[1:])
-        
     def run_batch(self, input_files: List[str], output_dir: str, output_format: str, extra_args: List[str] = None):
         """
         複数ファイルを一括変換する
-        
+
         Args:
             input_files: 入力ファイルパスのリスト
             output_dir: 出力ディレクトリ
             output_format: 出力形式（pdf, html, docx等）
             extra_args: 追加引数のリスト
         """
-        if extra_args is None:
-            extra_args = []
-            
-        # 出力ディレクトリを作成
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
-        
-        # 各ファイルを順次変換
-        self._batch_files = input_files
-        self._batch_output_dir = output_dir
-        self._batch_format = output_format
-        self._batch_extra_args = extra_args
-        self._batch_index = 0
-        self._run_next_batch_file()
-        
+        if not self._ensure_pandoc():
+            return
+
+        jobs = []
+        for input_file in input_files:
+            input_path = Path(input_file)
+            output_file = Path(output_dir) / f"{input_path.stem}.{output_format}"
+            jobs.append(self._make_job([str(input_file)], str(output_file), extra_args,
+                                       label=input_path.name))
+        self._start(jobs, batch=True)
+
     def run_merge(self, input_files: List[str], output_file: str, extra_args: List[str] = None):
         """
         複数ファイルを結合して一つのファイルに変換する
-        
+
         Args:
             input_files: 入力ファイルパスのリスト
             output_file: 出力ファイルパス
             extra_args: 追加引数のリスト
         """
-        if extra_args is None:
-            extra_args = []
-            
-        # Pandoc が PATH にあるかチェック
-        if not self._check_pandoc_available():
-            self.stderr_received.emit("エラー: Pandoc が見つかりません。Pandocがインストールされ、PATHに設定されていることを確認してください。\n")
-            self.finished.emit(1)
+        if not self._ensure_pandoc():
             return
-            
-        # 出力ディレクトリが存在しない場合は作成
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # リソースパスを抽出して追加
-        resource_paths = self._extract_resource_paths(input_files)
-
-        # 作業ディレクトリを最初の入力ファイルのディレクトリに設定
-        # SVG変換時にInkscapeがローカルファイルに直接アクセスできるようにする
-        working_dir = str(Path(input_files[0]).parent.resolve())
-        self.proc.setWorkingDirectory(working_dir)
 
-        # コマンドライン引数を構築（複数の入力ファイル + 出力ファイル + リソースパス + 追加引数）
-        cmd = ['pandoc'] + input_files + ['-o', output_file, '--resource-path', resource_paths] + extra_args
+        job = self._make_job(input_files, output_file, extra_args)
 
-        # プロセス実行
         self.stdout_received.emit(f"結合変換を開始:\n")
         self.stdout_received.emit(f"入力ファイル: {len(input_files)}個\n")
         for i, file in enumerate(input_files, 1):
             self.stdout_received.emit(f"  {i}. {Path(file).name}\n")
         self.stdout_received.emit(f"出力ファイル: {Path(output_file).name}\n")
-        self.stdout_received.emit(f"リソースパス: {resource_paths}\n")
-        self.stdout_received.emit(f"実行コマンド: {' '.join(cmd)}\n\n")
-
-        self.proc.start('pandoc', cmd[1:])
-        
-    def _run_next_batch_file(self):
-        """バッチ処理の次のファイルを実行"""
-        if self._batch_index >= len(self._batch_files):
-            self.stdout_received.emit("\n=== 一括変換完了 ===\n")
-            self.finished.emit(0)
-            return
-            
-        input_file = self._batch_files[self._batch_index]
-        input_path = Path(input_file)
-        output_file = Path(self._batch_output_dir) / f"{input_path.stem}.{self._batch_format}"
-        
-        self.stdout_received.emit(f"\n--- 変換中 ({self._batch_index + 1}/{len(self._batch_files)}): {input_path.name} ---\n")
-        
-        # 単一ファイル変換を実行
-        self.run(str(input_file), str(output_file), self._batch_extra_args)
-        
-    def _on_batch_finished(self, exit_code: int):
-        """バッチ処理の各ファイル完了時の処理"""
-        if exit_code == 0:
-            self.stdout_received.emit("✓ 変換成功\n")
-        else:
-            self.stderr_received.emit(f"✗ 変換失敗 (終了コード: {exit_code})\n")
-            
-        self._batch_index += 1
-        self._run_next_batch_file()
-        
+        self.stdout_received.emit(f"リソースパス: {job.resource_path}\n")
+        self.stdout_received.emit(f"実行コマンド: {' '.join(job.command())}\n\n")
+
+        self._start([job], batch=False)
+
+    def is_running(self) -> bool:
+        """変換スレッドが動作中か"""
+        return self._thread is not None and self._thread.is_alive()
+
     def terminate_process(self):
         """プロセスを強制終了する"""
-        if self.proc.state() == QProcess.ProcessState.Running:
-            self.proc.kill()
-            
-    def _extract_resource_paths(self, input_files: List[str]) -> str:
-        """
-        入力ファイルのディレクトリからリソースパスを抽出
-        
-        Args:
-            input_files: 入力ファイルパスのリスト
-            
-        Returns:
-            Windows形式（;区切り）のリソースパス文字列
+        loop, runner = self._loop, self._runner
+        if loop is not None and runner is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(runner.cancel)
+
+    def close(self):
+        """アプリ終了時の後始末 (高速経路の一時ディレクトリを消す)"""
+        if self._fast_path is not None:
+            self._fast_path.stop()
+            self._fast_path = None
+
+    def _make_job(self, input_files: List[str], output_file: str,
+                  extra_args: Optional[List[str]], label: str = "") -> ConversionJob:
+        # 作業ディレクトリは先頭入力ファイルのディレクトリ (ConversionJob.cwd の既定)
+        # SVG変換時にInkscapeがローカルファイルに直接アクセスできるようにする
+        return ConversionJob(
+            inputs=list(input_files),
+            output_file=output_file,
+            extra_args=list(extra_args or []),
+            resource_path=resource_path(input_files),
+            timeout=self.timeout or None,
+            idle_timeout=self.idle_timeout or None,
+            label=label,
+            # 一時ファイルと書きかけの出力は RAM (/dev/shm) 等のスクラッチに置く
+            scratch_dir=resolve_scratch(),
+        )
+
+    def check_pandoc_async(self):
+        """pandoc の利用可否をバックグラウンドで確認する (結果は pandoc_checked で通知)"""
+        if self._check_thread is not None and self._check_thread.is_alive():
+            return
+        self._check_thread = threading.Thread(target=self._check_pandoc, name="pandoc-check",
+                                              daemon=True)
+        self._check_thread.start()
+
+    def _check_pandoc(self):
+        version = pandoc_version()
+        self.pandoc_available = version is not None
+        self.pandoc_version = version or ""
+        self.pandoc_checked.emit(self.pandoc_available, self.pandoc_version)
+
+    def _ensure_pandoc(self) -> bool:
+        """確認済みの結果で pandoc が無いと分かっていればエラーを通知する (ここでは起動しない).
+
+        未確認 (確認中) のときはそのまま実行し、起動に失敗すれば _thread_main が再確認する。
         """
-        unique_dirs = set()
-        for file_path in input_files:
-            dir_path = Path(file_path).parent.resolve()
-            unique_dirs.add(str(dir_path))
-        
-        # Windows形式（;区切り）でパス結合、ソート済み
-        return ';'.join(sorted(unique_dirs))
-            
-    def _check_pandoc_available(self) -> bool:
-        """Pandoc が利用可能かチェック"""
-        # QProcessでチェック（EXE環境での互換性のため）
-        from PyQt6.QtCore import QProcess
-        test_proc = QProcess()
-        test_proc.start('pandoc', ['--version'])
-        if test_proc.waitForStarted(5000):
-            test_proc.waitForFinished(5000)
-            return test_proc.exitCode() == 0
+        if self.pandoc_available is not False:
+            return True
+        self.stderr_received.emit("エラー: Pandoc が見つかりません。Pandocがインストールされ、PATHに設定されていることを確認してください。\n")
+        self.finished.emit(1)
+        # インストール直後などに備えて確認し直す (次回の実行に反映される)
+        self.check_pandoc_async()
         return False
-            
-    def _on_stdout(self):
-        """標準出力受信時の処理"""
-        data = bytes(self.proc.readAllStandardOutput()).decode('utf-8', errors='replace')
-        if data:
-            self.stdout_received.emit(data)
-            
-    def _on_stderr(self):
-        """標準エラー受信時の処理"""
-        data = bytes(self.proc.readAllStandardError()).decode('utf-8', errors='replace')
-        if data:
-            self.stderr_received.emit(data)
-            
-    def _on_finished(self, exit_code: int, exit_status):
-        """プロセス終了時の処理"""
-        if hasattr(self, '_batch_files'):
-            # バッチ処理中の場合
-            self._on_batch_finished(exit_code)
-        else:
-            # 単一ファイル処理の場合
-            if exit_code == 0:
-                self.stdout_received.emit("\n=== 変換完了 ===\n")
+
+    def _start(self, jobs: List[ConversionJob], batch: bool):
+        """ジョブ群をバックグラウンドスレッドのイベントループで実行する"""
+        total = len(jobs)
+        index = {id(job): i for i, job in enumerate(jobs, 1)}
+        first_start = threading.Event()
+
+        def on_start(job: ConversionJob):
+            if batch:
+                self.stdout_received.emit(f"\n--- 変換中 ({index[id(job)]}/{total}): {job.name} ---\n")
+            if not first_start.is_set():
+                first_start.set()
+                self.started.emit()
+
+        def on_output(job: ConversionJob, stream: str, text: str):
+            if stream == "stderr":
+                self.stderr_received.emit(text)
             else:
-                self.stderr_received.emit(f"\n=== 変換失敗 (終了コード: {exit_code}) ===\n")
-            self.finished.emit(exit_code)
+                self.stdout_received.emit(text)
 
+        def on_finish(result: JobResult):
+            if result.attempts:
+                self.stdout_received.emit("エンジン: " + " → ".join(
+                    f"{a['engine']} {a['status']} ({a['duration']:.1f}秒)" for a in result.attempts) + "\n")
+            if not batch:
+                return
+            if result.ok:
+                self.stdout_received.emit("✓ 変換成功\n")
+            elif result.status == STATUS_TIMEOUT:
+                self.stderr_received.emit(f"✗ タイムアウト ({result.reason}) - 次のファイルへ進みます\n")
+            else:
+                self.stderr_received.emit(f"✗ 変換失敗 (終了コード: {result.exit_code})\n")
+
+        runner = ConversionRunner(max_jobs=1, on_output=on_output,
+                                  on_start=on_start, on_finish=on_finish)
+        self._runner = runner
+        self._thread = threading.Thread(target=self._thread_main, args=(runner, jobs, batch),
+                                        daemon=True)
+        self._thread.start()
 
-    def _on_started(self):
-        """プロセス開始時の処理"""
-        self.started.emit() 
\ No newline at end of file
+    def _thread_main(self, runner: ConversionRunner, jobs: List[ConversionJob], batch: bool):
+        """バックグラウンドスレッド本体: 専用イベントループで runner を回す"""
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        history = None
+        if self.auto_engine is not None:
+            history = RunHistory(log=lambda text: self.stderr_received.emit(text + "\n"))
+        rewriter = None
+        try:
+            if any(job.output_file.lower().endswith(".pdf") for job in jobs):
+                # 初回のみフォント索引を作る (数分かかることがあるのでこのスレッドで行う)
+                if ensure_warm(log=lambda text: self.stdout_received.emit(text + "\n")) is not None:
+                    # 集めたフォントのディレクトリは今できたので、Typst の --font-path を付け直す
+                    localize_jobs(jobs, typst_tool_paths(RESOURCE_DIR))
+            if self.auto_engine is not None:
+                apply_auto_engine(jobs, self.auto_engine, RESOURCE_DIR, history=history,
+                                  log=lambda text: self.stdout_received.emit(text + "\n"),
+                                  typst_paths=typst_tool_paths(RESOURCE_DIR))
+            if self.bib_cache:
+                # 初回のみ pandoc で変換するため、UI を止めないようこのスレッドで行う
+                prepare_jobs(jobs, prune=batch, log=self.stdout_received.emit)
+            if self.fast_path and self._fast_path is None:
+                self._fast_path = PypandocBackend()
+                self._fast_path.start()
+            if self.fast_path and self._fast_path.available:
+                runner.backends = [self._fast_path]
+            if self.resource_index:
+                rewriter = prepare_resources(jobs, log=self.stdout_received.emit)
+            if self.ast_cache:
+                # 高速経路で変換するジョブは元の入力を読むので対象外
+                fast = self._fast_path if runner.backends else None
+                prepare_ast([job for job in jobs if fast is None or fast.prepare(job) is None],
+                            log=self.stdout_received.emit)
+            results = loop.run_until_complete(runner.run_all(jobs))
+        except Exception as e:  # 想定外の例外でも finished を必ず通知する
+            self.stderr_received.emit(f"\n=== 変換エラー: {e} ===\n")
+            self.finished.emit(1)
+            return
+        finally:
+            self._loop = None
+            loop.close()
+            if rewriter is not None:
+                rewriter.cleanup()
+
+        if history is not None:
+            # Typst で失敗した入力は次回から LaTeX で始める
+            for r in results:
+                if r.attempts:
+                    history.record_attempts(r.job, r.attempts)
+            history.save()
+
+        if any(r.exit_code == EXIT_NOT_FOUND for r in results):
+            # 起動できなかった: 利用可否を確認し直す (このスレッド上なので UI は止まらない)
+            self._check_pandoc()
+
+        exit_code = next((r.exit_code for r in results if not r.ok), 0)
+        if batch:
+            ok = sum(1 for r in results if r.ok)
+            timed_out = [r.job.name for r in results if r.status == STATUS_TIMEOUT]
+            self.stdout_received.emit(f"\n=== 一括変換完了 (成功 {ok}/{len(results)}) ===\n")
+            if timed_out:
+                self.stderr_received.emit(f"タイムアウト: {', '.join(timed_out)}\n")
+        elif exit_code == 0:
+            self.stdout_received.emit("\n=== 変換完了 ===\n")
+        else:
+            self.stderr_received.emit(f"\n=== 変換失敗 (終了コード: {exit_code}) ===\n")
+        self.finished.emit(exit_code)
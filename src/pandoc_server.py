@@ -0,0 +1,338 @@
+"""
+pandoc server バックエンド (`--backend server`)
+
+数千の小さなファイルを docx / html / tex 等に変換するバッチでは、pandoc の起動
+(プロセス生成と初期化) が変換そのものより重い。pandoc 3 の `pandoc server` は
+localhost の HTTP で JSON の変換リクエストを受け付けるので、ローカルに 1 つだけ起動し、
+接続プール (HTTP keep-alive) 越しにジョブを送れば起動コストはバッチ全体で 1 回になる。
+
+サーバーはファイルシステムに触れない (フィルタ・PDF エンジン・テンプレート以外の外部ファイルを
+読めない) ため、server_request() が ConversionJob の引数をリクエストに翻訳できるジョブだけを
+引き受け、それ以外 (PDF 出力、Lua / JSON フィルタ、未知の引数、画像を埋め込む docx 等) は
+従来どおり pandoc プロセスで変換する (conversion.ConversionRunner が振り分ける)。
+内蔵フィルタ (default_filter.lua / typst_tag.lua) は、入力に対象の記法が無ければ何もしないので
+その場合は省いてサーバーへ送る。
+
+サーバーが起動できない (pandoc 2.x 等) ときや変換に失敗したときも pandoc プロセスに戻るので、
+出力と終了コードはプロセスで変換した場合と同じになる。
+"""
+from __future__ import annotations
+
+import base64
+import http.client
+import json
+import queue
+import re
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from conversion import BackendError, ConversionBackend, ConversionJob
+
+BACKEND_PROCESS = "process"
+BACKEND_SERVER = "server"
+
+HOST = "127.0.0.1"
+# サーバーの起動待ちの上限 (秒)
+STARTUP_TIMEOUT = 15.0
+# 1 リクエストの上限 (ジョブにタイムアウトが無いとき)
+REQUEST_TIMEOUT = 300.0
+
+# 出力ファイルの拡張子 → writer (サーバーは -o から writer を推定しない)
+WRITERS = {
+    ".tex": "latex", ".latex": "latex", ".typ": "typst", ".html": "html", ".htm": "html",
+    ".docx": "docx", ".odt": "odt", ".json": "json", ".md": "markdown", ".markdown": "markdown",
+    ".rst": "rst", ".org": "org", ".txt": "plain", ".adoc": "asciidoc",
+}
+# base64 で返ってくる writer (それ以外はテキスト)
+BINARY_WRITERS = {"docx", "odt"}
+
+# 内蔵フィルタと、それが何かをする入力の記法 (無ければフィルタを省いてよい)
+BUILTIN_FILTERS = {
+    "default_filter.lua": re.compile(r"\\begin\{(?:align|gather|multline|equation|flalign|alignat)"),
+    "typst_tag.lua": re.compile(r"\\tag\s*\{"),
+}
+_MARKDOWN_SUFFIXES = {".md", ".markdown", ".txt"}
+_IMAGE_RE = re.compile(r"!\[|<img\b", re.IGNORECASE)
+
+# 値を取らないフラグ → リクエストのキー
+_FLAGS = {
+    "--toc": "table-of-contents", "--table-of-contents": "table-of-contents",
+    "--number-sections": "number-sections", "-N": "number-sections",
+    "--standalone": "standalone", "-s": "standalone",
+    "--citeproc": "citeproc", "-C": "citeproc",
+}
+
+LogCallback = Callable[[str], None]
+
+
+def _split_option(args: List[str], i: int) -> Tuple[str, Optional[str], int]:
+    """args[i] を (オプション名, 値, 次の位置) に分ける (`--x=v` / `--x v` の両方)."""
+    arg = args[i]
+    if arg.startswith("--") and "=" in arg:
+        name, value = arg.split("=", 1)
+        return name, value, i + 1
+    if i + 1 < len(args):
+        return arg, args[i + 1], i + 2
+    return arg, None, i + 1
+
+
+def _read_inputs(inputs: List[str]) -> Optional[str]:
+    texts = []
+    for path in inputs:
+        try:
+            texts.append(Path(path).read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError):
+            return None
+    # pandoc も複数入力を空行で区切って連結する
+    return "\n\n".join(texts)
+
+
+def _file_entry(path: str, files: Dict[str, str]) -> bool:
+    try:
+        files[path] = base64.b64encode(Path(path).read_bytes()).decode("ascii")
+    except OSError:
+        return False
+    return True
+
+
+def server_request(job: ConversionJob) -> Optional[Dict[str, Any]]:
+    """job を pandoc server のリクエストにする。サーバーで変換できないジョブは None."""
+    writer = WRITERS.get(Path(job.output_file).suffix.lower())
+    if writer is None:
+        return None
+    text = _read_inputs(job.pandoc_inputs)
+    if text is None:
+        return None
+    # サーバーは画像を読めないので、画像を埋め込む形式は対象外
+    if writer in BINARY_WRITERS and _IMAGE_RE.search(text):
+        return None
+
+    request: Dict[str, Any] = {"text": text, "to": writer, "from": "markdown"}
+    variables: Dict[str, str] = {}
+    files: Dict[str, str] = {}
+    headers: List[str] = []
+    explicit = set()
+    args = list(job.extra_args)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in _FLAGS:
+            request[_FLAGS[arg]] = True
+            i += 1
+            continue
+        name, value, i = _split_option(args, i)
+        if value is None:
+            return None
+        if name in ("--from", "-f", "-r", "--read"):
+            request["from"] = value
+            explicit.add("from")
+        elif name in ("-V", "--variable"):
+            key, _, val = value.partition("=")
+            if key in variables:
+                return None
+            variables[key] = val or "true"
+        elif name == "--wrap":
+            request["wrap"] = value
+        elif name == "--template":
+            try:
+                request["template"] = Path(value).read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                return None
+        elif name == "--lua-filter":
+            pattern = BUILTIN_FILTERS.get(Path(value).name)
+            if pattern is None or pattern.search(text):
+                return None
+        elif name in ("--bibliography", "--csl"):
+            if not _file_entry(value, files):
+                return None
+            if name == "--csl":
+                request["csl"] = value
+            else:
+                request.setdefault("bibliography", []).append(value)
+        elif name in ("--include-in-header", "-H"):
+            headers.append(value)
+        else:
+            # フィルタ・PDF エンジン・未知の引数はプロセスで
+            return None
+    if "from" not in explicit and any(Path(p).suffix.lower() not in _MARKDOWN_SUFFIXES
+                                      for p in job.inputs):
+        # 入力形式を拡張子から推定するのはプロセス (pandoc) に任せる
+        return None
+    if headers and request.get("standalone"):
+        # ヘッダの挿入 (standalone 時のみ効く) はサーバーでは指定できない
+        return None
+    if variables:
+        request["variables"] = variables
+    if files:
+        request["files"] = files
+    return request
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class _ConnectionPool:
+    """keep-alive の HTTPConnection を使い回す (最大 size 本)."""
+
+    def __init__(self, port: int, size: int):
+        self.port = port
+        self._idle: "queue.LifoQueue[Optional[http.client.HTTPConnection]]" = queue.LifoQueue()
+        for _ in range(max(1, size)):
+            self._idle.put(None)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                timeout: float = REQUEST_TIMEOUT) -> Tuple[int, bytes]:
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        conn = self._idle.get()
+        # 使い回した接続はサーバー側で閉じられていることがあるので、新しい接続で 1 度だけやり直す
+        reused = conn is not None
+        while True:
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(HOST, self.port, timeout=timeout)
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                if conn is not None:
+                    conn.close()
+                conn = None
+                if reused and not isinstance(e, socket.timeout):
+                    reused = False
+                    continue
+                self._idle.put(None)
+                raise
+            self._idle.put(conn)
+            return resp.status, data
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn is not None:
+                conn.close()
+
+
+class PandocServer(ConversionBackend):
+    """ローカルに起動した `pandoc server` へ変換を送るバックエンド.
+
+    with PandocServer(pool_size=4) as server:
+        run_jobs(jobs, backends=[server] if server.available else [])
+    """
+
+    name = BACKEND_SERVER
+
+    def __init__(self, pandoc: str = "pandoc", pool_size: int = 4,
+                 log: Optional[LogCallback] = None):
+        self.pandoc = pandoc
+        self.pool_size = max(1, pool_size)
+        self.log = log or (lambda text: None)
+        self.version = ""
+        self._proc: Optional[subprocess.Popen] = None
+        self._pool: Optional[_ConnectionPool] = None
+
+    @property
+    def available(self) -> bool:
+        return self._pool is not None
+
+    def start(self) -> bool:
+        """サーバーを起動して応答を待つ。起動できなければ False (プロセスで変換する)."""
+        port = _free_port()
+        kwargs: Dict[str, Any] = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+        try:
+            self._proc = subprocess.Popen([self.pandoc, "server", "--port", str(port)],
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                          **kwargs)
+        except OSError as e:
+            self.log(f"pandoc server: 起動できません ({e})")
+            return False
+        pool = _ConnectionPool(port, self.pool_size)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                break
+            try:
+                status, body = pool.request("GET", "/version", timeout=2.0)
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.1)
+                continue
+            if status == 200:
+                self.version = body.decode("utf-8", errors="replace").strip()
+                self._pool = pool
+                self.log(f"pandoc server: 127.0.0.1:{port} (pandoc {self.version}, 接続 {self.pool_size})")
+                return True
+            break
+        self.log("pandoc server: 起動できないため pandoc プロセスで変換します")
+        pool.close()
+        self.stop()
+        return False
+
+    def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def __enter__(self) -> "PandocServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- ConversionBackend ----------------------------------------------------
+
+    def prepare(self, job: ConversionJob) -> Optional[Dict[str, Any]]:
+        if self._pool is None:
+            return None
+        return server_request(job)
+
+    def convert(self, request: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[bytes, List[str]]:
+        if self._pool is None:
+            raise BackendError("サーバーが起動していません")
+        body = json.dumps(request, ensure_ascii=False).encode("utf-8")
+        try:
+            status, data = self._pool.request("POST", "/", body=body, timeout=timeout or REQUEST_TIMEOUT)
+        except (OSError, http.client.HTTPException) as e:
+            raise BackendError(f"通信に失敗しました ({e})")
+        if status != 200:
+            raise BackendError(data.decode("utf-8", errors="replace").strip()[:500] or f"HTTP {status}")
+        try:
+            reply = json.loads(data.decode("utf-8"))
+        except ValueError:
+            raise BackendError("応答を解釈できません")
+        if not isinstance(reply, dict) or "output" not in reply:
+            # エラーは {"error": "..."} で返る版がある
+            raise BackendError(str(reply.get("error") if isinstance(reply, dict) else reply)[:500])
+        output = reply["output"]
+        if reply.get("base64"):
+            content = base64.b64decode(output)
+        else:
+            # pandoc (CLI) と同じくテキスト出力は改行で終える
+            if output and not output.endswith("\n"):
+                output += "\n"
+            content = output.encode("utf-8")
+        messages = [f"[{m.get('verbosity', 'INFO')}] {m.get('message', '')}"
+                    for m in reply.get("messages", []) if isinstance(m, dict)]
+        return content, messages
@@ -0,0 +1,96 @@
+"""
+入力ファイル一覧 (GUI のファイルリストの中身, Qt 非依存)
+
+数万件の Markdown を扱うバッチでも GUI が重くならないよう、一覧はパス文字列の配列と
+重複判定用の set だけで持つ (行ごとのウィジェットやアイテムオブジェクトを作らない)。
+表示は file_list_model.FileListModel がこの配列をそのまま参照する。
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterable, Iterator, List, Sequence
+
+# 並べ替えのキー
+SORT_NAME = "name"
+SORT_PATH = "path"
+SORT_KEYS = (SORT_NAME, SORT_PATH)
+
+
+def display_name(path: str) -> str:
+    """一覧に表示する名前 (ファイル名)."""
+    return os.path.basename(path)
+
+
+class PathList:
+    """順序付きで重複のないパスの一覧."""
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._paths: List[str] = []
+        self._known: set = set()
+        self.extend(paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __getitem__(self, row: int) -> str:
+        return self._paths[row]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._paths)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._known
+
+    def paths(self) -> List[str]:
+        return list(self._paths)
+
+    def new_paths(self, paths: Iterable[str]) -> List[str]:
+        """paths のうち一覧に無いもの (paths 内の重複も 1 つにまとめる)."""
+        seen = set()
+        fresh = []
+        for path in paths:
+            if path not in self._known and path not in seen:
+                seen.add(path)
+                fresh.append(path)
+        return fresh
+
+    def extend(self, paths: Iterable[str]) -> List[str]:
+        """末尾に追加し、実際に追加したパスを返す."""
+        fresh = self.new_paths(paths)
+        self._paths.extend(fresh)
+        self._known.update(fresh)
+        return fresh
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        drop = set(rows)
+        self._known.difference_update(self._paths[r] for r in drop)
+        self._paths = [p for r, p in enumerate(self._paths) if r not in drop]
+
+    def move(self, row: int, to: int) -> None:
+        """row の要素を取り出して to の位置に入れる (to は取り出した後の位置)."""
+        self._paths.insert(to, self._paths.pop(row))
+
+    def move_rows(self, rows: Sequence[int], before: int) -> int:
+        """rows (順序は保つ) を元の並びの before 行目の前へまとめて移し、移動先の先頭行を返す."""
+        rows = sorted(set(rows))
+        moving = [self._paths[r] for r in rows]
+        drop = set(rows)
+        before -= sum(1 for r in rows if r < before)
+        rest = [p for r, p in enumerate(self._paths) if r not in drop]
+        self._paths = rest[:before] + moving + rest[before:]
+        return before
+
+    def clear(self) -> None:
+        self._paths = []
+        self._known = set()
+
+    def sort(self, key: str = SORT_NAME, reverse: bool = False) -> None:
+        """ファイル名 (大文字小文字を無視、同名はパス順) かフルパスで並べ替える."""
+        if key == SORT_NAME:
+            self._paths.sort(key=lambda p: (display_name(p).lower(), p), reverse=reverse)
+        else:
+            self._paths.sort(reverse=reverse)
+
+    def matches(self, row: int, text: str) -> bool:
+        """絞り込み文字列 (大文字小文字を無視した部分一致, フルパス対象) に一致するか."""
+        return not text or text.lower() in self._paths[row].lower()
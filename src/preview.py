@@ -0,0 +1,295 @@
+"""
+HTML ライブプレビューの描画 (Qt 非依存)
+
+小さな修正の確認に PDF を組むのは遅いので、入力 Markdown を HTML にしてプレビューする。
+毎回文書全体を pandoc に渡す代わりに、
+
+  1. 入力をトップレベルのブロック (空行区切り。コードブロック・$$ 数式・YAML メタデータは
+     途中に空行があっても 1 ブロック) に分け (split_blocks)
+  2. 内容のハッシュで描画済み HTML を引き、変わったブロックだけを 1 回の pandoc で描画し
+     (PreviewRenderer。ブロックの間に区切りのコメントを挟んで出力を分割する)
+  3. 前回との差分を「先頭 / 末尾の一致しないブロックの置き換え」(PreviewPatch) として返す
+
+ので、保存のたびの描画は変わったブロックの量に比例し、表示側 (preview_pane.py) は
+置き換えたブロックの DOM だけを差し替えてスクロール位置を保てる。
+
+数式は RESOURCE_DIR/preview/katex (katex.min.js) か RESOURCE_DIR/preview/mathjax
+(tex-chtml.js) にローカルのコピーがあればそれで描画し、無ければ pandoc の MathML 出力にする
+(ネットワークには取りに行かない)。脚注は --reference-location=block でブロックの直後に置く。
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from common import RESOURCE_DIR
+
+MATH_KATEX = "katex"
+MATH_MATHJAX = "mathjax"
+MATH_MATHML = "mathml"
+
+# ブロックの区切り (raw HTML としてそのまま出力される)
+_SEPARATOR = "<!-- pandoctools-preview-block -->"
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_REF_DEF_RE = re.compile(r"^ {0,3}\[\^?[^\]]+\]:")
+# 描画済み HTML を覚えておくブロック数
+_CACHE_BLOCKS = 4000
+
+PANDOC_TIMEOUT = 30
+
+
+def split_blocks(text: str) -> List[str]:
+    """Markdown をトップレベルのブロックに分ける (連結すると空行の数以外は元に戻る)."""
+    blocks: List[str] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+    in_math = False
+    lines = text.splitlines()
+    # YAML メタデータ (先頭の --- ... ---) は 1 ブロック
+    if lines and lines[0].strip() == "---":
+        for end in range(1, len(lines)):
+            if lines[end].strip() in ("---", "..."):
+                blocks.append("\n".join(lines[:end + 1]))
+                lines = lines[end + 1:]
+                break
+    pending_blank = False
+    for line in lines:
+        if fence is not None:
+            current.append(line)
+            if line.strip().startswith(fence) and not line.strip().strip(fence[0]):
+                fence = None
+            continue
+        if in_math:
+            current.append(line)
+            if line.rstrip().endswith("$$"):
+                in_math = False
+            continue
+        if not line.strip():
+            pending_blank = bool(current)
+            continue
+        # 空行の後でも字下げされた行はリスト項目の続き / 字下げコードとして前のブロックに含める
+        if pending_blank and current and not line[:1].isspace():
+            blocks.append("\n".join(current))
+            current = []
+        elif pending_blank and current:
+            current.append("")
+        pending_blank = False
+        current.append(line)
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+        elif line.strip().startswith("$$") and (line.strip() == "$$" or not line.rstrip().endswith("$$")):
+            in_math = True
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def reference_definitions(blocks: List[str]) -> str:
+    """リンク参照・脚注の定義 ([id]: url / [^1]: ...)。各ブロックの描画に添える."""
+    return "\n\n".join(b for b in blocks if _REF_DEF_RE.match(b))
+
+
+def math_assets(resource_dir: Path = RESOURCE_DIR) -> Tuple[str, Optional[Path]]:
+    """使える数式描画 (MATH_*) とそのスクリプト。ローカルのコピーが無ければ MathML."""
+    katex = resource_dir / "preview" / "katex" / "katex.min.js"
+    if katex.is_file():
+        return MATH_KATEX, katex
+    mathjax = resource_dir / "preview" / "mathjax" / "tex-chtml.js"
+    if mathjax.is_file():
+        return MATH_MATHJAX, mathjax
+    return MATH_MATHML, None
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:32]
+
+
+class PreviewError(Exception):
+    """プレビューの描画に失敗した (pandoc のエラーメッセージを持つ)."""
+
+
+class PreviewRenderer:
+    """ブロック群を HTML 断片に描画する (pandoc 1 回。描画済みのブロックはハッシュで再利用)."""
+
+    def __init__(self, pandoc: str = "pandoc", reader: str = "markdown", math: str = MATH_MATHML,
+                 runner: Optional[Callable[[List[str], str, Optional[str]], str]] = None):
+        self.pandoc = pandoc
+        self.reader = reader or "markdown"
+        self.math = math
+        # テスト用に差し替えられる: (コマンド, 標準入力, 作業ディレクトリ) → 標準出力
+        self._run = runner or self._run_pandoc
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    def key(self, block: str, refs: str) -> str:
+        return _digest(self.reader, self.math, refs, block)
+
+    def command(self) -> List[str]:
+        math = {MATH_KATEX: "--katex", MATH_MATHJAX: "--mathjax"}.get(self.math, "--mathml")
+        return [self.pandoc, "--from", self.reader, "--to", "html", math,
+                "--reference-location=block", "--wrap=none"]
+
+    def render(self, blocks: List[str], refs: str = "", cwd: Optional[str] = None) -> List[str]:
+        """各ブロックの HTML (キャッシュに無いものだけを描画する)."""
+        keys = [self.key(b, refs) for b in blocks]
+        missing = list(OrderedDict((k, b) for k, b in zip(keys, blocks) if k not in self._cache).items())
+        if missing:
+            for (k, _), html in zip(missing, self._render_missing([b for _, b in missing], refs, cwd)):
+                self._cache[k] = html
+        out = []
+        for k in keys:
+            self._cache.move_to_end(k)
+            out.append(self._cache[k])
+        while len(self._cache) > _CACHE_BLOCKS:
+            self._cache.popitem(last=False)
+        return out
+
+    def _render_missing(self, blocks: List[str], refs: str, cwd: Optional[str]) -> List[str]:
+        suffix = f"\n\n{refs}\n" if refs else "\n"
+        source = f"\n\n{_SEPARATOR}\n\n".join(blocks) + suffix
+        parts = self._run(self.command(), source, cwd).split(_SEPARATOR)
+        if len(parts) == len(blocks):
+            return [p.strip() for p in parts]
+        # 区切りが raw HTML として残らない reader (-raw_html 等) はブロックごとに描画する
+        return [self._run(self.command(), block + suffix, cwd).strip() for block in blocks]
+
+    def _run_pandoc(self, cmd: List[str], source: str, cwd: Optional[str]) -> str:
+        try:
+            r = subprocess.run(cmd, input=source.encode("utf-8"), cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, timeout=PANDOC_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise PreviewError(str(e))
+        if r.returncode != 0:
+            raise PreviewError(r.stderr.decode("utf-8", errors="replace").strip())
+        return r.stdout.decode("utf-8", errors="replace")
+
+
+@dataclass
+class PreviewPatch:
+    """表示中のブロック [start, start + removed) を html で置き換える差分."""
+
+    start: int
+    removed: int
+    html: List[str] = field(default_factory=list)
+    # 置き換え後のブロック数
+    total: int = 0
+
+
+class PreviewDocument:
+    """表示中のブロック列を持ち、入力の更新から差分 (PreviewPatch) を作る."""
+
+    def __init__(self, renderer: PreviewRenderer):
+        self.renderer = renderer
+        self.keys: List[str] = []
+        self.html: List[str] = []
+
+    def reset(self) -> None:
+        self.keys, self.html = [], []
+
+    def update(self, text: str, cwd: Optional[str] = None) -> Optional[PreviewPatch]:
+        """text を描画し、前回からの差分を返す (変化が無ければ None)."""
+        blocks = split_blocks(text)
+        refs = reference_definitions(blocks)
+        keys = [self.renderer.key(b, refs) for b in blocks]
+        if keys == self.keys:
+            return None
+        head = 0
+        while head < min(len(keys), len(self.keys)) and keys[head] == self.keys[head]:
+            head += 1
+        tail = 0
+        while (tail < min(len(keys), len(self.keys)) - head
+               and keys[-1 - tail] == self.keys[-1 - tail]):
+            tail += 1
+        changed = blocks[head:len(blocks) - tail]
+        html = self.renderer.render(changed, refs, cwd)
+        patch = PreviewPatch(start=head, removed=len(self.keys) - head - tail, html=html,
+                             total=len(keys))
+        self.keys = keys
+        self.html[head:head + patch.removed] = html
+        return patch
+
+
+def page_html(blocks: List[str], math: str = MATH_MATHML, math_script: Optional[Path] = None,
+              base_dir: Optional[str] = None) -> str:
+    """プレビューのページ全体。各ブロックは <div class="pt-block"> に入れる.
+
+    ページには差分を当てる ptPatch(start, removed, htmls) と、新しいブロックの数式を描画する
+    スクリプトを入れておく (QWebEngine から runJavaScript で呼ぶ)。
+    base_dir を渡すと画像などの相対パスをそこから解決させる (入力ファイルのディレクトリ)。
+    """
+    head = ['<meta charset="utf-8">', f"<style>{_STYLE}</style>"]
+    if base_dir:
+        head.append(f'<base href="{Path(base_dir).resolve().as_uri()}/">')
+    if math_script is not None:
+        if math == MATH_KATEX:
+            css = math_script.with_name("katex.min.css")
+            if css.is_file():
+                head.append(f'<link rel="stylesheet" href="{css.as_uri()}">')
+        head.append(f'<script src="{math_script.as_uri()}"></script>')
+    body = "\n".join(block_html(h) for h in blocks)
+    return ("<!DOCTYPE html>\n<html><head>" + "".join(head) + "</head><body>\n" + body +
+            f"\n<script>var ptMath = {_js_string(math)};{_SCRIPT}</script>\n</body></html>")
+
+
+def block_html(html: str) -> str:
+    return f'<div class="pt-block">{html}</div>'
+
+
+def _js_string(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+def patch_script(patch: PreviewPatch) -> str:
+    """patch を当てる JavaScript (QWebEngineView.page().runJavaScript 用)."""
+    items = ",".join(_js_string(h) for h in patch.html)
+    return f"ptPatch({patch.start}, {patch.removed}, [{items}]);"
+
+
+_STYLE = (
+    "body{font-family:sans-serif;line-height:1.6;max-width:52em;margin:1em auto;padding:0 1em;}"
+    "pre{background:#f5f5f5;padding:.5em;overflow-x:auto;}"
+    "table{border-collapse:collapse;}td,th{border:1px solid #ccc;padding:.2em .5em;}"
+    "img{max-width:100%;}"
+)
+
+_SCRIPT = """
+function ptRenderMath(nodes) {
+  if (ptMath === "katex" && window.katex) {
+    nodes.forEach(function (n) {
+      n.querySelectorAll("span.math").forEach(function (el) {
+        var tex = el.textContent.replace(/^\\\\[\\(\\[]|\\\\[\\)\\]]$/g, "");
+        try { katex.render(tex, el, {displayMode: el.classList.contains("display"), throwOnError: false}); }
+        catch (e) {}
+      });
+    });
+  } else if (ptMath === "mathjax" && window.MathJax && MathJax.typesetPromise) {
+    MathJax.typesetPromise(nodes);
+  }
+}
+function ptPatch(start, removed, htmls) {
+  var blocks = document.querySelectorAll("body > div.pt-block");
+  var anchor = blocks[start + removed] || document.querySelector("body > script");
+  for (var i = 0; i < removed; i++) { blocks[start + i].remove(); }
+  var added = [];
+  htmls.forEach(function (h) {
+    var div = document.createElement("div");
+    div.className = "pt-block";
+    div.innerHTML = h;
+    document.body.insertBefore(div, anchor);
+    added.push(div);
+  });
+  ptRenderMath(added);
+}
+window.addEventListener("load", function () {
+  ptRenderMath(Array.prototype.slice.call(document.querySelectorAll("body > div.pt-block")));
+});
+"""
@@ -0,0 +1,323 @@
+"""
+GUI 向けライブプレビュー
+
+選択中の入力ファイルを監視し、保存されるたびに描画し直して表示する。描画 (pandoc / typst) は
+バックグラウンドスレッドで行い、結果は Qt シグナルで GUI スレッドへ渡す
+(PandocWorker / FolderImporter と同じ構成)。ファイル監視と描画スレッドの管理は
+_WatchedPreview にまとめ、表示の仕方ごとにサブクラスを置く。
+
+  - PreviewPane   : HTML (preview.PreviewDocument)。変わったブロックだけを描画する。
+                    表示には QWebEngineView (PyQt6-WebEngine が入っているとき) を使い、差分は
+                    ptPatch の JavaScript で該当ブロックの DOM だけを差し替えるので、スクロール
+                    位置はそのまま保たれる。WebEngine が無い環境では QTextBrowser に全体を入れ直し、
+                    スクロール位置を戻す (JavaScript を使えないため数式は描画されない)。
+  - TypstPagePane : Typst で組んだページ画像 (typst_preview.TypstPagePreview)。
+                    変わったページの画像だけを読み込み直す。
+"""
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, List, Optional
+
+from PyQt6.QtCore import QFileSystemWatcher, Qt, QTimer, QUrl, pyqtSignal
+from PyQt6.QtGui import QPixmap
+from PyQt6.QtWidgets import QLabel, QScrollArea, QTextBrowser, QVBoxLayout, QWidget
+
+from preview import (
+    PreviewDocument,
+    PreviewError,
+    PreviewPatch,
+    PreviewRenderer,
+    block_html,
+    math_assets,
+    page_html,
+    patch_script,
+)
+from typst_preview import PageUpdate, TypstPagePreview
+
+try:  # PyQt6-WebEngine は任意 (無ければ QTextBrowser で表示する)
+    from PyQt6.QtWebEngineWidgets import QWebEngineView
+except ImportError:
+    QWebEngineView = None
+
+# 保存直後の連続した変更通知をまとめる待ち時間 (ms)
+_DEBOUNCE_MS = 150
+_NO_SOURCE = "プレビューするファイルを一覧で選択してください"
+
+
+class _WatchedPreview(QWidget):
+    """入力ファイルを監視して描画し直すプレビューの共通部分.
+
+    サブクラスは _render (描画スレッドで実行)、_show (GUI スレッドで結果を表示)、
+    _clear (ファイル未選択時の表示) を実装する。
+    """
+
+    # (世代, _render の結果, エラーメッセージ)
+    _rendered = pyqtSignal(int, object, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+        self.status_label = QLabel(_NO_SOURCE)
+        self._layout.addWidget(self.status_label)
+
+        self._path: Optional[str] = None
+        self._generation = 0
+        self._thread: Optional[threading.Thread] = None
+        # 描画中に来た更新 (終わったらもう一度描画する) / 次の描画で最初から作り直すか
+        self._pending = False
+        self._reset = True
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self.refresh)
+        self._rendered.connect(self._apply)
+
+    # --- 公開 API ---------------------------------------------------------------
+
+    def set_source(self, path: Optional[str]):
+        """プレビューするファイルを切り替える (None で空にする)."""
+        if path == self._path:
+            return
+        if self._watcher.files():
+            self._watcher.removePaths(self._watcher.files())
+        self._path = path
+        self._restart()
+        if path:
+            self._watcher.addPath(path)
+            self.status_label.setText(Path(path).name)
+            self.refresh()
+        else:
+            self.status_label.setText(_NO_SOURCE)
+            self._clear()
+
+    def refresh(self):
+        """ファイルを読み直して描画する (見えていないときは表示されるまで遅らせる)."""
+        if not self._path:
+            return
+        if not self.isVisible():
+            self._pending = True
+            return
+        if self._thread is not None and self._thread.is_alive():
+            self._pending = True
+            return
+        self._pending = False
+        reset, self._reset = self._reset, False
+        self._thread = threading.Thread(
+            target=self._thread_main, args=(self._generation, self._path, reset),
+            name="preview", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """アプリ終了時の後始末 (ファイル監視を止め、以降の描画結果を捨てる)."""
+        self._generation += 1
+        if self._watcher.files():
+            self._watcher.removePaths(self._watcher.files())
+
+    # --- サブクラスで実装する ---------------------------------------------------
+
+    def _render(self, path: str, reset: bool) -> Any:
+        """描画スレッドで呼ばれる。reset なら前回の状態を捨てて最初から描画する."""
+        raise NotImplementedError
+
+    def _show(self, result: Any) -> Optional[str]:
+        """GUI スレッドで _render の結果を表示し、状態表示の文言を返す (None ならファイル名)."""
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    # --- 内部 -------------------------------------------------------------------
+
+    def _restart(self):
+        # 描画中のスレッドが前回の状態を使っているので、作り直しは次の描画スレッドで行う
+        self._generation += 1
+        self._reset = True
+
+    def _thread_main(self, generation: int, path: str, reset: bool):
+        try:
+            result = self._render(path, reset)
+        except (OSError, PreviewError) as e:
+            self._rendered.emit(generation, None, str(e) or type(e).__name__)
+            return
+        self._rendered.emit(generation, result, "")
+
+    def _apply(self, generation: int, result: Any, error: str):
+        if generation == self._generation and self._path:
+            name = Path(self._path).name
+            if error:
+                # 前回の表示は残し、次に描画するときは全体を作り直す
+                self.status_label.setText(f"{name}: 描画に失敗しました ({error.splitlines()[-1]})")
+                self._reset = True
+            else:
+                self.status_label.setText(self._show(result) or name)
+        if self._pending:
+            self.refresh()
+
+    def _on_file_changed(self, path: str):
+        # 保存時にファイルを置き換えるエディタでは監視が外れるので付け直す
+        if path == self._path and path not in self._watcher.files() and Path(path).exists():
+            self._watcher.addPath(path)
+        self._debounce.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._pending:
+            self.refresh()
+
+
+class PreviewPane(_WatchedPreview):
+    """入力ファイルの HTML プレビュー (保存のたびに差分だけ描画し直す)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.math, self.math_script = math_assets()
+        if QWebEngineView is not None:
+            self.view = QWebEngineView(self)
+            self.view.loadFinished.connect(self._on_load_finished)
+            # ページはファイルに書いて読み込む (setHtml は 2MB まで)
+            self._page_dir = tempfile.TemporaryDirectory(prefix="pandoctools-preview-")
+        else:
+            self.view = QTextBrowser(self)
+            self.view.setOpenExternalLinks(True)
+            self._page_dir = None
+        self._layout.addWidget(self.view, 1)
+
+        self._reader = "markdown"
+        self._document = PreviewDocument(PreviewRenderer(reader=self._reader, math=self.math))
+        self._html: List[str] = []
+        # WebEngine のページを読み込み終えたか (読み込み中は差分を当てられない)
+        self._loaded = False
+
+    def set_reader(self, reader: str):
+        """入力形式 (--from。例: markdown+hard_line_breaks) を変える."""
+        reader = reader.strip() or "markdown"
+        if reader == self._reader:
+            return
+        self._reader = reader
+        self._restart()
+        self.refresh()
+
+    def shutdown(self):
+        """アプリ終了時の後始末 (監視とページ用の一時ディレクトリ)."""
+        super().shutdown()
+        if self._page_dir is not None:
+            self._page_dir.cleanup()
+
+    def _render(self, path: str, reset: bool):
+        # (差分 or None, 全体を入れ直すときのブロック HTML or None)
+        if reset:
+            self._document = PreviewDocument(PreviewRenderer(reader=self._reader, math=self.math))
+        try:
+            text = Path(path).read_text(encoding="utf-8", errors="replace")
+            patch = self._document.update(text, cwd=str(Path(path).parent))
+        except (OSError, PreviewError):
+            self._document.reset()
+            raise
+        return patch, list(self._document.html) if reset else None
+
+    def _show(self, result) -> Optional[str]:
+        patch, full = result
+        if full is not None:
+            self._show_full(full)
+        elif patch is not None:
+            self._show_patch(patch)
+            return f"{Path(self._path).name}: {len(patch.html)} ブロックを更新"
+        return None
+
+    def _clear(self):
+        self._show_full([])
+
+    def _show_full(self, blocks: List[str]):
+        self._html = list(blocks)
+        base_dir = str(Path(self._path).parent) if self._path else None
+        if self._page_dir is not None:
+            page = Path(self._page_dir.name) / "preview.html"
+            page.write_text(page_html(blocks, self.math, self.math_script, base_dir=base_dir),
+                            encoding="utf-8")
+            self._loaded = False
+            self.view.load(QUrl.fromLocalFile(str(page)))
+        else:
+            self._set_browser_html(base_dir)
+
+    def _show_patch(self, patch: PreviewPatch):
+        self._html[patch.start:patch.start + patch.removed] = patch.html
+        if self._page_dir is not None and not self._loaded:
+            self._show_full(self._html)
+        elif self._page_dir is not None:
+            # 該当ブロックの DOM だけを差し替える (スクロール位置は動かない)
+            self.view.page().runJavaScript(patch_script(patch))
+        else:
+            self._set_browser_html(str(Path(self._path).parent))
+
+    def _set_browser_html(self, base_dir: Optional[str]):
+        bar = self.view.verticalScrollBar()
+        position = bar.value()
+        if base_dir:
+            self.view.document().setBaseUrl(QUrl.fromLocalFile(base_dir + "/"))
+        # QTextBrowser は JavaScript を実行しないのでブロックだけを入れる
+        self.view.setHtml("<html><body>" + "\n".join(block_html(h) for h in self._html) + "</body></html>")
+        bar.setValue(position)
+
+    def _on_load_finished(self, ok: bool):
+        self._loaded = ok
+
+
+class TypstPagePane(_WatchedPreview):
+    """Typst で組んだページ画像のプレビュー (変わったページだけ読み込み直す)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.scroll_area = QScrollArea(self)
+        self.scroll_area.setWidgetResizable(True)
+        content = QWidget()
+        self._pages_layout = QVBoxLayout(content)
+        self._pages_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop)
+        self.scroll_area.setWidget(content)
+        self._layout.addWidget(self.scroll_area, 1)
+
+        self._preview = TypstPagePreview()
+        self._labels: List[QLabel] = []
+        self._pandoc_args: List[str] = []
+        self._typst_args: List[str] = []
+
+    def set_options(self, pandoc_args: List[str], typst_args: List[str]):
+        """pandoc (--to typst) と typst compile に渡す引数を変える (変換設定の反映)."""
+        if [pandoc_args, typst_args] == [self._pandoc_args, self._typst_args]:
+            return
+        self._pandoc_args, self._typst_args = list(pandoc_args), list(typst_args)
+        self.refresh()
+
+    def shutdown(self):
+        """アプリ終了時の後始末 (監視とページ画像のキャッシュ)."""
+        super().shutdown()
+        self._preview.close()
+
+    def _render(self, path: str, reset: bool) -> PageUpdate:
+        update = self._preview.update([path], self._pandoc_args, self._typst_args)
+        if reset:
+            # ファイルを切り替えたときは (ページの内容が同じでも) 全ページを描き直す
+            update.changed = list(range(len(update.pages)))
+        return update
+
+    def _show(self, update: PageUpdate) -> Optional[str]:
+        # 減ったページのラベルを消し、変わったページの画像だけを読み込む (スクロール位置は動かない)
+        while len(self._labels) > len(update.pages):
+            self._labels.pop().deleteLater()
+        while len(self._labels) < len(update.pages):
+            label = QLabel()
+            label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            self._pages_layout.addWidget(label)
+            self._labels.append(label)
+        for i in update.changed:
+            self._labels[i].setPixmap(QPixmap(str(update.pages[i])))
+        return (f"{Path(self._path).name}: {len(update.pages)} ページ"
+                f" ({len(update.changed)} ページを更新)")
+
+    def _clear(self):
+        while self._labels:
+            self._labels.pop().deleteLater()
@@ -0,0 +1,161 @@
+"""
+小さな docx / html / markdown 出力の高速経路 (pypandoc, `--backend inprocess`)
+
+数 KB の Markdown を docx / html にするジョブでは、変換そのものより周辺の準備
+(PATH からの pandoc 探索、asyncio のプロセス起動とパイプの監視、出力先ごとの一時ファイル作成) の
+割合が大きい。PypandocBackend は
+
+  - pandoc のパスを start() で 1 度だけ確定する (pypandoc.get_pandoc_path。以後は探索しない)
+  - 出力は使い回しの一時ディレクトリに書かせて読み戻す
+  - pypandoc の書式確認 (pandoc --list-*-formats) は省く (verify_format=False)
+
+ことで、ジョブあたりの準備を最小にする。pandoc 自体は pypandoc 経由で起動される
+(pandoc を同じプロセス内で動かす手段は無い) ので、効果は benchmarks/bench_backends.py で確認できる。
+
+引き受けるのは fast_path_request() の条件 (出力が docx / html / markdown、入力 1 つで
+SMALL_INPUT_BYTES 以下、タイムアウト指定なし) を満たすジョブだけで、それ以外や
+pypandoc が入っていない環境では従来どおり pandoc プロセスで変換する。pypandoc は pandoc の警告を
+自身のロガーに流すため、この経路で変換したジョブの警告行は表示・レポートされない。
+"""
+from __future__ import annotations
+
+import inspect
+import itertools
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from conversion import BackendError, ConversionBackend, ConversionJob
+
+BACKEND_INPROCESS = "inprocess"
+# 出力形式と入力サイズで inprocess / process を自動で選ぶ (既定)
+BACKEND_AUTO = "auto"
+
+# 出力ファイルの拡張子 → writer
+FAST_WRITERS = {".docx": "docx", ".html": "html", ".htm": "html", ".md": "markdown",
+                ".markdown": "markdown"}
+# これより大きい入力は pandoc の処理時間が支配的なので通常の経路で
+SMALL_INPUT_BYTES = 256 * 1024
+
+LogCallback = Callable[[str], None]
+
+
+def fast_path_request(job: ConversionJob, max_bytes: int = SMALL_INPUT_BYTES) -> Optional[Dict[str, Any]]:
+    """job が高速経路の対象なら pypandoc.convert_file の引数を返す (対象外は None)."""
+    writer = FAST_WRITERS.get(Path(job.output_file).suffix.lower())
+    if writer is None or len(job.inputs) != 1:
+        return None
+    # pypandoc は子プロセスを止められないので、ハング対策が要るジョブはプロセスで
+    if job.timeout or job.idle_timeout:
+        return None
+    try:
+        if os.path.getsize(job.inputs[0]) > max_bytes:
+            return None
+    except OSError:
+        return None
+    fmt = "markdown"
+    extra: List[str] = []
+    args = list(job.extra_args)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("--from", "-f", "-r", "--read") and i + 1 < len(args):
+            fmt = args[i + 1]
+            i += 2
+            continue
+        if arg.startswith(("--from=", "--read=")):
+            fmt = arg.split("=", 1)[1]
+        else:
+            # 作業ディレクトリ (入力側) からの相対パスはこの経路では解決できない
+            value = arg.split("=", 1)[1] if arg.startswith("--") and "=" in arg else arg
+            if not os.path.isabs(value) and os.path.exists(os.path.join(job.cwd(), value)):
+                return None
+            extra.append(arg)
+        i += 1
+    if job.resource_path:
+        extra = ["--resource-path", job.resource_path] + extra
+    return {"source": job.inputs[0], "to": writer, "format": fmt, "extra_args": extra,
+            "suffix": Path(job.output_file).suffix}
+
+
+class PypandocBackend(ConversionBackend):
+    """pypandoc で小さなジョブを変換するバックエンド (start() が False なら使わない)."""
+
+    name = BACKEND_INPROCESS
+
+    def __init__(self, max_bytes: int = SMALL_INPUT_BYTES, log: Optional[LogCallback] = None):
+        self.max_bytes = max_bytes
+        self.log = log or (lambda text: None)
+        self.pandoc_path = ""
+        self._pypandoc: Any = None
+        self._options: Dict[str, Any] = {}
+        self._tmp_dir: Optional[str] = None
+        self._counter = itertools.count()
+
+    @property
+    def available(self) -> bool:
+        return self._pypandoc is not None
+
+    def start(self) -> bool:
+        try:
+            import pypandoc
+        except ImportError:
+            self.log("inprocess: pypandoc が無いため pandoc プロセスで変換します")
+            return False
+        try:
+            # パスを確定してキャッシュさせる (以後のジョブで探索しない)
+            self.pandoc_path = pypandoc.get_pandoc_path()
+        except OSError as e:
+            self.log(f"inprocess: pandoc が見つかりません ({e})")
+            return False
+        params = inspect.signature(pypandoc.convert_file).parameters
+        # 古い pypandoc は入力を並べ替え、書式確認のたびに pandoc を起動する
+        self._options = {"verify_format": False}
+        if "sort_files" in params:
+            self._options["sort_files"] = False
+        self._tmp_dir = tempfile.mkdtemp(prefix="pandoctools-inprocess-")
+        self._pypandoc = pypandoc
+        return True
+
+    def stop(self) -> None:
+        self._pypandoc = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self) -> "PypandocBackend":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- ConversionBackend ----------------------------------------------------
+
+    def prepare(self, job: ConversionJob) -> Optional[Dict[str, Any]]:
+        if self._pypandoc is None:
+            return None
+        return fast_path_request(job, self.max_bytes)
+
+    def convert(self, request: Dict[str, Any], timeout: Optional[float] = None) -> Tuple[bytes, List[str]]:
+        pypandoc, tmp_dir = self._pypandoc, self._tmp_dir
+        if pypandoc is None or tmp_dir is None:
+            raise BackendError("pypandoc が使えません")
+        out = os.path.join(tmp_dir, f"{next(self._counter)}{request['suffix']}")
+        try:
+            # cworkdir は使わない (pypandoc はプロセス全体の os.chdir で実現するためスレッド安全でない)。
+            # 画像などは --resource-path で解決される
+            pypandoc.convert_file(request["source"], request["to"], format=request["format"],
+                                  extra_args=request["extra_args"], outputfile=out, **self._options)
+            with open(out, "rb") as f:
+                return f.read(), []
+        except (RuntimeError, OSError) as e:
+            lines = str(e).strip().splitlines()
+            raise BackendError(lines[-1] if lines else type(e).__name__)
+        finally:
+            try:
+                os.unlink(out)
+            except OSError:
+                pass
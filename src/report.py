@@ -0,0 +1,135 @@
+"""
+機械可読な実行レポート (JSON Lines)
+
+`pandoctools convert --report json` で使う。ビルドスクリプトが人間向けの
+バナーや `exit code:` 行をスクレイピングしなくて済むよう、1 行 1 レコードで
+
+  {"type": "run", ...}      実行開始 (argv / プロファイル / 解決後の LogicalConfig)
+  {"type": "job", ...}      ジョブ 1 件の結果 (終わった順に逐次書き出す)
+  {"type": "summary", ...}  全体の集計と終了コード
+
+を書き出す。各行は書いた時点で flush するので、数千ファイルのバッチでも
+tail -f やパイプで完了したジョブから順に処理できる。
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import asdict
+from typing import IO, Dict, List, Optional
+
+from conversion import ConversionJob, JobResult
+from engines import LogicalConfig
+
+REPORT_FORMATS = ("json",)
+REPORT_VERSION = 1
+
+# pandoc ([WARNING]) / typst (warning:) の警告行の接頭辞。LaTeX は "... Warning:" を含む行
+_WARNING_PREFIXES = ("[WARNING]", "warning:")
+
+
+class WarningCollector:
+    """ジョブごとの stderr から警告行を拾う (チャンク境界で行が切れても良いよう行単位で処理)."""
+
+    def __init__(self):
+        self._partial: Dict[int, str] = {}
+        self._warnings: Dict[int, List[str]] = {}
+
+    def feed(self, job: ConversionJob, text: str) -> None:
+        buf = self._partial.get(id(job), "") + text
+        *lines, rest = buf.split("\n")
+        self._partial[id(job)] = rest
+        for line in lines:
+            self._scan(job, line)
+
+    def pop(self, job: ConversionJob) -> List[str]:
+        rest = self._partial.pop(id(job), "")
+        if rest:
+            self._scan(job, rest)
+        return self._warnings.pop(id(job), [])
+
+    def _scan(self, job: ConversionJob, line: str) -> None:
+        line = line.rstrip("\r")
+        if line.startswith(_WARNING_PREFIXES) or "Warning:" in line:
+            self._warnings.setdefault(id(job), []).append(line)
+
+
+class RunReport:
+    """JSON Lines レポートの書き手."""
+
+    def __init__(self, stream: IO[str], argv: List[str], profile: str,
+                 config: Optional[LogicalConfig] = None):
+        self.stream = stream
+        self.config = asdict(config) if config is not None else None
+        self.warnings = WarningCollector()
+        # job() で書いた結果 (複数回の run_conversions にまたがる実行の summary 用)
+        self.results: List[JobResult] = []
+        self._started = time.time()
+        self._write({
+            "type": "run",
+            "version": REPORT_VERSION,
+            "argv": list(argv),
+            "profile": profile,
+            "config": self.config,
+            "cwd": os.getcwd(),
+            "started": self._started,
+        })
+
+    def job(self, result: JobResult) -> None:
+        self.results.append(result)
+        job = result.job
+        try:
+            size = os.path.getsize(job.output_file)
+        except OSError:
+            size = None
+        self._write({
+            "type": "job",
+            "name": job.name,
+            "inputs": list(job.inputs),
+            "config": self.config,
+            "argv": job.command(),
+            "cwd": job.cwd(),
+            "output": job.output_file,
+            "output_size": size,
+            "status": result.status,
+            "exit_code": result.exit_code,
+            "reason": result.reason or None,
+            "duration": round(result.duration, 3),
+            "cache": result.cache or None,
+            "metrics": result.metrics,
+            "engine": job.engine or None,
+            "attempts": result.attempts or None,
+            "backend": result.backend or None,
+            "warnings": self.warnings.pop(job),
+        })
+
+    def planned(self, job: ConversionJob) -> None:
+        """--dry-run 用: 実行しなかったジョブの記録."""
+        self._write({
+            "type": "job",
+            "name": job.name,
+            "inputs": list(job.inputs),
+            "config": self.config,
+            "argv": job.command(),
+            "cwd": job.cwd(),
+            "output": job.output_file,
+            "engine": job.engine or None,
+            "status": "dry-run",
+        })
+
+    def summary(self, results: List[JobResult], exit_code: int) -> None:
+        counts: Dict[str, int] = {}
+        for r in results:
+            counts[r.status] = counts.get(r.status, 0) + 1
+        self._write({
+            "type": "summary",
+            "jobs": len(results),
+            "counts": counts,
+            "exit_code": exit_code,
+            "duration": round(time.time() - self._started, 3),
+        })
+
+    def _write(self, record: dict) -> None:
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
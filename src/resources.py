@@ -0,0 +1,250 @@
+"""
+リソースの探索パスと画像参照の解決 (CLI / GUI 共通)
+
+resource_path は入力ファイルのディレクトリから --resource-path の値を作る。絶対パスにして
+重複を除き (Windows では大文字小文字を区別しない)、入力の順に os.pathsep で区切る。
+CLI (cli._make_job) と GUI (PandocWorker._make_job) はどちらもこれを使う。
+
+章ごとに別フォルダにある入力をまとめて変換すると、--resource-path には全入力のディレクトリが
+並び、pandoc は画像ごとに見つかるまで各ディレクトリを順に探す。300 章なら参照 1 つにつき
+最大 300 回のファイル探索になり、同名の画像が複数のフォルダにあれば --resource-path で
+先に並んだほうが (その章のフォルダの画像でなくても) 使われる。
+
+ResourceIndex は実行ごとに 1 つ作り、ディレクトリの一覧 (os.scandir) を 1 度だけ読んで
+キャッシュし、画像の参照名から実際のパスを引く。ResourceRewriter は入力ディレクトリが
+複数あるジョブについて、画像参照を絶対パスに書き換えた入力のコピーを一時ディレクトリ
+(スクラッチがあればその下) に置き、pandoc にはそちらを渡す (ConversionJob.input_copies)。
+参照は
+
+  1. その入力ファイル自身のディレクトリ
+  2. 入力ディレクトリ (--resource-path の順)
+
+の順に探す。自分のディレクトリに無く、ほかの複数のディレクトリに候補があるときは警告し、
+先に並んだものを使う。見つからない参照はそのまま残す (pandoc に警告させる)。
+
+書き換えるのは Markdown の画像 (![...](...)) と HTML の <img src>。コードブロックの中は
+触らない。画像のパスがそのまま出力に残る形式 (HTML・LaTeX ソースなど) や、プロジェクト外の
+絶対パスを読めない Typst は対象外。
+"""
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from conversion import ConversionJob
+
+# pandoc が画像を取り込む出力形式 (出力に画像のパスが残らない)
+FETCHING_SUFFIXES = {".pdf", ".docx", ".odt", ".epub", ".pptx"}
+# HTML はこれらの指定があるときだけ画像を埋め込む
+_EMBED_FLAGS = {"--embed-resources", "--self-contained"}
+
+_MD_IMAGE_RE = re.compile(r"(!\[[^\]]*\]\(\s*)(<[^>\n]+>|[^)\s]+)")
+_HTML_IMG_RE = re.compile(r"(<img\b[^>]*?\bsrc\s*=\s*)([\"'])([^\"']+)\2", re.IGNORECASE)
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+LogCallback = Callable[[str], None]
+
+
+def _is_local(ref: str) -> bool:
+    return ("://" not in ref and not ref.startswith(("data:", "#", "mailto:"))
+            and "?" not in ref and "#" not in ref)
+
+
+def _key(name: str) -> str:
+    return os.path.normcase(name)
+
+
+def input_dirs(inputs: List[str]) -> List[str]:
+    """入力ファイルのディレクトリ (絶対パス、重複なし、入力順)."""
+    seen = set()
+    dirs: List[str] = []
+    for path in inputs:
+        directory = str(Path(path).parent.resolve())
+        if _key(directory) not in seen:
+            seen.add(_key(directory))
+            dirs.append(directory)
+    return dirs
+
+
+def resource_path(inputs: List[str]) -> str:
+    """--resource-path の値 (入力ディレクトリを入力順に os.pathsep で区切る)."""
+    return os.pathsep.join(input_dirs(inputs))
+
+
+def rewrites_images(job: ConversionJob) -> bool:
+    """job の出力形式で画像参照を絶対パスに書き換えてよいか."""
+    if any("typst" in arg for arg in job.extra_args if arg.startswith("--pdf-engine")):
+        return False
+    suffix = Path(job.output_file).suffix.lower()
+    if suffix in (".html", ".htm"):
+        return any(arg in _EMBED_FLAGS for arg in job.extra_args)
+    return suffix in FETCHING_SUFFIXES
+
+
+class ResourceIndex:
+    """ディレクトリ一覧のキャッシュから画像の参照名を実際のパスに引く."""
+
+    def __init__(self):
+        # ディレクトリ → {正規化した名前: (実際の名前, ディレクトリか)}
+        self._listings: Dict[str, Dict[str, Tuple[str, bool]]] = {}
+
+    def _listing(self, directory: str) -> Dict[str, Tuple[str, bool]]:
+        listing = self._listings.get(directory)
+        if listing is None:
+            listing = {}
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            listing[_key(entry.name)] = (entry.name, entry.is_dir())
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            self._listings[directory] = listing
+        return listing
+
+    def find(self, ref: str, directory: str) -> Optional[str]:
+        """directory から見た相対参照 ref のファイル (無ければ None)."""
+        parts = [p for p in ref.replace("\\", "/").split("/") if p and p != "."]
+        if not parts or ".." in parts:
+            # 親ディレクトリへの参照は一覧を辿らずに確認する
+            path = Path(directory, ref)
+            return str(path.resolve()) if path.is_file() else None
+        current = directory
+        for i, part in enumerate(parts):
+            entry = self._listing(current).get(_key(part))
+            if entry is None or entry[1] != (i < len(parts) - 1):
+                return None
+            current = os.path.join(current, entry[0])
+        return current
+
+    def candidates(self, ref: str, dirs: List[str]) -> List[str]:
+        """dirs のうち ref が見つかるものすべて (dirs の順)."""
+        return [path for path in (self.find(ref, d) for d in dirs) if path is not None]
+
+
+class ResourceRewriter:
+    """画像参照を絶対パスにした入力のコピーをジョブに使わせる (1 回の実行で共有する)."""
+
+    def __init__(self, index: Optional[ResourceIndex] = None, log: Optional[LogCallback] = None):
+        self.index = index or ResourceIndex()
+        self.log = log or (lambda text: None)
+        self._work_dir: Optional[str] = None
+        self._count = 0
+
+    def resolve(self, ref: str, base_dir: str, dirs: List[str], source: str) -> Optional[str]:
+        """ref の実際のパス (無ければ None)。自分のディレクトリに無く候補が複数なら警告する."""
+        if not _is_local(ref) or os.path.isabs(ref):
+            return None
+        own = self.index.find(ref, base_dir)
+        if own is not None:
+            return own
+        found = self.index.candidates(ref, [d for d in dirs if _key(d) != _key(base_dir)])
+        if len(found) > 1:
+            self.log(f"警告: 画像 {ref} ({Path(source).name}) の候補が複数あります: "
+                     f"{', '.join(found)} → {found[0]} を使います\n")
+        return found[0] if found else None
+
+    def rewrite_text(self, text: str, base_dir: str, dirs: List[str], source: str) -> Tuple[str, int]:
+        """text の画像参照を絶対パスにする。(書き換えた text, 書き換えた数) を返す."""
+        count = 0
+
+        def markdown(m: re.Match) -> str:
+            nonlocal count
+            raw = m.group(2)
+            ref = raw[1:-1] if raw.startswith("<") else raw
+            path = self.resolve(ref, base_dir, dirs, source)
+            if path is None:
+                return m.group(0)
+            count += 1
+            dest = Path(path).as_posix()
+            if any(c in dest for c in " \t()<>"):
+                dest = f"<{dest}>"
+            return m.group(1) + dest
+
+        def html(m: re.Match) -> str:
+            nonlocal count
+            path = self.resolve(m.group(3), base_dir, dirs, source)
+            if path is None:
+                return m.group(0)
+            count += 1
+            return f"{m.group(1)}{m.group(2)}{Path(path).as_posix()}{m.group(2)}"
+
+        out: List[str] = []
+        fence: Optional[str] = None
+        for line in text.splitlines(keepends=True):
+            m = _FENCE_RE.match(line)
+            if fence is None and m:
+                fence = m.group(1)
+            elif fence is not None:
+                if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) \
+                        and not line.strip()[len(m.group(1)):]:
+                    fence = None
+            elif "![" in line or "<img" in line.lower():
+                line = _HTML_IMG_RE.sub(html, _MD_IMAGE_RE.sub(markdown, line))
+            out.append(line)
+        return "".join(out), count
+
+    def prepare(self, job: ConversionJob) -> bool:
+        """入力ディレクトリが複数あるジョブに、画像参照を書き換えたコピーを使わせる."""
+        if job.input_copies is not None or not rewrites_images(job):
+            return False
+        dirs = input_dirs(job.inputs)
+        if len(dirs) < 2:
+            return False
+        copies: List[str] = []
+        total = 0
+        for path in job.inputs:
+            try:
+                text = Path(path).read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                copies.append(path)
+                continue
+            base_dir = str(Path(path).parent.resolve())
+            rewritten, count = self.rewrite_text(text, base_dir, dirs, path)
+            if not count:
+                copies.append(path)
+                continue
+            total += count
+            copies.append(self._write_copy(job, path, rewritten))
+        if not total:
+            return False
+        job.input_copies = copies
+        self.log(f"画像参照を解決しました: {job.name} ({total} 件を絶対パスに)\n")
+        return True
+
+    def cleanup(self) -> None:
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+    def _write_copy(self, job: ConversionJob, path: str, text: str) -> str:
+        if self._work_dir is None:
+            parent = None
+            if job.scratch_dir:
+                parent = os.path.join(job.scratch_dir, "pandoctools")
+                os.makedirs(parent, exist_ok=True)
+            self._work_dir = tempfile.mkdtemp(prefix="resources-", dir=parent)
+        # 同じ名前の入力がぶつからないよう 1 ファイルずつディレクトリを分ける (名前は変えない)
+        self._count += 1
+        directory = Path(self._work_dir, str(self._count))
+        directory.mkdir()
+        copy = directory / Path(path).name
+        copy.write_text(text, encoding="utf-8")
+        return str(copy)
+
+
+def prepare_jobs(jobs: List[ConversionJob], log: Optional[LogCallback] = None) -> ResourceRewriter:
+    """ジョブ群の画像参照を 1 つの索引で解決する (CLI / GUI 共通).
+
+    作ったコピーは返した ResourceRewriter の cleanup() で消す (変換が終わってから)。
+    """
+    rewriter = ResourceRewriter(log=log)
+    for job in jobs:
+        rewriter.prepare(job)
+    return rewriter
@@ -0,0 +1,350 @@
+"""
+バッチ変換の適応的スケジューラ
+
+固定の -j N では、xelatex (大きなフォント) や typst (大きな文書) が 1 ジョブで
+数 GB を使うとき、並列度が足りないかメモリを使い切ってスワップするかのどちらかになる。
+本モジュールの AdaptiveLimiter は、ジョブを開始するたびに
+
+  - ロードアベレージ (os.getloadavg)
+  - 利用可能メモリ (/proc/meminfo の MemAvailable)
+  - プロファイルごとのピーク RSS の実績 (RunHistory に永続化)
+
+を見て、余裕がある場合だけ次のジョブを開始する。余裕が無いときは実行中ジョブの
+終了 (または負荷の低下) を待つ。Linux 以外で計測値が取れない項目は判定に使わない。
+
+あわせて入力ごとの所要時間も RunHistory に残し、order_jobs で投入順を並べ替える
+(lpt: 長いジョブから = 並列時のメイクスパン短縮 / sjf: 短いジョブから = 早く結果を見る)。
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from common import CACHE_DIR
+from conversion import STATUS_FAILED, ConversionJob, JobLimiter, JobResult
+from jsonstore import JsonStore, LogCallback
+
+HISTORY_FILE = "history.json"
+
+# 実績が無いプロファイルのピーク RSS 見込み (xelatex + 日本語フォントで数百 MB 程度)
+DEFAULT_PEAK_RSS = 512 * 1024 * 1024
+# 見込みに掛ける安全係数
+RSS_SAFETY = 1.25
+# 実行中ジョブ以外に常に残しておく空きメモリ
+MIN_FREE_BYTES = 256 * 1024 * 1024
+# 1 コアあたり許容するロードアベレージ
+LOAD_PER_CPU = 1.0
+# ジョブ開始の最小間隔 (loadavg / RSS が立ち上がるまでのラグを吸収する)
+START_INTERVAL = 1.0
+# 開始待ちの再判定間隔 / RSS サンプリング間隔
+POLL_INTERVAL = 0.5
+
+# --order の選択肢
+ORDER_GIVEN = "given"
+ORDER_LPT = "lpt"  # longest processing time first
+ORDER_SJF = "sjf"  # shortest job first
+ORDERS = (ORDER_GIVEN, ORDER_LPT, ORDER_SJF)
+# 実績が無いときの入力サイズ → 所要時間の換算 (秒/バイト)。実績があればプロファイルごとに学習値を使う
+DEFAULT_SECONDS_PER_BYTE = 1e-4
+# 所要時間の指数移動平均の重み (新しい実測値側)
+DURATION_ALPHA = 0.5
+
+
+# --- システム計測 -------------------------------------------------------------
+
+def read_meminfo(path: str = "/proc/meminfo") -> Dict[str, int]:
+    """/proc/meminfo をバイト単位の辞書で返す (読めない環境では空)."""
+    info: Dict[str, int] = {}
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if not parts:
+                    continue
+                value = int(parts[0])
+                if len(parts) > 1 and parts[1].lower() == "kb":
+                    value *= 1024
+                info[key.strip()] = value
+    except (OSError, ValueError):
+        return {}
+    return info
+
+
+class SystemProbe:
+    """負荷・メモリ・プロセスツリー RSS の計測 (テストでは差し替える)."""
+
+    def available_memory(self) -> Optional[int]:
+        return read_meminfo().get("MemAvailable")
+
+    def load_average(self) -> Optional[float]:
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+
+    def cpu_count(self) -> int:
+        return os.cpu_count() or 1
+
+    def session_rss(self, pids: Iterable[int]) -> Optional[Dict[int, int]]:
+        """pids それぞれを先頭とするセッション (= pandoc と子の engine) の RSS 合計.
+
+        ConversionRunner はジョブを新しいセッションで起動するので、セッション ID で
+        子孫をまとめて拾える。/proc は 1 回だけ走査し、全ジョブ分をまとめて返す。
+        /proc が無い環境では None。
+        """
+        proc = Path("/proc")
+        if not proc.is_dir():
+            return None
+        page = os.sysconf("SC_PAGE_SIZE")
+        totals = {pid: 0 for pid in pids}
+        for entry in proc.iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                stat = (entry / "stat").read_text()
+                # comm に空白や括弧が含まれ得るので最後の ')' 以降をフィールドとして扱う
+                fields = stat[stat.rindex(")") + 2:].split()
+                session = int(fields[3])
+                if session not in totals:
+                    continue
+                totals[session] += int((entry / "statm").read_text().split()[1]) * page
+            except (OSError, ValueError, IndexError):
+                continue
+        return totals
+
+
+# --- 実行履歴 -----------------------------------------------------------------
+
+def _input_size(job: ConversionJob) -> int:
+    total = 0
+    for f in job.inputs:
+        try:
+            total += os.path.getsize(f)
+        except OSError:
+            pass
+    return total
+
+
+def _input_signature(job: ConversionJob) -> List[int]:
+    """入力群が変わったかの判定用 (合計サイズと最新の更新時刻)."""
+    size, mtime = 0, 0
+    for f in job.inputs:
+        try:
+            st = os.stat(f)
+        except OSError:
+            continue
+        size += st.st_size
+        mtime = max(mtime, st.st_mtime_ns)
+    return [size, mtime]
+
+
+def duration_key(job: ConversionJob) -> str:
+    """所要時間履歴のキー (入力パス群 + プロファイル)."""
+    paths = "|".join(os.path.normcase(os.path.abspath(f)) for f in job.inputs)
+    return f"{job.profile or 'default'}::{paths}"
+
+
+class RunHistory(JsonStore):
+    """プロファイルごとの実績 (ピーク RSS) と入力ごとの所要時間を JSON に永続化する.
+
+    保存時は他のプロセスが間に記録した内容とマージする (jsonstore.JsonStore)。
+    """
+
+    save_error = "実行履歴の保存に失敗しました"
+
+    def __init__(self, path: Optional[Path] = None, log: Optional[LogCallback] = None):
+        super().__init__(Path(path) if path else CACHE_DIR / HISTORY_FILE, log=log)
+
+    def _profile(self, profile: str) -> Dict[str, Any]:
+        return self.data.setdefault("profiles", {}).setdefault(profile or "default", {})
+
+    def peak_rss(self, profile: str) -> Optional[int]:
+        value = self.data.get("profiles", {}).get(profile or "default", {}).get("peak_rss")
+        return int(value) if value else None
+
+    def record_peak_rss(self, profile: str, rss: int) -> None:
+        """実測ピークを記録する。過去の大きな値はゆっくり減衰させる (一度の小さな文書で油断しない)."""
+        entry = self._profile(profile)
+        previous = int(entry.get("peak_rss") or 0)
+        entry["peak_rss"] = max(int(rss), int(previous * 0.9))
+        entry["runs"] = int(entry.get("runs", 0)) + 1
+
+    def duration(self, job: ConversionJob) -> Optional[float]:
+        entry = self.data.get("durations", {}).get(duration_key(job))
+        return float(entry["seconds"]) if entry else None
+
+    def record_duration(self, job: ConversionJob, seconds: float) -> None:
+        """成功したジョブの所要時間を記録し、プロファイルの秒/バイトも学習する."""
+        durations = self.data.setdefault("durations", {})
+        key = duration_key(job)
+        previous = durations.get(key, {}).get("seconds")
+        if previous is not None:
+            seconds = DURATION_ALPHA * seconds + (1 - DURATION_ALPHA) * float(previous)
+        size = _input_size(job)
+        durations[key] = {"seconds": round(seconds, 3), "size": size}
+        if size:
+            entry = self._profile(job.profile)
+            entry["seconds"] = float(entry.get("seconds", 0.0)) + seconds
+            entry["bytes"] = int(entry.get("bytes", 0)) + size
+
+    def typst_failed(self, job: ConversionJob) -> bool:
+        """engine auto: この入力が (変更される前に) Typst で失敗して LaTeX に切り替わったか."""
+        entry = self.data.get("typst_failed", {}).get(duration_key(job))
+        return entry is not None and entry == _input_signature(job)
+
+    def record_attempts(self, job: ConversionJob, attempts: List[Dict[str, Any]]) -> None:
+        """engine auto の実行結果 (JobResult.attempts) から Typst の成否を記録する."""
+        failed = self.data.setdefault("typst_failed", {})
+        for attempt in attempts:
+            if attempt["engine"] != "typst":
+                continue
+            if attempt["status"] == STATUS_FAILED:
+                failed[duration_key(job)] = _input_signature(job)
+            else:
+                failed.pop(duration_key(job), None)
+
+    def estimate_duration(self, job: ConversionJob) -> float:
+        """所要時間の見込み秒。履歴が無ければ入力サイズ × (学習済み or 既定の) 秒/バイト."""
+        known = self.duration(job)
+        if known is not None:
+            return known
+        entry = self.data.get("profiles", {}).get(job.profile or "default", {})
+        rate = DEFAULT_SECONDS_PER_BYTE
+        if entry.get("bytes"):
+            rate = float(entry["seconds"]) / int(entry["bytes"])
+        return _input_size(job) * rate
+
+
+def order_jobs(jobs: List[ConversionJob], order: str,
+               history: Optional[RunHistory] = None) -> List[ConversionJob]:
+    """--order に従ってジョブの投入順を並べ替える (given はそのまま)。同値は元の順を保つ."""
+    if order == ORDER_GIVEN or len(jobs) < 2:
+        return list(jobs)
+    if order not in ORDERS:
+        raise ValueError(f"未知の order です: {order}")
+    history = history if history is not None else RunHistory()
+    estimates = {id(job): history.estimate_duration(job) for job in jobs}
+    return sorted(jobs, key=lambda job: estimates[id(job)], reverse=(order == ORDER_LPT))
+
+
+# --- 適応的リミッタ -----------------------------------------------------------
+
+class AdaptiveLimiter(JobLimiter):
+    """CPU / メモリの余裕を見ながらジョブを開始する JobLimiter.
+
+    max_jobs は上限であり、実際の並列度は余裕に応じてそれ以下になる。
+    実行中ジョブが 0 のときは常に開始する (どれだけ重くても前進はする)。
+    計測したピーク RSS は history に記録するだけで、保存 (history.save) は実行の最後に
+    呼び出し側が 1 回だけ行う (ジョブごとのロック付き保存でイベントループを止めないように)。
+    """
+
+    def __init__(self, max_jobs: Optional[int] = None, history: Optional[RunHistory] = None,
+                 probe: Optional[SystemProbe] = None, log=None,
+                 start_interval: float = START_INTERVAL, poll_interval: float = POLL_INTERVAL):
+        self.probe = probe or SystemProbe()
+        super().__init__(max_jobs or self.probe.cpu_count())
+        self.history = history if history is not None else RunHistory(log=log)
+        self.log = log
+        self.start_interval = start_interval
+        self.poll_interval = poll_interval
+        self._running: Dict[int, Dict[str, Any]] = {}  # id(job) -> {estimate, rss, peak, pid}
+        # 実行中の全ジョブの RSS をまとめて測るタスク (False: /proc が無く計測しない)
+        self._sampler: Optional[asyncio.Future] = None
+        self._sampling = True
+        self._last_start = 0.0
+        self._waiting_logged = False
+        self._next_ticket = 0
+        self._serving = 0
+        self.last_reason = ""
+
+    def estimate(self, job: ConversionJob) -> int:
+        return int((self.history.peak_rss(job.profile) or DEFAULT_PEAK_RSS) * RSS_SAFETY)
+
+    def can_start(self, job: ConversionJob) -> bool:
+        """今 job を開始してよいか (理由は self.last_reason に残す)."""
+        self.last_reason = ""
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_jobs:
+            self.last_reason = f"上限 {self.max_jobs} 並列"
+            return False
+        load = self.probe.load_average()
+        if load is not None and load >= self.probe.cpu_count() * LOAD_PER_CPU:
+            self.last_reason = f"load average {load:.1f}"
+            return False
+        available = self.probe.available_memory()
+        if available is not None:
+            # 実行中ジョブがこれから使い増す分 (見込み - 現在値) を差し引いて判定する
+            reserved = sum(max(0, r["estimate"] - r["rss"]) for r in self._running.values())
+            need = self.estimate(job) + MIN_FREE_BYTES
+            if available - reserved < need:
+                self.last_reason = (f"空きメモリ不足 (available {available >> 20} MiB, "
+                                    f"reserved {reserved >> 20} MiB, need {need >> 20} MiB)")
+                return False
+        return True
+
+    async def acquire(self, job: ConversionJob) -> None:
+        # 到着順 (= 投入順) に 1 つずつ判定する。後続ジョブが軽いからといって追い越さない
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        while True:
+            if self._serving == ticket:
+                since = time.monotonic() - self._last_start
+                if self._running and since < self.start_interval:
+                    await asyncio.sleep(self.start_interval - since)
+                    continue
+                if self.can_start(job):
+                    break
+                if self.log and not self._waiting_logged:
+                    self.log(f"scheduler: 待機中 ({self.last_reason}, 実行中 {len(self._running)})")
+                    self._waiting_logged = True
+            await asyncio.sleep(self.poll_interval)
+        self._serving += 1
+        self._waiting_logged = False
+        self._last_start = time.monotonic()
+        self._running[id(job)] = {"estimate": self.estimate(job), "rss": 0, "peak": 0, "pid": None}
+
+    def started(self, job: ConversionJob, pid: int) -> None:
+        state = self._running.get(id(job))
+        if state is None:
+            return
+        # エンジンのフォールバックで同じジョブが 2 回起動することがある (新しい pid を測る)
+        state["pid"] = pid
+        if self._sampling and (self._sampler is None or self._sampler.done()):
+            self._sampler = asyncio.ensure_future(self._sample())
+
+    def release(self, job: ConversionJob, result: JobResult) -> None:
+        state = self._running.pop(id(job), None)
+        if state is None:
+            return
+        if not self._running and self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+        if state["peak"] and result.exit_code == 0:
+            self.history.record_peak_rss(job.profile, state["peak"])
+
+    async def _sample(self) -> None:
+        """poll_interval ごとに /proc を 1 回だけ走査し、実行中の全ジョブの RSS を更新する.
+
+        /proc の走査はプロセス数に比例して重いので、イベントループを止めないよう
+        executor のスレッドで行う。
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            states = [s for s in self._running.values() if s["pid"] is not None]
+            if not states:
+                return
+            rss = await loop.run_in_executor(None, self.probe.session_rss,
+                                             [s["pid"] for s in states])
+            if rss is None:
+                self._sampling = False
+                return
+            for state in states:
+                if state["pid"] in rss:
+                    state["rss"] = rss[state["pid"]]
+                    state["peak"] = max(state["peak"], state["rss"])
+            await asyncio.sleep(self.poll_interval)
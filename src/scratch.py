@@ -0,0 +1,176 @@
+"""
+中間ファイル用のスクラッチ領域
+
+pandoc の PDF 出力は一時ディレクトリに .tex / .aux / .log や画像を大量に書く。
+作業ディレクトリが Windows 共有などの遅いファイルシステムだとこの I/O が支配的になるため、
+ジョブごとにスクラッチ領域 (既定は Linux の /dev/shm = RAM) を用意して
+
+  - pandoc / xelatex / typst の一時ファイル (TMPDIR / TEMP / TMP)
+  - 出力ファイル自体 (完成後に出力先へ atomic に移動する)
+  - 2 段ビルド (--chunks) の中間ファイル
+
+をそこに置く。スクラッチの使用量 (ピーク) と出力先へ書いたバイト数は JobResult.metrics に残す。
+
+スクラッチを使わない場合も、出力は出力先ディレクトリ内の一時ファイル (temp_output_path) に
+書かせて成功時だけ os.replace する。失敗・キャンセル時に書きかけの出力が残らず、
+出力ディレクトリを監視するインデクサ等は完成したファイルだけを見る。
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+# 環境変数で場所を固定できる (none で無効)
+SCRATCH_ENV = "PANDOCTOOLS_SCRATCH"
+# /dev/shm を既定にする空き容量の下限
+MIN_SHM_FREE = 2 * 1024 ** 3
+
+SCRATCH_AUTO = "auto"
+SCRATCH_NONE = "none"
+
+
+def free_bytes(path: str) -> Optional[int]:
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def shm_root(min_free: int = MIN_SHM_FREE) -> Optional[str]:
+    """Linux の /dev/shm に十分な空きがあればそのパス."""
+    if sys.platform.startswith("linux") and os.path.isdir("/dev/shm"):
+        free = free_bytes("/dev/shm")
+        if free is not None and free >= min_free:
+            return "/dev/shm"
+    return None
+
+
+def resolve_scratch(value: Optional[str] = None, min_free: int = MIN_SHM_FREE) -> Optional[str]:
+    """スクラッチの親ディレクトリを決める (None = 使わない).
+
+    value は --scratch の値 (auto / none / ディレクトリ)。未指定なら環境変数
+    PANDOCTOOLS_SCRATCH、それも無ければ auto (/dev/shm に十分な空きがあれば使う)。
+    """
+    if value is None:
+        value = os.environ.get(SCRATCH_ENV) or SCRATCH_AUTO
+    if value == SCRATCH_AUTO:
+        return shm_root(min_free)
+    if value == SCRATCH_NONE:
+        return None
+    Path(value).mkdir(parents=True, exist_ok=True)
+    return str(Path(value).resolve())
+
+
+def make_job_dir(root: str) -> str:
+    """ジョブ専用のスクラッチディレクトリを作る."""
+    base = Path(root) / "pandoctools"
+    base.mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix="job-", dir=str(base))
+
+
+def scratch_env(job_dir: str) -> Dict[str, str]:
+    """子プロセスの一時ファイルをスクラッチに向ける環境変数."""
+    env = dict(os.environ)
+    tmp = os.path.join(job_dir, "tmp")
+    os.makedirs(tmp, exist_ok=True)
+    for name in ("TMPDIR", "TEMP", "TMP"):
+        env[name] = tmp
+    return env
+
+
+def dir_size(path: str) -> int:
+    """ディレクトリ以下のファイルサイズ合計 (途中で消えたファイルは数えない)."""
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def temp_output_path(dst: str) -> str:
+    """出力先と同じディレクトリの一時ファイル名 (拡張子は保つ: pandoc が writer を推定するため)."""
+    dst_path = Path(dst)
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{dst_path.stem}.", suffix=dst_path.suffix,
+                               dir=str(dst_path.parent))
+    os.close(fd)
+    return tmp
+
+
+def _read_umask() -> int:
+    # os.umask は設定し直さないと読めないので、起動時に 1 度だけ読む
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _read_umask()
+
+
+def output_mode(dst: str) -> int:
+    """出力ファイルに付けるパーミッション (既存の出力があればそのモード、無ければ 0o666 & ~umask)."""
+    try:
+        return os.stat(dst).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def replace_output(src: str, dst: str) -> None:
+    """src を dst へ os.replace で置く.
+
+    mkstemp の一時ファイルは 0600 なので、そのまま置くと出力が所有者しか読めなくなる。
+    置き換える前に、pandoc が直接書いた場合と同じモードにしておく。
+    """
+    try:
+        os.chmod(src, output_mode(dst))
+    except OSError:
+        pass  # モードを変えられないファイルシステム (一部のネットワーク共有など)
+    os.replace(src, dst)
+
+
+def discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def publish(src: str, dst: str) -> int:
+    """完成したファイルを出力先へ atomic に置き、書き込んだバイト数を返す.
+
+    同じファイルシステムなら rename、異なる場合 (/dev/shm → ディスク) は出力先ディレクトリ内の
+    一時ファイルへコピーしてから os.replace する。どちらでも読み手が書きかけを見ることはない。
+    """
+    size = os.path.getsize(src)
+    dst_path = Path(dst)
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        replace_output(src, dst)
+        return size
+    except OSError:
+        pass  # 別ファイルシステム (EXDEV)
+    tmp = temp_output_path(dst)
+    try:
+        with open(tmp, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out, 1 << 20)
+        replace_output(tmp, dst)
+    except BaseException:
+        discard(tmp)
+        raise
+    return size
@@ -0,0 +1,294 @@
+"""
+Typst パッケージのローカル配置 (オフライン用)
+
+default_typst.typ は `#import "@preview/js:0.1.3"` でパッケージを読み込むため、
+typst は初回コンパイル時にパッケージをダウンロードしようとする。ネットワークの無い
+ビルドノードでは初回ビルドが失敗・停止し、毎回まっさらなコンテナでは起動のたびに解決コストを払う。
+
+本モジュールはテンプレートが使うパッケージを RESOURCE_DIR/typst-packages
+(環境変数 PANDOCTOOLS_TYPST_PACKAGES で変更可) に typst の --package-path と同じ構成
+(<namespace>/<name>/<version>/...) で置き、TypstAdapter がそこを typst に渡す。
+
+  pandoctools typst-packages sync     足りない / 壊れたパッケージを取得して manifest.json を更新
+  pandoctools typst-packages verify   すべて揃っていて manifest.json のハッシュと一致するか確認
+
+取得元は --from DIR (別マシンの typst キャッシュ等、同じ構成のディレクトリ) か
+packages.typst.org (@preview のみ)。パッケージ内の import も辿って依存パッケージも揃える。
+manifest.json には各パッケージのファイル群のハッシュを記録し、一度記録したハッシュと
+異なる内容は sync でも受け付けない (--repin で記録し直す)。
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import urllib.request
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from common import RESOURCE_DIR
+from fonts import typst_font_path
+
+PACKAGES_ENV = "PANDOCTOOLS_TYPST_PACKAGES"
+MANIFEST_NAME = "manifest.json"
+REGISTRY_URL = "https://packages.typst.org"
+DOWNLOAD_TIMEOUT = 60
+
+# パッケージを探すテンプレート (RESOURCE_DIR/templates からの相対)
+TEMPLATES = ("default_typst.typ",)
+
+_IMPORT_RE = re.compile(r'#(?:import|include)\s+"@([a-z0-9_-]+)/([A-Za-z0-9_-]+):([0-9]+\.[0-9]+\.[0-9]+)"')
+
+# PackageStore.problem() の結果
+MISSING = "missing"
+UNPINNED = "unpinned"
+MISMATCH = "mismatch"
+PROBLEM_TEXT = {
+    MISSING: "見つかりません",
+    UNPINNED: "manifest.json に記録がありません",
+    MISMATCH: "ハッシュが manifest.json と一致しません",
+}
+
+LogCallback = Callable[[str], None]
+
+
+class PackageError(Exception):
+    """パッケージが取得できない / ハッシュが一致しない."""
+
+
+@dataclass(frozen=True)
+class PackageSpec:
+    namespace: str
+    name: str
+    version: str
+
+    def __str__(self) -> str:
+        return f"@{self.namespace}/{self.name}:{self.version}"
+
+    @property
+    def rel_dir(self) -> Path:
+        return Path(self.namespace) / self.name / self.version
+
+
+def package_dir(resource_dir: Path = RESOURCE_DIR) -> Path:
+    """パッケージを置くディレクトリ (--package-path に渡すもの)."""
+    override = os.environ.get(PACKAGES_ENV)
+    if override:
+        return Path(override)
+    return resource_dir / "typst-packages"
+
+
+def typst_tool_paths(resource_dir: Path = RESOURCE_DIR) -> Tuple[Optional[Path], Optional[Path]]:
+    """typst に渡す (パッケージディレクトリ, フォントディレクトリ)。無いものは None.
+
+    EngineAdapter (get_adapter) とプレビューの typst compile に渡す。
+    """
+    packages = package_dir(resource_dir)
+    return (packages if packages.is_dir() else None), typst_font_path()
+
+
+def find_imports(text: str) -> List[PackageSpec]:
+    """Typst ソース中の `#import "@ns/name:x.y.z"` を出現順 (重複なし) に返す."""
+    specs: List[PackageSpec] = []
+    for m in _IMPORT_RE.finditer(text):
+        spec = PackageSpec(*m.groups())
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def required_packages(resource_dir: Path = RESOURCE_DIR) -> List[PackageSpec]:
+    """内蔵テンプレートが直接 import するパッケージ."""
+    specs: List[PackageSpec] = []
+    for name in TEMPLATES:
+        path = resource_dir / "templates" / name
+        if path.exists():
+            for spec in find_imports(path.read_text(encoding="utf-8")):
+                if spec not in specs:
+                    specs.append(spec)
+    return specs
+
+
+def tree_hash(root: Path) -> str:
+    """ディレクトリ以下のファイル (相対パスと内容) から求めたハッシュ."""
+    h = hashlib.sha256()
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        rel = path.relative_to(root).as_posix()
+        h.update(rel.encode("utf-8") + b"\0")
+        h.update(hashlib.sha256(path.read_bytes()).hexdigest().encode("ascii") + b"\n")
+    return h.hexdigest()
+
+
+def package_imports(root: Path) -> List[PackageSpec]:
+    """パッケージ内の .typ が import している別パッケージ."""
+    specs: List[PackageSpec] = []
+    for path in sorted(root.rglob("*.typ")):
+        for spec in find_imports(path.read_text(encoding="utf-8", errors="replace")):
+            if spec not in specs:
+                specs.append(spec)
+    return specs
+
+
+def _safe_extract(data: bytes, dest: Path) -> None:
+    """tar.gz を dest に展開する (dest の外を指すエントリ・リンクは拒否)."""
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        base = dest.resolve()
+        for member in tar.getmembers():
+            target = (dest / member.name).resolve()
+            if base != target and base not in target.parents:
+                raise PackageError(f"不正なパスを含むアーカイブです: {member.name}")
+            if not (member.isfile() or member.isdir()):
+                raise PackageError(f"ファイル以外のエントリを含むアーカイブです: {member.name}")
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest, filter="data")
+        else:
+            tar.extractall(dest)
+
+
+def _download(spec: PackageSpec) -> bytes:
+    if spec.namespace != "preview":
+        raise PackageError(f"{spec}: @preview 以外はダウンロードできません (--from で指定してください)")
+    url = f"{REGISTRY_URL}/{spec.namespace}/{spec.name}-{spec.version}.tar.gz"
+    try:
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as resp:
+            return resp.read()
+    except OSError as e:
+        raise PackageError(f"{spec}: ダウンロードに失敗しました ({url}: {e})")
+
+
+class PackageStore:
+    """package_dir 上のパッケージ群と manifest.json."""
+
+    def __init__(self, root: Optional[Path] = None, resource_dir: Path = RESOURCE_DIR):
+        self.root = Path(root) if root is not None else package_dir(resource_dir)
+        self.resource_dir = resource_dir
+        self.manifest_path = self.root / MANIFEST_NAME
+        self.manifest: Dict[str, dict] = self._load_manifest()
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("packages", {})
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"packages": dict(sorted(self.manifest.items()))}, f,
+                      ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def path(self, spec: PackageSpec) -> Path:
+        return self.root / spec.rel_dir
+
+    def problem(self, spec: PackageSpec) -> Optional[str]:
+        """パッケージが使えない理由 (MISSING / UNPINNED / MISMATCH, 問題なければ None)."""
+        path = self.path(spec)
+        if not (path / "typst.toml").is_file():
+            return MISSING
+        pinned = self.manifest.get(str(spec), {}).get("sha256")
+        if not pinned:
+            return UNPINNED
+        if tree_hash(path) != pinned:
+            return MISMATCH
+        return None
+
+    def closure(self, specs: Iterable[PackageSpec]) -> List[PackageSpec]:
+        """specs と、配置済みのパッケージが import している依存を辿ったもの."""
+        result: List[PackageSpec] = []
+        pending = list(specs)
+        while pending:
+            spec = pending.pop(0)
+            if spec in result:
+                continue
+            result.append(spec)
+            if self.path(spec).is_dir():
+                pending.extend(package_imports(self.path(spec)))
+        return result
+
+    def verify(self, specs: Optional[Iterable[PackageSpec]] = None) -> Dict[PackageSpec, Optional[str]]:
+        """各パッケージの問題 (None = OK)。specs 省略時は内蔵テンプレートが使うもの."""
+        if specs is None:
+            specs = required_packages(self.resource_dir)
+        return {spec: self.problem(spec) for spec in self.closure(specs)}
+
+    def _fetch(self, spec: PackageSpec, source: Optional[Path]) -> Path:
+        """spec を root 内の一時ディレクトリに用意してそのパスを返す."""
+        staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=str(self.root)))
+        target = staging / "pkg"
+        try:
+            if source is not None:
+                src = source / spec.rel_dir
+                if not (src / "typst.toml").is_file():
+                    raise PackageError(f"{spec}: {source} にありません")
+                shutil.copytree(src, target)
+            else:
+                target.mkdir()
+                try:
+                    _safe_extract(_download(spec), target)
+                except tarfile.TarError as e:
+                    raise PackageError(f"{spec}: アーカイブを展開できません ({e})")
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return target
+
+    def install(self, spec: PackageSpec, source: Optional[Path] = None, repin: bool = False) -> str:
+        """spec を取得して配置し、ハッシュを manifest に記録する (manifest は呼び出し側で保存)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        staged = self._fetch(spec, source)
+        try:
+            digest = tree_hash(staged)
+            pinned = self.manifest.get(str(spec), {}).get("sha256")
+            if pinned and pinned != digest and not repin:
+                raise PackageError(f"{spec}: 取得した内容のハッシュが manifest.json と一致しません "
+                                   f"(記録 {pinned[:12]}…, 取得 {digest[:12]}…)")
+            dest = self.path(spec)
+            if dest.exists():
+                shutil.rmtree(dest)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, dest)
+        finally:
+            shutil.rmtree(staged.parent, ignore_errors=True)
+        self.manifest[str(spec)] = {"sha256": digest}
+        return digest
+
+    def sync(self, specs: Optional[Iterable[PackageSpec]] = None, source: Optional[Path] = None,
+             repin: bool = False, log: Optional[LogCallback] = None) -> List[PackageSpec]:
+        """問題のあるパッケージだけ取得し直し (依存も辿る)、取得したものを返す."""
+        log = log or (lambda text: None)
+        if specs is None:
+            specs = required_packages(self.resource_dir)
+        fetched: List[PackageSpec] = []
+        seen: List[PackageSpec] = []
+        pending = list(specs)
+        try:
+            while pending:
+                spec = pending.pop(0)
+                if spec in seen:
+                    continue
+                seen.append(spec)
+                problem = self.problem(spec)
+                if problem is None:
+                    log(f"ok: {spec}")
+                elif problem == UNPINNED:
+                    # 手で配置済み (typst キャッシュからのコピー等): 今の内容を記録する
+                    self.manifest[str(spec)] = {"sha256": tree_hash(self.path(spec))}
+                    log(f"pinned: {spec}")
+                else:
+                    log(f"fetch: {spec} ({PROBLEM_TEXT[problem]})")
+                    self.install(spec, source, repin=repin)
+                    fetched.append(spec)
+                pending.extend(package_imports(self.path(spec)))
+        finally:
+            if self.root.exists():
+                self.save_manifest()
+        return fetched
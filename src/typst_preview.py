@@ -0,0 +1,149 @@
+"""
+Typst 出力のページ単位プレビュー (Qt 非依存)
+
+Typst で組む文書は、修正のたびに PDF を作り直して open_output_pdf で開き直すと
+長い文書ほど待たされる。TypstPagePreview は
+
+  1. pandoc で入力を Typst ソースにし (-t typst。テンプレート等は変換時と同じ引数)
+  2. typst compile で各ページを PNG にし (ソースは標準入力から渡し、--root を入力の
+     ディレクトリにして画像の相対パスを解決させる)
+  3. ページを内容のハッシュで名前付けした PNG としてキャッシュし、前回と比べて
+     変わったページの番号 (PageUpdate.changed) を返す
+
+ので、表示側 (preview_pane.TypstPagePane) は変わったページだけを読み込んで描き直せる。
+Typst ソースと typst の引数が前回と同じなら typst を起動しない。typst のコンパイル自体は
+毎回文書全体に対して行われる (ページの一部だけを組むことはできない) が、ppi を
+低く (既定 PAGE_PPI) しているため 200 ページ級でも PDF を開き直すより速い。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from common import RESOURCE_DIR
+from preview import PreviewError
+from typst_packages import typst_tool_paths
+
+# プレビューの解像度 (画面表示用。印刷品質は不要)
+PAGE_PPI = 96
+PANDOC_TIMEOUT = 60
+TYPST_TIMEOUT = 300
+
+_PAGE_RE = re.compile(r"^(\d+)\.png$")
+
+LogCallback = Callable[[str], None]
+
+
+def typst_compile_args(resource_dir: Path = RESOURCE_DIR) -> List[str]:
+    """typst compile に渡す追加引数 (PDF 変換時の --pdf-engine-opt と同じパッケージ / フォント)."""
+    args: List[str] = []
+    packages, font_path = typst_tool_paths(resource_dir)
+    if packages is not None:
+        args.append(f"--package-path={packages}")
+    if font_path is not None:
+        args.append(f"--font-path={font_path}")
+    return args
+
+
+@dataclass
+class PageUpdate:
+    """プレビューの更新結果."""
+
+    # 各ページの PNG (内容のハッシュ名。変わっていないページは前回と同じパス)
+    pages: List[Path] = field(default_factory=list)
+    # 描き直しが必要なページ番号 (0 始まり)
+    changed: List[int] = field(default_factory=list)
+
+
+class TypstPagePreview:
+    """入力を Typst で組み、ページ PNG の差分を返す."""
+
+    def __init__(self, cache_dir: Optional[Path] = None, pandoc: str = "pandoc",
+                 typst: str = "typst", ppi: int = PAGE_PPI, log: Optional[LogCallback] = None):
+        if cache_dir is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="pandoctools-typst-preview-")
+            cache_dir = Path(self._tmp.name)
+        else:
+            self._tmp = None
+        self.cache_dir = Path(cache_dir)
+        self.pandoc = pandoc
+        self.typst = typst
+        self.ppi = ppi
+        self.log = log or (lambda text: None)
+        self.pages: List[Path] = []
+        self._source_key: Optional[str] = None
+
+    def update(self, inputs: List[str], pandoc_args: List[str],
+               typst_args: Optional[List[str]] = None) -> PageUpdate:
+        """inputs を組み直して、前回から変わったページを返す."""
+        cwd = str(Path(inputs[0]).parent.resolve())
+        source = self._run([self.pandoc, *inputs, "--to", "typst", "--standalone", *pandoc_args],
+                           cwd, None, PANDOC_TIMEOUT)
+        typst_args = list(typst_args or [])
+        key = hashlib.sha256(b"\0".join([source, str(self.ppi).encode("utf-8"),
+                                         *(a.encode("utf-8") for a in typst_args)])).hexdigest()
+        if key == self._source_key:
+            return PageUpdate(pages=list(self.pages))
+
+        staging = Path(tempfile.mkdtemp(prefix="pages-", dir=self._ensure_dir()))
+        try:
+            self._run([self.typst, "compile", "--root", cwd, "--ppi", str(self.ppi), *typst_args,
+                       "-", str(staging / "{p}.png")], cwd, source, TYPST_TIMEOUT)
+            rendered = sorted((int(m.group(1)), p) for p in staging.iterdir()
+                              if (m := _PAGE_RE.match(p.name)))
+            pages = [self._store(p) for _, p in rendered]
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        changed = [i for i, page in enumerate(pages) if i >= len(self.pages) or self.pages[i] != page]
+        self._forget(set(self.pages) - set(pages))
+        self.pages, self._source_key = pages, key
+        return PageUpdate(pages=list(pages), changed=changed)
+
+    def close(self) -> None:
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    # --- 内部 -------------------------------------------------------------------
+
+    def _ensure_dir(self) -> Path:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return self.cache_dir
+
+    def _store(self, png: Path) -> Path:
+        """ページ PNG を内容のハッシュ名でキャッシュに置く (同じ内容なら既存を使う)."""
+        digest = hashlib.sha256(png.read_bytes()).hexdigest()[:32]
+        cached = self.cache_dir / f"{digest}.png"
+        if cached.exists():
+            png.unlink()
+        else:
+            os.replace(png, cached)
+        return cached
+
+    def _forget(self, pages: set) -> None:
+        for page in pages:
+            try:
+                page.unlink()
+            except OSError:
+                pass
+
+    def _run(self, cmd: List[str], cwd: str, stdin: Optional[bytes], timeout: float) -> bytes:
+        try:
+            r = subprocess.run(cmd, input=stdin, cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise PreviewError(f"{Path(cmd[0]).name}: {e}")
+        if r.returncode != 0:
+            raise PreviewError(r.stderr.decode("utf-8", errors="replace").strip()
+                               or f"{Path(cmd[0]).name} が終了コード {r.returncode} で失敗しました")
+        if r.stderr:
+            self.log(r.stderr.decode("utf-8", errors="replace"))
+        return r.stdout
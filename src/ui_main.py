@@ -5,7 +5,7 @@ from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
     QPushButton, QLabel, QLineEdit, QComboBox, QTextEdit, QCheckBox,
     QFileDialog, QGroupBox, QSplitter, QProgressBar, QMessageBox,
-    QListWidget, QTabWidget, QSpinBox, QFormLayout, QScrollArea
+    QListView, QAbstractItemView, QTabWidget, QSpinBox, QFormLayout, QScrollArea
 )
 from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QFont, QIcon, QAction
@@ -41,6 +41,9 @@ class Ui_MainWindow:
         
         # プロファイル管理タブ
         self._setup_profile_tab()
+
+        # プレビュータブ
+        self._setup_preview_tab()
         
         # 実行・ログエリア
         self._setup_execution_area()
@@ -65,6 +68,9 @@ class Ui_MainWindow:
         self.btn_select_files = QPushButton("ファイル選択")
         self.btn_select_folder = QPushButton("フォルダ選択")
         self.btn_clear_files = QPushButton("全クリア")
+        # フォルダ取り込み中だけ表示する
+        self.btn_cancel_import = QPushButton("取り込み中止")
+        self.btn_cancel_import.setVisible(False)
 
         self.btn_select_files.setMinimumWidth(100)
         self.btn_select_folder.setMinimumWidth(100)
@@ -73,6 +79,7 @@ class Ui_MainWindow:
         file_buttons_layout.addWidget(self.btn_select_files)
         file_buttons_layout.addWidget(self.btn_select_folder)
         file_buttons_layout.addWidget(self.btn_clear_files)
+        file_buttons_layout.addWidget(self.btn_cancel_import)
         file_buttons_layout.addStretch()
         input_layout.addLayout(file_buttons_layout)
         
@@ -82,26 +89,41 @@ class Ui_MainWindow:
         # ファイル一覧
         list_layout = QVBoxLayout()
         list_layout.addWidget(QLabel("選択されたファイル:"))
-        self.file_list = QListWidget()
+        # 表示のみ。中身は MainWindow が FileListModel を設定する
+        self.file_list = QListView()
         self.file_list.setMinimumHeight(150)
         self.file_list.setMaximumHeight(200)
+        self.file_list.setUniformItemSizes(True)
+        self.file_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         # ドラッグ&ドロップで順序変更を有効化
-        self.file_list.setDragDropMode(QListWidget.DragDropMode.InternalMove)
+        self.file_list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.file_list.setDefaultDropAction(Qt.DropAction.MoveAction)
         list_layout.addWidget(self.file_list)
+        list_footer_layout = QHBoxLayout()
+        self.file_filter = QLineEdit()
+        self.file_filter.setPlaceholderText("絞り込み (パスの一部)")
+        self.file_filter.setClearButtonEnabled(True)
+        self.file_count_label = QLabel("0 件")
+        list_footer_layout.addWidget(self.file_filter)
+        list_footer_layout.addWidget(self.file_count_label)
+        list_layout.addLayout(list_footer_layout)
         
         # リスト操作ボタン
         list_controls_layout = QVBoxLayout()
         self.btn_move_up = QPushButton("↑ 上へ")
         self.btn_move_down = QPushButton("↓ 下へ")
         self.btn_remove_file = QPushButton("削除")
+        self.btn_sort_files = QPushButton("名前順")
         
         self.btn_move_up.setMinimumWidth(80)
         self.btn_move_down.setMinimumWidth(80)
         self.btn_remove_file.setMinimumWidth(80)
+        self.btn_sort_files.setMinimumWidth(80)
         
         list_controls_layout.addWidget(self.btn_move_up)
         list_controls_layout.addWidget(self.btn_move_down)
         list_controls_layout.addWidget(self.btn_remove_file)
+        list_controls_layout.addWidget(self.btn_sort_files)
         list_controls_layout.addStretch()
         
         list_and_controls_layout.addLayout(list_layout)
@@ -203,7 +225,7 @@ class Ui_MainWindow:
 
         # PDF エンジン
         self.pdf_engine = QComboBox()
-        self.pdf_engine.addItems(["xelatex", "pdflatex", "lualatex", "tectonic", "typst", "wkhtmltopdf", "weasyprint"])
+        self.pdf_engine.addItems(["xelatex", "pdflatex", "lualatex", "tectonic", "typst", "auto", "wkhtmltopdf", "weasyprint"])
         common_form.addRow("PDFエンジン:", self.pdf_engine)
 
         # Markdown拡張
@@ -336,6 +358,27 @@ class Ui_MainWindow:
         typst_layout = QVBoxLayout(typst_group)
         typst_layout.addWidget(QLabel("Typst 固有の設定は今後追加予定です。\n現状は内蔵テンプレート (default_typst.typ) のデフォルト値を使用します。"))
         layout.addWidget(typst_group)
+
+        # =========================================================
+        # 実行制御 (タイムアウト / ハング検出)
+        # =========================================================
+        run_group = QGroupBox("実行制御")
+        run_layout = QFormLayout(run_group)
+
+        self.timeout = QSpinBox()
+        self.timeout.setRange(0, 86400)
+        self.timeout.setSuffix(" 秒")
+        self.timeout.setSpecialValueText("無制限")
+        run_layout.addRow("タイムアウト:", self.timeout)
+
+        self.idle_timeout = QSpinBox()
+        self.idle_timeout.setRange(0, 86400)
+        self.idle_timeout.setSuffix(" 秒")
+        self.idle_timeout.setSpecialValueText("無制限")
+        self.idle_timeout.setToolTip("pandoc / エンジンの出力がこの時間途絶えたらハングとみなして停止します")
+        run_layout.addRow("無出力タイムアウト:", self.idle_timeout)
+
+        layout.addWidget(run_group)
         
         # カスタム引数
         custom_group = QGroupBox("カスタム引数")
@@ -408,6 +451,26 @@ class Ui_MainWindow:
         
         layout.addStretch()
         
+    def _setup_preview_tab(self):
+        """プレビュータブの設定 (中身の PreviewPane は MainWindow が配置する)"""
+        self.preview_tab = QWidget()
+        self.tab_widget.addTab(self.preview_tab, "プレビュー")
+
+        self.preview_layout = QVBoxLayout(self.preview_tab)
+        self.preview_layout.addWidget(QLabel("選択中のファイルを表示し、保存のたびに変わった部分だけを更新します"))
+
+        # HTML (ブロック単位) / Typst で組んだページ画像 (ページ単位)
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("表示:"))
+        self.preview_mode = QComboBox()
+        self.preview_mode.addItems(["HTML", "Typst (ページ)"])
+        mode_layout.addWidget(self.preview_mode)
+        self.btn_preview_apply = QPushButton("変換設定を反映")
+        self.btn_preview_apply.setToolTip("Typst のページ表示に現在の変換設定 (テンプレート・余白など) を使います")
+        mode_layout.addWidget(self.btn_preview_apply)
+        mode_layout.addStretch()
+        self.preview_layout.addLayout(mode_layout)
+
     def _setup_execution_area(self):
         """実行・ログエリアの設定"""
         execution_group = QGroupBox("実行")
@@ -466,4 +529,7 @@ class Ui_MainWindow:
     def _setup_status_bar(self, MainWindow):
         """ステータスバーの設定"""
         self.statusbar = MainWindow.statusBar()
-        self.statusbar.showMessage("準備完了") 
\ No newline at end of file
+        self.statusbar.showMessage("準備完了")
+        # Pandoc の利用可否 (起動時にバックグラウンドで確認した結果)
+        self.pandoc_status = QLabel("Pandoc: 確認中...")
+        self.statusbar.addPermanentWidget(self.pandoc_status)
\ No newline at end of file
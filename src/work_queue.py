@@ -0,0 +1,318 @@
+"""
+共有ディレクトリを使った分散バッチ変換キュー
+
+NFS 等で共有したディレクトリをジョブキューとして使い、複数マシンの
+`pandoctools worker --queue DIR` が 1 つの大きなバッチを協調して消化する。
+外部サービスは不要で、排他はすべて同一ファイルシステム内の atomic rename で行う。
+
+ディレクトリ構成:
+  DIR/tmp/      submit 途中のファイル (書き終えてから pending/ へ rename)
+  DIR/pending/  未着手ジョブ <id>.json (id は投入時刻順にソートできる)
+  DIR/running/  実行中ジョブ <id>.json と実行ログ <id>.log
+  DIR/done/     終了したジョブ <id>.json / <id>.log / <id>.result.json
+
+リース:
+  worker は pending/<id>.json を running/ へ rename できた場合だけそのジョブを得る
+  (rename は 1 プロセスしか成功しない)。実行中は running/<id>.json の mtime を
+  定期的に更新 (ハートビート) し、mtime が lease 秒より古いジョブは worker が
+  死んだとみなして、どの worker からでも pending/ へ戻される。
+  mtime はファイルサーバの時計で付くため、各マシンの時計は NTP 等で揃えておくこと。
+
+入出力パスはジョブに絶対パスで記録されるので、全マシンで同じパスにマウントしておく。
+スクラッチ領域と typst のパッケージ / フォントの置き場所はマシンごとに異なるので、
+worker がジョブを取得したときに自分の環境で決め直す。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from common import RESOURCE_DIR
+from conversion import STATUS_ERROR, ConversionJob, ConversionRunner, JobResult
+from engine_select import localize_jobs
+from scratch import resolve_scratch
+from typst_packages import typst_tool_paths
+
+# ハートビートが途絶えてから再投入するまでの秒数
+DEFAULT_LEASE = 60.0
+# pending/ を見に行く間隔 (秒)
+DEFAULT_POLL = 2.0
+
+_DIRS = ("tmp", "pending", "running", "done")
+_SUFFIX = ".json"
+_RESULT_SUFFIX = ".result.json"
+_LOG_SUFFIX = ".log"
+
+# ログ出力先 (worker の標準出力など)
+LogCallback = Callable[[str], None]
+
+
+def _dump_json(path: Path, data: dict) -> None:
+    """同じディレクトリの一時ファイルに書いてから rename する (読み手に書きかけを見せない)."""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def job_to_dict(job: ConversionJob) -> dict:
+    return asdict(job)
+
+
+def job_from_dict(data: dict) -> ConversionJob:
+    return ConversionJob(**{k: v for k, v in data.items() if k in ConversionJob.__dataclass_fields__})
+
+
+class WorkQueue:
+    """共有ディレクトリ上のジョブキュー (submit / claim / heartbeat / complete / reap)."""
+
+    def __init__(self, root: str, lease: float = DEFAULT_LEASE):
+        self.root = Path(root)
+        self.lease = lease
+        for name in _DIRS:
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, name: str) -> Path:
+        return self.root / name
+
+    def _ids(self, name: str) -> List[str]:
+        """<dir> 内のジョブ id (投入順)."""
+        try:
+            names = os.listdir(self._dir(name))
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-len(_SUFFIX)] for n in names
+                      if n.endswith(_SUFFIX) and not n.endswith(_RESULT_SUFFIX)
+                      and not n.startswith("."))
+
+    # --- 投入側 -----------------------------------------------------------------
+
+    def submit(self, jobs: List[ConversionJob]) -> List[str]:
+        """ジョブを pending/ に投入し、id の一覧を返す."""
+        ids = []
+        for seq, job in enumerate(jobs):
+            job_id = f"{time.time_ns():020d}-{seq:05d}-{uuid.uuid4().hex[:8]}"
+            tmp = self._dir("tmp") / (job_id + _SUFFIX)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"id": job_id, "job": job_to_dict(job),
+                           "submitted_by": socket.gethostname()}, f, ensure_ascii=False, indent=2)
+            os.rename(tmp, self._dir("pending") / (job_id + _SUFFIX))
+            ids.append(job_id)
+        return ids
+
+    def results(self, ids: List[str]) -> Dict[str, dict]:
+        """終了済みジョブの結果 (id → result.json の内容)."""
+        found = {}
+        for job_id in ids:
+            path = self._dir("done") / (job_id + _RESULT_SUFFIX)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    found[job_id] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+        return found
+
+    def counts(self) -> Dict[str, int]:
+        return {name: len(self._ids(name)) for name in ("pending", "running", "done")}
+
+    # --- worker 側 ----------------------------------------------------------------
+
+    def claim(self) -> Optional[tuple]:
+        """未着手ジョブを 1 つ取得する。(id, ConversionJob) か、無ければ None."""
+        for job_id in self._ids("pending"):
+            src = self._dir("pending") / (job_id + _SUFFIX)
+            dst = self._dir("running") / (job_id + _SUFFIX)
+            try:
+                # rename は mtime を保つので、先に触っておかないと取得直後に期限切れに見える
+                os.utime(src)
+                os.rename(src, dst)
+            except FileNotFoundError:
+                continue  # 他の worker が先に取った
+            try:
+                with open(dst, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                return job_id, job_from_dict(data["job"])
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # running/ に残すと reap() で pending/ に戻され続けるので、エラーとして終わらせる
+                self._reject(job_id, f"invalid job file: {type(e).__name__}: {e}")
+        return None
+
+    def _reject(self, job_id: str, reason: str) -> None:
+        """読めないジョブファイルを done/ へ移し、エラーの結果を残す."""
+        done = self._dir("done")
+        _dump_json(done / (job_id + _RESULT_SUFFIX), {
+            "id": job_id,
+            "status": STATUS_ERROR,
+            "exit_code": 1,
+            "duration": 0.0,
+            "reason": reason,
+            "attempts": [],
+            "output": "",
+            "output_exists": False,
+            "worker": "",
+        })
+        try:
+            os.rename(self._dir("running") / (job_id + _SUFFIX), done / (job_id + _SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self, job_id: str) -> bool:
+        """リースを延長する。ジョブが既に回収されていれば False."""
+        try:
+            os.utime(self._dir("running") / (job_id + _SUFFIX))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def log_path(self, job_id: str) -> Path:
+        return self._dir("running") / (job_id + _LOG_SUFFIX)
+
+    def complete(self, job_id: str, result: JobResult, worker: str = "") -> bool:
+        """結果とログを done/ に置く。リースを失っていた (再投入済み) 場合は False."""
+        src = self._dir("running") / (job_id + _SUFFIX)
+        if not src.exists():
+            return False
+        done = self._dir("done")
+        output = Path(result.job.output_file)
+        _dump_json(done / (job_id + _RESULT_SUFFIX), {
+            "id": job_id,
+            "status": result.status,
+            "exit_code": result.exit_code,
+            "duration": round(result.duration, 3),
+            "reason": result.reason,
+            "attempts": result.attempts,
+            "output": str(output),
+            "output_exists": output.exists(),
+            "worker": worker,
+        })
+        log = self.log_path(job_id)
+        if log.exists():
+            os.replace(log, done / (job_id + _LOG_SUFFIX))
+        try:
+            os.rename(src, done / (job_id + _SUFFIX))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def reap(self, now: Optional[float] = None) -> List[str]:
+        """リースが切れた実行中ジョブを pending/ へ戻し、その id を返す."""
+        now = time.time() if now is None else now
+        reaped = []
+        for job_id in self._ids("running"):
+            src = self._dir("running") / (job_id + _SUFFIX)
+            try:
+                if now - src.stat().st_mtime <= self.lease:
+                    continue
+                os.rename(src, self._dir("pending") / (job_id + _SUFFIX))
+            except FileNotFoundError:
+                continue  # 完了した / 他の worker が先に戻した
+            reaped.append(job_id)
+        return reaped
+
+
+class QueueWorker:
+    """WorkQueue からジョブを取り出して ConversionRunner で実行する worker."""
+
+    def __init__(self, queue: WorkQueue, max_jobs: int = 1, pandoc: str = "pandoc",
+                 poll: float = DEFAULT_POLL, log: Optional[LogCallback] = None):
+        self.queue = queue
+        self.max_jobs = max(1, int(max_jobs))
+        self.poll = poll
+        self.log = log or (lambda text: None)
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.processed = 0
+        # スクラッチ領域はマシンごとに異なるので worker 側で決める
+        self.scratch_dir = resolve_scratch()
+        self._active: Dict[str, asyncio.Task] = {}
+        self._logs: Dict[int, object] = {}
+        self._runner = ConversionRunner(max_jobs=self.max_jobs, pandoc=pandoc,
+                                        on_output=self._on_output)
+
+    def stop(self) -> None:
+        """実行中のジョブを止める (リースは切れて他の worker が拾い直す)."""
+        self._runner.cancel()
+
+    async def run(self, exit_when_empty: bool = False) -> int:
+        """キューを処理し続ける。exit_when_empty なら pending/running が空になった時点で戻る."""
+        beat = asyncio.ensure_future(self._heartbeat_loop())
+        try:
+            while not self._runner.cancelled:
+                for job_id in self.queue.reap():
+                    self.log(f"lease expired, requeued: {job_id}")
+                while len(self._active) < self.max_jobs:
+                    claimed = self.queue.claim()
+                    if claimed is None:
+                        break
+                    job_id, job = claimed
+                    self._localize(job)
+                    self.log(f"start: {job_id} {job.name}")
+                    self._active[job_id] = asyncio.ensure_future(self._run_one(job_id, job))
+                if not self._active and exit_when_empty:
+                    counts = self.queue.counts()
+                    if counts["pending"] == 0 and counts["running"] == 0:
+                        break
+                if self._active:
+                    await asyncio.wait(set(self._active.values()), timeout=self.poll,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(self.poll)
+        finally:
+            beat.cancel()
+            if self._active:
+                await asyncio.gather(*self._active.values(), return_exceptions=True)
+        return 0
+
+    def _localize(self, job: ConversionJob) -> None:
+        """投入側で決まったマシン固有の設定を、この worker の環境のものに替える."""
+        job.scratch_dir = self.scratch_dir
+        # fonts warm で集めたフォントは後から作られることがあるので取得のたびに調べる
+        localize_jobs([job], typst_tool_paths(RESOURCE_DIR))
+
+    async def _run_one(self, job_id: str, job: ConversionJob) -> None:
+        with open(self.queue.log_path(job_id), "a", encoding="utf-8") as log:
+            log.write(f"=== {self.name} ===\n")
+            self._logs[id(job)] = log
+            try:
+                result = await self._runner.run_job(job)
+            finally:
+                self._logs.pop(id(job), None)
+        if self.queue.complete(job_id, result, worker=self.name):
+            self.processed += 1
+            self.log(f"{result.status}: {job_id} {job.name} "
+                     f"(exit={result.exit_code}, {result.duration:.1f}s)")
+        else:
+            self.log(f"lease lost, result discarded: {job_id} {job.name}")
+        self._active.pop(job_id, None)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease / 3)
+            for job_id in list(self._active):
+                if not self.queue.heartbeat(job_id):
+                    self.log(f"lease lost: {job_id}")
+
+    def _on_output(self, job: ConversionJob, stream: str, text: str) -> None:
+        log = self._logs.get(id(job))
+        if log is not None:
+            log.write(text)
+            log.flush()
+
+
+def iter_wait(queue: WorkQueue, ids: List[str], poll: float = DEFAULT_POLL) -> Iterator[tuple]:
+    """投入したジョブの結果を終わった順に (id, result) で返す (全部揃うまでブロック)."""
+    remaining = list(ids)
+    while remaining:
+        found = queue.results(remaining)
+        for job_id in remaining:
+            if job_id in found:
+                yield job_id, found[job_id]
+        remaining = [i for i in remaining if i not in found]
+        if remaining:
+            time.sleep(poll)
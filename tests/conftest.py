@@ -1,7 +1,104 @@
 """pytest 共通設定 - src/ を import path に追加."""
+import os
+import stat
 import sys
+import textwrap
 from pathlib import Path
 
+import pytest
+
 SRC = Path(__file__).resolve().parent.parent / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
+
+# pandoc の代わりに使うスタブ。入力内容の指示 (@@...) に応じて振る舞いを変える:
+#   @@FAIL        : 終了コード 43 で失敗
+#   @@SLEEP <秒>  : 指定秒スリープしてから出力
+#   @@WARN        : stderr に [WARNING] 行を出す
+#   @@CHILD <file>: 長時間眠る子プロセスを起動し、その pid を <file> に書く (ツリー kill 検証用)
+#   @@TICK <秒>   : 0.1 秒ごとに出力し続けながら指定秒動く (無出力タイムアウト検証用)
+#   @@TMPDIR      : 環境変数 TMPDIR と -o の値を stdout に出す (スクラッチ検証用)
+#   @@TYPSTFAIL   : --pdf-engine=typst のときだけ終了コード 83 で失敗 (エンジンのフォールバック検証用)
+# 正常時は入力群を連結して -o の出力先に書き込む。
+# `server --port N` では pandoc server の代わりに、受け取った text を "server:<to>:" 付きで返す
+# (text に @@FAIL があれば 500)。
+_FAKE_PANDOC = textwrap.dedent('''\
+    import os, subprocess, sys, time
+    args = sys.argv[1:]
+    if args[:1] == ["--version"]:
+        print("pandoc 3.1 (fake)")
+        sys.exit(0)
+    if args[:1] == ["server"]:
+        import json
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a):
+                pass
+
+            def reply(self, code, body, ctype):
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.reply(200, "3.1", "text/plain")
+
+            def do_POST(self):
+                req = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if "@@FAIL" in req["text"]:
+                    self.reply(500, "fake server error", "text/plain")
+                    return
+                messages = [{"verbosity": "WARNING", "message": "w"}] if "@@WARN" in req["text"] else []
+                self.reply(200, json.dumps({"output": "server:" + req["to"] + ":" + req["text"],
+                                            "base64": False, "messages": messages}),
+                           "application/json")
+
+        port = int(args[args.index("--port") + 1])
+        ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+    out = args[args.index("-o") + 1]
+    inputs = args[:args.index("-o")]
+    text = "".join(open(p, encoding="utf-8").read() for p in inputs)
+    print("fake pandoc: " + " ".join(inputs), flush=True)
+    for line in text.splitlines():
+        if line.startswith("@@CHILD"):
+            child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+            with open(line.split()[1], "w") as f:
+                f.write(str(child.pid))
+        if line.startswith("@@SLEEP"):
+            time.sleep(float(line.split()[1]))
+        if line.startswith("@@TICK"):
+            end = time.time() + float(line.split()[1])
+            while time.time() < end:
+                print("tick", flush=True)
+                time.sleep(0.1)
+    if "@@TMPDIR" in text:
+        print("TMPDIR=" + os.environ.get("TMPDIR", ""), flush=True)
+        print("OUT=" + out, flush=True)
+    if "@@WARN" in text:
+        sys.stderr.write("[WARNING] Could not fetch resource x.png\\n")
+    if "@@TYPSTFAIL" in text and "--pdf-engine=typst" in args:
+        sys.stderr.write("error: unknown variable: foo\\n")
+        sys.exit(83)
+    if "@@FAIL" in text:
+        sys.stderr.write("Error producing PDF.\\n")
+        sys.exit(43)
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(text)
+''')
+
+
+@pytest.fixture
+def fake_pandoc(tmp_path):
+    """pandoc 互換のスタブ実行ファイルのパスを返す (POSIX のみ)."""
+    if os.name == "nt":
+        pytest.skip("fake pandoc は POSIX のみ")
+    script = tmp_path / "fake-pandoc"
+    script.write_text(f"#!{sys.executable}\n" + _FAKE_PANDOC, encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    return str(script)
@@ -0,0 +1,81 @@
+"""astcache.py (読み取り段の AST キャッシュ) のテスト."""
+import os
+
+from astcache import AstCache, split_args
+from common import RESOURCE_DIR
+from conversion import STATUS_OK, ConversionJob, run_jobs
+from deps import command_digest
+from engines import LatexAdapter, LogicalConfig
+
+
+def _job(tmp_path, name, body, extra_args):
+    src = tmp_path / f"{name}.md"
+    src.write_text(body, encoding="utf-8")
+    return ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / f"{name}.tex"),
+                         extra_args=list(extra_args))
+
+
+def test_split_args():
+    builtin = str(RESOURCE_DIR / "filters" / "default_filter.lua")
+    cfg = LogicalConfig(markdown_extensions="markdown+hard_line_breaks", fontsize="10pt",
+                        paper="a4paper", lua_filter="user.lua", citeproc=True)
+    reader, filters, writer = split_args(LatexAdapter().build_args(cfg, RESOURCE_DIR))
+    assert reader == ["--from", "markdown+hard_line_breaks"]
+    assert filters == [builtin]
+    assert writer[:2] == ["--citeproc", "-V"]
+    assert ["--lua-filter", "user.lua"] == writer[writer.index("--lua-filter"):][:2]
+    assert "-V" in writer and "papersize=a4paper" in writer
+
+    # ユーザーのフィルタより後ろの内蔵フィルタは順序を保つため書き出し段に残す
+    reader, filters, writer = split_args(["--filter", "pandoc-crossref", f"--lua-filter={builtin}",
+                                          "-fgfm", "--tab-stop", "2"])
+    assert (reader, filters) == (["-fgfm", "--tab-stop", "2"], [])
+    assert writer == ["--filter", "pandoc-crossref", f"--lua-filter={builtin}"]
+
+
+def test_cache_hit_when_only_writer_options_change(tmp_path, fake_pandoc):
+    builtin = str(RESOURCE_DIR / "filters" / "default_filter.lua")
+    base = ["--from", "markdown+hard_line_breaks", "--lua-filter", builtin]
+    logs = []
+    cache = AstCache(cache_dir=tmp_path / "ast", pandoc=fake_pandoc, log=logs.append)
+
+    job = _job(tmp_path, "doc", "# A\n", base + ["-V", "fontsize=10pt"])
+    digest = command_digest(job)
+    assert cache.prepare(job)
+    assert job.command()[1] == job.ast_input and job.command()[4:6] == ["--from", "json"]
+    assert job.command()[-2:] == ["-V", "fontsize=10pt"]
+    # 依存判定 (--incremental) は元のコマンドで比較する
+    assert command_digest(job) == digest
+    assert any("読み取り段" in line for line in logs)
+    result = run_jobs([job], pandoc=fake_pandoc)[0]
+    assert result.status == STATUS_OK
+    assert open(job.output_file, encoding="utf-8").read() == "# A\n"
+
+    # 書き出し側 (文字サイズ・エンジン) だけ変えた再変換はキャッシュを読む
+    again = _job(tmp_path, "doc", "# A\n", base + ["-V", "fontsize=12pt", "--pdf-engine=lualatex"])
+    logs.clear()
+    assert cache.prepare(again)
+    assert again.ast_input == job.ast_input
+    assert logs == ["AST キャッシュを使います: doc.tex\n"]
+    # 入力や読み取りオプションが変われば読み直す
+    edited = _job(tmp_path, "doc", "# B\n", base)
+    assert cache.prepare(edited) and edited.ast_input != job.ast_input
+    gfm = _job(tmp_path, "doc", "# B\n", ["--from", "gfm", "--lua-filter", builtin])
+    assert cache.prepare(gfm) and gfm.ast_input != edited.ast_input
+    assert len(list((tmp_path / "ast").glob("*.json"))) == 3
+    cache.prune(keep=1)
+    assert len(list((tmp_path / "ast").glob("*.json"))) == 1
+
+
+def test_skipped_jobs_run_unchanged(tmp_path, fake_pandoc):
+    cache = AstCache(cache_dir=tmp_path / "ast", pandoc=fake_pandoc)
+    # 読み取り段が失敗したジョブは元のコマンドのまま (エラーは pandoc 本体に出させる)
+    broken = _job(tmp_path, "broken", "@@FAIL\n", ["--from", "markdown"])
+    assert not cache.prepare(broken)
+    assert broken.ast_input is None and broken.command()[1] == broken.inputs[0]
+    # engine: auto のフォールバックを持つジョブ (エンジンごとに内蔵フィルタが違う) は対象外
+    auto = _job(tmp_path, "auto", "# A\n", ["--pdf-engine=typst"])
+    auto.fallback_args = ["--pdf-engine=xelatex"]
+    assert not cache.prepare(auto)
+    assert not cache.prepare(_job(tmp_path, "none", "# A\n", []), convert=False)
+    assert not os.path.exists(tmp_path / "ast") or not list((tmp_path / "ast").glob("*.json"))
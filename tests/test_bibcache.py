@@ -0,0 +1,107 @@
+"""bibcache.py (BibTeX → CSL JSON キャッシュ) のテスト."""
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+from bibcache import BibCache, cited_keys
+from conversion import ConversionJob
+
+# -f biblatex -t csljson だけを真似るスタブ: @type{key, ...} の key を id にした CSL JSON を書く
+_FAKE_BIB_PANDOC = r'''
+import json, re, sys
+args = sys.argv[1:]
+out = args[args.index("-o") + 1]
+text = open(args[0], encoding="utf-8").read()
+with open(out, "w", encoding="utf-8") as f:
+    json.dump([{"id": k, "type": "book"} for k in re.findall(r"@\w+\{([^,]+),", text)], f)
+with open(out + ".calls", "a") as f:
+    f.write("x")
+'''
+
+
+@pytest.fixture
+def bib_pandoc(tmp_path):
+    if os.name == "nt":
+        pytest.skip("POSIX のみ")
+    script = tmp_path / "fake-bib-pandoc"
+    script.write_text(f"#!{sys.executable}\n" + _FAKE_BIB_PANDOC, encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    return str(script)
+
+
+def test_cited_keys(tmp_path):
+    doc = tmp_path / "a.md"
+    doc.write_text("See [@knuth84; -@lamport94, p. 3] and @{odd key}.\n"
+                   "Mail me: user@example.com. Figure @fig:one.\n", encoding="utf-8")
+    assert cited_keys([str(doc)]) == {"knuth84", "lamport94", "odd key", "fig:one"}
+    doc.write_text("---\nnocite: |\n  @*\n---\n[@knuth84]\n", encoding="utf-8")
+    assert cited_keys([str(doc)]) is None
+
+
+def test_prepare_converts_once_and_prunes(tmp_path, bib_pandoc):
+    bib = tmp_path / "refs.bib"
+    bib.write_text("@book{knuth84, title={T}}\n@book{lamport94, title={L}}\n"
+                   "@book{unused, title={U}}\n", encoding="utf-8")
+    doc = tmp_path / "a.md"
+    doc.write_text("[@knuth84]\n", encoding="utf-8")
+    cache = BibCache(tmp_path / "cache", pandoc=bib_pandoc)
+
+    def job():
+        return ConversionJob(inputs=[str(doc)], output_file="a.pdf",
+                             extra_args=["--citeproc", "--bibliography", str(bib)])
+
+    full = job()
+    replaced = cache.prepare(full)
+    csl = replaced[str(bib)]
+    assert full.extra_args == ["--citeproc", "--bibliography", csl]
+    assert [e["id"] for e in json.loads(open(csl).read())] == ["knuth84", "lamport94", "unused"]
+
+    pruned = job()
+    cache.prepare(pruned, prune=True)
+    assert [e["id"] for e in json.loads(open(pruned.extra_args[-1]).read())] == ["knuth84"]
+    # 2 回目以降は内容ハッシュでキャッシュを引く (pandoc は 1 回だけ)
+    cache.prepare(job())
+    calls = [p for p in os.listdir(tmp_path / "cache") if p.endswith(".calls")]
+    assert len(calls) == 1 and open(tmp_path / "cache" / calls[0]).read() == "x"
+
+
+def test_prepare_skips_without_citeproc_and_on_failure(tmp_path):
+    bib = tmp_path / "refs.bib"
+    bib.write_text("@book{a, title={T}}\n", encoding="utf-8")
+    cache = BibCache(tmp_path / "cache", pandoc=str(tmp_path / "no-such-pandoc"))
+    job = ConversionJob(inputs=["a.md"], output_file="a.pdf", extra_args=["--bibliography", str(bib)])
+    assert cache.prepare(job) == {}
+    job.extra_args.insert(0, "--citeproc")
+    assert cache.prepare(job) == {}  # 変換できなければ元の .bib のまま
+    assert job.extra_args[-1] == str(bib)
+
+
+def test_batch_shares_parse_and_prunes_per_document(tmp_path, bib_pandoc, monkeypatch):
+    import bibcache
+
+    bib = tmp_path / "refs.bib"
+    bib.write_text("".join(f"@book{{k{i}, title={{T}}}}\n" for i in range(50)), encoding="utf-8")
+    docs = []
+    for name, body in [("a", "[@k1; @k2]"), ("b", "@k3"), ("c", "![](part.md)\n"
+                                                             "```{.include}\npart.md\n```\n")]:
+        doc = tmp_path / f"{name}.md"
+        doc.write_text(body, encoding="utf-8")
+        docs.append(doc)
+    (tmp_path / "part.md").write_text("Included text cites [@k49].\n", encoding="utf-8")
+
+    digests = []
+    real_digest = bibcache.file_digest
+    monkeypatch.setattr(bibcache, "file_digest", lambda p: digests.append(p) or real_digest(p))
+    cache = BibCache(tmp_path / "cache", pandoc=bib_pandoc)
+    jobs = [ConversionJob(inputs=[str(d)], output_file=f"{d.stem}.pdf",
+                          extra_args=["--citeproc", "--bibliography", str(bib)]) for d in docs]
+    for job in jobs:
+        cache.prepare(job, prune=True)
+
+    subsets = [[e["id"] for e in json.loads(open(j.extra_args[-1]).read())] for j in jobs]
+    assert subsets == [["k1", "k2"], ["k3"], ["k49"]]
+    assert len(digests) == 1  # ハッシュ計算は 1 回
+    assert len(cache._index) == 1  # CSL JSON のパースも 1 回
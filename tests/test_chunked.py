@@ -0,0 +1,219 @@
+"""chunked.py (巨大文書の分割並列変換) のテスト."""
+import io
+import json
+import os
+import shutil
+import struct
+import zlib
+from pathlib import Path
+
+import pytest
+
+import cli
+from conversion import ConversionJob, run_jobs
+from chunked import (
+    ChunkPlan,
+    body_args,
+    group_sections,
+    raw_block,
+    split_chunk_output,
+    split_front_matter,
+    split_sections,
+    unsupported_reason,
+)
+from engines import LogicalConfig
+from report import RunReport
+from scheduler import RunHistory
+
+DOC = """\
+---
+title: Manual
+---
+Intro paragraph.
+
+# One
+text 1
+
+```python
+# not a heading
+```
+
+## One.A
+sub
+
+# Two
+text 2
+
+# Three
+text 3
+"""
+
+
+def test_split_front_matter():
+    front, body = split_front_matter(DOC)
+    assert front == "---\ntitle: Manual\n---\n"
+    assert body.startswith("Intro paragraph.")
+    assert split_front_matter("# x\n") == ("", "# x\n")
+
+
+def test_split_sections_at_top_level_outside_code():
+    _, body = split_front_matter(DOC)
+    sections = split_sections(body)
+    assert [s.splitlines()[0] for s in sections] == ["Intro paragraph.", "# One", "# Two", "# Three"]
+    assert "# not a heading" in sections[1] and "## One.A" in sections[1]
+    assert "".join(sections) == body
+    # 最も浅い見出しがトップレベル
+    assert len(split_sections("## a\nx\n### b\n## c\n")) == 2
+
+
+def test_group_sections_balances_and_keeps_order():
+    sections = ["a" * 10, "b" * 10, "c" * 10, "d" * 10]
+    assert group_sections(sections, 2) == ["a" * 10 + "b" * 10, "c" * 10 + "d" * 10]
+    assert group_sections(sections, 10) == sections
+    assert group_sections(["x" * 100, "y", "z"], 3) == ["x" * 100, "y", "z"]
+
+
+def test_body_args_keeps_reader_and_filters_only():
+    args = ["--toc", "--from", "markdown+hard_line_breaks", "--lua-filter", "/r/f.lua",
+            "--pdf-engine=xelatex", "--template=/t.tex", "--include-in-header", "/h.tex",
+            "--wrap=preserve", "-V", "fontsize=11pt", "--citeproc"]
+    assert body_args(args) == ["--from", "markdown+hard_line_breaks", "--lua-filter", "/r/f.lua",
+                               "--wrap=preserve"]
+
+
+def test_unsupported_reason():
+    assert unsupported_reason(["--toc"]) is None
+    assert unsupported_reason(["--citeproc"])
+    assert unsupported_reason(["--filter", "pandoc-crossref"])
+
+
+def test_raw_block_uses_longer_fence():
+    block = raw_block("\\begin{verbatim}\n````\n\\end{verbatim}\n", "latex")
+    assert block.startswith("`````{=latex}\n") and block.endswith("\n`````\n")
+
+
+def test_chunk_pipeline_keeps_document_order(tmp_path, fake_pandoc):
+    src = tmp_path / "manual.md"
+    src.write_text(DOC, encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "manual.pdf"),
+                        extra_args=["--toc", "--pdf-engine=xelatex"])
+    plan = ChunkPlan(job, 3, str(tmp_path / "work"), typst=False)
+    chunk_jobs = plan.chunk_jobs()
+    assert len(chunk_jobs) == 3
+    assert all(j.cwd() == str(tmp_path.resolve()) for j in chunk_jobs)
+    assert chunk_jobs[0].extra_args[:2] == ["-t", "latex"]
+
+    results = run_jobs(chunk_jobs, max_jobs=3, pandoc=fake_pandoc)
+    assert all(r.ok for r in results)
+    final = plan.final_job(chunk_jobs)
+    assert final.extra_args == job.extra_args and final.output_file == job.output_file
+    [result] = run_jobs([final], pandoc=fake_pandoc)
+    assert result.ok
+
+    out = (tmp_path / "manual.pdf").read_text(encoding="utf-8")
+    assert out.startswith("---\ntitle: Manual\n---\n")
+    assert out.count("```{=latex}") == 3
+    positions = [out.index(marker) for marker in ("Intro", "# One", "# Two", "# Three")]
+    assert positions == sorted(positions)
+
+
+def _run_chunked(tmp_path, fake_pandoc, monkeypatch, job, cfg):
+    """PATH 上の fake pandoc で cli.run_chunked を実行し、(終了コード, レポートのレコード) を返す."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    shutil.copy(fake_pandoc, bin_dir / "pandoc")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setattr(cli, "RunHistory", lambda: RunHistory(tmp_path / "history.json"))
+    stream = io.StringIO()
+    report = RunReport(stream, argv=["convert"], profile="default", config=cfg)
+    rc = cli.run_chunked(job, cfg, 3, report=report)
+    report.summary(report.results, rc)
+    return rc, [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_run_chunked_fallback_writes_one_summary(tmp_path, fake_pandoc, monkeypatch):
+    src = tmp_path / "manual.md"
+    src.write_text(DOC + "\n@@TYPSTFAIL\n", encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "manual.pdf"),
+                        extra_args=["--pdf-engine=typst"], engine="typst",
+                        fallback_args=["--pdf-engine=xelatex"], fallback_engine="xelatex",
+                        scratch_dir=str(tmp_path / "scratch"))
+    cfg = LogicalConfig(output_format="pdf")
+    rc, records = _run_chunked(tmp_path, fake_pandoc, monkeypatch, job, cfg)
+    assert rc == 0
+    # Typst の最終組版の失敗と LaTeX でのやり直しを含めても summary は 1 つ
+    assert [r["type"] for r in records].count("summary") == 1
+    assert records[-1]["type"] == "summary" and records[-1]["exit_code"] == 0
+
+
+def test_run_chunked_reports_failed_chunk(tmp_path, fake_pandoc, monkeypatch):
+    src = tmp_path / "manual.md"
+    src.write_text(DOC.replace("text 1", "@@FAIL"), encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "manual.pdf"),
+                        extra_args=["--pdf-engine=xelatex"], scratch_dir=str(tmp_path / "scratch"))
+    cfg = LogicalConfig(output_format="pdf")
+    rc, records = _run_chunked(tmp_path, fake_pandoc, monkeypatch, job, cfg)
+    assert rc == 43
+    jobs = [r for r in records if r["type"] == "job"]
+    # 最終組版には進まず、チャンクの結果だけが残る
+    assert len(jobs) == 3 and all("[chunk " in r["name"] for r in jobs)
+    [failed] = [r for r in jobs if r["status"] == "failed"]
+    assert failed["exit_code"] == 43
+    assert records[-1] == {**records[-1], "type": "summary", "jobs": 3, "exit_code": 43}
+
+
+def test_final_latex_pass_gets_template_variables_and_macros(tmp_path):
+    src = tmp_path / "manual.md"
+    src.write_text(DOC, encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "manual.pdf"),
+                        extra_args=["--pdf-engine=xelatex"])
+    plan = ChunkPlan(job, 3, str(tmp_path / "work"), typst=False)
+    chunk_jobs = plan.chunk_jobs()
+    assert "--standalone" in chunk_jobs[0].extra_args
+    # pandoc が専用テンプレートで書き出す形 (変数の行 / マクロ / 本文)
+    outputs = [
+        "%% pandoctools-chunk-vars: graphics\n\\includegraphics{a.png}\n",
+        "%% pandoctools-chunk-vars: tables\n"
+        "%% pandoctools-chunk-highlighting-begin\n\\newenvironment{Shaded}{}{}\n"
+        "%% pandoctools-chunk-highlighting-end\n\\begin{longtable}\n",
+        "%% pandoctools-chunk-vars: graphics\nplain\n",
+    ]
+    for chunk, text in zip(chunk_jobs, outputs):
+        Path(chunk.output_file).write_text(text, encoding="utf-8")
+    assert split_chunk_output(outputs[1])[:2] == (["tables"], "\\newenvironment{Shaded}{}{}")
+    final = plan.final_job(chunk_jobs)
+    header = final.extra_args[final.extra_args.index("--include-in-header") + 1]
+    assert final.extra_args[:5] == ["--pdf-engine=xelatex", "-V", "graphics=true", "-V", "tables=true"]
+    assert Path(header).read_text(encoding="utf-8") == "\\newenvironment{Shaded}{}{}\n"
+    assembled = plan.assembled.read_text(encoding="utf-8")
+    assert "pandoctools-chunk" not in assembled and "Shaded" not in assembled
+    # Typst のチャンクは専用テンプレートを使わない
+    typst = ChunkPlan(job, 3, str(tmp_path / "typst"), typst=True).chunk_jobs()
+    assert "--standalone" not in typst[0].extra_args
+
+
+def _png() -> bytes:
+    """1x1 のグレースケール PNG."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00\x00")) + chunk(b"IEND", b""))
+
+
+@pytest.mark.skipif(not (shutil.which("pandoc") and shutil.which("xelatex")),
+                    reason="pandoc と xelatex が必要")
+def test_real_pandoc_chunked_pdf_with_image_table_and_code(tmp_path, monkeypatch):
+    (tmp_path / "dot.png").write_bytes(_png())
+    src = tmp_path / "doc.md"
+    src.write_text(
+        "# Image\n\n![dot](dot.png)\n\n"
+        "# Table\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+        "# Code\n\n```python\ndef f(x):\n    return x + 1\n```\n",
+        encoding="utf-8")
+    out = tmp_path / "doc.pdf"
+    job = ConversionJob(inputs=[str(src)], output_file=str(out), extra_args=["--pdf-engine=xelatex"],
+                        timeout=300, scratch_dir=str(tmp_path / "scratch"))
+    monkeypatch.setattr(cli, "RunHistory", lambda: RunHistory(tmp_path / "history.json"))
+    assert cli.run_chunked(job, LogicalConfig(output_format="pdf"), 3) == 0
+    assert out.read_bytes().startswith(b"%PDF")
+
@@ -83,3 +83,17 @@ def test_legacy_v1_profile_loadable(tmp_path, monkeypatch):
     assert not cfg.is_v2_profile(loaded)
     assert "extra_args" in loaded
     assert loaded["output_format"] == "pdf"
+
+
+def test_profile_extras_timeouts(tmp_path, monkeypatch):
+    cfg = _force_isolated_profile_dir(tmp_path, monkeypatch)
+    extras = cfg.profile_extras({"timeout": 600, "idle_timeout": "120"})
+    assert extras["timeout"] == 600.0
+    assert extras["idle_timeout"] == 120.0
+
+
+def test_profile_extras_timeouts_default_unlimited(tmp_path, monkeypatch):
+    cfg = _force_isolated_profile_dir(tmp_path, monkeypatch)
+    extras = cfg.profile_extras({"timeout": "abc", "idle_timeout": -5})
+    assert extras["timeout"] == 0.0
+    assert extras["idle_timeout"] == 0.0
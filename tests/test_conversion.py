@@ -0,0 +1,186 @@
+"""conversion.py (asyncio 変換コア) の単体テスト."""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from conversion import (
+    EXIT_NOT_FOUND,
+    EXIT_TIMEOUT,
+    REASON_NO_OUTPUT,
+    REASON_WALL_CLOCK,
+    STATUS_CANCELLED,
+    STATUS_ERROR,
+    STATUS_FAILED,
+    STATUS_OK,
+    STATUS_TIMEOUT,
+    ConversionJob,
+    ConversionRunner,
+    pandoc_version,
+    run_jobs,
+)
+
+
+def _job(tmp_path, name, body, **kwargs):
+    src = tmp_path / f"{name}.md"
+    src.write_text(body, encoding="utf-8")
+    return ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / f"{name}.pdf"),
+                         label=name, **kwargs)
+
+
+def test_command_layout(tmp_path):
+    job = ConversionJob(inputs=["a.md", "b.md"], output_file="o.pdf",
+                        extra_args=["--toc"], resource_path="/x")
+    assert job.command() == ["pandoc", "a.md", "b.md", "-o", "o.pdf",
+                             "--resource-path", "/x", "--toc"]
+
+
+def test_cwd_defaults_to_first_input_dir(tmp_path):
+    job = _job(tmp_path, "a", "x")
+    assert job.cwd() == str(tmp_path.resolve())
+
+
+def test_run_success_and_streamed_output(tmp_path, fake_pandoc):
+    chunks = []
+    job = _job(tmp_path, "a", "hello\n")
+    [result] = run_jobs([job], pandoc=fake_pandoc,
+                        on_output=lambda j, stream, text: chunks.append((stream, text)))
+    assert result.status == STATUS_OK
+    assert result.exit_code == 0
+    assert (tmp_path / "out" / "a.pdf").read_text(encoding="utf-8") == "hello\n"
+    assert any("fake pandoc" in text for stream, text in chunks if stream == "stdout")
+
+
+def test_run_failure_keeps_exit_code(tmp_path, fake_pandoc):
+    [result] = run_jobs([_job(tmp_path, "a", "@@FAIL\n")], pandoc=fake_pandoc)
+    assert result.status == STATUS_FAILED
+    assert result.exit_code == 43
+
+
+def test_missing_executable(tmp_path):
+    [result] = run_jobs([_job(tmp_path, "a", "x")], pandoc=str(tmp_path / "no-such-pandoc"))
+    assert result.status == STATUS_ERROR
+    assert result.exit_code == EXIT_NOT_FOUND
+
+
+def test_timeout_kills_job(tmp_path, fake_pandoc):
+    job = _job(tmp_path, "slow", "@@SLEEP 30\n", timeout=0.5)
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.status == STATUS_TIMEOUT
+    assert result.exit_code == EXIT_TIMEOUT
+    assert result.duration < 10
+
+
+def test_concurrency_limit_and_order(tmp_path, fake_pandoc):
+    running = {"now": 0, "max": 0}
+
+    def on_start(job):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+
+    def on_finish(result):
+        running["now"] -= 1
+
+    jobs = [_job(tmp_path, f"j{i}", "@@SLEEP 0.3\n") for i in range(5)]
+    results = run_jobs(jobs, pandoc=fake_pandoc, max_jobs=2,
+                       on_start=on_start, on_finish=on_finish)
+    assert [r.job.label for r in results] == [f"j{i}" for i in range(5)]
+    assert all(r.ok for r in results)
+    assert running["max"] == 2
+
+
+def test_cancel_stops_running_and_pending(tmp_path, fake_pandoc):
+    jobs = [_job(tmp_path, f"j{i}", "@@SLEEP 30\n") for i in range(3)]
+
+    async def scenario():
+        runner = ConversionRunner(pandoc=fake_pandoc, on_start=lambda job: runner.cancel())
+        return await runner.run_all(jobs)
+
+    results = asyncio.run(scenario())
+    assert [r.status for r in results] == [STATUS_CANCELLED] * 3
+
+
+def test_idle_timeout_detects_silent_hang(tmp_path, fake_pandoc):
+    job = _job(tmp_path, "hang", "@@SLEEP 30\n", idle_timeout=0.5)
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.status == STATUS_TIMEOUT
+    assert result.reason == REASON_NO_OUTPUT
+
+
+def test_idle_timeout_ignores_chatty_job(tmp_path, fake_pandoc):
+    job = _job(tmp_path, "busy", "@@TICK 1.5\n", idle_timeout=0.8)
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.status == STATUS_OK
+
+
+def test_wall_clock_reason(tmp_path, fake_pandoc):
+    job = _job(tmp_path, "busy", "@@TICK 30\n", timeout=0.5, idle_timeout=10)
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.reason == REASON_WALL_CLOCK
+
+
+def test_timeout_kills_process_tree(tmp_path, fake_pandoc):
+    if sys.platform == "win32":
+        pytest.skip("POSIX のプロセスグループ前提")
+    pid_file = tmp_path / "child.pid"
+    job = _job(tmp_path, "tree", f"@@CHILD {pid_file}\n@@SLEEP 30\n", timeout=1.0)
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.status == STATUS_TIMEOUT
+    child = int(pid_file.read_text())
+    deadline = time.time() + 5
+    while time.time() < deadline and _alive(child):
+        time.sleep(0.05)
+    assert not _alive(child)
+
+
+def test_batch_continues_after_timeout(tmp_path, fake_pandoc):
+    jobs = [_job(tmp_path, "slow", "@@SLEEP 30\n", timeout=0.5),
+            _job(tmp_path, "fast", "ok\n", timeout=0.5)]
+    results = run_jobs(jobs, pandoc=fake_pandoc)
+    assert [r.status for r in results] == [STATUS_TIMEOUT, STATUS_OK]
+
+
+def _alive(pid):
+    try:
+        # ゾンビ (親が回収前) も終了済みとみなす
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_output_replaced_atomically_only_on_success(tmp_path, fake_pandoc):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    (out_dir / "a.pdf").write_text("previous", encoding="utf-8")
+    [result] = run_jobs([_job(tmp_path, "a", "@@FAIL\n")], pandoc=fake_pandoc)
+    assert result.status == STATUS_FAILED
+    # 失敗時は前回の出力がそのまま残り、一時ファイルも残らない
+    assert os.listdir(out_dir) == ["a.pdf"]
+    assert (out_dir / "a.pdf").read_text(encoding="utf-8") == "previous"
+
+    seen = []
+    [result] = run_jobs([_job(tmp_path, "a", "@@TMPDIR\nnew\n")], pandoc=fake_pandoc,
+                        on_output=lambda j, stream, text: seen.append(text))
+    assert result.status == STATUS_OK
+    staged = next(line for line in "".join(seen).splitlines() if line.startswith("OUT="))[4:]
+    # pandoc には同じディレクトリ・同じ拡張子の一時ファイルを渡している
+    assert os.path.dirname(staged) == str(out_dir) and staged.endswith(".pdf")
+    assert os.listdir(out_dir) == ["a.pdf"]
+    assert "new" in (out_dir / "a.pdf").read_text(encoding="utf-8")
+
+
+def test_cancelled_job_leaves_no_partial_output(tmp_path, fake_pandoc):
+    job = _job(tmp_path, "slow", "@@SLEEP 5\n")
+    runner = ConversionRunner(pandoc=fake_pandoc,
+                              on_start=lambda j: asyncio.get_running_loop().call_later(0.2, runner.cancel))
+    [result] = asyncio.run(runner.run_all([job]))
+    assert result.status == STATUS_CANCELLED
+    assert os.listdir(tmp_path / "out") == []
+
+
+def test_pandoc_version(tmp_path, fake_pandoc):
+    assert pandoc_version(fake_pandoc) == "pandoc 3.1 (fake)"
+    assert pandoc_version(str(tmp_path / "no-such-pandoc")) is None
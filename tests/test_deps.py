@@ -0,0 +1,116 @@
+"""deps.py (依存集合と --incremental 判定) のテスト."""
+import os
+
+from conversion import ConversionJob
+from deps import DependencyDB, argument_files, collect_dependencies, scan_references
+
+
+def _touch(path, text="", mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def _project(tmp_path):
+    doc = _touch(tmp_path / "doc.md", "\n".join([
+        "# Title",
+        "![fig](img/a.png){width=50%}",
+        '<img src="img/b.svg">',
+        "![remote](https://example.com/x.png)",
+        "![missing](img/none.png)",
+        "```{.include}",
+        "parts/ch1.md",
+        "```",
+        r"\input{parts/tex_part}",
+    ]), mtime=1000)
+    _touch(tmp_path / "img" / "a.png", mtime=1000)
+    _touch(tmp_path / "img" / "b.svg", mtime=1000)
+    _touch(tmp_path / "parts" / "ch1.md", "![c](../img/c.jpg)\n", mtime=1000)
+    _touch(tmp_path / "img" / "c.jpg", mtime=1000)
+    _touch(tmp_path / "parts" / "tex_part.tex", mtime=1000)
+    return doc
+
+
+def test_scan_references_follows_includes(tmp_path):
+    doc = _project(tmp_path)
+    found = {os.path.relpath(p, tmp_path) for p in scan_references(str(doc))}
+    assert found == {os.path.join("img", "a.png"), os.path.join("img", "b.svg"),
+                     os.path.join("parts", "ch1.md"), os.path.join("img", "c.jpg"),
+                     os.path.join("parts", "tex_part.tex")}
+
+
+def test_argument_files(tmp_path):
+    bib = _touch(tmp_path / "refs.bib")
+    lua = _touch(tmp_path / "f.lua")
+    tpl = _touch(tmp_path / "t.tex")
+    args = ["--toc", "--bibliography", str(bib), "--lua-filter", "f.lua",
+            f"--template={tpl}", "--filter", "pandoc-crossref"]
+    assert argument_files(args, str(tmp_path)) == {str(bib.resolve()), str(lua.resolve()),
+                                                   str(tpl.resolve())}
+
+
+def test_incremental_up_to_date_by_stat(tmp_path):
+    doc = _project(tmp_path)
+    profile = _touch(tmp_path / "profile.yml", mtime=1000)
+    out = _touch(tmp_path / "doc.pdf", "pdf", mtime=2000)
+    job = ConversionJob(inputs=[str(doc)], output_file=str(out), extra_args=["--toc"])
+    db = DependencyDB(tmp_path / "deps.json", extra_files=[str(profile)])
+    assert not db.is_up_to_date(job)  # 記録が無い
+
+    db.record(job)
+    db.save()
+    assert str(profile.resolve()) in collect_dependencies(job, [str(profile)])
+    db = DependencyDB(tmp_path / "deps.json")
+    assert db.is_up_to_date(job)
+
+    # include 先の画像が更新された
+    os.utime(tmp_path / "img" / "c.jpg", (3000, 3000))
+    assert not db.is_up_to_date(job)
+    os.utime(tmp_path / "img" / "c.jpg", (1000, 1000))
+    # プロファイル YAML が更新された
+    os.utime(profile, (3000, 3000))
+    assert not db.is_up_to_date(job)
+    os.utime(profile, (1000, 1000))
+    assert db.is_up_to_date(job)
+
+    # コマンドが変わった / 出力が消えた
+    changed = ConversionJob(inputs=[str(doc)], output_file=str(out), extra_args=["--no-toc"])
+    assert not db.is_up_to_date(changed)
+    out.unlink()
+    assert not db.is_up_to_date(job)
+
+
+def test_concurrent_runs_keep_each_others_records(tmp_path):
+    doc = _project(tmp_path)
+    outs = [_touch(tmp_path / f"{name}.pdf", "pdf", mtime=2000) for name in ("a", "b")]
+    jobs = [ConversionJob(inputs=[str(doc)], output_file=str(out)) for out in outs]
+    first = DependencyDB(tmp_path / "deps.json")
+    second = DependencyDB(tmp_path / "deps.json")
+    first.record(jobs[0])
+    second.record(jobs[1])
+    first.save()
+    second.save()
+    db = DependencyDB(tmp_path / "deps.json")
+    assert all(db.is_up_to_date(job) for job in jobs)
+
+
+def test_missing_reference_that_appears_triggers_rebuild(tmp_path):
+    doc = _project(tmp_path)
+    out = _touch(tmp_path / "doc.pdf", "pdf", mtime=2000)
+    job = ConversionJob(inputs=[str(doc)], output_file=str(out),
+                        extra_args=["--bibliography", "refs.bib"])
+    db = DependencyDB(tmp_path / "deps.json")
+    db.record(job)
+    db.save()
+    db = DependencyDB(tmp_path / "deps.json")
+    assert db.is_up_to_date(job)
+    # 変換時に無かった画像が後から置かれた (出力より古い mtime でも作り直す)
+    _touch(tmp_path / "img" / "none.png", mtime=1000)
+    assert not db.is_up_to_date(job)
+    (tmp_path / "img" / "none.png").unlink()
+    assert db.is_up_to_date(job)
+    # 引数のファイルも同様
+    _touch(tmp_path / "refs.bib", mtime=1000)
+    assert not db.is_up_to_date(job)
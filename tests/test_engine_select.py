@@ -0,0 +1,89 @@
+"""engine_select.py (engine: auto のエンジン選択とフォールバック) のテスト."""
+from common import RESOURCE_DIR
+from conversion import STATUS_FAILED, STATUS_OK, ConversionJob, run_jobs
+from engine_select import apply_auto_engine, choose_engine, localize_jobs, typst_blockers
+from engines import AUTO_FALLBACK_ENGINE, ENGINE_AUTO, LogicalConfig
+from scheduler import RunHistory
+
+
+def _input(tmp_path, name, body):
+    src = tmp_path / name
+    src.write_text(body, encoding="utf-8")
+    return str(src)
+
+
+def test_typst_blockers():
+    assert typst_blockers("# 見出し\n\n本文 $x^2$ と $$\\frac{a}{b}$$\n") == []
+    assert typst_blockers("```{=latex}\n\\newpage\n```\n") == ["raw LaTeX ブロック"]
+    assert typst_blockers("$$\n\\begin{align*}\na &= b\n\\end{align*}\n$$\n") == ["数式環境 align"]
+    assert typst_blockers("前\n\n\\newpage\n\n後\n") == ["LaTeX コマンド \\newpage"]
+    # コード中の記法は数えない
+    assert typst_blockers("`\\newpage` と\n\n```tex\n\\begin{equation}\n```\n") == []
+    # crossref の参照は pandoc-crossref を使うときだけ問題になる
+    assert typst_blockers("図 @fig:a を参照\n") == []
+    assert typst_blockers("図 @fig:a を参照\n", crossref=True) == ["pandoc-crossref の参照"]
+
+
+def test_choose_engine(tmp_path):
+    cfg = LogicalConfig(engine=ENGINE_AUTO)
+    plain = _input(tmp_path, "plain.md", "# A\n\n本文\n")
+    raw = _input(tmp_path, "raw.md", "\\clearpage\n")
+    assert choose_engine(cfg, [plain]).engine == "typst"
+    assert choose_engine(cfg, [plain]).fallback == AUTO_FALLBACK_ENGINE
+    choice = choose_engine(cfg, [plain, raw])
+    assert (choice.engine, choice.fallback) == (AUTO_FALLBACK_ENGINE, None)
+    assert choice.reasons == ["LaTeX コマンド \\clearpage"]
+    assert choose_engine(LogicalConfig(engine=ENGINE_AUTO, template_file="my.tex"),
+                         [plain]).reasons == ["LaTeX テンプレート"]
+    assert choose_engine(cfg, [plain], typst_failed=True).engine == AUTO_FALLBACK_ENGINE
+    # PDF 以外ではエンジンを使わない
+    assert choose_engine(LogicalConfig(engine=ENGINE_AUTO, output_format="docx"),
+                         [plain]).engine == AUTO_FALLBACK_ENGINE
+
+
+def test_auto_falls_back_to_latex_and_remembers(tmp_path, fake_pandoc):
+    cfg = LogicalConfig(engine=ENGINE_AUTO)
+    good = _input(tmp_path, "good.md", "# A\n")
+    bad = _input(tmp_path, "bad.md", "@@TYPSTFAIL\n")
+    jobs = [ConversionJob(inputs=[p], output_file=str(tmp_path / "out" / (name + ".pdf")))
+            for name, p in (("good", good), ("bad", bad))]
+    history = RunHistory(tmp_path / "history.json")
+    logs = []
+    apply_auto_engine(jobs, cfg, RESOURCE_DIR, history=history, log=logs.append)
+    assert [job.engine for job in jobs] == ["typst", "typst"]
+    assert "--pdf-engine=typst" in jobs[0].extra_args
+    assert f"--pdf-engine={AUTO_FALLBACK_ENGINE}" in jobs[0].fallback_args
+    assert len(logs) == 2
+
+    results = run_jobs(jobs, pandoc=fake_pandoc)
+    assert [r.status for r in results] == [STATUS_OK, STATUS_OK]
+    assert [a["engine"] for a in results[0].attempts] == ["typst"]
+    attempts = results[1].attempts
+    assert [(a["engine"], a["status"]) for a in attempts] == [
+        ("typst", STATUS_FAILED), (AUTO_FALLBACK_ENGINE, STATUS_OK)]
+    assert results[1].duration >= sum(a["duration"] for a in attempts) - 0.01
+    assert f"--pdf-engine={AUTO_FALLBACK_ENGINE}" in results[1].job.command()
+
+    # Typst で失敗した入力は、変わるまで最初から LaTeX で変換する
+    for r in results:
+        history.record_attempts(r.job, r.attempts)
+    retry = ConversionJob(inputs=[bad], output_file=str(tmp_path / "out" / "bad.pdf"))
+    apply_auto_engine([retry], cfg, RESOURCE_DIR, history=history)
+    assert (retry.engine, retry.fallback_args) == (AUTO_FALLBACK_ENGINE, None)
+    with open(bad, "a", encoding="utf-8") as f:
+        f.write("追記\n")
+    apply_auto_engine([retry], cfg, RESOURCE_DIR, history=history)
+    assert retry.engine == "typst"
+
+
+def test_localize_jobs_adds_font_path_after_warm(tmp_path):
+    doc = tmp_path / "doc.md"
+    doc.write_text("# Title\n", encoding="utf-8")
+    cfg = LogicalConfig(engine=ENGINE_AUTO, output_format="pdf")
+    job = ConversionJob(inputs=[str(doc)], output_file=str(tmp_path / "doc.pdf"))
+    # 引数を組み立てた時点ではフォントのディレクトリがまだ無い
+    apply_auto_engine([job], cfg, RESOURCE_DIR, history=RunHistory(tmp_path / "h.json"))
+    assert not any("--font-path" in a for a in job.extra_args)
+    localize_jobs([job], (None, tmp_path / "fonts"))
+    assert f"--pdf-engine-opt=--font-path={tmp_path / 'fonts'}" in job.extra_args
+    assert not any("--font-path" in a for a in job.fallback_args)
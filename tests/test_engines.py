@@ -9,7 +9,9 @@ from engines import (
     TypstAdapter,
     get_adapter,
     is_typst_mode,
+    localize_typst_args,
 )
+from typst_packages import typst_tool_paths
 
 
 RESOURCE_DIR = Path(__file__).resolve().parent.parent / "src"
@@ -121,6 +123,36 @@ def test_latex_filters_include_default_lua():
 # --- TypstAdapter._engine_specific ---
 
 
+def test_typst_package_path(tmp_path, monkeypatch):
+    cfg = LogicalConfig(engine="typst", output_format="pdf")
+    monkeypatch.setenv("PANDOCTOOLS_TYPST_PACKAGES", str(tmp_path / "missing"))
+    assert typst_tool_paths(RESOURCE_DIR)[0] is None
+    # build_args はディスクを調べず、渡された置き場所だけを使う
+    assert not any("--package-path" in a for a in TypstAdapter().build_args(cfg, RESOURCE_DIR))
+    monkeypatch.setenv("PANDOCTOOLS_TYPST_PACKAGES", str(tmp_path))
+    assert not any("--package-path" in a for a in TypstAdapter().build_args(cfg, RESOURCE_DIR))
+    packages, _ = typst_tool_paths(RESOURCE_DIR)
+    assert packages == tmp_path
+    args = get_adapter(cfg, package_path=packages).build_args(cfg, RESOURCE_DIR)
+    assert f"--pdf-engine-opt=--package-path={tmp_path}" in args
+    # .typ 出力では typst を起動しないので渡さない
+    cfg = LogicalConfig(engine="typst", output_format="typst")
+    assert not any("--package-path" in a
+                   for a in TypstAdapter(package_path=packages).build_args(cfg, RESOURCE_DIR))
+
+
+def test_localize_typst_args(tmp_path):
+    cfg = LogicalConfig(engine="typst", output_format="pdf")
+    submitted = TypstAdapter(package_path=Path("/submitter/packages"),
+                             font_path=Path("/submitter/fonts")).build_args(cfg, RESOURCE_DIR)
+    local = localize_typst_args(submitted, package_path=tmp_path)
+    assert not any("/submitter/" in a for a in local)
+    assert local == TypstAdapter(package_path=tmp_path).build_args(cfg, RESOURCE_DIR)
+    # typst を使わない引数はそのまま
+    latex = LatexAdapter().build_args(LogicalConfig(), RESOURCE_DIR)
+    assert localize_typst_args(latex, package_path=tmp_path) == latex
+
+
 def test_typst_paper_mapping():
     cfg = LogicalConfig(engine="typst", paper="a4paper")
     args = TypstAdapter().build_args(cfg, RESOURCE_DIR)
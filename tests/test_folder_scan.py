@@ -0,0 +1,43 @@
+"""folder_scan.py (フォルダ取り込みの走査) のテスト."""
+import os
+
+from folder_scan import FolderScanner, is_ignored, scan_folder
+
+
+def _touch(root, *names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x", encoding="utf-8")
+
+
+def test_scan_filters_extensions_and_ignores(tmp_path):
+    _touch(tmp_path, "b.md", "a.MARKDOWN", "notes.txt", "sub/c.mkd", "sub/deep/d.md",
+           ".git/e.md", "node_modules/pkg/f.md", "drafts/g.md", "drafts/keep/h.md")
+    found = scan_folder(str(tmp_path), ignore=(".*", "node_modules", "drafts/keep"))
+    rel = [os.path.relpath(p, tmp_path).replace(os.sep, "/") for p in found]
+    # ディレクトリごとにファイル → サブディレクトリの名前順
+    assert rel == ["a.MARKDOWN", "b.md", "drafts/g.md", "sub/c.mkd", "sub/deep/d.md"]
+    assert scan_folder(str(tmp_path), recursive=False) == [str(tmp_path / "a.MARKDOWN"),
+                                                           str(tmp_path / "b.md")]
+
+
+def test_is_ignored():
+    assert is_ignored(".git", ".git", [".*"])
+    assert is_ignored("build", "docs/build", ["docs/build"])
+    assert not is_ignored("docs", "docs", ["docs/build"])
+
+
+def test_batches_and_cancel(tmp_path):
+    _touch(tmp_path, *[f"d{i}/{j}.md" for i in range(5) for j in range(10)])
+    scanner = FolderScanner(str(tmp_path))
+    batches = list(scanner.batches(size=7, interval=3600))
+    assert [len(b) for b in batches] == [7] * 7 + [1]
+    assert scanner.found == 50 and scanner.scanned == 55
+
+    scanner = FolderScanner(str(tmp_path))
+    got = []
+    for batch in scanner.batches(size=7, interval=3600):
+        got.extend(batch)
+        scanner.cancel()
+    assert len(got) == 7 and scanner.cancelled
@@ -0,0 +1,64 @@
+"""fonts.py (フォント確認とフォントキャッシュの事前作成) のテスト."""
+import pytest
+
+import fonts
+from common import RESOURCE_DIR
+from engines import LogicalConfig, TypstAdapter
+from typst_packages import typst_tool_paths
+from fonts import ENGINE_LATEX, ENGINE_TYPST, check_fonts, ensure_warm, is_warm, referenced_fonts
+
+
+@pytest.fixture
+def font_env(tmp_path, monkeypatch):
+    """FONT_DIR を一時ディレクトリにし、外部ツール (fc-cache / typst ...) は無いものとする."""
+    monkeypatch.setattr(fonts, "FONT_DIR", tmp_path / "fonts")
+    monkeypatch.setattr(fonts.shutil, "which", lambda name: None)
+    monkeypatch.delenv(fonts.NO_WARM_ENV, raising=False)
+    return tmp_path
+
+
+def test_referenced_fonts_from_templates():
+    refs = referenced_fonts(RESOURCE_DIR)
+    assert refs[ENGINE_LATEX] == ["XITS", "IPAexGothic", "NewComputerModernMath"]
+    assert refs[ENGINE_TYPST] == ["New Computer Modern", "Source Sans Pro"]
+
+
+def test_check_fonts_normalizes_names():
+    index = {"xits": ["/f/XITS-Regular.otf"], "newcomputermodernmath": ["/f/NewCMMath.otf"]}
+    checks = {(c.engine, c.name): c for c in check_fonts(RESOURCE_DIR, index=index)}
+    assert checks[(ENGINE_LATEX, "XITS")].found
+    assert checks[(ENGINE_LATEX, "NewComputerModernMath")].files == ["/f/NewCMMath.otf"]
+    assert checks[(ENGINE_LATEX, "IPAexGothic")].found is False
+    # typst は自身の一覧 (内蔵フォントを含む) があればそれで判定する
+    checks = check_fonts(RESOURCE_DIR, index=index, typst={"newcomputermodern"})
+    assert [c.found for c in checks if c.engine == ENGINE_TYPST] == [True, False]
+    # 確認手段が無ければ不明
+    assert all(c.found is None for c in check_fonts(RESOURCE_DIR))
+
+
+def test_warm_collects_fonts_and_runs_once(font_env, monkeypatch):
+    font = font_env / "XITS-Regular.otf"
+    font.write_bytes(b"OTTO")
+    monkeypatch.setattr(fonts, "fontconfig_index", lambda: {"xits": [str(font)]})
+    assert not is_warm(RESOURCE_DIR)
+    assert fonts.typst_font_path() is None
+
+    logs = []
+    record = ensure_warm(RESOURCE_DIR, log=logs.append)
+    assert record is not None and logs
+    assert any(c["name"] == "XITS" and c["found"] for c in record["fonts"])
+    assert (font_env / "fonts" / "files" / "XITS-Regular.otf").read_bytes() == b"OTTO"
+    assert is_warm(RESOURCE_DIR)
+    assert ensure_warm(RESOURCE_DIR) is None
+
+    # 集めたフォントは Typst の PDF 出力に --font-path で渡る
+    font_path = typst_tool_paths(RESOURCE_DIR)[1]
+    args = TypstAdapter(font_path=font_path).build_args(LogicalConfig(engine="typst", output_format="pdf"),
+                                                        RESOURCE_DIR)
+    assert f"--pdf-engine-opt=--font-path={font_env / 'fonts' / 'files'}" in args
+
+
+def test_ensure_warm_can_be_disabled(font_env, monkeypatch):
+    monkeypatch.setenv(fonts.NO_WARM_ENV, "1")
+    assert ensure_warm(RESOURCE_DIR) is None
+    assert not (font_env / "fonts").exists()
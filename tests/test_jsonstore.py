@@ -0,0 +1,49 @@
+"""jsonstore.py (共有 JSON のマージ保存) の単体テスト."""
+import json
+import os
+import time
+
+import jsonstore
+from jsonstore import JsonStore, file_lock, merge_changes
+
+
+def test_merge_changes_applies_only_our_edits():
+    base = {"a": {"x": 1, "y": 2}, "gone": 1, "same": 1}
+    ours = {"a": {"x": 10, "y": 2}, "same": 1, "new": 3}
+    theirs = {"a": {"x": 1, "y": 20, "z": 30}, "gone": 1, "same": 5, "theirs": 4}
+    assert merge_changes(base, ours, theirs) == {
+        "a": {"x": 10, "y": 20, "z": 30}, "same": 5, "new": 3, "theirs": 4}
+
+
+def test_concurrent_stores_keep_each_others_updates(tmp_path):
+    path = tmp_path / "store.json"
+    first, second = JsonStore(path), JsonStore(path)
+    first.data.setdefault("items", {})["a"] = 1
+    second.data.setdefault("items", {})["b"] = 2
+    assert first.save() and second.save()
+    assert json.loads(path.read_text(encoding="utf-8")) == {"items": {"a": 1, "b": 2}}
+    # 削除も他方の追加を消さずに反映される
+    first.data["items"].pop("a")
+    assert first.save()
+    assert JsonStore(path).data == {"items": {"b": 2}}
+    assert sorted(os.listdir(tmp_path)) == ["store.json"]
+
+
+def test_save_failure_is_logged(tmp_path):
+    (tmp_path / "file").write_text("", encoding="utf-8")
+    messages = []
+    store = JsonStore(tmp_path / "file" / "store.json", log=messages.append)
+    store.data["a"] = 1
+    assert not store.save()
+    assert messages and messages[0].startswith(JsonStore.save_error)
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    path = tmp_path / "store.json"
+    lock = tmp_path / "store.json.lock"
+    lock.write_text("", encoding="utf-8")
+    old = time.time() - jsonstore.STALE_LOCK - 1
+    os.utime(lock, (old, old))
+    with file_lock(path, timeout=0.1):
+        assert lock.exists()
+    assert not lock.exists()
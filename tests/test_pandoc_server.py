@@ -0,0 +1,91 @@
+"""pandoc_server.py (pandoc server バックエンド) のテスト."""
+import json
+import os
+
+import scheduler
+from cli import main
+from common import RESOURCE_DIR
+from conversion import STATUS_FAILED, STATUS_OK, ConversionJob, run_jobs
+from engines import LatexAdapter, LogicalConfig
+from pandoc_server import BACKEND_SERVER, PandocServer, server_request
+
+
+def _job(tmp_path, name, body, ext, extra_args=None):
+    src = tmp_path / f"{name}.md"
+    src.write_text(body, encoding="utf-8")
+    return ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / f"{name}.{ext}"),
+                         extra_args=list(extra_args or []), label=name)
+
+
+def test_server_request_translates_supported_args(tmp_path):
+    cfg = LogicalConfig(output_format="html", toc=True, wrap_preserve=True, fontsize="10pt",
+                        markdown_extensions="markdown+hard_line_breaks")
+    args = LatexAdapter().build_args(cfg, RESOURCE_DIR)
+    request = server_request(_job(tmp_path, "a", "# A\n", "html", args))
+    assert request["to"] == "html" and request["from"] == "markdown+hard_line_breaks"
+    assert request["table-of-contents"] is True and request["wrap"] == "preserve"
+    assert request["variables"] == {"fontsize": "10pt"}
+    assert request["text"] == "# A\n"
+
+    # 内蔵フィルタは対象の記法があるときだけプロセスに回す
+    body = "$$\n\\begin{align}\na\n\\end{align}\n$$\n"
+    assert server_request(_job(tmp_path, "b", body, "html", args)) is None
+    # PDF / 外部フィルタ / 画像入りの docx はプロセスで
+    assert server_request(_job(tmp_path, "c", "x", "pdf")) is None
+    assert server_request(_job(tmp_path, "d", "x", "html", ["--filter", "pandoc-crossref"])) is None
+    assert server_request(_job(tmp_path, "e", "![](a.png)\n", "docx")) is None
+    assert server_request(_job(tmp_path, "f", "![](a.png)\n", "html")) is not None
+
+
+def test_server_backend_with_process_fallback(tmp_path, fake_pandoc):
+    jobs = [_job(tmp_path, f"doc{i}", f"# {i}\n", "tex") for i in range(5)]
+    jobs.append(_job(tmp_path, "warn", "@@WARN\n", "html"))
+    jobs.append(_job(tmp_path, "pdf", "# pdf\n", "pdf"))
+    jobs.append(_job(tmp_path, "broken", "@@FAIL\n", "html"))
+    logs = []
+    with PandocServer(pandoc=fake_pandoc, pool_size=2, log=logs.append) as server:
+        assert server.available and server.version == "3.1"
+        errors = []
+        results = run_jobs(jobs, pandoc=fake_pandoc, max_jobs=3, backends=[server],
+                           on_output=lambda job, stream, text: errors.append((job.name, text)))
+    assert not server.available
+
+    by_name = {r.job.name: r for r in results}
+    for i in range(5):
+        r = by_name[f"doc{i}"]
+        assert (r.status, r.backend) == (STATUS_OK, BACKEND_SERVER)
+        assert open(r.job.output_file, encoding="utf-8").read() == f"server:latex:# {i}\n"
+    assert ("warn", "[WARNING] w\n") in errors
+    # サーバーで扱えない / 失敗したジョブは pandoc プロセスで
+    assert (by_name["pdf"].status, by_name["pdf"].backend) == (STATUS_OK, "")
+    assert open(by_name["pdf"].job.output_file, encoding="utf-8").read() == "# pdf\n"
+    assert (by_name["broken"].status, by_name["broken"].exit_code) == (STATUS_FAILED, 43)
+    assert not list((tmp_path / "out").glob(".*"))
+
+
+def test_server_unavailable_is_skipped(tmp_path):
+    logs = []
+    server = PandocServer(pandoc=str(tmp_path / "no-such-pandoc"), log=logs.append)
+    assert server.start() is False
+    assert server.prepare(_job(tmp_path, "a", "# A\n", "html")) is None
+    assert logs
+
+
+def test_cli_backend_server(tmp_path, fake_pandoc, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "pandoc").symlink_to(fake_pandoc)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(scheduler, "CACHE_DIR", tmp_path / "cache")
+    inputs = []
+    for name in ("a", "b"):
+        src = tmp_path / f"{name}.md"
+        src.write_text(f"# {name}\n", encoding="utf-8")
+        inputs.append(str(src))
+    report = tmp_path / "report.jsonl"
+    rc = main(["convert", *inputs, "--batch", "-j", "2", "--to", "html", "--backend", "server",
+               "--output-dir", str(tmp_path / "out"), "--report", "json", "--report-file", str(report)])
+    assert rc == 0
+    jobs = [json.loads(line) for line in report.read_text(encoding="utf-8").splitlines()][1:-1]
+    assert [job["backend"] for job in jobs] == [BACKEND_SERVER, BACKEND_SERVER]
+    assert (tmp_path / "out" / "a.html").read_text(encoding="utf-8") == "server:html:# a\n"
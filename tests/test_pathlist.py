@@ -0,0 +1,48 @@
+"""pathlist.py (GUI ファイル一覧の中身) のテスト."""
+import time
+
+from pathlist import SORT_PATH, PathList, display_name
+
+
+def test_extend_skips_duplicates():
+    paths = PathList(["/a/x.md", "/a/y.md"])
+    assert paths.extend(["/a/y.md", "/b/z.md", "/b/z.md"]) == ["/b/z.md"]
+    assert paths.paths() == ["/a/x.md", "/a/y.md", "/b/z.md"]
+    assert "/b/z.md" in paths and len(paths) == 3
+    paths.remove_rows([0, 2])
+    assert paths.paths() == ["/a/y.md"]
+    assert "/a/x.md" not in paths
+    assert paths.extend(["/a/x.md"]) == ["/a/x.md"]
+
+
+def test_move_rows_keeps_order():
+    paths = PathList(list("abcdef"))
+    assert paths.move_rows([1, 3], 5) == 3
+    assert "".join(paths) == "acebdf"
+    assert paths.move_rows([4, 5], 0) == 0
+    assert "".join(paths) == "dfaceb"
+    paths.move(0, 5)
+    assert "".join(paths) == "facebd"
+
+
+def test_sort_and_filter():
+    paths = PathList(["/z/B.md", "/y/a.md", "/x/b.md"])
+    paths.sort()
+    assert [display_name(p) for p in paths] == ["a.md", "b.md", "B.md"]
+    paths.sort(SORT_PATH, reverse=True)
+    assert paths.paths() == ["/z/B.md", "/y/a.md", "/x/b.md"]
+    assert [r for r in range(len(paths)) if paths.matches(r, "Y/")] == [1]
+    assert all(paths.matches(r, "") for r in range(len(paths)))
+
+
+def test_large_list_is_fast():
+    names = [f"/docs/{i // 1000}/{i:05d}.md" for i in range(20000)]
+    start = time.perf_counter()
+    paths = PathList()
+    for i in range(0, len(names), 200):
+        paths.extend(names[i:i + 200])
+    paths.extend(names)  # 全部重複
+    paths.sort(reverse=True)
+    paths.move_rows(range(0, 20000, 2), 10000)
+    assert len(paths) == 20000
+    assert time.perf_counter() - start < 2.0
@@ -0,0 +1,88 @@
+"""preview.py (HTML ライブプレビューの差分描画) のテスト."""
+from preview import (
+    PreviewDocument,
+    PreviewRenderer,
+    page_html,
+    patch_script,
+    reference_definitions,
+    split_blocks,
+)
+
+SEPARATOR = "<!-- pandoctools-preview-block -->"
+
+
+def test_split_blocks():
+    text = ("---\ntitle: x\n\n---\n\n# 見出し\n\n段落\n2 行目\n\n```py\na\n\nb\n```\n\n"
+            "$$\na\n\nb\n$$\n\n- 項目\n\n  続き\n\n- 次\n\n[x]: http://a\n[^1]: 注\n")
+    assert split_blocks(text) == [
+        "---\ntitle: x\n\n---", "# 見出し", "段落\n2 行目", "```py\na\n\nb\n```", "$$\na\n\nb\n$$",
+        "- 項目\n\n  続き", "- 次", "[x]: http://a\n[^1]: 注",
+    ]
+    assert reference_definitions(split_blocks(text)) == "[x]: http://a\n[^1]: 注"
+    assert split_blocks("$$x$$\n\n後\n") == ["$$x$$", "後"]
+
+
+class FakePandoc:
+    """区切りを保ったままブロックを <p> にする pandoc の代わり."""
+
+    def __init__(self, keep_separator=True):
+        self.calls = []
+        self.keep_separator = keep_separator
+
+    def __call__(self, cmd, source, cwd):
+        self.calls.append(source)
+        out = []
+        for part in source.split("\n\n"):
+            part = part.strip()
+            if part == SEPARATOR:
+                if self.keep_separator:
+                    out.append(part)
+            elif part and not part.startswith("["):
+                out.append(f"<p>{part}</p>")
+        return "\n".join(out) + "\n"
+
+
+def test_only_changed_blocks_are_rendered():
+    fake = FakePandoc()
+    doc = PreviewDocument(PreviewRenderer(reader="markdown+hard_line_breaks", runner=fake))
+    patch = doc.update("A\n\nB\n\nC\n")
+    assert (patch.start, patch.removed, patch.html) == (0, 0, ["<p>A</p>", "<p>B</p>", "<p>C</p>"])
+    assert len(fake.calls) == 1
+    assert doc.update("A\n\nB\n\nC\n") is None
+
+    # 中央のブロックだけ変わった: 1 ブロックだけを描画して置き換える
+    fake.calls.clear()
+    patch = doc.update("A\n\nB2\n\nC\n")
+    assert (patch.start, patch.removed, patch.html, patch.total) == (1, 1, ["<p>B2</p>"], 3)
+    assert fake.calls == ["B2\n"]
+    # 挿入 / 削除、描画済みのブロックはキャッシュから
+    patch = doc.update("A\n\nX\n\nB2\n\nC\n")
+    assert (patch.start, patch.removed, patch.html) == (1, 0, ["<p>X</p>"])
+    fake.calls.clear()
+    patch = doc.update("A\n\nB\n\nC\n")
+    assert (patch.start, patch.removed, patch.html) == (1, 2, ["<p>B</p>"])
+    assert fake.calls == []
+    assert doc.html == ["<p>A</p>", "<p>B</p>", "<p>C</p>"]
+
+
+def test_reference_definitions_and_separator_fallback():
+    fake = FakePandoc(keep_separator=False)
+    doc = PreviewDocument(PreviewRenderer(runner=fake))
+    patch = doc.update("see [x]\n\nB\n\n[x]: http://a\n")
+    # 区切りが残らない reader ではブロックごとに描画する
+    assert patch.html == ["<p>see [x]</p>", "<p>B</p>", ""]
+    assert len(fake.calls) == 4
+    assert all(call.endswith("[x]: http://a\n") for call in fake.calls[1:])
+    # 参照の定義が変わると全ブロックを描画し直す
+    patch = doc.update("see [x]\n\nB\n\n[x]: http://b\n")
+    assert (patch.start, patch.removed) == (0, 3)
+
+
+def test_page_html_and_patch_script(tmp_path):
+    html = page_html(["<p>A</p>"], base_dir=str(tmp_path))
+    assert '<div class="pt-block"><p>A</p></div>' in html
+    assert f'<base href="{tmp_path.resolve().as_uri()}/">' in html
+    assert "function ptPatch" in html
+    doc = PreviewDocument(PreviewRenderer(runner=FakePandoc()))
+    doc.update("A\n")
+    assert patch_script(doc.update('A\n\n"B"\n')) == 'ptPatch(1, 0, ["<p>\\"B\\"</p>"]);'
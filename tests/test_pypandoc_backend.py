@@ -0,0 +1,79 @@
+"""pypandoc_backend.py (小さな出力の高速経路) のテスト."""
+import subprocess
+import sys
+import types
+
+from conversion import STATUS_OK, ConversionJob, run_jobs
+from pypandoc_backend import BACKEND_INPROCESS, PypandocBackend, fast_path_request
+
+
+def _job(tmp_path, name, body, ext, extra_args=None, **kwargs):
+    src = tmp_path / f"{name}.md"
+    src.write_text(body, encoding="utf-8")
+    return ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / f"{name}.{ext}"),
+                         extra_args=list(extra_args or []), label=name, **kwargs)
+
+
+def test_fast_path_request_selection(tmp_path):
+    request = fast_path_request(_job(tmp_path, "a", "# A\n", "docx",
+                                     ["--from", "markdown+hard_line_breaks", "--toc"],
+                                     resource_path="/img"))
+    assert (request["to"], request["format"]) == ("docx", "markdown+hard_line_breaks")
+    assert request["extra_args"] == ["--resource-path", "/img", "--toc"]
+    assert fast_path_request(_job(tmp_path, "b", "# B\n", "md", ["--from=gfm"]))["format"] == "gfm"
+
+    # PDF / 大きな入力 / タイムアウト付き / 複数入力はプロセスで
+    assert fast_path_request(_job(tmp_path, "c", "x", "pdf")) is None
+    assert fast_path_request(_job(tmp_path, "d", "x" * 100, "html"), max_bytes=10) is None
+    assert fast_path_request(_job(tmp_path, "e", "x", "html", timeout=30)) is None
+    multi = _job(tmp_path, "f", "x", "html")
+    multi.inputs.append(multi.inputs[0])
+    assert fast_path_request(multi) is None
+    # 入力側の相対パス (フィルタやテンプレート) はこの経路では解決できない
+    (tmp_path / "style.css").write_text("", encoding="utf-8")
+    assert fast_path_request(_job(tmp_path, "g", "x", "html", ["--css=style.css"])) is None
+
+
+def test_start_without_pypandoc(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pypandoc", None)
+    logs = []
+    backend = PypandocBackend(log=logs.append)
+    assert backend.start() is False and not backend.available
+    assert backend.prepare(_job(tmp_path, "a", "# A\n", "html")) is None
+    assert logs
+
+
+def test_backend_with_process_fallback(tmp_path, fake_pandoc, monkeypatch):
+    # pypandoc の代わり: 受け取った引数で fake pandoc を起動する
+    calls = []
+
+    def convert_file(source, to, format=None, extra_args=(), outputfile=None, **options):
+        calls.append((to, format, options))
+        proc = subprocess.run([fake_pandoc, source, *extra_args, "-o", outputfile],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Pandoc died with exitcode \"{proc.returncode}\"")
+
+    fake = types.ModuleType("pypandoc")
+    fake.get_pandoc_path = lambda: fake_pandoc
+    fake.convert_file = convert_file
+    monkeypatch.setitem(sys.modules, "pypandoc", fake)
+
+    jobs = [_job(tmp_path, f"doc{i}", f"# {i}\n", "html") for i in range(3)]
+    jobs.append(_job(tmp_path, "pdf", "# pdf\n", "pdf"))
+    jobs.append(_job(tmp_path, "broken", "@@FAIL\n", "docx"))
+    with PypandocBackend() as backend:
+        assert backend.pandoc_path == fake_pandoc
+        results = run_jobs(jobs, pandoc=fake_pandoc, max_jobs=2, backends=[backend])
+    assert not backend.available
+
+    by_name = {r.job.name: r for r in results}
+    for i in range(3):
+        r = by_name[f"doc{i}"]
+        assert (r.status, r.backend) == (STATUS_OK, BACKEND_INPROCESS)
+        assert open(r.job.output_file, encoding="utf-8").read() == f"# {i}\n"
+    assert calls[0] == ("html", "markdown", {"verify_format": False})
+    # 対象外 / 高速経路で失敗したジョブは pandoc プロセスで
+    assert (by_name["pdf"].status, by_name["pdf"].backend) == (STATUS_OK, "")
+    assert (by_name["broken"].exit_code, by_name["broken"].backend) == (43, "")
+    assert not list((tmp_path / "out").glob(".*"))
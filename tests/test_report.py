@@ -0,0 +1,67 @@
+"""report.py (JSON Lines レポート) のテスト."""
+import io
+import json
+
+from cli import main
+from conversion import STATUS_FAILED, STATUS_OK, ConversionJob, run_jobs
+from engines import LogicalConfig
+from report import RunReport, WarningCollector
+
+
+def _records(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_warning_collector_handles_split_lines():
+    job = ConversionJob(inputs=["a.md"], output_file="a.pdf")
+    wc = WarningCollector()
+    wc.feed(job, "[WARN")
+    wc.feed(job, "ING] Could not fetch resource x.png\nplain line\nLaTeX Warning: Label(s) may")
+    wc.feed(job, " have changed.\r\n")
+    assert wc.pop(job) == ["[WARNING] Could not fetch resource x.png",
+                           "LaTeX Warning: Label(s) may have changed."]
+    assert wc.pop(job) == []
+
+
+def test_report_streams_job_records(tmp_path, fake_pandoc):
+    jobs = []
+    for name, body in [("a", "@@WARN\nok\n"), ("b", "@@FAIL\n")]:
+        src = tmp_path / f"{name}.md"
+        src.write_text(body, encoding="utf-8")
+        jobs.append(ConversionJob(inputs=[str(src)], output_file=str(tmp_path / f"{name}.pdf")))
+
+    out = io.StringIO()
+    report = RunReport(out, argv=["convert", "a.md", "b.md"], profile="default",
+                       config=LogicalConfig(toc=True))
+
+    def on_output(job, stream, text):
+        if stream == "stderr":
+            report.warnings.feed(job, text)
+
+    results = run_jobs(jobs, pandoc=fake_pandoc, on_output=on_output, on_finish=report.job)
+    report.summary(results, 43)
+
+    run, a, b, summary = _records(out.getvalue())
+    assert run["type"] == "run" and run["config"]["toc"] is True
+    assert a["status"] == STATUS_OK
+    assert a["output_size"] == len("@@WARN\nok\n")
+    assert a["warnings"] == ["[WARNING] Could not fetch resource x.png"]
+    assert a["argv"][1:] == [jobs[0].inputs[0], "-o", jobs[0].output_file]
+    assert b["status"] == STATUS_FAILED and b["exit_code"] == 43 and b["output_size"] is None
+    assert summary == {"type": "summary", "jobs": 2, "counts": {"ok": 1, "failed": 1},
+                       "exit_code": 43, "duration": summary["duration"]}
+
+
+def test_cli_dry_run_report_on_stdout(tmp_path, capsys):
+    src = tmp_path / "doc.md"
+    src.write_text("# x\n", encoding="utf-8")
+    rc = main(["convert", str(src), "--dry-run", "--report", "json"])
+    assert rc == 0
+    captured = capsys.readouterr()
+    # 人間向けの表示は stderr、stdout はレポートだけ
+    assert "COMMAND:" in captured.err
+    records = _records(captured.out)
+    assert [r["type"] for r in records] == ["run", "job", "summary"]
+    assert records[1]["status"] == "dry-run"
+    assert records[1]["output"].endswith("doc.pdf")
+    assert records[0]["argv"][0] == "convert"
@@ -0,0 +1,123 @@
+"""resources.py (リソースの探索パスと画像参照の解決) のテスト."""
+import os
+import time
+from pathlib import Path
+
+from conversion import STATUS_OK, ConversionJob, run_jobs
+from deps import command_digest
+from resources import ResourceIndex, input_dirs, prepare_jobs, resource_path
+
+
+def _chapter(root, name, body, images=()):
+    directory = root / name
+    directory.mkdir(parents=True, exist_ok=True)
+    for image in images:
+        (directory / image).parent.mkdir(parents=True, exist_ok=True)
+        (directory / image).write_bytes(b"png")
+    src = directory / f"{name}.md"
+    src.write_text(body, encoding="utf-8")
+    return str(src)
+
+
+def test_index_lookup(tmp_path):
+    _chapter(tmp_path, "a", "", images=["img/fig.png", "Logo.PNG"])
+    index = ResourceIndex()
+    a = str(tmp_path / "a")
+    assert index.find("img/fig.png", a) == str(tmp_path / "a" / "img" / "fig.png")
+    assert index.find("./img/fig.png", a) == str(tmp_path / "a" / "img" / "fig.png")
+    assert index.find("img", a) is None and index.find("img/none.png", a) is None
+    assert index.find("../a/Logo.PNG", a) == str((tmp_path / "a" / "Logo.PNG").resolve())
+    assert input_dirs([str(tmp_path / "a" / "x.md"), str(tmp_path / "b" / "y.md"),
+                       str(tmp_path / "a" / "z.md")]) == [a, str(tmp_path / "b")]
+
+
+def test_rewrites_references_in_copies(tmp_path):
+    a = _chapter(tmp_path, "a", "![A](fig.png)\n\n![shared](shared.png)\n", images=["fig.png"])
+    b = _chapter(tmp_path, "b", '![B](fig.png "t")\n\n```md\n![code](fig.png)\n```\n'
+                 '<img src="fig.png">\n![web](http://x/fig.png)\n![none](none.png)\n',
+                 images=["fig.png", "shared.png"])
+    c = _chapter(tmp_path, "c", "![again](shared.png)\n", images=["shared.png"])
+    job = ConversionJob(inputs=[a, b, c], output_file=str(tmp_path / "out.pdf"))
+    digest = command_digest(job)
+    logs = []
+    rewriter = prepare_jobs([job], log=logs.append)
+    try:
+        copies = [Path(p).read_text(encoding="utf-8") for p in job.input_copies]
+        b_fig = (tmp_path / "b" / "fig.png").as_posix()
+        # 各章のフォルダの画像を優先する (--resource-path の順なら a/fig.png が使われていた)
+        assert copies[0].startswith(f"![A]({(tmp_path / 'a' / 'fig.png').as_posix()})")
+        assert f'![B]({b_fig} "t")' in copies[1]
+        assert "![code](fig.png)" in copies[1] and f'<img src="{b_fig}">' in copies[1]
+        assert "![web](http://x/fig.png)" in copies[1] and "![none](none.png)" in copies[1]
+        # 自分のフォルダに無く候補が 2 つ: 警告して先に並んだほうを使う
+        assert f"({(tmp_path / 'b' / 'shared.png').as_posix()})" in copies[0]
+        assert any("shared.png (a.md) の候補が複数" in line for line in logs)
+        assert job.command()[1:4] == job.input_copies
+        assert command_digest(job) == digest
+    finally:
+        rewriter.cleanup()
+    assert not any(Path(p).exists() for p in job.input_copies)
+
+
+def test_skipped_jobs(tmp_path, fake_pandoc):
+    a = _chapter(tmp_path, "a", "![A](fig.png)\n", images=["fig.png"])
+    b = _chapter(tmp_path, "b", "# B\n")
+    # 出力に画像のパスが残る形式・Typst・単一フォルダは書き換えない
+    html = ConversionJob(inputs=[a, b], output_file=str(tmp_path / "out.html"))
+    typst = ConversionJob(inputs=[a, b], output_file=str(tmp_path / "out.pdf"),
+                          extra_args=["--pdf-engine=typst"])
+    single = ConversionJob(inputs=[a], output_file=str(tmp_path / "one.docx"))
+    embedded = ConversionJob(inputs=[a, b], output_file=str(tmp_path / "embedded.html"),
+                             extra_args=["--embed-resources"])
+    rewriter = prepare_jobs([html, typst, single, embedded])
+    try:
+        assert html.input_copies is typst.input_copies is single.input_copies is None
+        assert embedded.input_copies[1] == b
+        result = run_jobs([embedded], pandoc=fake_pandoc)[0]
+        assert result.status == STATUS_OK
+        text = Path(embedded.output_file).read_text(encoding="utf-8")
+        assert f"![A]({(tmp_path / 'a' / 'fig.png').as_posix()})" in text
+    finally:
+        rewriter.cleanup()
+
+
+def test_resource_path_is_ordered_and_deduplicated(tmp_path):
+    inputs = [str(tmp_path / "b" / "1.md"), str(tmp_path / "a" / "2.md"),
+              str(tmp_path / "b" / "sub" / ".." / "3.md")]
+    # 区切りはプラットフォームのもの (GUI も ';' 固定ではない)、順序は入力順
+    assert resource_path(inputs).split(os.pathsep) == [str(tmp_path / "b"), str(tmp_path / "a")]
+    assert resource_path([]) == ""
+
+
+def test_large_multi_directory_merge(tmp_path, monkeypatch):
+    # 300 章がそれぞれのフォルダにあり、cover.png は ch000 と ch150 にだけある
+    chapters = [_chapter(tmp_path, f"ch{i:03d}",
+                         f"# {i}\n\n![fig](img/fig.png)\n\n![cover](cover.png)\n",
+                         images=["img/fig.png"] + (["cover.png"] if i in (0, 150) else []))
+                for i in range(300)]
+    job = ConversionJob(inputs=chapters, output_file=str(tmp_path / "book.pdf"),
+                        resource_path=resource_path(chapters))
+    assert len(job.resource_path.split(os.pathsep)) == 300
+
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or real_scandir(path))
+    logs = []
+    start = time.perf_counter()
+    rewriter = prepare_jobs([job], log=logs.append)
+    elapsed = time.perf_counter() - start
+    try:
+        # ディレクトリの一覧は 1 度ずつしか読まない (章フォルダ 300 + img 300)
+        assert len(scans) == len(set(scans)) == 600
+        assert elapsed < 10
+        copies = job.input_copies
+        assert len(copies) == 300 and len({Path(p).parent for p in copies}) == 300
+        for i in (0, 42, 299):
+            text = Path(copies[i]).read_text(encoding="utf-8")
+            assert f"![fig]({(tmp_path / f'ch{i:03d}' / 'img' / 'fig.png').as_posix()})" in text
+        # cover.png は ch000 と ch150 にある: 他の章では候補が 2 つなので警告し、先の ch000 を使う
+        text = Path(copies[42]).read_text(encoding="utf-8")
+        assert f"![cover]({(tmp_path / 'ch000' / 'cover.png').as_posix()})" in text
+        assert sum("候補が複数" in line for line in logs) == 298
+    finally:
+        rewriter.cleanup()
@@ -0,0 +1,227 @@
+"""scheduler.py (適応的スケジューラ) の単体テスト."""
+import asyncio
+import threading
+
+from conversion import ConversionJob, ConversionRunner, JobResult, STATUS_OK
+from scheduler import (
+    DEFAULT_PEAK_RSS,
+    MIN_FREE_BYTES,
+    ORDER_GIVEN,
+    ORDER_LPT,
+    ORDER_SJF,
+    RSS_SAFETY,
+    AdaptiveLimiter,
+    RunHistory,
+    order_jobs,
+    read_meminfo,
+)
+
+MiB = 1024 * 1024
+
+
+class FakeProbe:
+    def __init__(self, available=None, load=None, cpus=8, rss=None):
+        self.available = available
+        self.load = load
+        self.cpus = cpus
+        self.rss = rss
+        self.calls = []
+
+    def available_memory(self):
+        return self.available
+
+    def load_average(self):
+        return self.load
+
+    def cpu_count(self):
+        return self.cpus
+
+    def session_rss(self, pids):
+        self.calls.append((threading.get_ident(), sorted(pids)))
+        return None if self.rss is None else {pid: self.rss for pid in pids}
+
+
+def _job(name, profile="default"):
+    return ConversionJob(inputs=[f"{name}.md"], output_file=f"{name}.pdf", label=name,
+                         profile=profile)
+
+
+def _limiter(tmp_path, **probe_kwargs):
+    return AdaptiveLimiter(max_jobs=4, history=RunHistory(tmp_path / "history.json"),
+                           probe=FakeProbe(**probe_kwargs), start_interval=0, poll_interval=0.01)
+
+
+def test_read_meminfo(tmp_path):
+    f = tmp_path / "meminfo"
+    f.write_text("MemTotal:       16000000 kB\nMemAvailable:    8000000 kB\nHugePages_Total:       0\n")
+    info = read_meminfo(str(f))
+    assert info["MemAvailable"] == 8000000 * 1024
+    assert info["HugePages_Total"] == 0
+
+
+def test_read_meminfo_missing_file(tmp_path):
+    assert read_meminfo(str(tmp_path / "nope")) == {}
+
+
+def test_history_roundtrip_and_decay(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    history.record_peak_rss("big", 1000 * MiB)
+    history.save()
+    reloaded = RunHistory(tmp_path / "history.json")
+    assert reloaded.peak_rss("big") == 1000 * MiB
+    # 小さな実測値では一気に下がらない
+    reloaded.record_peak_rss("big", 100 * MiB)
+    assert reloaded.peak_rss("big") == 900 * MiB
+    assert reloaded.peak_rss("unknown") is None
+
+
+def test_history_save_merges_concurrent_runs(tmp_path):
+    first = RunHistory(tmp_path / "history.json")
+    second = RunHistory(tmp_path / "history.json")
+    first.record_peak_rss("a", 100 * MiB)
+    second.record_peak_rss("b", 200 * MiB)
+    first.save()
+    second.save()
+    reloaded = RunHistory(tmp_path / "history.json")
+    assert reloaded.peak_rss("a") == 100 * MiB
+    assert reloaded.peak_rss("b") == 200 * MiB
+
+
+def test_first_job_always_starts_even_without_memory(tmp_path):
+    limiter = _limiter(tmp_path, available=0)
+    assert limiter.can_start(_job("a"))
+
+
+def test_second_job_waits_for_memory_headroom(tmp_path):
+    limiter = _limiter(tmp_path, available=int(DEFAULT_PEAK_RSS * RSS_SAFETY) + MIN_FREE_BYTES)
+
+    async def scenario():
+        await limiter.acquire(_job("a"))
+        # a の見込み分が予約されているので b は開始できない
+        return limiter.can_start(_job("b"))
+
+    assert not asyncio.run(scenario())
+    assert "メモリ" in limiter.last_reason
+
+
+def test_backs_off_on_high_load(tmp_path):
+    limiter = _limiter(tmp_path, available=64 * 1024 * MiB, load=9.0, cpus=8)
+
+    async def scenario():
+        await limiter.acquire(_job("a"))
+        return limiter.can_start(_job("b"))
+
+    assert not asyncio.run(scenario())
+
+
+def test_learned_profile_peak_allows_more_jobs(tmp_path):
+    limiter = _limiter(tmp_path, available=2048 * MiB)
+    limiter.history.record_peak_rss("small", 100 * MiB)
+
+    # limiter は id(job) で管理するので、ジョブへの参照を保持しておく
+    jobs = [_job(name, profile="small") for name in "abc"]
+
+    async def scenario():
+        for job in jobs:
+            await limiter.acquire(job)
+        return len(limiter._running)
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_release_records_peak(tmp_path):
+    limiter = _limiter(tmp_path, available=64 * 1024 * MiB)
+    job = _job("a", profile="p")
+
+    async def scenario():
+        await limiter.acquire(job)
+        limiter._running[id(job)]["peak"] = 300 * MiB
+        limiter.release(job, JobResult(job, STATUS_OK, 0))
+
+    asyncio.run(scenario())
+    assert limiter.history.peak_rss("p") == 300 * MiB
+    # 保存は実行の最後に呼び出し側が行う (ジョブの終了ごとには書かない)
+    assert not (tmp_path / "history.json").exists()
+    limiter.history.save()
+    assert RunHistory(tmp_path / "history.json").peak_rss("p") == 300 * MiB
+
+
+def test_runner_with_adaptive_limiter(tmp_path, fake_pandoc):
+    jobs = []
+    for i in range(3):
+        src = tmp_path / f"j{i}.md"
+        src.write_text("@@SLEEP 0.2\n", encoding="utf-8")
+        jobs.append(ConversionJob(inputs=[str(src)], output_file=str(tmp_path / f"j{i}.pdf")))
+    limiter = _limiter(tmp_path, available=64 * 1024 * MiB, rss=50 * MiB)
+    runner = ConversionRunner(pandoc=fake_pandoc, limiter=limiter)
+    results = asyncio.run(runner.run_all(jobs))
+    assert all(r.ok for r in results)
+    assert not limiter._running
+
+
+def _sized_job(tmp_path, name, size, profile="default"):
+    src = tmp_path / f"{name}.md"
+    src.write_text("x" * size, encoding="utf-8")
+    return ConversionJob(inputs=[str(src)], output_file=str(tmp_path / f"{name}.pdf"),
+                         label=name, profile=profile)
+
+
+def test_order_given_keeps_list(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    jobs = [_sized_job(tmp_path, n, s) for n, s in [("a", 10), ("b", 1000), ("c", 100)]]
+    assert [j.label for j in order_jobs(jobs, ORDER_GIVEN, history)] == ["a", "b", "c"]
+
+
+def test_order_falls_back_to_file_size(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    jobs = [_sized_job(tmp_path, n, s) for n, s in [("a", 10), ("b", 1000), ("c", 100)]]
+    assert [j.label for j in order_jobs(jobs, ORDER_LPT, history)] == ["b", "c", "a"]
+    assert [j.label for j in order_jobs(jobs, ORDER_SJF, history)] == ["a", "c", "b"]
+
+
+def test_order_prefers_recorded_durations(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    jobs = [_sized_job(tmp_path, n, s) for n, s in [("a", 10), ("b", 1000)]]
+    # 小さな a が実際には長時間かかった (例: 巨大な画像を含む)
+    history.record_duration(jobs[0], 300.0)
+    history.record_duration(jobs[1], 5.0)
+    history.save()
+    reloaded = RunHistory(tmp_path / "history.json")
+    assert [j.label for j in order_jobs(jobs, ORDER_LPT, reloaded)] == ["a", "b"]
+
+
+def test_duration_history_keyed_by_profile(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    job_latex = _sized_job(tmp_path, "doc", 100, profile="default")
+    job_typst = ConversionJob(inputs=job_latex.inputs, output_file="x.pdf", profile="typst")
+    history.record_duration(job_latex, 30.0)
+    assert history.duration(job_latex) == 30.0
+    assert history.duration(job_typst) is None
+
+
+def test_unknown_input_estimate_uses_learned_rate(tmp_path):
+    history = RunHistory(tmp_path / "history.json")
+    history.record_duration(_sized_job(tmp_path, "known", 1000), 10.0)
+    fresh = _sized_job(tmp_path, "fresh", 500)
+    assert abs(history.estimate_duration(fresh) - 5.0) < 1e-6
+
+
+def test_one_rss_snapshot_per_tick_off_the_loop(tmp_path):
+    limiter = _limiter(tmp_path, available=64 * 1024 * MiB, rss=50 * MiB)
+    jobs = [_job(name) for name in "abc"]
+
+    async def scenario():
+        for pid, job in enumerate(jobs, start=100):
+            await limiter.acquire(job)
+            limiter.started(job, pid)
+        await asyncio.sleep(0.05)
+        for job in jobs:
+            limiter.release(job, JobResult(job, STATUS_OK, 0))
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    calls = limiter.probe.calls
+    # ジョブごとではなく、1 回の走査で実行中の全ジョブを測る
+    assert calls and calls[-1][1] == [100, 101, 102]
+    assert all(thread != loop_thread for thread, _ in calls)
+    assert limiter._sampler is None
@@ -0,0 +1,102 @@
+"""scratch.py (スクラッチ領域) と ConversionRunner のスクラッチ連携のテスト."""
+import os
+
+import pytest
+
+import scratch
+from conversion import STATUS_FAILED, STATUS_OK, ConversionJob, run_jobs
+from scratch import SCRATCH_ENV, dir_size, publish, resolve_scratch
+
+
+def test_resolve_scratch(tmp_path, monkeypatch):
+    monkeypatch.delenv(SCRATCH_ENV, raising=False)
+    assert resolve_scratch("none") is None
+    assert resolve_scratch(str(tmp_path / "s")) == str((tmp_path / "s").resolve())
+    assert (tmp_path / "s").is_dir()
+    # auto は十分な空きがある /dev/shm だけを使う
+    assert resolve_scratch("auto", min_free=1 << 62) is None
+    monkeypatch.setenv(SCRATCH_ENV, str(tmp_path / "env"))
+    assert resolve_scratch() == str((tmp_path / "env").resolve())
+
+
+def test_dir_size(tmp_path):
+    (tmp_path / "a").write_bytes(b"x" * 10)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b").write_bytes(b"x" * 5)
+    assert dir_size(str(tmp_path)) == 15
+
+
+def test_publish_across_filesystems(tmp_path, monkeypatch):
+    src = tmp_path / "staged.pdf"
+    src.write_bytes(b"%PDF-data")
+    dst = tmp_path / "out" / "doc.pdf"
+    real_replace = os.replace
+    calls = []
+
+    def fake_replace(a, b):
+        calls.append((str(a), str(b)))
+        if len(calls) == 1:
+            raise OSError(18, "Invalid cross-device link")
+        return real_replace(a, b)
+
+    monkeypatch.setattr(os, "replace", fake_replace)
+    assert publish(str(src), str(dst)) == len(b"%PDF-data")
+    assert dst.read_bytes() == b"%PDF-data"
+    # 2 回目は出力先ディレクトリ内の一時ファイルからの置き換え
+    assert os.path.dirname(calls[1][0]) == str(dst.parent)
+    assert os.listdir(dst.parent) == ["doc.pdf"]
+
+
+def test_runner_stages_output_in_scratch(tmp_path, fake_pandoc):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    src = tmp_path / "a.md"
+    body = "hello\n@@TMPDIR\n"
+    src.write_text(body, encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / "a.pdf"),
+                        scratch_dir=str(scratch))
+    seen = []
+    [result] = run_jobs([job], pandoc=fake_pandoc,
+                        on_output=lambda j, stream, text: seen.append(text))
+    assert result.status == STATUS_OK
+    assert (tmp_path / "out" / "a.pdf").read_text(encoding="utf-8") == body
+    # 一時ファイルと出力の書きかけはスクラッチに置かれる
+    lines = "".join(seen).splitlines()
+    tmpdir = next(line for line in lines if line.startswith("TMPDIR="))[len("TMPDIR="):]
+    staged = next(line for line in lines if line.startswith("OUT="))[len("OUT="):]
+    assert tmpdir.startswith(str(scratch)) and staged.startswith(str(scratch))
+    assert result.metrics["dest_bytes"] == len(body)
+    assert result.metrics["scratch_bytes"] >= len(body)
+    # ジョブのスクラッチは片付けられる
+    assert dir_size(str(scratch)) == 0
+
+
+def test_runner_scratch_failure_leaves_no_output(tmp_path, fake_pandoc):
+    scratch = tmp_path / "scratch"
+    src = tmp_path / "a.md"
+    src.write_text("@@FAIL\n", encoding="utf-8")
+    job = ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "a.pdf"),
+                        scratch_dir=str(scratch))
+    [result] = run_jobs([job], pandoc=fake_pandoc)
+    assert result.status == STATUS_FAILED
+    assert not (tmp_path / "a.pdf").exists()
+    assert dir_size(str(scratch)) == 0
+
+
+def test_published_output_mode(tmp_path, fake_pandoc):
+    if os.name == "nt":
+        pytest.skip("POSIX のパーミッションのみ")
+    src = tmp_path / "a.md"
+    src.write_text("hello\n", encoding="utf-8")
+    out = tmp_path / "out" / "a.pdf"
+    # 新しい出力は 0o666 & ~umask (一時ファイルの 0600 のままにしない)
+    job = ConversionJob(inputs=[str(src)], output_file=str(out))
+    assert run_jobs([job], pandoc=fake_pandoc)[0].status == STATUS_OK
+    assert out.stat().st_mode & 0o777 == 0o666 & ~scratch._UMASK
+    # 既存の出力はそのモードを保つ (スクラッチ経由でも同じ)
+    out.chmod(0o640)
+    scratch_dir = tmp_path / "scratch"
+    scratch_dir.mkdir()
+    job = ConversionJob(inputs=[str(src)], output_file=str(out), scratch_dir=str(scratch_dir))
+    assert run_jobs([job], pandoc=fake_pandoc)[0].status == STATUS_OK
+    assert out.stat().st_mode & 0o777 == 0o640
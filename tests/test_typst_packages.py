@@ -0,0 +1,98 @@
+"""typst_packages.py (Typst パッケージのローカル配置) のテスト."""
+import io
+import tarfile
+
+import pytest
+
+import typst_packages
+from common import RESOURCE_DIR
+from typst_packages import (
+    MISMATCH,
+    MISSING,
+    PackageError,
+    PackageSpec,
+    PackageStore,
+    find_imports,
+    required_packages,
+)
+
+JS = PackageSpec("preview", "js", "0.1.3")
+DEP = PackageSpec("preview", "dep", "1.0.0")
+
+
+def _make_package(root, spec, body="", files=None):
+    pkg = root / spec.namespace / spec.name / spec.version
+    pkg.mkdir(parents=True)
+    (pkg / "typst.toml").write_text(f'[package]\nname = "{spec.name}"\n', encoding="utf-8")
+    (pkg / "lib.typ").write_text(body, encoding="utf-8")
+    for name, text in (files or {}).items():
+        (pkg / name).write_text(text, encoding="utf-8")
+    return pkg
+
+
+def test_find_imports_and_required_packages():
+    text = '#import "@preview/js:0.1.3": js\n#import "@local/x:1.2.3"\n#import "@preview/js:0.1.3"\n'
+    assert find_imports(text) == [JS, PackageSpec("local", "x", "1.2.3")]
+    assert JS in required_packages(RESOURCE_DIR)
+
+
+def test_sync_from_directory_follows_dependencies(tmp_path):
+    source = tmp_path / "cache"
+    _make_package(source, JS, body='#import "@preview/dep:1.0.0": *\n')
+    _make_package(source, DEP)
+    store = PackageStore(tmp_path / "pkgs")
+    assert store.verify([JS]) == {JS: MISSING}
+
+    logs = []
+    assert store.sync([JS], source=source, log=logs.append) == [JS, DEP]
+    assert store.verify([JS]) == {JS: None, DEP: None}
+    assert not [p for p in store.root.iterdir() if p.name.startswith(".staging-")]
+    # 2 回目は何も取得しない
+    assert PackageStore(store.root).sync([JS], source=source) == []
+
+    # 改変は verify で検出され、sync で取得し直す
+    (store.path(DEP) / "lib.typ").write_text("tampered", encoding="utf-8")
+    store = PackageStore(store.root)
+    assert store.verify([JS])[DEP] == MISMATCH
+    assert store.sync([JS], source=source) == [DEP]
+    assert store.verify([JS]) == {JS: None, DEP: None}
+
+
+def test_sync_rejects_content_differing_from_pin(tmp_path):
+    source = tmp_path / "cache"
+    _make_package(source, JS)
+    store = PackageStore(tmp_path / "pkgs")
+    store.sync([JS], source=source)
+
+    other = tmp_path / "other"
+    _make_package(other, JS, body="// different")
+    store = PackageStore(store.root)
+    (store.path(JS) / "lib.typ").unlink()
+    with pytest.raises(PackageError):
+        store.sync([JS], source=other)
+    assert store.sync([JS], source=other, repin=True) == [JS]
+    assert store.verify([JS]) == {JS: None}
+
+
+def test_sync_downloads_and_rejects_unsafe_archives(tmp_path, monkeypatch):
+    def tarball(entries):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            for name, text in entries.items():
+                data = text.encode("utf-8")
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    archives = {JS: tarball({"typst.toml": "[package]\n", "lib.typ": ""})}
+    monkeypatch.setattr(typst_packages, "_download", lambda spec: archives[spec])
+    store = PackageStore(tmp_path / "pkgs")
+    assert store.sync([JS]) == [JS]
+    assert (store.path(JS) / "typst.toml").is_file()
+
+    archives[JS] = tarball({"../evil.typ": ""})
+    store = PackageStore(tmp_path / "pkgs2")
+    with pytest.raises(PackageError):
+        store.sync([JS])
+    assert not (tmp_path / "evil.typ").exists()
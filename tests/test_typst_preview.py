@@ -0,0 +1,90 @@
+"""typst_preview.py (Typst 出力のページ単位プレビュー) のテスト."""
+import os
+import stat
+import sys
+
+import pytest
+
+from preview import PreviewError
+from typst_preview import TypstPagePreview
+
+# 入力をつなげて標準出力に書く pandoc の代わり
+_PANDOC = """
+import sys
+args = sys.argv[1:]
+inputs = args[:args.index("--to")]
+sys.stdout.write("".join(open(p, encoding="utf-8").read() for p in inputs))
+"""
+
+# 標準入力の段落を 1 ページとし、{p} を置き換えたパスに書く typst の代わり
+_TYPST = """
+import sys
+if sys.argv[1] != "compile" or "--root" not in sys.argv:
+    sys.exit(2)
+source = sys.stdin.read()
+if "@@FAIL" in source:
+    sys.stderr.write("error: unknown variable\\n")
+    sys.exit(1)
+with open(sys.argv[0] + ".calls", "a") as f:
+    f.write("x")
+for i, page in enumerate(p for p in source.split("\\n\\n") if p.strip()):
+    with open(sys.argv[-1].replace("{p}", str(i + 1)), "w", encoding="utf-8") as f:
+        f.write(page.strip())
+"""
+
+
+def _script(path, body):
+    path.write_text(f"#!{sys.executable}\n" + body, encoding="utf-8")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+@pytest.fixture
+def preview(tmp_path):
+    if os.name == "nt":
+        pytest.skip("fake pandoc / typst は POSIX のみ")
+    pandoc = _script(tmp_path / "pandoc", _PANDOC)
+    typst = _script(tmp_path / "typst", _TYPST)
+    return TypstPagePreview(cache_dir=tmp_path / "pages", pandoc=pandoc, typst=typst)
+
+
+def _compiles(tmp_path):
+    calls = tmp_path / "typst.calls"
+    return len(calls.read_text()) if calls.exists() else 0
+
+
+def test_only_changed_pages_are_reported(tmp_path, preview):
+    src = tmp_path / "doc.md"
+    src.write_text("A\n\nB\n\nC\n", encoding="utf-8")
+    first = preview.update([str(src)], [])
+    assert first.changed == [0, 1, 2]
+    assert [p.read_text(encoding="utf-8") for p in first.pages] == ["A", "B", "C"]
+
+    # 2 ページ目だけ変わった: 他のページは同じキャッシュ (同じパス) のまま
+    src.write_text("A\n\nB2\n\nC\n", encoding="utf-8")
+    second = preview.update([str(src)], [])
+    assert second.changed == [1]
+    assert second.pages[0] == first.pages[0] and second.pages[2] == first.pages[2]
+    assert not first.pages[1].exists()
+
+    # ページが減った / Typst ソースが同じなら typst を起動しない
+    src.write_text("A\n\nB2\n", encoding="utf-8")
+    assert preview.update([str(src)], []).changed == []
+    assert len(preview.pages) == 2 and not first.pages[2].exists()
+    assert _compiles(tmp_path) == 3
+    assert preview.update([str(src)], []).changed == []
+    assert _compiles(tmp_path) == 3
+    # typst の引数が変われば組み直す
+    preview.update([str(src)], [], ["--font-path=fonts"])
+    assert _compiles(tmp_path) == 4
+
+
+def test_typst_error_keeps_previous_pages(tmp_path, preview):
+    src = tmp_path / "doc.md"
+    src.write_text("A\n\nB\n", encoding="utf-8")
+    pages = preview.update([str(src)], []).pages
+    src.write_text("A\n\n@@FAIL\n", encoding="utf-8")
+    with pytest.raises(PreviewError, match="unknown variable"):
+        preview.update([str(src)], [])
+    assert preview.pages == pages and all(p.exists() for p in pages)
+    assert {p.name for p in (tmp_path / "pages").iterdir()} == {p.name for p in pages}
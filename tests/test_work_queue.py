@@ -0,0 +1,131 @@
+"""work_queue.py (共有ディレクトリキュー) のテスト."""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conversion import STATUS_ERROR, STATUS_FAILED, STATUS_OK, ConversionJob, JobResult
+import work_queue
+from work_queue import QueueWorker, WorkQueue, iter_wait, job_from_dict, job_to_dict
+
+from .conftest import SRC
+
+
+def _jobs(tmp_path, bodies):
+    jobs = []
+    for i, body in enumerate(bodies):
+        src = tmp_path / f"in{i}.md"
+        src.write_text(body, encoding="utf-8")
+        jobs.append(ConversionJob(inputs=[str(src)], output_file=str(tmp_path / "out" / f"in{i}.pdf"),
+                                  label=src.name, timeout=30))
+    return jobs
+
+
+def test_job_roundtrip():
+    job = ConversionJob(inputs=["/a.md"], output_file="/a.pdf", extra_args=["--toc"],
+                        resource_path="/x", timeout=5, label="a", profile="p")
+    assert job_from_dict(json.loads(json.dumps(job_to_dict(job)))) == job
+
+
+def test_claim_is_exclusive_and_fifo(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q"))
+    ids = queue.submit(_jobs(tmp_path, ["a", "b"]))
+    other = WorkQueue(str(tmp_path / "q"))
+    first = queue.claim()
+    second = other.claim()
+    assert [first[0], second[0]] == ids
+    assert queue.claim() is None
+    assert queue.counts() == {"pending": 0, "running": 2, "done": 0}
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q"), lease=10)
+    [job_id] = queue.submit(_jobs(tmp_path, ["a"]))
+    queue.claim()
+    assert queue.reap() == []
+    # worker が死んでハートビートが止まった
+    assert queue.reap(now=time.time() + 11) == [job_id]
+    assert queue.counts()["pending"] == 1
+    # 回収済みジョブの完了報告は捨てられる
+    job = job_from_dict(json.loads((tmp_path / "q" / "pending" / f"{job_id}.json").read_text())["job"])
+    assert not queue.complete(job_id, JobResult(job, STATUS_OK, 0))
+    assert not queue.heartbeat(job_id)
+
+
+def test_invalid_job_files_are_finished_as_errors(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q"), lease=10)
+    pending = tmp_path / "q" / "pending"
+    bad = {"00-broken": "{not json", "00-no-job": json.dumps({"id": "x"}),
+           "00-bad-job": json.dumps({"job": ["a.md"]}), "00-bad-fields": json.dumps({"job": {"label": "x"}})}
+    for job_id, text in bad.items():
+        (pending / f"{job_id}.json").write_text(text, encoding="utf-8")
+    [job_id] = queue.submit(_jobs(tmp_path, ["a"]))
+    assert queue.claim()[0] == job_id
+    results = queue.results(list(bad))
+    assert sorted(results) == sorted(bad)
+    assert all(r["status"] == STATUS_ERROR and "invalid job file" in r["reason"] for r in results.values())
+    # running/ に残らないので、リースが切れても再投入されない
+    assert queue.reap(now=time.time() + 11) == [job_id]
+    assert queue.counts() == {"pending": 1, "running": 0, "done": len(bad)}
+
+
+def test_worker_resolves_typst_tool_paths_locally(tmp_path, monkeypatch):
+    queue = WorkQueue(str(tmp_path / "q"))
+    remote = ["--pdf-engine=typst", "--pdf-engine-opt=--package-path=/submitter/packages",
+              "--pdf-engine-opt=--font-path=/submitter/fonts"]
+    [job] = _jobs(tmp_path, ["a"])
+    job.extra_args = list(remote)
+    job.fallback_args = ["--pdf-engine=xelatex"]
+    queue.submit([job])
+    monkeypatch.setattr(work_queue, "typst_tool_paths", lambda resource_dir: (tmp_path / "pkg", None))
+    worker = QueueWorker(queue)
+    _, claimed = queue.claim()
+    worker._localize(claimed)
+    assert claimed.extra_args == ["--pdf-engine=typst",
+                                  f"--pdf-engine-opt=--package-path={tmp_path / 'pkg'}"]
+    assert claimed.fallback_args == ["--pdf-engine=xelatex"]
+    assert claimed.scratch_dir == worker.scratch_dir
+
+
+def test_worker_writes_results_and_logs(tmp_path, fake_pandoc):
+    queue = WorkQueue(str(tmp_path / "q"))
+    ids = queue.submit(_jobs(tmp_path, ["ok\n", "@@FAIL\n"]))
+    worker = QueueWorker(queue, max_jobs=2, pandoc=fake_pandoc, poll=0.05)
+    asyncio.run(worker.run(exit_when_empty=True))
+
+    results = dict(iter_wait(queue, ids, poll=0.05))
+    assert results[ids[0]]["status"] == STATUS_OK
+    assert results[ids[0]]["output_exists"]
+    assert results[ids[1]]["status"] == STATUS_FAILED
+    assert results[ids[1]]["exit_code"] == 43
+    done = tmp_path / "q" / "done"
+    assert "Error producing PDF." in (done / f"{ids[1]}.log").read_text(encoding="utf-8")
+    assert queue.counts() == {"pending": 0, "running": 0, "done": 2}
+
+
+_WORKER_SCRIPT = """
+import asyncio, sys
+sys.path.insert(0, sys.argv[1])
+from work_queue import QueueWorker, WorkQueue
+worker = QueueWorker(WorkQueue(sys.argv[2]), pandoc=sys.argv[3], poll=0.05)
+asyncio.run(worker.run(exit_when_empty=True))
+print(worker.processed)
+"""
+
+
+def test_multiple_processes_drain_queue_once(tmp_path, fake_pandoc):
+    queue = WorkQueue(str(tmp_path / "q"))
+    ids = queue.submit(_jobs(tmp_path, [f"@@SLEEP 0.1\njob {i}\n" for i in range(12)]))
+    procs = [subprocess.Popen([sys.executable, "-c", _WORKER_SCRIPT, str(SRC),
+                               str(tmp_path / "q"), fake_pandoc],
+                              stdout=subprocess.PIPE, text=True)
+             for _ in range(3)]
+    processed = [int(p.communicate(timeout=60)[0].strip()) for p in procs]
+
+    assert sum(processed) == len(ids)
+    results = queue.results(ids)
+    assert len(results) == len(ids)
+    assert all(r["status"] == STATUS_OK for r in results.values())
+    assert len(os.listdir(tmp_path / "out")) == len(ids)